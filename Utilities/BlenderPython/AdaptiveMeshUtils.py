@@ -0,0 +1,211 @@
+# Blender-free adaptive triangulation of elevation maps, bounded by a maximum
+# vertical error and/or a triangle budget.
+#
+# The mesh is a right-triangulated irregular network (RTIN): starting from the
+# two halves of a (2^k+1) x (2^k+1) grid that contains the map, right triangles
+# are split at the midpoint of their hypotenuse, level by level, down to half
+# grid squares. The error of each triangle is measured exactly, at every map
+# sample it covers, and stored at its hypotenuse midpoint, which it shares
+# with its hypotenuse neighbour. Errors are then made to never decrease from
+# a triangle to its parent, so that splitting every triangle whose midpoint
+# error exceeds a threshold gives a mesh without cracks, whose error at the
+# map samples is at most that threshold. Triangles that straddle the border
+# of a map smaller than the grid are always split, and those outside dropped.
+# All steps work on whole levels of the triangle tree at once.
+
+import math
+
+import numpy
+
+import ElevationMapUtils
+
+
+# Largest number of samples gathered at once when measuring triangle errors
+maxGatheredSamples = 4*1024**2;
+
+
+# Helper method to get the root triangles of a grid with size+1 vertices per
+# side, as (a, b, c) arrays of (x,y) grid vertices, where a-b is the hypotenuse
+def rootTriangles(size):
+    a = numpy.array([(0, 0), (size, size)], dtype=numpy.int64);
+    b = numpy.array([(size, size), (0, 0)], dtype=numpy.int64);
+    c = numpy.array([(0, size), (size, 0)], dtype=numpy.int64);
+    return(a, b, c);
+
+
+# Helper method to split triangles at the midpoint m of their hypotenuse,
+# into (c, a, m) and (b, c, m)
+def childTriangles(a, b, c):
+    m = (a + b)//2;
+    return(numpy.concatenate((c, b)), numpy.concatenate((a, c)), numpy.concatenate((m, m)));
+
+
+# Helper method to get the map samples covered by a triangle with right angle
+# at the origin and legs ac and bc, as (S,2) offsets and the (S,) barycentric
+# weights u, v of a and b
+def triangleSamples(ac, bc):
+    corners = numpy.array([(0, 0), ac, bc]);
+    xs, ys = numpy.meshgrid(numpy.arange(corners[:, 0].min(), corners[:, 0].max()+1),
+                            numpy.arange(corners[:, 1].min(), corners[:, 1].max()+1));
+    offsets = numpy.column_stack((xs.reshape(-1), ys.reshape(-1)));
+    u = offsets.dot(ac)/float(numpy.dot(ac, ac));
+    v = offsets.dot(bc)/float(numpy.dot(bc, bc));
+    inside = (u >= -1e-9) & (v >= -1e-9) & (u+v <= 1+1e-9);
+    return(offsets[inside], u[inside], v[inside]);
+
+
+# Method to measure the maximum absolute difference between the map samples
+# covered by each triangle and the plane through its vertices. Triangles are
+# given as (a, b, c) arrays of the same level. Triangles that straddle the
+# border of the xBinsNum x yBinsNum map get an infinite error, and those
+# outside the map a zero error.
+def triangleErrors(elevation, a, b, c, xBinsNum, yBinsNum):
+    errors = numpy.zeros(a.shape[0]);
+    xMax = numpy.maximum(numpy.maximum(a[:, 0], b[:, 0]), c[:, 0]);
+    yMax = numpy.maximum(numpy.maximum(a[:, 1], b[:, 1]), c[:, 1]);
+    xMin = numpy.minimum(numpy.minimum(a[:, 0], b[:, 0]), c[:, 0]);
+    yMin = numpy.minimum(numpy.minimum(a[:, 1], b[:, 1]), c[:, 1]);
+    inside  = (xMax <= xBinsNum-1) & (yMax <= yBinsNum-1);
+    outside = (xMin >= xBinsNum-1) | (yMin >= yBinsNum-1);
+    errors[~inside & ~outside] = numpy.inf;
+
+    # triangles of a level differ only by their position and orientation
+    ac = a - c;
+    bc = b - c;
+    orientation = numpy.sign(ac[:, 0]) + 3*numpy.sign(ac[:, 1]) + 9*numpy.sign(bc[:, 0]) + 27*numpy.sign(bc[:, 1]);
+    for key in numpy.unique(orientation[inside]):
+        group = numpy.nonzero(inside & (orientation == key))[0];
+        offsets, u, v = triangleSamples(ac[group[0]], bc[group[0]]);
+        chunkSize = max(1, maxGatheredSamples // offsets.shape[0]);
+        for first in range(0, group.size, chunkSize):
+            chunk = group[first:first+chunkSize];
+            za = elevation[a[chunk, 1], a[chunk, 0]][:, numpy.newaxis];
+            zb = elevation[b[chunk, 1], b[chunk, 0]][:, numpy.newaxis];
+            zc = elevation[c[chunk, 1], c[chunk, 0]][:, numpy.newaxis];
+            samples = elevation[c[chunk, 1][:, numpy.newaxis] + offsets[:, 1], c[chunk, 0][:, numpy.newaxis] + offsets[:, 0]];
+            plane = zc + u*(za - zc) + v*(zb - zc);
+            errors[chunk] = numpy.max(numpy.abs(samples - plane), axis=1);
+    return(errors);
+
+
+# Class for the RTIN of one elevation map, with the split errors of all
+# triangles, from which meshes for any error threshold are extracted
+class rtinMesher:
+    def __init__(self, elevation):
+        elevation = numpy.asarray(elevation, dtype=numpy.float64);
+        self.yBinsNum, self.xBinsNum = elevation.shape;
+        if min(self.xBinsNum, self.yBinsNum) < 2:
+            raise ValueError('Elevation maps need at least 2 x 2 samples to be meshed');
+        self.gridSize = 2**int(math.ceil(math.log(max(self.xBinsNum, self.yBinsNum)-1, 2)));
+        # the value of samples outside the map does not matter, they are never used
+        self.elevation = numpy.pad(elevation, ((0, self.gridSize+1-self.yBinsNum), (0, self.gridSize+1-self.xBinsNum)), mode='edge');
+        # levels whose triangles can be split (the last level has half grid squares)
+        self.levelsNum = 2*int(round(math.log(self.gridSize, 2)));
+        self.computeSplitErrors();
+
+    # Method to compute the split error of each hypotenuse midpoint: the error
+    # of the (one or two) triangles split there, and of all their descendants
+    def computeSplitErrors(self):
+        width = self.gridSize+1;
+        splitErrors = numpy.zeros(width*width);
+        children = [];
+        a, b, c = rootTriangles(self.gridSize);
+        for level in range(0, self.levelsNum):
+            errors = triangleErrors(self.elevation, a, b, c, self.xBinsNum, self.yBinsNum);
+            m = (a + b)//2;
+            midpoints = m[:, 1]*width + m[:, 0];
+            numpy.maximum.at(splitErrors, midpoints, errors);
+            if level+1 < self.levelsNum:
+                # midpoints of the children's hypotenuses
+                children.append((midpoints, ((c + a)//2).dot((1, width)), ((b + c)//2).dot((1, width))));
+            a, b, c = childTriangles(a, b, c);
+
+        # a triangle must be split whenever one of its descendants is
+        for midpoints, childMidpoints1, childMidpoints2 in reversed(children):
+            numpy.maximum.at(splitErrors, midpoints, numpy.maximum(splitErrors[childMidpoints1], splitErrors[childMidpoints2]));
+        self.splitErrors = splitErrors;
+
+    # Method to get the triangles of the mesh for an error threshold, as a
+    # list of (a, b, c) arrays, one per level. Triangles outside the map are dropped.
+    def triangles(self, threshold):
+        width = self.gridSize+1;
+        levels = [];
+        a, b, c = rootTriangles(self.gridSize);
+        for level in range(0, self.levelsNum+1):
+            if level < self.levelsNum:
+                m = (a + b)//2;
+                split = self.splitErrors[m[:, 1]*width + m[:, 0]] > threshold;
+            else:
+                split = numpy.zeros(a.shape[0], dtype=bool);
+            leaves = ~split;
+            leaves &= (numpy.maximum(numpy.maximum(a[:, 0], b[:, 0]), c[:, 0]) <= self.xBinsNum-1);
+            leaves &= (numpy.maximum(numpy.maximum(a[:, 1], b[:, 1]), c[:, 1]) <= self.yBinsNum-1);
+            levels.append((a[leaves], b[leaves], c[leaves]));
+            if not numpy.any(split):
+                break;
+            a, b, c = childTriangles(a[split], b[split], c[split]);
+        return(levels);
+
+    # Method to count the triangles of the mesh for an error threshold
+    def trianglesNum(self, threshold):
+        return(sum([level[0].shape[0] for level in self.triangles(threshold)]));
+
+    # Method to find the smallest threshold whose mesh has at most maxTriangles
+    # triangles. If even the coarsest mesh has more, its threshold is returned.
+    def budgetThreshold(self, maxTriangles):
+        thresholds = numpy.unique(self.splitErrors[numpy.isfinite(self.splitErrors)]);
+        thresholds = numpy.concatenate(([0.0], thresholds));
+        low, high = 0, thresholds.size-1;
+        while low < high:
+            middle = (low + high)//2;
+            if self.trianglesNum(thresholds[middle]) <= maxTriangles:
+                high = middle;
+            else:
+                low = middle+1;
+        return(thresholds[low]);
+
+    # Method to measure the exact maximum error of a mesh
+    def maxError(self, levels):
+        errors = [numpy.max(triangleErrors(self.elevation, a, b, c, self.xBinsNum, self.yBinsNum)) for a, b, c in levels if a.shape[0] > 0];
+        return(float(max(errors + [0.0])));
+
+
+# Method to compute an adaptive triangle mesh of an elevation map, with at most
+# maxError vertical error (in elevation map units) at the map samples, or with
+# at most maxTriangles triangles, or, if both are given, whichever gives fewer
+# triangles. Maps whose sides are not 2^k+1 samples long are always meshed
+# finely along their far borders, so tiny budgets may not be met there.
+# Vertices are placed as in ElevationMapUtils.elevationMapMeshArrays.
+# Returns a (V,3) float32 array of vertex coordinates, a (T,3) int32 array of
+# triangles, and the statistics {'maxError', 'trianglesNum', 'verticesNum', 'regularTrianglesNum'}.
+def adaptiveElevationMapMeshArrays(elevation, xBinsNum, yBinsNum, maxError=None, maxTriangles=None):
+    if (maxError is None) and (maxTriangles is None):
+        raise ValueError('Adaptive meshing needs a maxError, a maxTriangles budget, or both');
+    elevation = ElevationMapUtils.elevationAsArray(elevation, xBinsNum, yBinsNum);
+
+    mesher = rtinMesher(elevation);
+    thresholds = [];
+    if maxError is not None:
+        thresholds.append(maxError);
+    if maxTriangles is not None:
+        thresholds.append(mesher.budgetThreshold(maxTriangles));
+    levels = mesher.triangles(max(thresholds));
+
+    # keep only the grid vertices used by the triangles
+    triangles = numpy.concatenate([numpy.stack(level, axis=1) for level in levels]);
+    gridIndices = triangles[:, :, 1]*xBinsNum + triangles[:, :, 0];
+    usedIndices, faces = numpy.unique(gridIndices.reshape(-1), return_inverse=True);
+    vertices = numpy.empty((usedIndices.size, 3), dtype=numpy.float32);
+    xs = usedIndices % xBinsNum;
+    ys = usedIndices // xBinsNum;
+    vertices[:, 0] = 2*(xs-(xBinsNum-1.5)/2)/(xBinsNum-2);
+    vertices[:, 1] = 2*(ys-(yBinsNum-1.5)/2)/(yBinsNum-2);
+    vertices[:, 2] = elevation[ys, xs];
+
+    statistics = {
+        'maxError'            : mesher.maxError(levels),
+        'trianglesNum'        : int(triangles.shape[0]),
+        'verticesNum'         : int(usedIndices.size),
+        'regularTrianglesNum' : 2*(xBinsNum-1)*(yBinsNum-1),
+    };
+    return(vertices, faces.reshape((-1, 3)).astype(numpy.int32), statistics);
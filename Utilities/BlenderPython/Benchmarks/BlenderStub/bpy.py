@@ -0,0 +1,406 @@
+# Lightweight stand-in for the parts of the Blender 2.7x bpy API that are used
+# by SceneUtilsV1, so that its scene building code can be benchmarked in plain
+# CPython. Mesh element data is kept in NumPy arrays, so that foreach_set and
+# from_pydata cost roughly what they cost in Blender, relative to each other.
+# Nothing is rendered, and operators are no-ops.
+# Datablocks do not count their users: once the objects are removed, all other
+# datablocks are orphans, which is what erasePreviousContents expects.
+
+import types
+
+import numpy
+
+
+# Class for a datablock collection (bpy.data.meshes, bpy.data.objects, ...)
+class dataCollection:
+    def __init__(self, factory):
+        self.factory = factory;
+        self.clear();
+
+    def clear(self):
+        self.items  = {};
+        self.byName = {};
+        # last suffix used per base name, so that the search for a free name
+        # does not restart at .001 every time
+        self.lastSuffix = {};
+
+    # Helper method to make a name unique with Blender's .001 suffixes
+    def uniqueName(self, name):
+        if name not in self.byName:
+            return(name);
+        index = self.lastSuffix.get(name, 0) + 1;
+        while '{}.{:03d}'.format(name, index) in self.byName:
+            index += 1;
+        self.lastSuffix[name] = index;
+        return('{}.{:03d}'.format(name, index));
+
+    def new(self, name, *args):
+        datablock = self.factory(name, *args);
+        self.link(datablock, name);
+        return(datablock);
+
+    # Method to add an image datablock for a file (bpy.data.images only)
+    def load(self, filepath):
+        datablock = self.new(filepath.replace('\\', '/').split('/')[-1]);
+        datablock.filepath = filepath;
+        return(datablock);
+
+    def link(self, datablock, name):
+        object.__setattr__(datablock, 'collection', self);
+        object.__setattr__(datablock, '_name', self.uniqueName(name));
+        self.items[id(datablock)] = datablock;
+        self.byName[datablock.name] = datablock;
+
+    def rename(self, datablock, name):
+        del self.byName[datablock.name];
+        object.__setattr__(datablock, '_name', self.uniqueName(name));
+        self.byName[datablock.name] = datablock;
+
+    def remove(self, datablock, do_unlink=True):
+        del self.items[id(datablock)];
+        del self.byName[datablock.name];
+        object.__setattr__(datablock, 'collection', None);
+
+    def get(self, name, default=None):
+        return(self.byName.get(name, default));
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return(self.byName[key]);
+        return(list(self.items.values())[key]);
+
+    def __contains__(self, key):
+        if isinstance(key, str):
+            return(key in self.byName);
+        return(id(key) in self.items);
+
+    def __iter__(self):
+        return(iter(list(self.items.values())));
+
+    def __len__(self):
+        return(len(self.items));
+
+
+# Base class for datablocks, with custom properties
+class ID:
+    users         = 0;
+    use_fake_user = False;
+
+    def __init__(self, name):
+        object.__setattr__(self, 'collection', None);
+        object.__setattr__(self, '_name', name);
+        object.__setattr__(self, 'properties', {});
+
+    @property
+    def name(self):
+        return(self._name);
+
+    @name.setter
+    def name(self, name):
+        if self.collection is None:
+            object.__setattr__(self, '_name', name);
+        else:
+            self.collection.rename(self, name);
+
+    def __getitem__(self, key):
+        return(self.properties[key]);
+
+    def __setitem__(self, key, value):
+        self.properties[key] = value;
+
+    def __delitem__(self, key):
+        del self.properties[key];
+
+    def __contains__(self, key):
+        return(key in self.properties);
+
+    def get(self, key, default=None):
+        return(self.properties.get(key, default));
+
+    def keys(self):
+        return(list(self.properties.keys()));
+
+    def user_clear(self):
+        pass;
+
+
+# Class for mesh element arrays (mesh.vertices, mesh.loops, mesh.polygons)
+class elementArrays:
+    def __init__(self, fields):
+        self.fields = dict([(name, numpy.zeros((0,)+shape, dtype)) for name, (shape, dtype) in fields.items()]);
+        self.size = 0;
+
+    def add(self, count):
+        self.size += count;
+        for name, values in self.fields.items():
+            self.fields[name] = numpy.concatenate((values, numpy.zeros((count,)+values.shape[1:], values.dtype)));
+
+    def foreach_set(self, name, sequence):
+        self.fields[name][...] = numpy.asarray(sequence).reshape(self.fields[name].shape);
+
+    def foreach_get(self, name, sequence):
+        sequence[...] = self.fields[name].reshape(-1);
+
+    def __len__(self):
+        return(self.size);
+
+    def __iter__(self):
+        for index in range(0, self.size):
+            yield element(self, index);
+
+    def __getitem__(self, index):
+        return(element(self, index));
+
+
+# Class for a single mesh element, e.g. one polygon
+class element:
+    def __init__(self, arrays, index):
+        object.__setattr__(self, 'arrays', arrays);
+        object.__setattr__(self, 'index', index);
+
+    def __getattr__(self, name):
+        return(self.arrays.fields[name][self.index]);
+
+    def __setattr__(self, name, value):
+        self.arrays.fields[name][self.index] = value;
+
+
+# Class for the UV maps of a mesh (mesh.uv_textures), whose per-loop
+# coordinates are kept in mesh.uv_layers
+class uvTextureCollection(list):
+    def __init__(self, theMesh):
+        list.__init__(self);
+        self.mesh = theMesh;
+
+    def new(self, name='UVMap'):
+        layer = types.SimpleNamespace(name=name, data=elementArrays({'uv': ((2,), numpy.float32)}));
+        layer.data.add(len(self.mesh.loops));
+        self.mesh.uv_layers.append(layer);
+        self.append(types.SimpleNamespace(name=name));
+        return(self[-1]);
+
+
+class Mesh(ID):
+    def __init__(self, name):
+        ID.__init__(self, name);
+        self.materials = [];
+        self.vertices  = elementArrays({'co': ((3,), numpy.float32)});
+        self.edges     = elementArrays({'vertices': ((2,), numpy.int32)});
+        self.loops     = elementArrays({'vertex_index': ((), numpy.int32)});
+        self.polygons  = elementArrays({'loop_start': ((), numpy.int32), 'loop_total': ((), numpy.int32),
+                                        'use_smooth': ((), bool), 'material_index': ((), numpy.int16)});
+        self.uv_layers   = [];
+        self.uv_textures = uvTextureCollection(self);
+        self.show_normal_face = False;
+
+    def from_pydata(self, vertices, edges, faces):
+        self.vertices.add(len(vertices));
+        self.vertices.foreach_set('co', numpy.array(vertices, dtype=numpy.float32));
+        faceSizes = [len(face) for face in faces];
+        self.loops.add(sum(faceSizes));
+        self.loops.foreach_set('vertex_index', numpy.array([index for face in faces for index in face], dtype=numpy.int32));
+        self.polygons.add(len(faces));
+        self.polygons.foreach_set('loop_start', numpy.cumsum([0]+faceSizes)[:-1]);
+        self.polygons.foreach_set('loop_total', faceSizes);
+        self.update(calc_edges=True);
+
+    def update(self, calc_edges=False):
+        if not calc_edges:
+            return;
+        # one edge per pair of consecutive face vertices, as Blender does
+        loopVertexIndices = self.loops.fields['vertex_index'];
+        loopStart = self.polygons.fields['loop_start'];
+        loopTotal = self.polygons.fields['loop_total'];
+        nextLoop = numpy.arange(1, loopVertexIndices.size+1);
+        nextLoop[loopStart+loopTotal-1] = loopStart;
+        pairs = numpy.sort(numpy.column_stack((loopVertexIndices, loopVertexIndices[nextLoop])), axis=1);
+        pairs = numpy.unique(pairs[:, 0].astype(numpy.int64)*max(len(self.vertices), 1) + pairs[:, 1]);
+        self.edges = elementArrays({'vertices': ((2,), numpy.int32)});
+        self.edges.add(pairs.size);
+        self.edges.foreach_set('vertices', numpy.column_stack((pairs // max(len(self.vertices), 1), pairs % max(len(self.vertices), 1))));
+
+    def validate(self, verbose=False):
+        return(False);
+
+    def copy(self):
+        theCopy = data.meshes.new(self.name);
+        theCopy.materials = list(self.materials);
+        for name in ('vertices', 'edges', 'loops', 'polygons'):
+            arrays = getattr(theCopy, name);
+            arrays.add(len(getattr(self, name)));
+            for field, values in getattr(self, name).fields.items():
+                arrays.fields[field][...] = values;
+        for layer in self.uv_layers:
+            theCopy.uv_textures.new(layer.name);
+            theCopy.uv_layers[-1].data.fields['uv'][...] = layer.data.fields['uv'];
+        theCopy.properties.update(self.properties);
+        return(theCopy);
+
+
+class Object(ID):
+    def __init__(self, name, objectData=None):
+        ID.__init__(self, name);
+        self.data           = objectData;
+        self.location       = [0.0, 0.0, 0.0];
+        self.rotation_euler = [0.0, 0.0, 0.0];
+        self.scale          = [1.0, 1.0, 1.0];
+        self.show_name      = False;
+        self.hide           = False;
+        self.hide_render    = False;
+        self.select         = False;
+        self.modifiers      = modifierCollection();
+        self.slots          = [];
+        if isinstance(objectData, Mesh):
+            self.type = 'MESH';
+        elif isinstance(objectData, Lamp):
+            self.type = 'LAMP';
+        else:
+            self.type = 'CAMERA';
+
+    # one slot per mesh material, linked to the mesh unless set to 'OBJECT'
+    @property
+    def material_slots(self):
+        materials = getattr(self.data, 'materials', []);
+        while len(self.slots) < len(materials):
+            self.slots.append(materialSlot(self, len(self.slots)));
+        return(self.slots[0:len(materials)]);
+
+
+# Class for the modifiers of an object; applying them (an operator) does nothing
+class modifierCollection(list):
+    def new(self, name, type):
+        modifier = types.SimpleNamespace(name=name, type=type, object=None, operation=None);
+        self.append(modifier);
+        return(modifier);
+
+
+class materialSlot:
+    def __init__(self, theObject, index):
+        self.object         = theObject;
+        self.index          = index;
+        self.link           = 'DATA';
+        self.objectMaterial = None;
+
+    @property
+    def material(self):
+        if self.link == 'OBJECT':
+            return(self.objectMaterial);
+        return(self.object.data.materials[self.index]);
+
+    @material.setter
+    def material(self, material):
+        if self.link == 'OBJECT':
+            self.objectMaterial = material;
+        else:
+            self.object.data.materials[self.index] = material;
+
+
+# Class for the texture slots of a material
+class textureSlots(list):
+    def add(self):
+        self.append(types.SimpleNamespace(texture=None, texture_coords='ORCO', use_map_color_diffuse=True,
+                                          use_map_normal=False, normal_factor=1.0));
+        return(self[-1]);
+
+
+class Material(ID):
+    def __init__(self, name):
+        ID.__init__(self, name);
+        self.texture_slots = textureSlots();
+
+
+class Texture(ID):
+    def __init__(self, name, type):
+        ID.__init__(self, name);
+        self.type  = type;
+        self.image = None;
+
+
+class Image(ID):
+    def __init__(self, name):
+        ID.__init__(self, name);
+        self.filepath = '';
+        self.colorspace_settings = types.SimpleNamespace(name='sRGB');
+
+
+class Lamp(ID):
+    def __init__(self, name, type):
+        ID.__init__(self, name);
+        self.type   = type;
+        self.size   = 1;
+        self.size_y = 1;
+
+
+class Camera(ID):
+    def __init__(self, name):
+        ID.__init__(self, name);
+        self.sensor_width  = 32;
+        self.sensor_height = 18;
+
+
+# Class for the objects linked to a scene
+class sceneObjects:
+    def __init__(self):
+        self.objects = {};
+        self.active  = None;
+
+    def link(self, theObject):
+        self.objects[id(theObject)] = theObject;
+
+    def unlink(self, theObject):
+        del self.objects[id(theObject)];
+
+    def __contains__(self, key):
+        if isinstance(key, str):
+            return((key in data.objects) and (id(data.objects[key]) in self.objects));
+        return(id(key) in self.objects);
+
+    def __iter__(self):
+        return(iter(list(self.objects.values())));
+
+    def __len__(self):
+        return(len(self.objects));
+
+
+# Operators do nothing, except for the collada export which writes an empty document
+def noOperator(*args, **kwargs):
+    return({'FINISHED'});
+
+def colladaExport(filepath, **kwargs):
+    with open(filepath, 'w') as fileHandle:
+        fileHandle.write('<?xml version="1.0" encoding="utf-8"?>\n<COLLADA version="1.4.1"/>\n');
+    return({'FINISHED'});
+
+modeSet = types.SimpleNamespace(poll=lambda: False);
+ops = types.SimpleNamespace(
+    object = types.SimpleNamespace(mode_set=modeSet, select_all=noOperator, modifier_add=noOperator, modifier_apply=noOperator),
+    mesh   = types.SimpleNamespace(),
+    wm     = types.SimpleNamespace(collada_export=colladaExport, open_mainfile=noOperator, save_as_mainfile=noOperator),
+);
+
+
+# Method to empty the stand-in Blender data, e.g. between benchmark runs
+def resetData():
+    global data, context;
+    render = types.SimpleNamespace(resolution_x=0, resolution_y=0, resolution_percentage=100,
+                                   use_antialiasing=False, use_full_sample=False, engine='BLENDER_RENDER',
+                                   image_settings=types.SimpleNamespace());
+    scene = types.SimpleNamespace(name='Scene', objects=sceneObjects(), render=render,
+                                  unit_settings=types.SimpleNamespace(), tool_settings=types.SimpleNamespace(),
+                                  cycles=types.SimpleNamespace());
+    data = types.SimpleNamespace(
+        objects   = dataCollection(Object),
+        meshes    = dataCollection(Mesh),
+        materials = dataCollection(Material),
+        lamps     = dataCollection(Lamp),
+        cameras   = dataCollection(Camera),
+        textures  = dataCollection(Texture),
+        images    = dataCollection(Image),
+        curves    = dataCollection(ID),
+        scenes    = [scene],
+        worlds    = [types.SimpleNamespace()],
+        screens   = [],
+    );
+    context = types.SimpleNamespace(scene=scene, screen=types.SimpleNamespace(scene=scene), object=None, active_object=None);
+
+resetData();
@@ -0,0 +1,54 @@
+# Lightweight stand-in for the parts of Blender's mathutils module that are
+# used by SceneUtilsV1 (see bpy.py in this folder).
+
+import math
+
+
+# Helper method to make a named property for one vector component
+def componentProperty(index):
+    return(property(lambda self: self[index], lambda self, value: self.__setitem__(index, float(value))));
+
+
+class Vector(list):
+    def __init__(self, components=(0.0, 0.0, 0.0)):
+        list.__init__(self, [float(component) for component in components]);
+
+    x = componentProperty(0);
+    y = componentProperty(1);
+    z = componentProperty(2);
+
+    def __add__(self, other):
+        return(Vector([a+b for a, b in zip(self, other)]));
+
+    def __sub__(self, other):
+        return(Vector([a-b for a, b in zip(self, other)]));
+
+    def __mul__(self, scalar):
+        return(Vector([a*scalar for a in self]));
+
+    __rmul__ = __mul__;
+
+    def __neg__(self):
+        return(Vector([-a for a in self]));
+
+    @property
+    def length(self):
+        return(math.sqrt(sum([a*a for a in self])));
+
+    def normalized(self):
+        length = self.length;
+        if length == 0:
+            return(self.copy());
+        return(Vector([a/length for a in self]));
+
+    def copy(self):
+        return(Vector(self));
+
+
+class Euler(Vector):
+    def __init__(self, angles=(0.0, 0.0, 0.0), order='XYZ'):
+        Vector.__init__(self, angles);
+        self.order = order;
+
+    def copy(self):
+        return(Euler(self, self.order));
@@ -0,0 +1,497 @@
+# Benchmarks for the scene building hot paths of SceneUtilsV1, runnable in
+# plain CPython (with NumPy) against the bpy/mathutils stand-ins in BlenderStub.
+#
+# Usage:
+#   python runSceneUtilsBenchmarks.py                    compare against the baselines
+#   python runSceneUtilsBenchmarks.py --update-baselines  record new baselines
+#   python runSceneUtilsBenchmarks.py --filter addRoom    run matching benchmarks only
+#
+# Each benchmark records its best wall time over --repeats runs and its peak
+# traced memory (tracemalloc, in a separate run). The script exits with status
+# 1 when a tracked benchmark is slower than its baseline by more than
+# --threshold, or uses more memory by more than --memory-threshold (relative).
+# Peak memory is nearly deterministic, times are not, and depend on the
+# machine: baselines should be recorded on the machine that checks against them.
+#
+# Before the benchmarks, behavior checks make sure that the optimized code
+# paths build the same scenes as the ones they replace; after them, the
+# comparisons make sure that they are still faster and leaner. The script
+# also exits with status 1 when one of them fails.
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+benchmarksFolder = os.path.dirname(os.path.abspath(__file__));
+# the stand-ins must shadow any real bpy
+sys.path.insert(0, os.path.dirname(benchmarksFolder));
+sys.path.insert(0, os.path.join(benchmarksFolder, 'BlenderStub'));
+
+import bpy
+import mathutils
+import numpy
+
+import SceneGraphV1
+import SceneUtilsV1
+import TiledElevationMapUtils
+
+
+defaultBaselinesFile = os.path.join(benchmarksFolder, 'sceneUtilsBaselines.json');
+
+# Differences below these are treated as noise, whatever the relative change
+minSecondsDifference = 0.005;
+minBytesDifference   = 256*1024;
+
+
+# Helper method to get a scene manager for an empty stand-in scene
+def newSceneManager(extraParams=None):
+    bpy.resetData();
+    params = {
+        'name'                : 'Benchmark',
+        'erasePreviousScene'  : True,
+        'sceneWidthInPixels'  : 640,
+        'sceneHeightInPixels' : 480,
+        'verbosity'           : 0,
+    };
+    params.update(extraParams or {});
+    return(SceneUtilsV1.sceneManager(params));
+
+
+# Helper method to get the params of an elevation map object
+def elevationMapParams(scene, binsNum, meshBuildMethod):
+    return({
+        'name'            : 'elevationMap',
+        'xBinsNum'        : binsNum,
+        'yBinsNum'        : binsNum,
+        'elevationMap'    : SceneUtilsV1.ElevationMapUtils.generateRandomSurfaceMap(binsNum, binsNum, {'seed': 1}),
+        'location'        : mathutils.Vector((0, 0, 0)),
+        'scale'           : mathutils.Vector((1, 1, 1)),
+        'rotation'        : mathutils.Vector((0, 0, 0)),
+        'material'        : scene.transparentMaterial,
+        'meshBuildMethod' : meshBuildMethod,
+    });
+
+
+# Helper method to get the params of a room with walls of a given thickness
+def roomParams(scene, roomIndex):
+    params = {
+        'roomLocation'  : mathutils.Vector((20*roomIndex, 0, 0)),
+        'roomWidth'     : 10,
+        'roomDepth'     : 8,
+        'roomHeight'    : 4,
+        'wallThickness' : 0.1,
+    };
+    for surface in ('floor', 'backWall', 'leftWall', 'rightWall', 'frontWall', 'ceiling'):
+        params['{}Name'.format(surface)] = 'room{:03d}-{}'.format(roomIndex, surface);
+        params['{}MaterialType'.format(surface)] = scene.transparentMaterial;
+    return(params);
+
+
+# Benchmarks. Each setup(size) returns the state passed to run(state); only run is measured.
+def setupNothing(size):
+    return(size);
+
+def runRandomSurfaceMap(size):
+    SceneUtilsV1.createRandomSurfaceMap(size, size, {'seed': 1});
+
+def runGaussianBlobsMap(size):
+    SceneUtilsV1.createRandomGaussianBlobsMap(size, size, {'seed': 1});
+
+def runTiledGaussianBlobsMap(size):
+    theMap = TiledElevationMapUtils.generateTiledGaussianBlobsMap(size, size, {'seed': 1});
+    theMap.close();
+
+def setupElevationMapTiled(size):
+    scene = newSceneManager();
+    params = elevationMapParams(scene, size, 'arrays');
+    params['elevationMap'] = TiledElevationMapUtils.generateTiledRandomSurfaceMap(size, size, {'seed': 1});
+    return(scene, params);
+
+def setupElevationMapArrays(size):
+    scene = newSceneManager();
+    return(scene, elevationMapParams(scene, size, 'arrays'));
+
+def setupElevationMapPydata(size):
+    scene = newSceneManager();
+    params = elevationMapParams(scene, size, 'pydata');
+    # from_pydata expects nested lists, as returned by createRandomSurfaceMap
+    params['elevationMap'] = params['elevationMap'].tolist();
+    return(scene, params);
+
+def setupElevationMapAdaptive(size):
+    scene = newSceneManager();
+    params = elevationMapParams(scene, size, 'adaptive');
+    params['maxError'] = 0.01;
+    return(scene, params);
+
+def setupElevationMapTexture(size):
+    scene = newSceneManager();
+    params = elevationMapParams(scene, size, 'arrays');
+    params['elevationTexture'] = {'folder': tempfile.mkdtemp(prefix='rtbElevationTexture'), 'baseResolution': 32};
+    return(scene, params);
+
+def runElevationMapTexture(state):
+    scene, params = state;
+    scene.addElevationMapObject(params);
+    shutil.rmtree(params['elevationTexture']['folder']);
+
+def runElevationMap(state):
+    scene, params = state;
+    scene.addElevationMapObject(params);
+
+def runTiledElevationMap(state):
+    scene, params = state;
+    scene.addElevationMapObject(params);
+    # the mesh holds its own copy, the temporary map file can go
+    params['elevationMap'].close();
+
+def setupRooms(size):
+    scene = newSceneManager();
+    return(scene, [roomParams(scene, roomIndex) for roomIndex in range(0, size)]);
+
+def runRooms(state):
+    scene, rooms = state;
+    for params in rooms:
+        scene.addRoom(params);
+
+def setupFloorplan(size):
+    scene = newSceneManager();
+    # as many rooms as addRoom builds, side by side on a square grid
+    columnsNum = int(math.ceil(math.sqrt(size)));
+    roomGrid = -numpy.ones((int(math.ceil(size/float(columnsNum))), columnsNum), dtype=int);
+    roomGrid.reshape(-1)[0:size] = numpy.arange(0, size);
+    return(scene, {
+        'name'          : 'floorplan',
+        'rooms'         : [roomParams(scene, roomIndex) for roomIndex in range(0, size)],
+        'roomGrid'      : roomGrid,
+        'cellSize'      : 8,
+        'roomHeight'    : 4,
+        'wallThickness' : 0.2,
+    });
+
+def runFloorplan(state):
+    scene, params = state;
+    scene.addFloorplan(params);
+
+def setupWallOpenings(size):
+    scene = newSceneManager();
+    scene.addRoom(roomParams(scene, 0));
+    # a grid of windows through the back wall (10 x 4, inner side at y = 3.8)
+    columnsNum = int(math.ceil(math.sqrt(size)));
+    windows = [];
+    for index in range(0, size):
+        windows.append(scene.addCube({
+            'name'     : 'window{:03d}'.format(index),
+            'scaling'  : mathutils.Vector((2.5/columnsNum, 1.0/columnsNum, 0.3)),
+            'rotation' : mathutils.Vector((math.pi/2, 0, 0)),
+            'location' : mathutils.Vector((-4.5+9.0*(index % columnsNum + 0.5)/columnsNum, 3.9, 0.2+3.6*(index // columnsNum + 0.5)/columnsNum)),
+            'material' : scene.transparentMaterial,
+        }));
+    return(scene, bpy.data.objects['room000-backWall'], windows);
+
+def runWallOpenings(state):
+    scene, wall, windows = state;
+    scene.boreOutBatch(wall, windows, True);
+
+def setupCameraRig(size):
+    scene = newSceneManager();
+    cameraType = scene.generateCameraType({'fieldOfViewInDegrees': 40, 'clipRange': (0.1, 100), 'drawSize': 1});
+    return(scene, cameraType, size);
+
+def runCameraRig(state):
+    scene, cameraType, size = state;
+    rig = SceneUtilsV1.CameraRigUtils.sphereRig((0, 0, 0), 5, size);
+    scene.addCameraRig({'rig': rig, 'cameraType': cameraType});
+
+def setupSpectralMaterials(size):
+    spectrumFolder = tempfile.mkdtemp(prefix='rtbSpectra');
+    scene = newSceneManager({'spectrumFolder': spectrumFolder});
+    # one material per size, with one of 10 gray reflectance spectra (1nm steps, as the example .spd files)
+    wavelengths = numpy.arange(380, 781);
+    materials = [];
+    for index in range(0, size):
+        materials.append({
+            'name'               : 'material{:04d}'.format(index),
+            'diffuse_shader'     : 'LAMBERT',
+            'diffuse_intensity'  : 1.0,
+            'diffuse_spectrum'   : (wavelengths, numpy.full(wavelengths.size, 0.1*(index % 10 + 0.5))),
+            'specular_shader'    : 'WARDISO',
+            'specular_intensity' : 0.0,
+            'specular_color'     : mathutils.Vector((0.0, 0.0, 0.0)),
+            'alpha'              : 1.0,
+            'reuseExisting'      : False,
+        });
+    return(scene, materials, spectrumFolder);
+
+def runSpectralMaterials(state):
+    scene, materials, spectrumFolder = state;
+    for params in materials:
+        scene.generateMaterialType(params);
+    # (10 files at most, so removing them barely adds to the time)
+    shutil.rmtree(spectrumFolder);
+
+# Helper method to get a room with space for about 4 times as many dice as are scattered
+def scatterRoom(size):
+    side = math.sqrt(4*size)*0.25;
+    return({'roomLocation': mathutils.Vector((0, 0, 0)), 'roomWidth': side, 'roomDepth': side, 'roomHeight': 2, 'wallThickness': 0.05});
+
+def setupScatter(size):
+    return(newSceneManager(), scatterRoom(size), size);
+
+# the same scatter with the Blender-free backend
+def setupScatterSceneGraph(size):
+    scene = SceneGraphV1.sceneManager({'name': 'Benchmark', 'sceneWidthInPixels': 640, 'sceneHeightInPixels': 480, 'verbosity': 0});
+    return(scene, scatterRoom(size), size);
+
+def runScatter(state):
+    scene, room, size = state;
+    scene.scatterObjects({
+        'namePrefix' : 'die',
+        'materials'  : scene.transparentMaterial,
+        'type'       : 'cube',
+        'count'      : size,
+        'scaling'    : (0.05, 0.05, 0.05),
+        'scaleRange' : (0.5, 1.0),
+        'rotateZ'    : True,
+        'room'       : room,
+        'minSpacing' : 0.01,
+        'seed'       : 1,
+    });
+
+def setupPopulatedScene(size):
+    scene = newSceneManager();
+    scene.addPrimitivesBatch({
+        'type'       : 'cube',
+        'namePrefix' : 'cube',
+        'locations'  : numpy.random.RandomState(1).uniform(-10, 10, (size, 3)),
+        'materials'  : scene.transparentMaterial,
+        'sharedMesh' : False,
+    });
+    return(scene);
+
+def runErasePreviousContents(scene):
+    scene.erasePreviousContents();
+
+benchmarks = [
+    # (name, setup, run, sizes)
+    ('createRandomSurfaceMap',            setupNothing,            runRandomSurfaceMap,      (64, 256, 1024)),
+    ('createRandomGaussianBlobsMap',      setupNothing,            runGaussianBlobsMap,      (64, 256, 1024)),
+    ('createTiledGaussianBlobsMap',       setupNothing,            runTiledGaussianBlobsMap, (256, 1024, 2048)),
+    ('addElevationMapObject-foreach_set', setupElevationMapArrays, runElevationMap,          (64, 256, 512)),
+    ('addElevationMapObject-tiled',       setupElevationMapTiled,  runTiledElevationMap,     (64, 256, 512)),
+    ('addElevationMapObject-from_pydata', setupElevationMapPydata, runElevationMap,          (64, 256, 512)),
+    ('addElevationMapObject-adaptive',    setupElevationMapAdaptive, runElevationMap,        (64, 256, 512)),
+    ('addElevationMapObject-texture',     setupElevationMapTexture, runElevationMapTexture,  (64, 256, 512)),
+    ('addRoom',                           setupRooms,              runRooms,                 (1, 10, 100)),
+    ('addFloorplan',                      setupFloorplan,          runFloorplan,             (1, 10, 100)),
+    ('boreOutBatch-slab',                 setupWallOpenings,       runWallOpenings,          (10, 50, 200)),
+    ('addCameraRig',                      setupCameraRig,          runCameraRig,             (10, 100, 1000)),
+    ('generateMaterialType-spectra',      setupSpectralMaterials,  runSpectralMaterials,     (10, 100, 1000)),
+    ('scatterObjects',                    setupScatter,            runScatter,               (100, 1000, 10000)),
+    ('scatterObjects-SceneGraphV1',       setupScatterSceneGraph,  runScatter,               (100, 1000, 10000)),
+    ('erasePreviousContents',             setupPopulatedScene,     runErasePreviousContents, (100, 1000, 10000)),
+];
+
+
+# Checks of the behavior of the benchmarked code. Each raises an
+# AssertionError with a message when it fails.
+
+# Helper method to get the arrays of a stand-in mesh that from_pydata and
+# foreach_set fill
+def meshFields(theMesh):
+    return({
+        'co'           : theMesh.vertices.fields['co'],
+        'vertex_index' : theMesh.loops.fields['vertex_index'],
+        'loop_start'   : theMesh.polygons.fields['loop_start'],
+        'loop_total'   : theMesh.polygons.fields['loop_total'],
+        'use_smooth'   : theMesh.polygons.fields['use_smooth'],
+    });
+
+# the foreach_set path of addElevationMapObject builds the same mesh as from_pydata,
+# for array and list of lists maps (not square, so that swapped axes show)
+def checkElevationMapMeshModes():
+    xBinsNum, yBinsNum = 24, 17;
+    elevation = SceneUtilsV1.ElevationMapUtils.generateRandomSurfaceMap(xBinsNum, yBinsNum, {'seed': 1});
+    for inputKind, elevationMap in (('array', elevation), ('list of lists', elevation.tolist())):
+        meshes = {};
+        for meshBuildMethod in ('arrays', 'pydata'):
+            scene = newSceneManager();
+            params = elevationMapParams(scene, xBinsNum, meshBuildMethod);
+            params['yBinsNum']     = yBinsNum;
+            params['elevationMap'] = elevationMap;
+            meshes[meshBuildMethod] = meshFields(scene.addElevationMapObject(params).data);
+        for name, expected in meshes['pydata'].items():
+            value = meshes['arrays'][name];
+            if name == 'co':
+                same = (value.shape == expected.shape) and numpy.allclose(value, expected, rtol=0, atol=1e-6);
+            else:
+                same = numpy.array_equal(value, expected);
+            if not same:
+                raise AssertionError('addElevationMapObject: mesh {} differs between foreach_set and from_pydata ({} input)'.format(name, inputKind));
+
+checks = [
+    # (name, check)
+    ('addElevationMapObject-foreach_set', checkElevationMapMeshModes),
+];
+
+# Pairs of benchmarks where the first must take less time and less peak
+# memory than the second, at each size both were run at
+comparisons = [
+    ('addElevationMapObject-foreach_set', 'addElevationMapObject-from_pydata'),
+];
+
+
+# Method to run the checks whose names contain nameFilter. Returns a list of failure messages.
+def runChecks(nameFilter):
+    failures = [];
+    for name, check in checks:
+        if nameFilter not in name:
+            continue;
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                check();
+        except AssertionError as error:
+            failures.append(str(error));
+    return(failures);
+
+
+# Method to compare benchmarks that must beat others. Returns a list of failure messages.
+def findComparisonFailures(results):
+    failures = [];
+    for name, referenceName in comparisons:
+        for benchmarkName in sorted(results):
+            if not benchmarkName.startswith(name + '/'):
+                continue;
+            referenceBenchmarkName = referenceName + benchmarkName[len(name):];
+            if referenceBenchmarkName not in results:
+                continue;
+            for metric in ('seconds', 'peakBytes'):
+                if results[benchmarkName][metric] >= results[referenceBenchmarkName][metric]:
+                    failures.append('{}: {} {:.4g} is not below the {:.4g} of {}'.format(
+                        benchmarkName, metric, results[benchmarkName][metric], results[referenceBenchmarkName][metric], referenceBenchmarkName));
+    return(failures);
+
+
+# Method to measure one benchmark at one size. Returns the best time over
+# repeats runs and the peak memory allocated during one more, traced, run.
+def measureBenchmark(setup, run, size, repeats):
+    bestSeconds = None;
+    for repeat in range(0, repeats):
+        state = setup(size);
+        # as timeit does, keep the garbage collector out of the timings
+        gc.collect();
+        gc.disable();
+        try:
+            startTime = time.perf_counter();
+            run(state);
+            elapsedTime = time.perf_counter() - startTime;
+        finally:
+            gc.enable();
+        if (bestSeconds is None) or (elapsedTime < bestSeconds):
+            bestSeconds = elapsedTime;
+
+    state = setup(size);
+    gc.collect();
+    tracemalloc.start();
+    run(state);
+    currentBytes, peakBytes = tracemalloc.get_traced_memory();
+    tracemalloc.stop();
+    return({'seconds': bestSeconds, 'peakBytes': peakBytes});
+
+
+# Method to compare results with baselines. Returns a list of regression messages.
+def findRegressions(results, baselines, timeThreshold, memoryThreshold):
+    regressions = [];
+    for name in sorted(results):
+        if name not in baselines:
+            continue;
+        for metric, threshold, minDifference in (('seconds', timeThreshold, minSecondsDifference), ('peakBytes', memoryThreshold, minBytesDifference)):
+            value    = results[name][metric];
+            baseline = baselines[name][metric];
+            if (value > baseline*(1+threshold)) and (value-baseline > minDifference):
+                regressions.append('{}: {} went from {:.4g} to {:.4g} (+{:.0f}%)'.format(
+                    name, metric, baseline, value, 100*(value-baseline)/max(baseline, 1e-12)));
+    return(regressions);
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark the SceneUtilsV1 scene building hot paths.');
+    parser.add_argument('--baselines', default=defaultBaselinesFile, help='baselines JSON file');
+    parser.add_argument('--update-baselines', action='store_true', help='record the results as the new baselines');
+    parser.add_argument('--threshold', type=float, default=0.5, help='allowed relative time regression (default 0.5)');
+    parser.add_argument('--memory-threshold', type=float, default=0.1, help='allowed relative peak memory regression (default 0.1)');
+    parser.add_argument('--repeats', type=int, default=5, help='timed runs per benchmark (default 5)');
+    parser.add_argument('--filter', default='', help='run only benchmarks whose name contains this string');
+    parser.add_argument('--output', help='also write the results to this JSON file');
+    arguments = parser.parse_args(arguments);
+
+    failures = runChecks(arguments.filter);
+    for failure in failures:
+        print('CHECK FAILED {}'.format(failure));
+
+    results = {};
+    for name, setup, run, sizes in benchmarks:
+        if arguments.filter not in name:
+            continue;
+        for size in sizes:
+            benchmarkName = '{}/{}'.format(name, size);
+            # the scene utilities print progress messages
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[benchmarkName] = measureBenchmark(setup, run, size, arguments.repeats);
+            print('{:<48} {:>10.4f} s {:>10.1f} MiB'.format(benchmarkName, results[benchmarkName]['seconds'], results[benchmarkName]['peakBytes']/1024.0**2));
+
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as fileHandle:
+            json.dump(results, fileHandle, indent=2, sort_keys=True);
+
+    comparisonFailures = findComparisonFailures(results);
+    for failure in comparisonFailures:
+        print('COMPARISON FAILED {}'.format(failure));
+    failures += comparisonFailures;
+    if len(failures) > 0:
+        # baselines are not recorded, nor compared with, for failing code
+        return(1);
+
+    if arguments.update_baselines:
+        baselines = {'benchmarks': {}};
+        if os.path.isfile(arguments.baselines):
+            with open(arguments.baselines, 'r') as fileHandle:
+                baselines = json.load(fileHandle);
+        baselines['benchmarks'].update(results);
+        baselines['environment'] = {
+            'python'   : platform.python_version(),
+            'numpy'    : numpy.__version__,
+            'machine'  : platform.machine(),
+            'platform' : platform.platform(),
+        };
+        with open(arguments.baselines, 'w') as fileHandle:
+            json.dump(baselines, fileHandle, indent=2, sort_keys=True);
+        print('Updated baselines in "{}"'.format(arguments.baselines));
+        return(0);
+
+    if not os.path.isfile(arguments.baselines):
+        print('No baselines in "{}": run with --update-baselines first'.format(arguments.baselines));
+        return(0);
+    with open(arguments.baselines, 'r') as fileHandle:
+        baselines = json.load(fileHandle)['benchmarks'];
+    regressions = findRegressions(results, baselines, arguments.threshold, arguments.memory_threshold);
+    for regression in regressions:
+        print('REGRESSION {}'.format(regression));
+    if len(regressions) > 0:
+        return(1);
+    print('No regressions beyond {:.0f}% (time) and {:.0f}% (memory) of the baselines'.format(100*arguments.threshold, 100*arguments.memory_threshold));
+    return(0);
+
+
+if __name__ == '__main__':
+    sys.exit(main());
@@ -0,0 +1,156 @@
+# Blender-free helpers for camera rigs: many camera poses (flythrough paths,
+# light-field spheres and grids) computed at once with NumPy, and exported in
+# one pass, either as one camera object per pose in a single scene file, or
+# as one scene file plus a conditions file with one camera pose per row.
+#
+# A rig is a dictionary of (N,3) arrays: 'positions', 'targets' and
+# 'rotations' (Euler XYZ angles, in radians, as set by pointObjectToTarget).
+# Cameras look at their targets with the z axis up, without roll.
+
+import math
+import os
+
+import numpy
+
+import ConditionsUtils
+
+
+# Method to compute the Euler rotations (XYZ, radians) that point cameras at
+# positions towards targets, as SceneUtilsV1.pointObjectToTarget does for one object
+def lookAtRotations(positions, targets):
+    directions = numpy.asarray(targets, dtype=numpy.float64).reshape((-1, 3)) - numpy.asarray(positions, dtype=numpy.float64).reshape((-1, 3));
+    rotations = numpy.zeros(directions.shape);
+    rotations[:, 0] = numpy.arctan2(directions[:, 2], numpy.hypot(directions[:, 0], directions[:, 1])) + math.pi/2;
+    rotations[:, 2] = numpy.arctan2(directions[:, 1], directions[:, 0]) - math.pi/2;
+    return(rotations);
+
+
+# Method to make a rig of cameras at positions looking at targets. A single
+# target is shared by all cameras.
+def cameraRig(positions, targets):
+    positions = numpy.asarray(positions, dtype=numpy.float64).reshape((-1, 3));
+    targets   = numpy.asarray(targets, dtype=numpy.float64).reshape((-1, 3));
+    targets   = numpy.broadcast_to(targets, positions.shape).copy();
+    return({
+        'positions' : positions,
+        'targets'   : targets,
+        'rotations' : lookAtRotations(positions, targets),
+    });
+
+
+# Method to interpolate (K,3) waypoints at framesNum frames, spread evenly
+# over the waypoints (as Matlab's spline over linspace frames, in rtbMakeFlythrough).
+# With smooth set, the path is a Catmull-Rom spline through the waypoints,
+# otherwise it is made of straight segments.
+def interpolateWaypoints(waypoints, framesNum, smooth=True):
+    waypoints = numpy.asarray(waypoints, dtype=numpy.float64).reshape((-1, 3));
+    if waypoints.shape[0] == 1:
+        return(numpy.repeat(waypoints, framesNum, axis=0));
+    frames = numpy.linspace(0, waypoints.shape[0]-1, framesNum);
+    segments = numpy.minimum(numpy.floor(frames).astype(int), waypoints.shape[0]-2);
+    t = (frames - segments)[:, numpy.newaxis];
+    p1 = waypoints[segments];
+    p2 = waypoints[segments+1];
+    if not smooth:
+        return(p1 + t*(p2 - p1));
+    # end tangents from waypoints mirrored about the ends
+    padded = numpy.concatenate(([2*waypoints[0]-waypoints[1]], waypoints, [2*waypoints[-1]-waypoints[-2]]));
+    p0 = padded[segments];
+    p3 = padded[segments+3];
+    return(0.5*((2*p1) + (p2 - p0)*t + (2*p0 - 5*p1 + 4*p2 - p3)*t**2 + (3*p1 - p0 - 3*p2 + p3)*t**3));
+
+
+# Method to make a rig that follows a path: camera positions and targets are
+# both interpolated from waypoints (see interpolateWaypoints). A single
+# target waypoint is a fixed target.
+def pathRig(positionWaypoints, targetWaypoints, framesNum, smooth=True):
+    positions = interpolateWaypoints(positionWaypoints, framesNum, smooth);
+    targets   = interpolateWaypoints(targetWaypoints, framesNum, smooth);
+    return(cameraRig(positions, targets));
+
+
+# Method to make a rig of camerasNum cameras spread evenly over a sphere (on a
+# Fibonacci lattice), all looking at its center. With hemisphere set, only
+# the upper half (z >= center) is covered.
+def sphereRig(center, radius, camerasNum, hemisphere=False):
+    center = numpy.asarray(center, dtype=numpy.float64).reshape(3);
+    indices = numpy.arange(camerasNum) + 0.5;
+    if hemisphere:
+        z = 1 - indices/camerasNum;
+    else:
+        z = 1 - 2*indices/camerasNum;
+    azimuths = math.pi*(3 - math.sqrt(5))*indices;
+    ringRadii = numpy.sqrt(1 - z*z);
+    directions = numpy.column_stack((ringRadii*numpy.cos(azimuths), ringRadii*numpy.sin(azimuths), z));
+    return(cameraRig(center + radius*directions, center));
+
+
+# Method to make a rig of columnsNum x rowsNum cameras on a planar grid
+# centered on center, with the given spacing, all looking along viewDirection
+# (e.g. a light field camera array). Rows are stacked along the up direction
+# (z, or y for cameras looking up or down), from bottom to top.
+def gridRig(center, viewDirection, columnsNum, rowsNum, spacing):
+    center = numpy.asarray(center, dtype=numpy.float64).reshape(3);
+    viewDirection = numpy.asarray(viewDirection, dtype=numpy.float64).reshape(3);
+    viewDirection = viewDirection/numpy.linalg.norm(viewDirection);
+    up = numpy.array([0.0, 0.0, 1.0]);
+    if abs(numpy.dot(up, viewDirection)) > 1 - 1e-9:
+        up = numpy.array([0.0, 1.0, 0.0]);
+    right = numpy.cross(viewDirection, up);
+    right = right/numpy.linalg.norm(right);
+    up = numpy.cross(right, viewDirection);
+
+    columns, rows = numpy.meshgrid(numpy.arange(columnsNum) - (columnsNum-1)/2.0, numpy.arange(rowsNum) - (rowsNum-1)/2.0);
+    positions = center + spacing*(columns.reshape((-1, 1))*right + rows.reshape((-1, 1))*up);
+    return(cameraRig(positions, positions + viewDirection));
+
+
+# Helper method to get the names of the cameras (or frames) of a rig
+def rigNames(rig, namePrefix):
+    return(['{}-{:04d}'.format(namePrefix, index+1) for index in range(0, rig['positions'].shape[0])]);
+
+
+# Method to write the camera poses of a rig as a conditions file, with one row
+# per frame: imageName, cameraPosition, cameraTarget, cameraUp and
+# cameraRotation (Euler XYZ, radians), the variables used by rtbMakeFlythrough.
+def writeCameraTable(conditionsFile, rig, namePrefix='camera'):
+    names = ['imageName', 'cameraPosition', 'cameraTarget', 'cameraUp', 'cameraRotation'];
+    up = (0, 0, 1);
+    rows = [[imageName, position, target, up, rotation] for imageName, position, target, rotation
+            in zip(rigNames(rig, namePrefix), rig['positions'], rig['targets'], rig['rotations'])];
+    return(ConditionsUtils.writeConditionsFile(conditionsFile, names, rows));
+
+
+# Method to export a rig with a single scene export.
+#   params['rig']          : the rig (see cameraRig)
+#   params['cameraType']   : the camera type (see generateCameraType)
+#   params['outputFolder'] : where to export the files
+#   params['fileName']     : optional name of the scene file (default: the scene's name)
+#   params['namePrefix']   : optional prefix of the camera and image names (default: 'camera')
+#   params['mode']         : 'cameras' (the default) to add one camera object
+#                            per pose, or 'table' to add a single camera, at
+#                            the first pose, and write all poses to a
+#                            conditions file next to the scene file, named
+#                            after it with a 'Cameras.txt' suffix
+# Returns a dictionary with the 'sceneFile', the 'imageNames' and, in table
+# mode, the 'conditionsFile'.
+def exportCameraRig(scene, params):
+    rig = params['rig'];
+    namePrefix = params.get('namePrefix', 'camera');
+    mode = params.get('mode', 'cameras');
+    if mode not in ('cameras', 'table'):
+        raise ValueError('Unknown camera rig export mode "{}"'.format(mode));
+    if not os.path.isdir(params['outputFolder']):
+        os.makedirs(params['outputFolder']);
+
+    result = {'imageNames': rigNames(rig, namePrefix)};
+    if mode == 'cameras':
+        scene.addCameraRig({'rig': rig, 'cameraType': params['cameraType'], 'names': result['imageNames']});
+    else:
+        firstPose = dict([(key, values[0:1]) for key, values in rig.items()]);
+        scene.addCameraRig({'rig': firstPose, 'cameraType': params['cameraType'], 'names': [namePrefix]});
+    result['sceneFile'] = scene.exportToColladaFile(params['outputFolder'], params.get('fileName'));
+    if mode == 'table':
+        conditionsFile = '{}Cameras.txt'.format(os.path.splitext(result['sceneFile'])[0]);
+        result['conditionsFile'] = writeCameraTable(conditionsFile, rig, namePrefix);
+    return(result);
@@ -0,0 +1,170 @@
+# Blender-free helpers for conditions files and multi-condition scene export.
+# Conditions files have the same tab-separated format that rtbParseConditions.m
+# reads: a header line with variable names, then one line of values per
+# condition.  Lines starting with % are comments.
+
+import hashlib
+import json
+import os
+import re
+
+import numpy
+
+
+# Same patterns as rtbParseConditions.m
+columnPattern  = re.compile(r'([\S ]+)[\t,]*');
+commentPattern = re.compile(r'^\s*%');
+
+# Variables that name a condition but do not change the scene
+namingVariables = ('imageName', 'groupName');
+
+
+# Method to parse a conditions file.  Returns the list of variable names and
+# a list of rows, each a list of string values.
+def parseConditionsFile(conditionsFile):
+    names  = [];
+    values = [];
+    if not os.path.isfile(conditionsFile):
+        return(names, values);
+
+    with open(conditionsFile, 'r') as fileHandle:
+        lines = fileHandle.read().splitlines();
+    if len(lines) == 0:
+        return(names, values);
+
+    names = [token.strip() for token in columnPattern.findall(lines[0])];
+    for line in lines[1:]:
+        # skip comment lines
+        if commentPattern.match(line):
+            continue;
+        tokens = [token.strip() for token in columnPattern.findall(line)];
+        if len(tokens) == len(names):
+            values.append(tokens);
+    return(names, values);
+
+
+# Helper method to format a conditions file value as rtbWriteConditionsFile
+# does: numbers and vectors of numbers as space-separated integers when they
+# are all integers, decimals otherwise, and anything else as text
+def formatConditionValue(value):
+    if isinstance(value, str):
+        return(value);
+    try:
+        numbers = [float(number) for number in numpy.ravel(value)];
+    except (TypeError, ValueError):
+        return(str(value));
+    if all([number == round(number) for number in numbers]):
+        return(' '.join(['{:d}'.format(int(number)) for number in numbers]));
+    return(' '.join(['{:f}'.format(number) for number in numbers]));
+
+
+# Method to write a conditions file, as rtbWriteConditionsFile.m does: the
+# variable names, then one line of values per row, all followed by tabs.
+# Returns the file name.
+def writeConditionsFile(conditionsFile, names, rows):
+    conditionsFolder = os.path.dirname(conditionsFile);
+    if (conditionsFolder != '') and not os.path.isdir(conditionsFolder):
+        os.makedirs(conditionsFolder);
+    with open(conditionsFile, 'w') as fileHandle:
+        fileHandle.write(''.join(['{}\t'.format(name) for name in names]) + '\n');
+        for row in rows:
+            if len(row) != len(names):
+                raise ValueError('Conditions rows must have {} values, not {}'.format(len(names), len(row)));
+            fileHandle.write(''.join(['{}\t'.format(formatConditionValue(value)) for value in row]) + '\n');
+        fileHandle.write('\n');
+    return(conditionsFile);
+
+
+# Method to compute a hash of the scene-relevant values of a condition
+def conditionHash(condition, parameterNames, sceneKey):
+    effective = {
+        'sceneKey'   : sceneKey,
+        'parameters' : dict([(name, condition[name]) for name in parameterNames]),
+    };
+    text = json.dumps(effective, sort_keys=True);
+    return(hashlib.sha1(text.encode('utf-8')).hexdigest());
+
+
+# Helper method to read the export manifest of an output folder
+def loadManifest(manifestFile):
+    if not os.path.isfile(manifestFile):
+        return({'exports' : {}, 'conditions' : {}});
+    with open(manifestFile, 'r') as fileHandle:
+        return(json.load(fileHandle));
+
+
+# Helper method to write the export manifest of an output folder
+def saveManifest(manifestFile, manifest):
+    tempFile = manifestFile + '.tmp';
+    with open(tempFile, 'w') as fileHandle:
+        json.dump(manifest, fileHandle, indent=2, sort_keys=True);
+    os.replace(tempFile, manifestFile);
+
+
+# Method to export one scene file per row of a conditions file, building the
+# static part of the scene only once.
+#   params['conditionsFile']   : the conditions file
+#   params['outputFolder']     : where to export scene files
+#   params['applyCondition']   : function(scene, condition) that updates the
+#                                parameterized objects, materials, lamps and
+#                                cameras for one condition (a dictionary)
+#   params['buildStaticScene'] : optional function(scene) called once, before the first row
+#   params['parameterNames']   : optional list of the variables that affect the
+#                                scene (default: all but imageName and groupName)
+#   params['sceneKey']         : optional string identifying the static scene and
+#                                the scene code, e.g. a version or a hash of the
+#                                scripts. Files exported in earlier runs are only
+#                                reused when it is given, and for the same key.
+# Rows whose scene-relevant values hash the same as a file exported earlier in
+# this run (or, with a sceneKey, in an earlier run) are not rebuilt nor
+# exported again.  They are mapped to the existing file in the returned list
+# and in the exportManifest.json of the output folder.
+def exportConditionsBatch(scene, params):
+    names, rows  = parseConditionsFile(params['conditionsFile']);
+    outputFolder = params['outputFolder'];
+    if not os.path.isdir(outputFolder):
+        os.makedirs(outputFolder);
+
+    if 'parameterNames' in params:
+        parameterNames = params['parameterNames'];
+    else:
+        parameterNames = [name for name in names if name not in namingVariables];
+    # without a sceneKey, the scene code may have changed since the files of
+    # the manifest were exported, so only this run's files are reused
+    sceneKey = params.get('sceneKey');
+    exportedKeys = set();
+
+    manifestFile = os.path.join(outputFolder, 'exportManifest.json');
+    manifest = loadManifest(manifestFile);
+
+    # build the static geometry once
+    if 'buildStaticScene' in params:
+        params['buildStaticScene'](scene);
+
+    results = [];
+    for rowIndex, row in enumerate(rows):
+        condition = dict(zip(names, row));
+        if 'imageName' in condition:
+            imageName = condition['imageName'];
+        else:
+            imageName = 'condition-{:03d}'.format(rowIndex+1);
+
+        key = conditionHash(condition, parameterNames, sceneKey or '');
+        existingFile = manifest['exports'].get(key);
+        if (sceneKey is None) and (key not in exportedKeys):
+            existingFile = None;
+        if (existingFile is not None) and os.path.isfile(existingFile):
+            scene.log(1, 'Condition "{}" matches already exported file "{}"'.format(imageName, existingFile));
+            exported = False;
+            fileName = existingFile;
+        else:
+            params['applyCondition'](scene, condition);
+            fileName = scene.exportToColladaFile(outputFolder, imageName);
+            manifest['exports'][key] = fileName;
+            exportedKeys.add(key);
+            exported = True;
+
+        manifest['conditions'][imageName] = fileName;
+        saveManifest(manifestFile, manifest);
+        results.append({'imageName' : imageName, 'fileName' : fileName, 'exported' : exported, 'hash' : key});
+    return(results);
@@ -0,0 +1,193 @@
+# Content-addressed, on-disk cache for generated elevation maps.
+# Maps are stored as .npy files, keyed by generator name, grid size,
+# generator parameters and RNG seed, and are returned memory-mapped.
+# Like ElevationMapUtils, this module does not depend on bpy.
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy
+
+import ElevationMapUtils
+import TiledElevationMapUtils
+
+
+# Bump this whenever the output of a generator changes for the same params
+cacheFormatVersion = 1;
+
+# Default parameters for the cache
+cacheDefaults = {
+    'cacheDir'  : os.path.join(tempfile.gettempdir(), 'RenderToolbox4', 'ElevationMapCache'),
+    'maxBytes'  : 2*1024**3,
+};
+
+
+# Helper method to convert the NumPy scalars and arrays of the params (e.g. a
+# numpy.int64 seed) to Python values for the cache key, so that they key the
+# same maps as the equal Python values
+def paramValue(value):
+    if isinstance(value, (numpy.generic, numpy.ndarray)):
+        return(value.tolist());
+    raise TypeError('Cannot key elevation maps by a {}'.format(type(value).__name__));
+
+
+# Class for managing a directory of cached elevation maps
+class elevationMapCache:
+    # ---- Method to initialize the cache -----
+    def __init__(self, params=None):
+        params = ElevationMapUtils.mergeParams(cacheDefaults, params);
+        self.cacheDir = params['cacheDir'];
+        self.maxBytes = params['maxBytes'];
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir);
+        self.hits      = 0;
+        self.misses    = 0;
+        self.bypasses  = 0;
+        self.evictions = 0;
+
+    # Method to compute the cache key for a map.  The generator's default
+    # params are merged in first, so that implicit and explicit defaults
+    # produce the same key.
+    def mapKey(self, generatorName, xBinsNum, yBinsNum, params):
+        generator, defaults = ElevationMapUtils.generators[generatorName];
+        params = ElevationMapUtils.mergeParams(defaults, params);
+        description = {
+            'version'   : cacheFormatVersion,
+            'generator' : generatorName,
+            'xBinsNum'  : int(xBinsNum),
+            'yBinsNum'  : int(yBinsNum),
+            'params'    : params,
+        };
+        text = json.dumps(description, sort_keys=True, default=paramValue);
+        return(hashlib.sha1(text.encode('utf-8')).hexdigest());
+
+    # Method to get the file path of a cached map
+    def mapPath(self, key):
+        return(os.path.join(self.cacheDir, '{}.npy'.format(key)));
+
+    # Method to get an elevation map, generating and storing it on a miss.
+    # Maps are returned as read-only, memory-mapped float32 arrays.  Maps
+    # without a seed are not reproducible, so they are generated and
+    # returned without being cached. progress is passed on to the generator.
+    # If tiling params are given (see TiledElevationMapUtils.tilingDefaults),
+    # maps are generated tile by tile straight into the cache, and returned
+    # as read-only tiled maps. If workersNum is given, maps are generated on
+    # that many processes (see TiledElevationMapUtils.generateParallelMap).
+    # Tiled, parallel and whole maps are identical, and share cache entries.
+    def getMap(self, generatorName, xBinsNum, yBinsNum, params=None, progress=None, tiling=None, workersNum=None):
+        generator, defaults = ElevationMapUtils.generators[generatorName];
+        if (params is None) or (params.get('seed') is None):
+            self.bypasses += 1;
+            if (tiling is not None) or (workersNum is not None):
+                return(TiledElevationMapUtils.generateTiledMap(generatorName, xBinsNum, yBinsNum, params, progress, tiling, workersNum));
+            return(generator(xBinsNum, yBinsNum, params, progress));
+        if tiling is not None:
+            tiling = ElevationMapUtils.mergeParams(TiledElevationMapUtils.tilingDefaults, tiling);
+
+        key  = self.mapKey(generatorName, xBinsNum, yBinsNum, params);
+        path = self.mapPath(key);
+        if os.path.isfile(path):
+            try:
+                elevation = self.loadMap(path, tiling);
+                # touch the file so that it becomes the most recently used
+                os.utime(path, None);
+                self.hits += 1;
+                return(elevation);
+            except (IOError, OSError, ValueError):
+                # unreadable entry: regenerate it
+                self.removeEntry(path);
+
+        self.misses += 1;
+        if (tiling is not None) or (workersNum is not None):
+            self.storeTiledMap(path, generatorName, xBinsNum, yBinsNum, params, progress, tiling, workersNum);
+        else:
+            self.storeMap(path, generator(xBinsNum, yBinsNum, params, progress));
+        self.evict(keepPath=path);
+        return(self.loadMap(path, tiling));
+
+    # Method to open a cached map, as a tiled map if tiling params are given
+    def loadMap(self, path, tiling=None):
+        if tiling is not None:
+            return(TiledElevationMapUtils.openTiledElevationMap(path, tiling['tileSize']));
+        return(numpy.load(path, mmap_mode='r'));
+
+    # Method to write a map atomically, so that concurrent readers never see partial files
+    def storeMap(self, path, elevation):
+        fileHandle, tempPath = tempfile.mkstemp(suffix='.tmp', dir=self.cacheDir);
+        try:
+            with os.fdopen(fileHandle, 'wb') as tempFile:
+                numpy.save(tempFile, numpy.ascontiguousarray(elevation, dtype=numpy.float32));
+            os.replace(tempPath, path);
+        except:
+            if os.path.exists(tempPath):
+                os.remove(tempPath);
+            raise;
+
+    # Method to generate a tiled map into a temporary file of the cache, and
+    # then move it into place, as storeMap does
+    def storeTiledMap(self, path, generatorName, xBinsNum, yBinsNum, params, progress, tiling, workersNum):
+        fileHandle, tempPath = tempfile.mkstemp(suffix='.tmp', dir=self.cacheDir);
+        os.close(fileHandle);
+        try:
+            tiling = dict(tiling or {}, filePath=tempPath);
+            theMap = TiledElevationMapUtils.generateTiledMap(generatorName, xBinsNum, yBinsNum, params, progress, tiling, workersNum);
+            theMap.close();
+            os.replace(tempPath, path);
+        except:
+            if os.path.exists(tempPath):
+                os.remove(tempPath);
+            raise;
+
+    # Method to remove a single cache entry
+    def removeEntry(self, path):
+        try:
+            os.remove(path);
+        except OSError:
+            pass;
+
+    # Method to list cache entries as (lastUseTime, bytes, path) tuples, oldest first
+    def entries(self):
+        entries = [];
+        for fileName in os.listdir(self.cacheDir):
+            if not fileName.endswith('.npy'):
+                continue;
+            path = os.path.join(self.cacheDir, fileName);
+            try:
+                info = os.stat(path);
+            except OSError:
+                continue;
+            entries.append((info.st_mtime, info.st_size, path));
+        entries.sort();
+        return(entries);
+
+    # Method to evict the least recently used maps until the cache fits in maxBytes
+    def evict(self, keepPath=None):
+        entries = self.entries();
+        totalBytes = sum([entry[1] for entry in entries]);
+        for lastUseTime, entryBytes, path in entries:
+            if totalBytes <= self.maxBytes:
+                break;
+            if path == keepPath:
+                continue;
+            self.removeEntry(path);
+            totalBytes -= entryBytes;
+            self.evictions += 1;
+
+    # Method to remove all cached maps
+    def clear(self):
+        for lastUseTime, entryBytes, path in self.entries():
+            self.removeEntry(path);
+
+    # Method to get the hit/miss counters and the current cache size
+    def statistics(self):
+        entries = self.entries();
+        return({
+            'hits'        : self.hits,
+            'misses'      : self.misses,
+            'bypasses'    : self.bypasses,
+            'evictions'   : self.evictions,
+            'entriesNum'  : len(entries),
+            'bytes'       : sum([entry[1] for entry in entries]),
+        });
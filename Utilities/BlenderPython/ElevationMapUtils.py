@@ -0,0 +1,361 @@
+# Blender-free helpers for generating elevation maps with NumPy.
+# These are used by SceneUtilsV1, but do not depend on bpy or mathutils,
+# so they can also be used from a plain Python interpreter.
+
+import math
+import random
+
+import numpy
+
+import InstrumentationUtils
+
+
+# Default parameters for the Gaussian blobs (stretched cloth) generator
+gaussianBlobsDefaults = {
+    'mediumBumpsNum'      : 200,
+    'smallBumpsNum'       : 100,
+    'mediumSigmaXRange'   : (0.16*0.03, 1.16*0.03),
+    'smallSigmaXRange'    : (0.12*0.03, 1.12*0.03),
+    'elongationRange'     : (6.0, 8.0),
+    'radiusMean'          : 0.9,
+    'radiusSigma'         : 0.35,
+    'orientationSigma'    : math.pi/60,
+    'sigmaCutoff'         : 4.0,
+    'bumpsPerPass'        : 8,
+    'seed'                : None,
+    'rngStreams'          : False,
+};
+
+
+# Default parameters for the random surface (spilled liquid) generator
+randomSurfaceDefaults = {
+    'sigma'       : 1/3.2,
+    'exponent'    : 0.7,
+    'clampLevel'  : 0.25,
+    'seed'        : None,
+    'rngStreams'  : False,
+};
+
+# With 'rngStreams' set, each Gaussian bump, or each row of random surface
+# noise, is drawn from its own NumPy stream, spawned from the seed with a
+# SeedSequence. Bumps and rows can then be drawn in any order, and by any
+# process, which parallel generation relies on. Maps differ from the ones
+# drawn from a single stream, so this is off by default.
+
+
+# Helper method to merge user supplied params with the generator defaults
+def mergeParams(defaults, params):
+    merged = dict(defaults);
+    if params is not None:
+        for key in params:
+            if key not in defaults:
+                raise ValueError('Unknown elevation map parameter "{}"'.format(key));
+            merged[key] = params[key];
+    return(merged);
+
+
+# Helper method to get a random number generator.  If a seed is given, a
+# private generator is used, otherwise the global random module is used.
+# NumPy integer seeds seed the same generator as the equal Python integers.
+def getRandomGenerator(seed):
+    if seed is None:
+        return(random);
+    if isinstance(seed, numpy.integer):
+        seed = int(seed);
+    return(random.Random(seed));
+
+
+# Helper method to get the entropy that the per-bump or per-row streams are
+# spawned from: the seed, or fresh entropy if there is no seed. Parallel
+# generators get it once, and pass it on as the seed of all workers.
+def streamsEntropy(seed):
+    return(numpy.random.SeedSequence(seed).entropy);
+
+
+# Helper method to get the NumPy generator of stream number streamIndex
+# (a bump or a row), as spawned by numpy.random.SeedSequence(entropy).spawn()
+def streamGenerator(entropy, streamIndex):
+    return(numpy.random.default_rng(numpy.random.SeedSequence(entropy, spawn_key=(streamIndex,))));
+
+
+# Helper method to compute the bin-center coordinates in [-1 1] along one axis
+def binCenters(binsNum):
+    return((2.0*(numpy.arange(binsNum, dtype=numpy.float64)+0.5)/binsNum - 1.0).astype(numpy.float32));
+
+
+# Helper method to draw the random parameters of all Gaussian bumps, from
+# rng, or from one stream per bump if params['rngStreams'] is set.
+# Returns a list of (xc, yc, sigmaX, sigmaY, theta) tuples.
+def drawGaussianBumps(params, rng):
+    bumps = [];
+    bumpsNum = params['mediumBumpsNum'] + params['smallBumpsNum'];
+    if params['rngStreams']:
+        entropy = streamsEntropy(params['seed']);
+    for bumpIndex in range(0, bumpsNum):
+        if params['rngStreams']:
+            bumpRng = streamGenerator(entropy, bumpIndex);
+            uniform, gauss = bumpRng.random, bumpRng.normal;
+        else:
+            uniform, gauss = rng.random, rng.gauss;
+
+        # randomize Gaussian sigmas
+        if bumpIndex < params['mediumBumpsNum']:
+            sigmaRange = params['mediumSigmaXRange'];
+        else:
+            sigmaRange = params['smallSigmaXRange'];
+        bumpSigmaX = sigmaRange[0] + uniform()*(sigmaRange[1]-sigmaRange[0]);
+        elongationRange = params['elongationRange'];
+        bumpSigmaY = (elongationRange[0] + uniform()*(elongationRange[1]-elongationRange[0]))*bumpSigmaX;
+
+        # randomize Gaussian position around main radius
+        randomRadius = gauss(params['radiusMean'], params['radiusSigma']);
+        if (randomRadius < 0.0):
+            continue;
+        randomTheta = uniform()*2.0*math.pi + 2.0*math.pi;
+        xc = randomRadius * math.cos(randomTheta);
+        yc = randomRadius * math.sin(randomTheta);
+
+        # this choice of Gaussian orientation results in an elevation map resembling a stretched cloth
+        gaussianOrientation = randomTheta - math.pi/2.0 + gauss(0, params['orientationSigma']);
+        bumps.append((xc, yc, bumpSigmaX, bumpSigmaY, gaussianOrientation));
+    return(bumps);
+
+
+# Helper method to compute the index range [first, last) of the bins whose
+# centers fall within [lo hi] along an axis with binsNum bins
+def binRange(lo, hi, binsNum):
+    first = int(math.ceil((lo+1.0)*binsNum/2.0 - 0.5));
+    last  = int(math.floor((hi+1.0)*binsNum/2.0 - 0.5)) + 1;
+    return(max(first, 0), min(last, binsNum));
+
+
+# Helper method to compute the (clipped) bounding box of a rotated Gaussian,
+# truncated at sigmaCutoff standard deviations.
+# Returns (x0, x1, y0, y1) bin ranges, or None if the bump misses the grid.
+def gaussianSupport(bump, sigmaCutoff, xBinsNum, yBinsNum):
+    xc, yc, sigmaX, sigmaY, theta = bump;
+    cosTheta = math.cos(theta);
+    sinTheta = math.sin(theta);
+    halfWidthX = sigmaCutoff * math.sqrt((cosTheta*sigmaX)**2 + (sinTheta*sigmaY)**2);
+    halfWidthY = sigmaCutoff * math.sqrt((sinTheta*sigmaX)**2 + (cosTheta*sigmaY)**2);
+    x0, x1 = binRange(xc-halfWidthX, xc+halfWidthX, xBinsNum);
+    y0, y1 = binRange(yc-halfWidthY, yc+halfWidthY, yBinsNum);
+    if (x0 >= x1) or (y0 >= y1):
+        return(None);
+    return((x0, x1, y0, y1));
+
+
+# Helper method to compute the quadratic form coefficients of a rotated Gaussian
+def gaussianCoefficients(bump):
+    xc, yc, sigmaX, sigmaY, theta = bump;
+    cosTheta = math.cos(theta);
+    sinTheta = math.sin(theta);
+    # xx = fx*cos - fy*sin, yy = fx*sin + fy*cos
+    # (xx/sx)^2 + (yy/sy)^2 = a*fx^2 + 2*b*fx*fy + c*fy^2
+    a = (cosTheta/sigmaX)**2 + (sinTheta/sigmaY)**2;
+    b = sinTheta*cosTheta*(1.0/sigmaY**2 - 1.0/sigmaX**2);
+    c = (sinTheta/sigmaX)**2 + (cosTheta/sigmaY)**2;
+    return(a, b, c);
+
+
+# Helper method to compute the windows over which a batch of Gaussians is
+# evaluated: equally sized, and shifted so that every window lies inside the
+# grid. Returns (xOrigins, yOrigins, windowWidth, windowHeight).
+def batchWindows(supports, xBinsNum, yBinsNum):
+    windowWidth  = max([s[1]-s[0] for s in supports]);
+    windowHeight = max([s[3]-s[2] for s in supports]);
+    xOrigins = [min(s[0], xBinsNum-windowWidth)  for s in supports];
+    yOrigins = [min(s[2], yBinsNum-windowHeight) for s in supports];
+    return(xOrigins, yOrigins, windowWidth, windowHeight);
+
+
+# Helper method to blit a batch of Gaussians into an elevation array.
+# All bumps of the batch are evaluated over equally sized windows in a single
+# vectorized pass, and each window is then added into place. The elevation
+# array can be a tile of the grid, whose first bin is (xOffset, yOffset):
+# only the parts of the windows that overlap the tile are then evaluated.
+def blitGaussianBatch(elevation, bumps, windows, xCenters, yCenters, xOffset=0, yOffset=0):
+    tileHeight, tileWidth = elevation.shape;
+    xOrigins, yOrigins, windowWidth, windowHeight = windows;
+
+    # clip the windows to the tile
+    x0 = [max(xOrigin, xOffset) for xOrigin in xOrigins];
+    x1 = [min(xOrigin+windowWidth, xOffset+tileWidth) for xOrigin in xOrigins];
+    y0 = [max(yOrigin, yOffset) for yOrigin in yOrigins];
+    y1 = [min(yOrigin+windowHeight, yOffset+tileHeight) for yOrigin in yOrigins];
+    batch = [k for k in range(0, len(bumps)) if (x0[k] < x1[k]) and (y0[k] < y1[k])];
+    if len(batch) == 0:
+        return;
+    width  = max([x1[k]-x0[k] for k in batch]);
+    height = max([y1[k]-y0[k] for k in batch]);
+
+    fx = numpy.empty((len(batch), 1, width),  dtype=numpy.float32);
+    fy = numpy.empty((len(batch), height, 1), dtype=numpy.float32);
+    a  = numpy.empty((len(batch), 1, 1), dtype=numpy.float32);
+    b  = numpy.empty((len(batch), 1, 1), dtype=numpy.float32);
+    c  = numpy.empty((len(batch), 1, 1), dtype=numpy.float32);
+    for i, k in enumerate(batch):
+        # clipped windows may be narrower than the batch: the bins past them are evaluated, not added
+        fx[i, 0, :] = xCenters.take(numpy.arange(x0[k], x0[k]+width),  mode='clip') - bumps[k][0];
+        fy[i, :, 0] = yCenters.take(numpy.arange(y0[k], y0[k]+height), mode='clip') - bumps[k][1];
+        a[i], b[i], c[i] = gaussianCoefficients(bumps[k]);
+
+    # evaluate all Gaussians of the batch at once
+    exponent = a*fx*fx;
+    exponent = exponent + (2.0*b)*fy*fx;
+    exponent += c*fy*fy;
+    exponent *= -0.5;
+    values = numpy.exp(exponent, out=exponent);
+
+    # accumulate into the elevation map
+    for i, k in enumerate(batch):
+        elevation[y0[k]-yOffset:y1[k]-yOffset, x0[k]-xOffset:x1[k]-xOffset] += values[i, 0:y1[k]-y0[k], 0:x1[k]-x0[k]];
+
+
+# Helper method to group the Gaussians that touch an xBinsNum x yBinsNum grid
+# in batches of up to bumpsPerPass bumps, in blitting order.
+# Returns a list of (bumps, windows) tuples.
+def gaussianBatches(bumps, sigmaCutoff, bumpsPerPass, xBinsNum, yBinsNum):
+    # keep only the bumps that touch the grid
+    visibleBumps = [];
+    supports     = [];
+    for bump in bumps:
+        support = gaussianSupport(bump, sigmaCutoff, xBinsNum, yBinsNum);
+        if support is not None:
+            visibleBumps.append(bump);
+            supports.append(support);
+
+    # batch bumps of similar size together to keep the padded windows small
+    order = sorted(range(0, len(visibleBumps)), key=lambda k: (supports[k][1]-supports[k][0])*(supports[k][3]-supports[k][2]));
+    bumpsPerPass = max(int(bumpsPerPass), 1);
+    batches = [];
+    for first in range(0, len(order), bumpsPerPass):
+        batch = order[first:first+bumpsPerPass];
+        batches.append(([visibleBumps[k] for k in batch], batchWindows([supports[k] for k in batch], xBinsNum, yBinsNum)));
+    return(batches);
+
+
+# Helper method to blit a list of Gaussians into an elevation array, one
+# batch of up to bumpsPerPass bumps at a time. progress(bumpsDone, bumpsNum)
+# is called after each batch.
+def blitGaussians(elevation, bumps, sigmaCutoff, bumpsPerPass, progress=None):
+    yBinsNum, xBinsNum = elevation.shape;
+    xCenters = binCenters(xBinsNum);
+    yCenters = binCenters(yBinsNum);
+
+    batches = gaussianBatches(bumps, sigmaCutoff, bumpsPerPass, xBinsNum, yBinsNum);
+    bumpsNum  = sum([len(batch[0]) for batch in batches]);
+    bumpsDone = 0;
+    for batchBumps, windows in batches:
+        blitGaussianBatch(elevation, batchBumps, windows, xCenters, yCenters);
+        bumpsDone += len(batchBumps);
+        InstrumentationUtils.reportProgress(progress, bumpsDone, bumpsNum);
+
+
+# Helper method to scale an elevation array so that its max |elevation| is 1.0
+def normalizeElevation(elevation):
+    maxElevation = float(numpy.max(numpy.abs(elevation))) if elevation.size > 0 else 0.0;
+    if maxElevation > 0:
+        elevation *= 1.0/maxElevation;
+    return(elevation);
+
+
+# Helper method to get the generator of the noise of random surface maps,
+# when it is drawn from a single stream
+def randomSurfaceGenerator(params):
+    if params['seed'] is None:
+        return(numpy.random);
+    return(numpy.random.RandomState(params['seed']));
+
+
+# Helper method to compute rows y0 .. y1-1 of a random surface map, as a
+# float64 array. The noise is drawn from rng, which must then be called for
+# the rows in order, or, if params['rngStreams'] is set, from one stream per
+# row, spawned from entropy (see streamsEntropy).
+def randomSurfaceRows(xBinsNum, yBinsNum, y0, y1, params, rng=None, entropy=None):
+    if params['rngStreams']:
+        noise = numpy.empty((y1-y0, xBinsNum));
+        for y in range(y0, y1):
+            noise[y-y0, :] = streamGenerator(entropy, y).random(xBinsNum);
+    else:
+        noise = rng.random_sample((y1-y0, xBinsNum));
+
+    xc = binCenters(xBinsNum).astype(numpy.float64)[numpy.newaxis, :];
+    yc = binCenters(yBinsNum).astype(numpy.float64)[y0:y1, numpy.newaxis];
+    envelope = numpy.exp(-0.5*params['exponent']*((xc/params['sigma'])**2 + (yc/params['sigma'])**2));
+    elevation = noise*envelope;
+    numpy.minimum(elevation, params['clampLevel'], out=elevation);
+    return(elevation);
+
+
+# Method to generate a random surface (resembling spilled liquid) by 
+# modulating a Gaussian with uniform noise and truncating the result.
+# Returns a (yBinsNum, xBinsNum) float32 array.
+def generateRandomSurfaceMap(xBinsNum, yBinsNum, params=None, progress=None):
+    params = mergeParams(randomSurfaceDefaults, params);
+    if params['rngStreams']:
+        elevation = randomSurfaceRows(xBinsNum, yBinsNum, 0, yBinsNum, params, entropy=streamsEntropy(params['seed']));
+    else:
+        elevation = randomSurfaceRows(xBinsNum, yBinsNum, 0, yBinsNum, params, rng=randomSurfaceGenerator(params));
+    InstrumentationUtils.reportProgress(progress, 1, 1);
+    return(elevation.astype(numpy.float32));
+
+
+# Method to generate an elevation map (resembling a stretched cloth) by
+# blitting elongated Gaussians at random positions/orientations.
+# Each Gaussian is evaluated only within its rotated bounding box, truncated
+# at params['sigmaCutoff'] sigmas. Returns a (yBinsNum, xBinsNum) float32 array.
+# If given, progress(bumpsDone, bumpsNum) is called as the bumps are blitted.
+def generateGaussianBlobsMap(xBinsNum, yBinsNum, params=None, progress=None):
+    params = mergeParams(gaussianBlobsDefaults, params);
+    rng = getRandomGenerator(params['seed']);
+    bumps = drawGaussianBumps(params, rng);
+
+    elevation = numpy.zeros((yBinsNum, xBinsNum), dtype=numpy.float32);
+    blitGaussians(elevation, bumps, params['sigmaCutoff'], params['bumpsPerPass'], progress);
+
+    # normalize elevation to 1.0
+    return(normalizeElevation(elevation));
+
+
+# Registry of the elevation map generators, by name
+generators = {
+    'randomSurface'   : (generateRandomSurfaceMap, randomSurfaceDefaults),
+    'gaussianBlobs'   : (generateGaussianBlobsMap, gaussianBlobsDefaults),
+};
+
+
+# Helper method to get an elevation map as a (yBinsNum, xBinsNum) float32 array.
+# Accepts NumPy arrays, lists of lists and flat buffer-protocol objects.
+def elevationAsArray(elevation, xBinsNum, yBinsNum):
+    elevation = numpy.asarray(elevation, dtype=numpy.float32);
+    if elevation.ndim == 1:
+        elevation = elevation.reshape((yBinsNum, xBinsNum));
+    if elevation.shape != (yBinsNum, xBinsNum):
+        raise ValueError('Elevation map has shape {}, expected ({}, {})'.format(elevation.shape, yBinsNum, xBinsNum));
+    return(elevation);
+
+
+# Method to compute the vertex and face arrays of the regular quad grid that
+# represents an elevation map. Returns a (xBinsNum*yBinsNum, 3) float32 array
+# of vertex coordinates and a ((xBinsNum-1)*(yBinsNum-1), 4) int32 array of
+# vertex indices, one row per quad.
+def elevationMapMeshArrays(elevation, xBinsNum, yBinsNum):
+    elevation = elevationAsArray(elevation, xBinsNum, yBinsNum);
+
+    # vertices
+    vertices = numpy.empty((yBinsNum, xBinsNum, 3), dtype=numpy.float32);
+    vertices[:, :, 0] = (2*(numpy.arange(xBinsNum)-(xBinsNum-1.5)/2)/(xBinsNum-2))[numpy.newaxis, :];
+    vertices[:, :, 1] = (2*(numpy.arange(yBinsNum)-(yBinsNum-1.5)/2)/(yBinsNum-2))[:, numpy.newaxis];
+    vertices[:, :, 2] = elevation;
+
+    # faces: each quad refers to (A,B,C,D) = (i, i+1, i+xBinsNum+1, i+xBinsNum)
+    firstVertex = (numpy.arange(yBinsNum-1, dtype=numpy.int32)[:, numpy.newaxis]*xBinsNum +
+                   numpy.arange(xBinsNum-1, dtype=numpy.int32)[numpy.newaxis, :]).reshape(-1);
+    faces = numpy.empty((firstVertex.size, 4), dtype=numpy.int32);
+    faces[:, 0] = firstVertex;
+    faces[:, 1] = firstVertex + 1;
+    faces[:, 2] = firstVertex + xBinsNum + 1;
+    faces[:, 3] = firstVertex + xBinsNum;
+
+    return(vertices.reshape((-1, 3)), faces);
@@ -0,0 +1,247 @@
+# Blender-free helpers for representing an elevation map as a coarse base
+# mesh with an elevation texture, instead of as a mesh with one vertex per
+# map sample, for the sceneManager's addElevationMapObject.
+#
+# The base mesh is a regular grid of baseResolution vertices, which spans the
+# same extent as the full mesh of ElevationMapUtils.elevationMapMeshArrays and
+# follows the map at the coarse scale. The texture holds, for each map
+# sample, the residual relief: the elevation minus that of the base mesh
+# under the sample. Renderers apply it as a bump map (or, in Blender, as a
+# displacement), so that the fine relief costs one texel per sample instead
+# of two triangles. Each texel sits at the center of its sample, so that the
+# renderers' bilinear lookups give the map back between the samples.
+#
+# Textures are written as 16-bit grayscale PNG files, with residuals mapped
+# linearly to [0, 1], or as single-channel FLOAT OpenEXR files, with the
+# residuals as they are. Both are streamed in blocks of rows, so that maps
+# larger than memory (see TiledElevationMapUtils) can be written.
+
+import math
+import os
+import time
+
+import numpy
+
+import ElevationMapUtils
+import MultispectralEXRUtils
+import SensorImageUtils
+import TiledElevationMapUtils
+
+
+# Default parameters of an elevation texture (see elevationTextureArrays).
+# PBRT-v3 reads PNG textures with 8 bits per channel, so 'exr' suits it better.
+textureDefaults = {
+    'mode'           : 'bump',
+    'format'         : 'png16',
+    'folder'         : None,
+    'fileName'       : None,
+    'baseResolution' : 32,
+    'scale'          : 1.0,
+};
+
+# Texture file extensions, by format
+textureExtensions = {'png16': 'png', 'exr': 'exr'};
+
+# Number of map samples handled per block of rows
+blockSamples = 1024**2;
+
+
+# Helper method to get the map as an array that can be sliced by rows
+# without reading all of it (tiled maps stay memory-mapped)
+def elevationRows(elevation, xBinsNum, yBinsNum):
+    if isinstance(elevation, TiledElevationMapUtils.tiledElevationMap):
+        return(numpy.asarray(elevation));
+    return(ElevationMapUtils.elevationAsArray(elevation, xBinsNum, yBinsNum));
+
+
+# Helper method to get the number of base mesh vertices along x and y, from
+# a number or an (x, y) pair, at least 2 and at most the number of samples
+def baseVerticesNum(baseResolution, xBinsNum, yBinsNum):
+    if numpy.ndim(baseResolution) == 0:
+        baseResolution = (baseResolution, baseResolution);
+    baseX, baseY = [int(value) for value in baseResolution];
+    if (baseX < 2) or (baseY < 2):
+        raise ValueError('The base mesh needs at least 2 vertices along x and y, not {}x{}'.format(baseX, baseY));
+    return(min(baseX, xBinsNum), min(baseY, yBinsNum));
+
+
+# Helper method to get the interpolation weights of positions that fall
+# between the nodes of a grid: the node before each position and the weight
+# of the node after it
+def interpolationWeights(positions, nodesNum):
+    first = numpy.minimum(numpy.floor(positions).astype(numpy.int64), nodesNum-2);
+    return(first, positions - first);
+
+
+# Method to compute the base mesh of a map: a (baseY, baseX) grid whose
+# vertices sit at evenly spaced (fractional) sample positions, from the first
+# to the last sample along each axis, at the bilinearly interpolated map
+# elevation there. Returns the sample positions along x and along y, and the
+# (baseY, baseX) elevations.
+def baseGrid(rows, xBinsNum, yBinsNum, baseX, baseY):
+    xPositions = numpy.linspace(0, xBinsNum-1, baseX);
+    yPositions = numpy.linspace(0, yBinsNum-1, baseY);
+    xFirst, xWeights = interpolationWeights(xPositions, xBinsNum);
+    yFirst, yWeights = interpolationWeights(yPositions, yBinsNum);
+    # only the two map rows around each base row are read
+    lower = numpy.asarray(rows[yFirst], dtype=numpy.float64);
+    upper = numpy.asarray(rows[yFirst+1], dtype=numpy.float64);
+    between = lower*(1-yWeights)[:, numpy.newaxis] + upper*yWeights[:, numpy.newaxis];
+    elevations = between[:, xFirst]*(1-xWeights) + between[:, xFirst+1]*xWeights;
+    return(xPositions, yPositions, elevations);
+
+
+# Method to compute the residual relief of the map rows y0 to y1-1, as a
+# (y1-y0, xBinsNum) float64 array: the elevation minus the bilinear
+# interpolation of the base grid at each sample
+def residualRows(rows, base, xBinsNum, yBinsNum, y0, y1):
+    xPositions, yPositions, elevations = base;
+    baseY, baseX = elevations.shape;
+    xFirst, xWeights = interpolationWeights(numpy.arange(xBinsNum)*(baseX-1.0)/(xBinsNum-1), baseX);
+    yFirst, yWeights = interpolationWeights(numpy.arange(y0, y1)*(baseY-1.0)/(yBinsNum-1), baseY);
+    between = elevations[yFirst]*(1-yWeights)[:, numpy.newaxis] + elevations[yFirst+1]*yWeights[:, numpy.newaxis];
+    baseSurface = between[:, xFirst]*(1-xWeights) + between[:, xFirst+1]*xWeights;
+    return(numpy.asarray(rows[y0:y1], dtype=numpy.float64) - baseSurface);
+
+
+# Helper method to list (y0, y1) blocks of map rows, from the top of the
+# texture (the last map row) down to its bottom (the first map row)
+def textureBlocks(xBinsNum, yBinsNum):
+    rowsNum = max(1, blockSamples//xBinsNum);
+    return([(max(0, y1-rowsNum), y1) for y1 in range(yBinsNum, 0, -rowsNum)]);
+
+
+# Method to write the residual relief of a map as a texture file, whose
+# first line is the last map row (textures have v = 0 at the bottom).
+# Returns the texture value of the base surface ('midLevel') and the
+# elevation of one texture unit ('heightScale'), so that the residual is
+# (value - midLevel)*heightScale, and the min and max residuals.
+def writeElevationTexture(fileName, textureFormat, rows, base, xBinsNum, yBinsNum):
+    blocks = textureBlocks(xBinsNum, yBinsNum);
+    if textureFormat == 'exr':
+        writer = MultispectralEXRUtils.exrWriter(fileName, xBinsNum, yBinsNum, ['Y']);
+        low, high = math.inf, -math.inf;
+        try:
+            for y0, y1 in blocks:
+                residuals = residualRows(rows, base, xBinsNum, yBinsNum, y0, y1);
+                low, high = min(low, float(residuals.min())), max(high, float(residuals.max()));
+                writer.writeLines(residuals[::-1]);
+        finally:
+            writer.close();
+        return({'midLevel': 0.0, 'heightScale': 1.0, 'residualRange': (low, high)});
+
+    # 16-bit PNG files need the range of the residuals up front
+    low, high = math.inf, -math.inf;
+    for y0, y1 in blocks:
+        residuals = residualRows(rows, base, xBinsNum, yBinsNum, y0, y1);
+        low, high = min(low, float(residuals.min())), max(high, float(residuals.max()));
+    heightScale = (high - low) if high > low else 1.0;
+    writer = SensorImageUtils.pngWriter(fileName, xBinsNum, yBinsNum, bitDepth=16, channelsNum=1);
+    try:
+        for y0, y1 in blocks:
+            residuals = residualRows(rows, base, xBinsNum, yBinsNum, y0, y1);
+            writer.writeRows(numpy.round((residuals[::-1] - low)/heightScale*65535).astype(numpy.uint16));
+    finally:
+        writer.close();
+    return({'midLevel': -low/heightScale, 'heightScale': heightScale, 'residualRange': (low, high)});
+
+
+# Method to compute the base mesh and the elevation texture of a map.
+#   params['mode']           : 'bump', to apply the texture as a bump map, or
+#                              'displacement', to displace the base mesh by it
+#                              (in Blender; the renderer exports use bump maps)
+#   params['format']         : 'png16' (16-bit PNG) or 'exr' (float OpenEXR)
+#   params['folder']         : folder of the texture file
+#   params['fileName']       : name of the texture file, without extension
+#                              (default: the name given)
+#   params['baseResolution'] : vertices of the base mesh along x and y, as a
+#                              number or an (x, y) pair
+#   params['scale']          : factor applied to the relief by the renderers,
+#                              e.g. the z scale of the object
+# Vertices are placed as in ElevationMapUtils.elevationMapMeshArrays. Returns
+# a (V,3) float32 array of vertex coordinates, a (F,4) int32 array of quads,
+# a (V,2) float32 array of texture coordinates, the texture description
+# {'file', 'format', 'mode', 'midLevel', 'heightScale', 'strength', 'width',
+# 'height', 'baseResolution'}, where strength is the elevation of one
+# texture unit, scaled, and baseResolution the (x, y) vertices of the base grid,
+# and the statistics {'maxError' (the largest residual), 'trianglesNum',
+# 'verticesNum', 'regularTrianglesNum', 'textureBytes', 'seconds'}.
+def elevationTextureArrays(name, elevation, xBinsNum, yBinsNum, params):
+    params = ElevationMapUtils.mergeParams(textureDefaults, params);
+    startTime = time.time();
+    if params['mode'] not in ('bump', 'displacement'):
+        raise ValueError('Unknown elevation texture mode "{}"'.format(params['mode']));
+    if params['format'] not in textureExtensions:
+        raise ValueError('Unknown elevation texture format "{}" (supported: {})'.format(params['format'], ', '.join(sorted(textureExtensions))));
+    if params['folder'] is None:
+        raise ValueError('Elevation textures need a folder');
+    if not os.path.isdir(params['folder']):
+        os.makedirs(params['folder']);
+    fileName = os.path.join(params['folder'], '{}.{}'.format(params['fileName'] or name, textureExtensions[params['format']]));
+
+    rows = elevationRows(elevation, xBinsNum, yBinsNum);
+    baseX, baseY = baseVerticesNum(params['baseResolution'], xBinsNum, yBinsNum);
+    base = baseGrid(rows, xBinsNum, yBinsNum, baseX, baseY);
+    texture = writeElevationTexture(fileName, params['format'], rows, base, xBinsNum, yBinsNum);
+
+    # vertices, at fractional sample positions of the full mesh
+    xPositions, yPositions, elevations = base;
+    vertices = numpy.empty((baseY, baseX, 3), dtype=numpy.float32);
+    vertices[:, :, 0] = (2*(xPositions-(xBinsNum-1.5)/2)/(xBinsNum-2))[numpy.newaxis, :];
+    vertices[:, :, 1] = (2*(yPositions-(yBinsNum-1.5)/2)/(yBinsNum-2))[:, numpy.newaxis];
+    vertices[:, :, 2] = elevations;
+
+    # texture coordinates, at the centers of the texels of the samples
+    uvs = numpy.empty((baseY, baseX, 2), dtype=numpy.float32);
+    uvs[:, :, 0] = ((xPositions + 0.5)/xBinsNum)[numpy.newaxis, :];
+    uvs[:, :, 1] = ((yPositions + 0.5)/yBinsNum)[:, numpy.newaxis];
+
+    # faces, as in elevationMapMeshArrays
+    firstVertex = (numpy.arange(baseY-1, dtype=numpy.int32)[:, numpy.newaxis]*baseX +
+                   numpy.arange(baseX-1, dtype=numpy.int32)[numpy.newaxis, :]).reshape(-1);
+    faces = numpy.column_stack((firstVertex, firstVertex + 1, firstVertex + baseX + 1, firstVertex + baseX)).astype(numpy.int32);
+
+    texture.update({
+        'file'           : fileName,
+        'format'         : params['format'],
+        'mode'           : params['mode'],
+        'strength'       : texture['heightScale']*params['scale'],
+        'width'          : xBinsNum,
+        'height'         : yBinsNum,
+        'baseResolution' : (baseX, baseY),
+    });
+    low, high = texture.pop('residualRange');
+    statistics = {
+        'maxError'            : max(abs(low), abs(high)),
+        'trianglesNum'        : 2*faces.shape[0],
+        'verticesNum'         : baseX*baseY,
+        'regularTrianglesNum' : 2*(xBinsNum-1)*(yBinsNum-1),
+        'textureBytes'        : os.path.getsize(fileName),
+        'seconds'             : time.time() - startTime,
+    };
+    return(vertices.reshape((-1, 3)), faces, uvs.reshape((-1, 2)), texture, statistics);
+
+
+# Method to get the mappings (see rtbApplyMappings.m) that turn the texture
+# of a material into a bump map, as in the MaterialSphere example, for scenes
+# exported to Collada: a floatTextures bitmap and a blessAsBumpMap operation
+def bumpMappings(materialName, texture, textureName=None):
+    textureName = textureName or '{}-elevation'.format(materialName);
+    return([
+        {
+            'name'         : textureName,
+            'broadType'    : 'floatTextures',
+            'specificType' : 'bitmap',
+            'operation'    : 'create',
+            'properties'   : {'name': 'filename', 'valueType': 'string', 'value': os.path.basename(texture['file'])},
+        },
+        {
+            'name'       : materialName,
+            'broadType'  : 'materials',
+            'operation'  : 'blessAsBumpMap',
+            'properties' : [
+                {'name': 'texture', 'valueType': 'string', 'value': textureName},
+                {'name': 'scale', 'valueType': 'float', 'value': texture['strength']},
+            ],
+        },
+    ]);
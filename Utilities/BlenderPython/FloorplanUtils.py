@@ -0,0 +1,162 @@
+# Blender-free generation of building interiors made of rectangular rooms, as
+# a single closed mesh: one floor slab, one ceiling slab and the walls between
+# them, with the walls of adjoining rooms shared, and every face tagged with
+# the room surface (floor, backWall, ...) that it belongs to.
+#
+# Rooms are given by their (xMin, yMin, xMax, yMax) rectangles, measured at
+# the middle of their walls, so that rooms that share a side share one wall.
+# Rooms may touch but must not overlap. The floorplan is cut into the cells of
+# the grid of all wall faces (plus the floor and ceiling levels), each cell is
+# either solid or empty, and the mesh is made of the quads between solid and
+# empty cells. Faces therefore share their vertices, and the mesh is closed.
+
+import numpy
+
+
+# The surfaces of each room, in the order of their material slots. The back
+# wall is on the +y side and the left wall on the -x side, as in addRoom.
+roomSurfaces = ('floor', 'backWall', 'leftWall', 'rightWall', 'frontWall', 'ceiling');
+
+# Surface seen from inside a room, by axis and by the direction (+1/-1) from the solid to the room
+surfaceFacingRoom = {
+    (0,  1) : 'leftWall',
+    (0, -1) : 'rightWall',
+    (1,  1) : 'frontWall',
+    (1, -1) : 'backWall',
+    (2,  1) : 'floor',
+    (2, -1) : 'ceiling',
+};
+
+# Coordinates are rounded to this many decimals, so that walls computed from
+# different rooms fall on the same grid lines
+coordinateDecimals = 9;
+
+
+# Method to get the rectangles of the rooms of a grid of room labels: the
+# cells of room k are the ones labelled k (k = 0, 1, ...), and must make up a
+# rectangle. Negative labels mark cells without a room. Cell (row, column)
+# spans [column, column+1]*cellSize along x and [row, row+1]*cellSize along y.
+def roomRectanglesFromGrid(roomGrid, cellSize=1.0):
+    roomGrid = numpy.asarray(roomGrid);
+    if roomGrid.ndim != 2:
+        raise ValueError('The room grid must be a 2D array of room labels');
+    roomsNum = int(roomGrid.max())+1 if roomGrid.size > 0 else 0;
+    rectangles = [];
+    for label in range(0, roomsNum):
+        rows, columns = numpy.nonzero(roomGrid == label);
+        if rows.size == 0:
+            raise ValueError('Room {} is missing from the room grid'.format(label));
+        if rows.size != (rows.max()-rows.min()+1)*(columns.max()-columns.min()+1):
+            raise ValueError('Room {} is not a rectangle in the room grid'.format(label));
+        rectangles.append((columns.min()*cellSize, rows.min()*cellSize, (columns.max()+1)*cellSize, (rows.max()+1)*cellSize));
+    return(rectangles);
+
+
+# Helper method to get the sorted grid lines of a set of coordinates, and the
+# indices of the coordinates along these lines
+def gridLines(coordinates):
+    coordinates = numpy.round(coordinates, coordinateDecimals);
+    lines = numpy.unique(coordinates);
+    return(lines, numpy.searchsorted(lines, coordinates));
+
+
+# Method to compute the mesh of a floorplan, with rooms of the given
+# (R,4) rectangles, a common height (from the top of the floor to the
+# bottom of the ceiling), and walls, floor and ceiling of the given thickness.
+# The top of the floor is at z = 0. Returns a (V,3) float32 array of vertex
+# coordinates, a (F,4) int32 array of quads and the (F,) int32 surface of
+# each quad, which is 6*room + the index of the surface in roomSurfaces.
+# Faces inside a room belong to that room. Outside faces belong to the room
+# whose walls they are part of: side faces of the floor and ceiling slabs to
+# its floor and ceiling, and the others to the wall on the same side.
+def floorplanMeshArrays(rectangles, roomHeight, wallThickness):
+    rectangles = numpy.asarray(rectangles, dtype=numpy.float64).reshape((-1, 4));
+    if rectangles.shape[0] == 0:
+        raise ValueError('A floorplan needs at least one room');
+    if (wallThickness <= 0) or (roomHeight <= 0):
+        raise ValueError('The room height and the wall thickness must be positive');
+    halfThickness = wallThickness/2.0;
+    outer = rectangles + (-halfThickness, -halfThickness, halfThickness, halfThickness);
+    inner = rectangles + (halfThickness, halfThickness, -halfThickness, -halfThickness);
+    if numpy.any(inner[:, 2] <= inner[:, 0]) or numpy.any(inner[:, 3] <= inner[:, 1]):
+        raise ValueError('Rooms must be wider and deeper than the wall thickness');
+
+    # grid lines, and the span of each room's outer and inner rectangle in grid cells
+    xs, xIndices = gridLines(numpy.concatenate((outer[:, 0], outer[:, 2], inner[:, 0], inner[:, 2])));
+    ys, yIndices = gridLines(numpy.concatenate((outer[:, 1], outer[:, 3], inner[:, 1], inner[:, 3])));
+    zs = numpy.array([-wallThickness, 0.0, roomHeight, roomHeight+wallThickness]);
+    roomsNum = rectangles.shape[0];
+    outerX, innerX = xIndices[0:2*roomsNum].reshape((2, -1)), xIndices[2*roomsNum:].reshape((2, -1));
+    outerY, innerY = yIndices[0:2*roomsNum].reshape((2, -1)), yIndices[2*roomsNum:].reshape((2, -1));
+
+    # the room whose walls cover each column of cells (the first one listed
+    # wins), and the room whose inside each column is in
+    owners   = numpy.full((xs.size-1, ys.size-1), -1, dtype=numpy.int32);
+    interior = numpy.full((xs.size-1, ys.size-1), -1, dtype=numpy.int32);
+    for room in reversed(range(0, roomsNum)):
+        owners[outerX[0, room]:outerX[1, room], outerY[0, room]:outerY[1, room]] = room;
+    for room in range(0, roomsNum):
+        interior[innerX[0, room]:innerX[1, room], innerY[0, room]:innerY[1, room]] = room;
+
+    # solid cells, with a border of empty cells around them: floor slab,
+    # walls and ceiling slab, from bottom to top
+    solid = numpy.zeros((xs.size+1, ys.size+1, zs.size+1), dtype=bool);
+    solid[1:-1, 1:-1, 1] = (owners >= 0);
+    solid[1:-1, 1:-1, 2] = (owners >= 0) & (interior < 0);
+    solid[1:-1, 1:-1, 3] = (owners >= 0);
+    roomOfCell = numpy.full(solid.shape, -1, dtype=numpy.int32);
+    roomOfCell[1:-1, 1:-1, 2] = interior;
+    ownerOfCell = numpy.full(solid.shape, -1, dtype=numpy.int32);
+    for level in (1, 2, 3):
+        ownerOfCell[1:-1, 1:-1, level] = owners;
+
+    nodesShape = (xs.size, ys.size, zs.size);
+    allQuads = [];
+    allSurfaces = [];
+    for axis in range(0, 3):
+        lower = [slice(None)]*3;
+        upper = [slice(None)]*3;
+        lower[axis] = slice(0, -1);
+        upper[axis] = slice(1, None);
+        lowerSolid = solid[tuple(lower)];
+        cells = numpy.nonzero(lowerSolid != solid[tuple(upper)]);
+        # +1 where the solid cell is below the face along the axis
+        direction = numpy.where(lowerSolid[cells], 1, -1);
+        lowerCells = numpy.stack(cells, axis=1);
+        upperCells = lowerCells.copy();
+        upperCells[:, axis] += 1;
+        solidCells = numpy.where((direction > 0)[:, numpy.newaxis], lowerCells, upperCells);
+        emptyCells = numpy.where((direction > 0)[:, numpy.newaxis], upperCells, lowerCells);
+
+        # the room surface of each face
+        facingRooms = roomOfCell[emptyCells[:, 0], emptyCells[:, 1], emptyCells[:, 2]];
+        ownerRooms  = ownerOfCell[solidCells[:, 0], solidCells[:, 1], solidCells[:, 2]];
+        inside = (facingRooms >= 0);
+        rooms = numpy.where(inside, facingRooms, ownerRooms);
+        sides = numpy.where(inside, direction, -direction);
+        surfaces = numpy.where(sides > 0, roomSurfaces.index(surfaceFacingRoom[(axis, 1)]), roomSurfaces.index(surfaceFacingRoom[(axis, -1)]));
+        if axis < 2:
+            surfaces[~inside & (solidCells[:, 2] == 1)] = roomSurfaces.index('floor');
+            surfaces[~inside & (solidCells[:, 2] == 3)] = roomSurfaces.index('ceiling');
+        allSurfaces.append(6*rooms + surfaces);
+
+        # the corners of each face, counterclockwise seen from the empty side
+        # (the padded cell (i,j,k) spans the grid nodes i-1 to i, along each axis)
+        uAxis = (axis+1) % 3;
+        vAxis = (axis+2) % 3;
+        corner = lowerCells - 1;
+        corner[:, axis] += 1;
+        uStep = numpy.zeros(3, dtype=numpy.int64);
+        vStep = numpy.zeros(3, dtype=numpy.int64);
+        uStep[uAxis] = 1;
+        vStep[vAxis] = 1;
+        corners = numpy.stack((corner, corner+uStep, corner+uStep+vStep, corner+vStep), axis=1);
+        corners[direction < 0] = corners[direction < 0][:, ::-1];
+        allQuads.append(numpy.ravel_multi_index((corners[:, :, 0], corners[:, :, 1], corners[:, :, 2]), nodesShape));
+
+    # keep only the grid nodes used by the faces
+    quads = numpy.concatenate(allQuads);
+    usedNodes, faces = numpy.unique(quads.reshape(-1), return_inverse=True);
+    xNodes, yNodes, zNodes = numpy.unravel_index(usedNodes, nodesShape);
+    vertices = numpy.column_stack((xs[xNodes], ys[yNodes], zs[zNodes])).astype(numpy.float32);
+    return(vertices, faces.reshape((-1, 4)).astype(numpy.int32), numpy.concatenate(allSurfaces).astype(numpy.int32));
@@ -0,0 +1,79 @@
+# Blender-free helpers for timing and progress reporting of scene building.
+
+import contextlib
+import functools
+import json
+import time
+
+
+# Class for accumulating wall-time and call-count counters, per method and
+# per category (e.g. 'mapGeneration', 'meshBuilding', 'booleanOps', 'export').
+# Nested measurements of the same category are counted once in the category
+# totals, so e.g. addRoom -> addCube is not counted twice as 'meshBuilding'.
+class timingCounters:
+    def __init__(self):
+        self.reset();
+
+    # Method to clear all counters
+    def reset(self):
+        self.methods    = {};
+        self.categories = {};
+        self.openCategories = [];
+
+    # Method to measure the wall time of a block of code
+    @contextlib.contextmanager
+    def measure(self, methodName, category):
+        isOutermost = category not in self.openCategories;
+        self.openCategories.append(category);
+        startTime = time.time();
+        try:
+            yield;
+        finally:
+            elapsedTime = time.time() - startTime;
+            self.openCategories.pop();
+            self.addTime(self.methods, methodName, elapsedTime, category);
+            if isOutermost:
+                self.addTime(self.categories, category, elapsedTime);
+
+    # Helper method to add one call to a counter
+    def addTime(self, counters, name, elapsedTime, category=None):
+        if name not in counters:
+            counters[name] = {'calls': 0, 'seconds': 0.0};
+            if category is not None:
+                counters[name]['category'] = category;
+        counters[name]['calls']   += 1;
+        counters[name]['seconds'] += elapsedTime;
+
+    # Method to get a copy of all counters
+    def summary(self):
+        return({
+            'methods'    : dict([(name, dict(counter)) for name, counter in self.methods.items()]),
+            'categories' : dict([(name, dict(counter)) for name, counter in self.categories.items()]),
+        });
+
+    # Method to write all counters to a JSON file
+    def dump(self, fileName, extra=None):
+        summary = self.summary();
+        if extra is not None:
+            summary.update(extra);
+        with open(fileName, 'w') as fileHandle:
+            json.dump(summary, fileHandle, indent=2, sort_keys=True);
+        return(fileName);
+
+
+# Decorator for sceneManager methods whose wall time and calls are counted
+# in self.timers under the method name and the given category
+def timedMethod(category):
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.timers.measure(method.__name__, category):
+                return(method(self, *args, **kwargs));
+        return(wrapper);
+    return(decorator);
+
+
+# Helper method to report progress, if there is a progress callback
+def reportProgress(progress, done, total):
+    if progress is not None:
+        progress(done, total);
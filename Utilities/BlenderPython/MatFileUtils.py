@@ -0,0 +1,291 @@
+# Blender-free reader and writer for the numeric matrices of Matlab data
+# files (.mat), in plain Python with NumPy and zlib, for the data files that
+# RenderToolbox4 reads and writes: Psychtoolbox colorimetric files (T_*.mat),
+# multispectral renderings (rtbBatchRender) and sensor images
+# (rtbMakeSensorImages).
+#
+# Level 4 files and level 5 files (the format of save's default '-v7' and of
+# '-v6'), in either byte order, are read. Only full numeric, logical and
+# character matrices are returned; structs, cells, sparse matrices and
+# objects are skipped. Uncompressed matrices whose stored type is their
+# class are memory-mapped rather than read, so that slices of large images
+# can be read without reading the whole image. Compressed matrices are
+# decompressed whole.
+#
+# Files are written in level 5 format, uncompressed, so that large matrices
+# can be filled in place, block by block (see matFileWriter.allocate).
+# Matrices are returned and written with their Matlab dimensions, in Fortran
+# (column-major) order, e.g. an image is a (height, width, channels) array.
+
+import struct
+import zlib
+
+import numpy
+
+
+# Level 5 data types, by number: NumPy type (without byte order)
+matDataTypes = {
+    1  : 'i1',
+    2  : 'u1',
+    3  : 'i2',
+    4  : 'u2',
+    5  : 'i4',
+    6  : 'u4',
+    7  : 'f4',
+    9  : 'f8',
+    12 : 'i8',
+    13 : 'u8',
+    16 : 'u1',
+    17 : 'u2',
+    18 : 'u4',
+};
+miMATRIX     = 14;
+miCOMPRESSED = 15;
+
+# Level 5 array classes, by number: NumPy type of the matrix
+matClasses = {
+    4  : 'U',
+    6  : 'f8',
+    7  : 'f4',
+    8  : 'i1',
+    9  : 'u1',
+    10 : 'i2',
+    11 : 'u2',
+    12 : 'i4',
+    13 : 'u4',
+    14 : 'i8',
+    15 : 'u8',
+};
+complexFlag = 0x0800;
+logicalFlag = 0x0200;
+
+# Level 4 precisions, by number: NumPy type (without byte order)
+matV4Precisions = {0: 'f8', 1: 'f4', 2: 'i4', 3: 'i2', 4: 'u2', 5: 'u1'};
+
+# Level 5 data type and array class of the NumPy types that can be written
+writableTypes = {
+    'f8' : (9, 6),
+    'f4' : (7, 7),
+    'i1' : (1, 8),
+    'u1' : (2, 9),
+    'i2' : (3, 10),
+    'u2' : (4, 11),
+    'i4' : (5, 12),
+    'u4' : (6, 13),
+    'i8' : (12, 14),
+    'u8' : (13, 15),
+};
+
+
+# Method to read the matrices of a .mat file, as a dictionary of arrays by
+# name. If names are given, only these matrices are read.
+def readMatFile(fileName, names=None):
+    data = numpy.memmap(fileName, dtype=numpy.uint8, mode='r');
+    if (data.size >= 128) and (bytes(data[126:128]) in (b'IM', b'MI')) and (bytes(data[124:126]) in (b'\x00\x01', b'\x01\x00')):
+        return(readMatV5(data, names));
+    return(readMatV4(data, names, fileName));
+
+
+# Helper method to read the matrices of a level 4 file
+def readMatV4(data, names, fileName):
+    matrices = {};
+    position = 0;
+    while position + 20 <= data.size:
+        # the byte order is the one in which the type code makes sense
+        for byteOrder in ('<', '>'):
+            typeCode, rowsNum, columnsNum, imaginary, nameLength = struct.unpack_from(byteOrder + '5i', data, position);
+            if (0 <= typeCode < 5000) and (typeCode // 1000 == (0 if byteOrder == '<' else 1)) and (rowsNum >= 0) and (columnsNum >= 0) and (nameLength > 0):
+                break;
+        else:
+            raise ValueError('"{}" is not a Matlab data file'.format(fileName));
+        precision = (typeCode // 10) % 10;
+        matrixType = typeCode % 10;
+        name = bytes(data[position+20:position+20+nameLength]).rstrip(b'\x00').decode('latin-1');
+        position += 20 + nameLength;
+        dtype = numpy.dtype(byteOrder + matV4Precisions[precision]);
+        count = rowsNum*columnsNum*(2 if imaginary else 1);
+        if ((names is None) or (name in names)) and (matrixType in (0, 1)):
+            values = numpy.frombuffer(data, dtype=dtype, count=rowsNum*columnsNum, offset=position);
+            matrix = values.reshape((rowsNum, columnsNum), order='F');
+            if imaginary:
+                imaginaryValues = numpy.frombuffer(data, dtype=dtype, count=rowsNum*columnsNum, offset=position + rowsNum*columnsNum*dtype.itemsize);
+                matrix = matrix + 1j*imaginaryValues.reshape((rowsNum, columnsNum), order='F');
+            elif matrixType == 1:
+                matrix = numpy.array([''.join([chr(int(code)) for code in row]) for row in matrix]);
+            else:
+                matrix = matrix.astype(dtype.newbyteorder('='));
+            matrices[name] = matrix;
+        position += count*dtype.itemsize;
+    return(matrices);
+
+
+# Helper method to read a level 5 data element tag at a position. Returns
+# the data type, the position and size of the data, and the position of the
+# next element.
+def readTag(data, position, byteOrder):
+    dataType, size = struct.unpack_from(byteOrder + 'II', data, position);
+    if dataType >> 16:
+        # small data element: the data is packed into the tag
+        return(dataType & 0xFFFF, position + 4, dataType >> 16, position + 8);
+    return(dataType, position + 8, size, position + 8 + size + (-size % 8));
+
+
+# Helper method to read the data of a level 5 data element as an array
+def readElementArray(data, position, byteOrder):
+    dataType, start, size, end = readTag(data, position, byteOrder);
+    dtype = numpy.dtype(byteOrder + matDataTypes[dataType]);
+    return(numpy.frombuffer(data, dtype=dtype, count=size//dtype.itemsize, offset=start), end);
+
+
+# Helper method to read the matrices of a level 5 file
+def readMatV5(data, names):
+    byteOrder = '<' if bytes(data[126:128]) == b'IM' else '>';
+    matrices = {};
+    position = 128;
+    while position + 8 <= data.size:
+        dataType, start, size, end = readTag(data, position, byteOrder);
+        if dataType == miCOMPRESSED:
+            # compressed elements are not padded
+            end = start + size;
+            packed = data[start:end];
+            if names is not None:
+                # the name comes first: decompress just enough to read it
+                header = zlib.decompressobj().decompress(bytes(packed[0:min(size, 256)]), 128);
+                if matrixName(header, byteOrder) not in names:
+                    position = end;
+                    continue;
+            element = numpy.frombuffer(zlib.decompress(bytes(packed)), dtype=numpy.uint8);
+            dataType, start, size, _ = readTag(element, 0, byteOrder);
+            if dataType == miMATRIX:
+                readMatrix(element, start, byteOrder, names, matrices);
+        elif dataType == miMATRIX:
+            readMatrix(data, start, byteOrder, names, matrices);
+        position = end;
+    return(matrices);
+
+
+# Helper method to get the name of a level 5 matrix from the start of its
+# (decompressed) element, or None
+def matrixName(header, byteOrder):
+    try:
+        header = numpy.frombuffer(header, dtype=numpy.uint8);
+        dataType, start, size, _ = readTag(header, 0, byteOrder);
+        position = readTag(header, start, byteOrder)[3];
+        position = readTag(header, position, byteOrder)[3];
+        dataType, start, size, _ = readTag(header, position, byteOrder);
+        return(bytes(header[start:start+size]).decode('latin-1'));
+    except (struct.error, ValueError):
+        return(None);
+
+
+# Helper method to read a level 5 matrix into matrices, by name, if it is
+# numeric, logical or character, and if its name is wanted
+def readMatrix(data, position, byteOrder, names, matrices):
+    flags, position = readElementArray(data, position, byteOrder);
+    dimensions, position = readElementArray(data, position, byteOrder);
+    dataType, start, size, position = readTag(data, position, byteOrder);
+    name = bytes(data[start:start+size]).decode('latin-1');
+    matrixClass = int(flags[0]) & 0xFF;
+    if (not name) or ((names is not None) and (name not in names)) or (matrixClass not in matClasses):
+        return;
+
+    shape = tuple([int(dimension) for dimension in dimensions]);
+    realPart, position = readElementArray(data, position, byteOrder);
+    if int(flags[0]) & complexFlag:
+        imaginaryPart, position = readElementArray(data, position, byteOrder);
+        realPart = realPart + 1j*imaginaryPart;
+    if matrixClass == 4:
+        codes = realPart.reshape(shape, order='F');
+        matrices[name] = numpy.array([''.join([chr(int(code)) for code in row]) for row in codes.reshape((shape[0], -1))]);
+        return;
+    classType = numpy.dtype(matClasses[matrixClass]);
+    if int(flags[0]) & logicalFlag:
+        classType = numpy.dtype(bool);
+    if realPart.dtype.kind != 'c':
+        if realPart.dtype.newbyteorder('=') == classType:
+            # keep the memory-mapped values, in the file's byte order
+            classType = realPart.dtype;
+        realPart = realPart.astype(classType, copy=False);
+    matrices[name] = realPart.reshape(shape, order='F');
+
+
+# Class for a level 5 .mat file being written. Matrices are added with
+# write, or with allocate, which makes room for a matrix in the file and
+# returns a memory-mapped array to fill in.
+class matFileWriter:
+    def __init__(self, fileName, description='RenderToolbox4'):
+        self.fileName = fileName;
+        header = 'MATLAB 5.0 MAT-file, {}'.format(description).encode('latin-1')[0:116];
+        self.fileHandle = open(fileName, 'wb');
+        self.fileHandle.write(header.ljust(116, b' ') + b'\x00'*8 + struct.pack('<H', 0x0100) + b'IM');
+        self.size = 128;
+        self.arrays = [];
+
+    # Helper method to pack a data element (tag and data, padded to 8 bytes)
+    def packElement(self, dataType, payload):
+        return(struct.pack('<II', dataType, len(payload)) + payload + b'\x00'*(-len(payload) % 8));
+
+    # Method to add a matrix with the given shape and NumPy type, and get the
+    # (memory-mapped, Fortran-ordered) array of its values, which starts
+    # out filled with zeros
+    def allocate(self, name, shape, dtype=numpy.float64):
+        dtype = numpy.dtype(dtype).newbyteorder('<');
+        if dtype.str[1:] not in writableTypes:
+            raise ValueError('Matrices of type {} cannot be written to .mat files'.format(dtype));
+        dataType, matrixClass = writableTypes[dtype.str[1:]];
+        shape = tuple([int(dimension) for dimension in shape]);
+        if len(shape) < 2:
+            shape = shape + (1,)*(2-len(shape));
+        dataSize = int(numpy.prod(shape))*dtype.itemsize;
+        header  = self.packElement(6, struct.pack('<II', matrixClass, 0));
+        header += self.packElement(5, struct.pack('<{}i'.format(len(shape)), *shape));
+        header += self.packElement(1, name.encode('latin-1'));
+        header += struct.pack('<II', dataType, dataSize);
+        elementSize = len(header) + dataSize + (-dataSize % 8);
+        if elementSize >= 2**32:
+            raise ValueError('Matrix "{}" is too large for a level 5 .mat file'.format(name));
+
+        self.fileHandle.seek(self.size);
+        self.fileHandle.write(struct.pack('<II', miMATRIX, elementSize) + header);
+        dataStart = self.size + 8 + len(header);
+        self.size += 8 + elementSize;
+        self.fileHandle.truncate(self.size);
+        self.fileHandle.flush();
+        if dataSize == 0:
+            return(numpy.zeros(shape, dtype=dtype, order='F'));
+        values = numpy.memmap(self.fileName, dtype=dtype, mode='r+', offset=dataStart, shape=shape, order='F');
+        self.arrays.append(values);
+        return(values);
+
+    # Method to add a matrix with the given values (a number, a vector or an array)
+    def write(self, name, values):
+        values = numpy.asarray(values);
+        if values.dtype == bool:
+            values = values.astype(numpy.uint8);
+        elif values.dtype.kind not in 'iuf':
+            raise ValueError('Matrix "{}" is not numeric'.format(name));
+        if values.ndim < 2:
+            values = values.reshape((1, -1));
+        self.allocate(name, values.shape, values.dtype)[...] = values;
+
+    # Method to flush the matrices to the file and close it
+    def close(self):
+        for values in self.arrays:
+            if isinstance(values, numpy.memmap):
+                values.flush();
+        self.arrays = [];
+        self.fileHandle.close();
+
+    def __enter__(self):
+        return(self);
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close();
+
+
+# Method to write a dictionary of matrices, by name, to a level 5 .mat file
+def writeMatFile(fileName, matrices):
+    with matFileWriter(fileName) as writer:
+        for name in sorted(matrices):
+            writer.write(name, matrices[name]);
+    return(fileName);
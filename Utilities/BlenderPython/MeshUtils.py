@@ -0,0 +1,265 @@
+# Blender-free helpers for generating mesh arrays with NumPy.
+# Meshes are described by a (N,3) float32 array of vertex coordinates, a flat
+# int32 array of per-loop vertex indices, and an int32 array with the number
+# of vertices (loops) of each face, i.e. the same layout as Blender's
+# mesh.vertices['co'], mesh.loops['vertex_index'] and mesh.polygons['loop_total'].
+
+import math
+
+import numpy
+
+
+# Helper method to convert faces to (loopVertexIndices, faceSizes) arrays.
+# Faces can be given as a (F,K) array (K vertices per face), as a list of
+# index sequences, or as an already converted (loopVertexIndices, faceSizes) pair.
+def faceArrays(faces):
+    if isinstance(faces, tuple) and (len(faces) == 2) and (numpy.ndim(faces[1]) == 1) and (numpy.ndim(faces[0]) == 1):
+        return(numpy.asarray(faces[0], dtype=numpy.int32), numpy.asarray(faces[1], dtype=numpy.int32));
+    if isinstance(faces, numpy.ndarray):
+        faces = numpy.asarray(faces, dtype=numpy.int32);
+        return(faces.reshape(-1), numpy.full(faces.shape[0], faces.shape[1], dtype=numpy.int32));
+    faceSizes = numpy.array([len(face) for face in faces], dtype=numpy.int32);
+    loopVertexIndices = numpy.array([index for face in faces for index in face], dtype=numpy.int32);
+    return(loopVertexIndices, faceSizes);
+
+
+# Helper method to compute the (unnormalized) normal of each face with Newell's method
+def faceNormals(vertices, loopVertexIndices, faceSizes):
+    vertices  = numpy.asarray(vertices, dtype=numpy.float64);
+    loopStart = numpy.concatenate(([0], numpy.cumsum(faceSizes)[:-1])).astype(numpy.int64);
+    # index of the next loop within the same face
+    loopNum   = numpy.arange(loopVertexIndices.size, dtype=numpy.int64);
+    faceOfLoop = numpy.repeat(numpy.arange(faceSizes.size), faceSizes);
+    nextLoop  = loopNum + 1;
+    lastLoops = loopStart + faceSizes - 1;
+    nextLoop[lastLoops] = loopStart;
+    current = vertices[loopVertexIndices];
+    following = vertices[loopVertexIndices[nextLoop]];
+    terms = numpy.empty_like(current);
+    terms[:, 0] = (current[:, 1]-following[:, 1])*(current[:, 2]+following[:, 2]);
+    terms[:, 1] = (current[:, 2]-following[:, 2])*(current[:, 0]+following[:, 0]);
+    terms[:, 2] = (current[:, 0]-following[:, 0])*(current[:, 1]+following[:, 1]);
+    normals = numpy.zeros((faceSizes.size, 3), dtype=numpy.float64);
+    for axis in range(0, 3):
+        normals[:, axis] = numpy.bincount(faceOfLoop, weights=terms[:, axis], minlength=faceSizes.size);
+    return(normals);
+
+
+# Helper method to scale vectors to unit length (zero vectors are left as is)
+def normalizeVectors(vectors):
+    lengths = numpy.sqrt(numpy.sum(vectors*vectors, axis=1));
+    lengths[lengths == 0] = 1.0;
+    return(vectors/lengths[:, numpy.newaxis]);
+
+
+# Method to compute unit face normals, and, for smooth meshes, unit vertex normals
+# (area weighted averages of the adjoining face normals)
+def meshNormals(vertices, loopVertexIndices, faceSizes, smooth=False):
+    normals = faceNormals(vertices, loopVertexIndices, faceSizes);
+    if not smooth:
+        return(normalizeVectors(normals).astype(numpy.float32));
+    faceOfLoop = numpy.repeat(numpy.arange(faceSizes.size), faceSizes);
+    vertexNormals = numpy.zeros((len(vertices), 3), dtype=numpy.float64);
+    for axis in range(0, 3):
+        vertexNormals[:, axis] = numpy.bincount(loopVertexIndices, weights=normals[faceOfLoop, axis], minlength=len(vertices));
+    return(normalizeVectors(vertexNormals).astype(numpy.float32));
+
+
+# Method to generate a cube with vertices at +/-1 (as bpy.ops.mesh.primitive_cube_add)
+def cubeMeshArrays():
+    vertices = numpy.array([(-1,-1,-1), (-1,-1, 1), (-1, 1,-1), (-1, 1, 1),
+                            ( 1,-1,-1), ( 1,-1, 1), ( 1, 1,-1), ( 1, 1, 1)], dtype=numpy.float32);
+    faces = numpy.array([(0,1,3,2), (2,3,7,6), (6,7,5,4), (4,5,1,0), (2,6,4,0), (7,3,1,5)], dtype=numpy.int32);
+    return(vertices, faceArrays(faces));
+
+
+# Method to generate a cylinder of unit radius and depth along z, with n-gon
+# caps (as bpy.ops.mesh.primitive_cylinder_add(radius=1, depth=1, end_fill_type='NGON'))
+def cylinderMeshArrays(verticesNum=128):
+    angles = 2*math.pi*numpy.arange(verticesNum)/verticesNum;
+    ring = numpy.column_stack((numpy.sin(angles), -numpy.cos(angles)));
+    vertices = numpy.empty((2*verticesNum, 3), dtype=numpy.float32);
+    # interleaved bottom/top vertices
+    vertices[0::2, 0:2] = ring;
+    vertices[0::2, 2]   = -0.5;
+    vertices[1::2, 0:2] = ring;
+    vertices[1::2, 2]   = 0.5;
+
+    bottom = 2*numpy.arange(verticesNum, dtype=numpy.int32);
+    nextBottom = numpy.roll(bottom, -1);
+    sides = numpy.column_stack((bottom, nextBottom, nextBottom+1, bottom+1));
+    loopVertexIndices = numpy.concatenate((sides.reshape(-1), (bottom+1), bottom[::-1]));
+    faceSizes = numpy.concatenate((numpy.full(verticesNum, 4, dtype=numpy.int32), [verticesNum, verticesNum])).astype(numpy.int32);
+    return(vertices, (loopVertexIndices.astype(numpy.int32), faceSizes));
+
+
+# Method to generate an icosphere of unit radius (as bpy.ops.mesh.primitive_ico_sphere_add(size=1)).
+# subdivisions=1 gives the icosahedron, each further level splits every triangle in 4.
+def icoSphereMeshArrays(subdivisions=5):
+    t = (1.0 + math.sqrt(5.0))/2.0;
+    vertices = numpy.array([(-1, t, 0), (1, t, 0), (-1,-t, 0), (1,-t, 0),
+                            ( 0,-1, t), (0, 1, t), ( 0,-1,-t), (0, 1,-t),
+                            ( t, 0,-1), (t, 0, 1), (-t, 0,-1), (-t, 0, 1)], dtype=numpy.float64);
+    faces = numpy.array([(0,11,5), (0,5,1), (0,1,7), (0,7,10), (0,10,11),
+                         (1,5,9), (5,11,4), (11,10,2), (10,7,6), (7,1,8),
+                         (3,9,4), (3,4,2), (3,2,6), (3,6,8), (3,8,9),
+                         (4,9,5), (2,4,11), (6,2,10), (8,6,7), (9,8,1)], dtype=numpy.int64);
+    vertices = normalizeVectors(vertices);
+
+    for level in range(1, subdivisions):
+        # one new vertex per unique edge
+        edges = numpy.concatenate((faces[:, [0,1]], faces[:, [1,2]], faces[:, [2,0]]));
+        edges.sort(axis=1);
+        uniqueEdges, edgeIndex = numpy.unique(edges[:, 0]*len(vertices) + edges[:, 1], return_inverse=True);
+        midpoints = normalizeVectors(0.5*(vertices[uniqueEdges // len(vertices)] + vertices[uniqueEdges % len(vertices)]));
+        midpointIndex = (edgeIndex.reshape(3, -1) + len(vertices));
+        a, b, c = faces[:, 0], faces[:, 1], faces[:, 2];
+        ab, bc, ca = midpointIndex[0], midpointIndex[1], midpointIndex[2];
+        faces = numpy.concatenate((numpy.column_stack((a, ab, ca)),
+                                   numpy.column_stack((b, bc, ab)),
+                                   numpy.column_stack((c, ca, bc)),
+                                   numpy.column_stack((ab, bc, ca))));
+        vertices = numpy.concatenate((vertices, midpoints));
+
+    return(vertices.astype(numpy.float32), faceArrays(faces.astype(numpy.int32)));
+
+
+# Method to generate a unit planar quad in the z=0 plane, optionally facing -z
+def planarQuadMeshArrays(flipNormal=False, vertices=None):
+    if vertices is None:
+        vertices = [(-0.5, -0.5, 0),(0.5, -0.5, 0),(0.5, 0.5, 0),(-0.5, 0.5, 0)];
+    if flipNormal:
+        faces = numpy.array([(3,2,1,0)], dtype=numpy.int32);
+    else:
+        faces = numpy.array([(0,1,2,3)], dtype=numpy.int32);
+    return(numpy.asarray(vertices, dtype=numpy.float32), faceArrays(faces));
+
+
+# Method to split faces with more than maxFaceSize vertices into triangle fans
+# (fine for the convex faces generated here). Returns the new loop vertex
+# indices and face sizes, and the index of the original face of each new face.
+def triangulateLargeFaces(loopVertexIndices, faceSizes, maxFaceSize=4):
+    loopVertexIndices = numpy.asarray(loopVertexIndices, dtype=numpy.int32);
+    faceSizes = numpy.asarray(faceSizes, dtype=numpy.int32);
+    isLarge = faceSizes > maxFaceSize;
+    if not numpy.any(isLarge):
+        return(loopVertexIndices, faceSizes, numpy.arange(faceSizes.size));
+
+    loopStart = numpy.concatenate(([0], numpy.cumsum(faceSizes)[:-1]));
+    # n-2 triangles (first, k, k+1) per large face
+    largeFaces = numpy.nonzero(isLarge)[0];
+    trianglesNum = faceSizes[largeFaces] - 2;
+    triangleFace = numpy.repeat(largeFaces, trianglesNum);
+    triangleStart = numpy.repeat(numpy.cumsum(trianglesNum) - trianglesNum, trianglesNum);
+    k = numpy.arange(triangleFace.size) - triangleStart + 1;
+    first = loopStart[triangleFace];
+    triangles = numpy.column_stack((loopVertexIndices[first], loopVertexIndices[first+k], loopVertexIndices[first+k+1]));
+
+    # keep the other faces in place, followed by the triangles
+    keptFaces = numpy.nonzero(~isLarge)[0];
+    keptLoops = numpy.repeat(~isLarge, faceSizes);
+    newLoopVertexIndices = numpy.concatenate((loopVertexIndices[keptLoops], triangles.reshape(-1))).astype(numpy.int32);
+    newFaceSizes = numpy.concatenate((faceSizes[keptFaces], numpy.full(triangleFace.size, 3, dtype=numpy.int32))).astype(numpy.int32);
+    return(newLoopVertexIndices, newFaceSizes, numpy.concatenate((keptFaces, triangleFace)));
+
+
+# Method to get the bounds of a mesh that is an axis-aligned box (8 corner
+# vertices, and 6 quads or 12 triangles), as (boxMin, boxMax) float64 arrays.
+# Returns None for any other mesh.
+def axisAlignedBoxBounds(vertices, faceSizes, tolerance=1e-6):
+    vertices = numpy.asarray(vertices, dtype=numpy.float64).reshape((-1, 3));
+    faceSizes = numpy.asarray(faceSizes);
+    if (vertices.shape[0] != 8) or (int(numpy.sum(faceSizes - 2)) != 12):
+        return(None);
+    boxMin = vertices.min(axis=0);
+    boxMax = vertices.max(axis=0);
+    onBounds = (numpy.abs(vertices - boxMin) <= tolerance) | (numpy.abs(vertices - boxMax) <= tolerance);
+    corners = set([tuple(row) for row in (numpy.abs(vertices - boxMax) <= tolerance)]);
+    if (not numpy.all(onBounds)) or (len(corners) != 8) or numpy.any(boxMax - boxMin <= tolerance):
+        return(None);
+    return(boxMin, boxMax);
+
+
+# Method to transform an axis-aligned box by a 4x4 matrix. Returns the
+# bounds of the transformed box, or None if it is no longer axis-aligned,
+# i.e. if the matrix does more than scale, translate and swap axes.
+def transformAxisAlignedBox(matrix, boxMin, boxMax, tolerance=1e-9):
+    linear = numpy.asarray(matrix, dtype=numpy.float64)[0:3, 0:3];
+    nonzero = numpy.abs(linear) > tolerance*numpy.max(numpy.abs(linear));
+    if not (numpy.all(numpy.sum(nonzero, axis=0) == 1) and numpy.all(numpy.sum(nonzero, axis=1) == 1)):
+        return(None);
+    corners = numpy.array([(x, y, z) for x in (boxMin[0], boxMax[0]) for y in (boxMin[1], boxMax[1]) for z in (boxMin[2], boxMax[2])]);
+    corners = corners.dot(numpy.asarray(matrix, dtype=numpy.float64)[0:3, 0:3].T) + numpy.asarray(matrix, dtype=numpy.float64)[0:3, 3];
+    return(corners.min(axis=0), corners.max(axis=0));
+
+
+# Method to get the openings that axis-aligned box cutters make in a slab,
+# i.e. in an axis-aligned box that is thin along thinAxis. Cutters that miss
+# the slab are skipped, and the others are clipped to it. Returns a list of
+# (holeMin, holeMax) bounds, or None if a cutter does not go through the slab.
+def slabOpenings(slabMin, slabMax, thinAxis, cutterBoxes, tolerance=1e-6):
+    openings = [];
+    for cutterMin, cutterMax in cutterBoxes:
+        holeMin = numpy.maximum(cutterMin, slabMin);
+        holeMax = numpy.minimum(cutterMax, slabMax);
+        if numpy.any(holeMax - holeMin <= tolerance):
+            continue;
+        if (cutterMin[thinAxis] > slabMin[thinAxis] + tolerance) or (cutterMax[thinAxis] < slabMax[thinAxis] - tolerance):
+            return(None);
+        openings.append((holeMin, holeMax));
+    return(openings);
+
+
+# Method to generate a slab (an axis-aligned box, thin along thinAxis) with
+# rectangular openings through it, given as (holeMin, holeMax) bounds
+# within the slab (see slabOpenings). The face of the slab is split along
+# all opening edges into a grid of cells, whose solid cells get front and
+# back quads, and whose boundaries with openings get side quads. All quads
+# share the vertices of the grid, so the mesh is watertight, with outward
+# normals. Returns a (N,3) float32 array of vertices and a (F,4) int32 array of faces.
+def slabWithOpeningsMeshArrays(slabMin, slabMax, thinAxis, openings):
+    # (u, v, thin) is a right-handed frame
+    u, v = {0: (1, 2), 1: (2, 0), 2: (0, 1)}[thinAxis];
+    us = numpy.unique([slabMin[u], slabMax[u]] + [bounds[k][u] for bounds in openings for k in (0, 1)]);
+    vs = numpy.unique([slabMin[v], slabMax[v]] + [bounds[k][v] for bounds in openings for k in (0, 1)]);
+
+    # solid cells, with a border of empty cells around the slab
+    uCenters = (us[:-1] + us[1:])/2;
+    vCenters = (vs[:-1] + vs[1:])/2;
+    solid = numpy.zeros((us.size+1, vs.size+1), dtype=bool);
+    solid[1:-1, 1:-1] = True;
+    for holeMin, holeMax in openings:
+        inU = (uCenters > holeMin[u]) & (uCenters < holeMax[u]);
+        inV = (vCenters > holeMin[v]) & (vCenters < holeMax[v]);
+        solid[1:-1, 1:-1][numpy.ix_(inU, inV)] = False;
+
+    # grid vertices at the back (side 0) and front (side 1) of the slab
+    vertices = numpy.empty((2, us.size, vs.size, 3), dtype=numpy.float64);
+    vertices[:, :, :, u] = us[numpy.newaxis, :, numpy.newaxis];
+    vertices[:, :, :, v] = vs[numpy.newaxis, numpy.newaxis, :];
+    vertices[0, :, :, thinAxis] = slabMin[thinAxis];
+    vertices[1, :, :, thinAxis] = slabMax[thinAxis];
+    index = numpy.arange(vertices.size//3).reshape((2, us.size, vs.size));
+
+    # front and back quads of the solid cells (counterclockwise seen from outside)
+    i, j = numpy.nonzero(solid[1:-1, 1:-1]);
+    front = numpy.column_stack((index[1, i, j], index[1, i+1, j], index[1, i+1, j+1], index[1, i, j+1]));
+    back  = numpy.column_stack((index[0, i, j+1], index[0, i+1, j+1], index[0, i+1, j], index[0, i, j]));
+
+    # side quads where solid cells meet empty ones, across grid lines of constant u ...
+    change = solid[1:, 1:-1].astype(numpy.int8) - solid[:-1, 1:-1];
+    i, j = numpy.nonzero(change);
+    sides = [numpy.where((change[i, j] < 0)[:, numpy.newaxis],
+        numpy.column_stack((index[0, i, j], index[0, i, j+1], index[1, i, j+1], index[1, i, j])),
+        numpy.column_stack((index[1, i, j], index[1, i, j+1], index[0, i, j+1], index[0, i, j])))];
+    # ... and of constant v
+    change = solid[1:-1, 1:].astype(numpy.int8) - solid[1:-1, :-1];
+    i, j = numpy.nonzero(change);
+    sides.append(numpy.where((change[i, j] < 0)[:, numpy.newaxis],
+        numpy.column_stack((index[0, i, j], index[1, i, j], index[1, i+1, j], index[0, i+1, j])),
+        numpy.column_stack((index[0, i+1, j], index[1, i+1, j], index[1, i, j], index[0, i, j]))));
+
+    # keep only the vertices used by the quads
+    faces = numpy.concatenate([front, back] + sides);
+    usedIndices, faces = numpy.unique(faces.reshape(-1), return_inverse=True);
+    return(vertices.reshape((-1, 3))[usedIndices].astype(numpy.float32), faces.reshape((-1, 4)).astype(numpy.int32));
@@ -0,0 +1,419 @@
+# Blender-free reader for multispectral OpenEXR images, as written by the
+# renderers, in plain Python with NumPy and zlib (no OpenEXR library needed).
+#
+# The file is memory-mapped and only its header is parsed up front. Channels
+# are decoded on demand, for a range of scanlines: only the blocks of lines
+# that cover the range are read and decompressed, and only the requested
+# channels are converted. The lines of a block hold all channels, so reading
+# a single wavelength over the whole image still decompresses every block;
+# reading several channels in one call decompresses each block only once.
+#
+# Single-part scanline images are supported, with channels of HALF, FLOAT or
+# UINT pixels, without subsampling, and with NONE, RLE, ZIPS or ZIP
+# compression (the compressions written by Mitsuba, PBRT and Blender by
+# default). Other files raise a ValueError.
+#
+# Slice names are mapped to wavelengths as rtbWlsFromSliceNames.m does, and
+# readMultispectralEXR and readMultichannelEXR return what
+# rtbReadMultispectralEXR.m and rtbReadMultichannelEXR.m return, with
+# zero-based channel indices.
+#
+# exrWriter writes FLOAT channels to single-part scanline images with ZIP
+# compression, block by block, e.g. for textures computed in strips.
+
+import math
+import re
+import struct
+import zlib
+
+import numpy
+
+
+exrMagic = 20000630;
+
+# Version flags
+tiledFlag     = 0x200;
+deepFlag      = 0x800;
+multipartFlag = 0x1000;
+
+# Pixel types, by their number in the file: name and NumPy type
+pixelTypes = {
+    0 : ('UINT',  numpy.dtype('<u4')),
+    1 : ('HALF',  numpy.dtype('<f2')),
+    2 : ('FLOAT', numpy.dtype('<f4')),
+};
+
+# Compressions, by their number in the file: name and scanlines per block
+compressions = {
+    0 : ('NONE',  1),
+    1 : ('RLE',   1),
+    2 : ('ZIPS',  1),
+    3 : ('ZIP',   16),
+    4 : ('PIZ',   32),
+    5 : ('PXR24', 16),
+    6 : ('B44',   32),
+    7 : ('B44A',  32),
+    8 : ('DWAA',  32),
+    9 : ('DWAB',  256),
+};
+supportedCompressions = ('NONE', 'RLE', 'ZIPS', 'ZIP');
+
+
+# Helper method to split an sscanf format (such as '%f-%f') into regular
+# expressions, one per conversion or literal
+def scanfExpressions(namePattern):
+    expressions = [];
+    for token in re.findall(r'%[fgde]|%%|\s+|.', namePattern, re.DOTALL):
+        if token in ('%f', '%g', '%e'):
+            expressions.append((re.compile(r'\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)'), True));
+        elif token == '%d':
+            expressions.append((re.compile(r'\s*([-+]?\d+)'), True));
+        elif token.isspace():
+            expressions.append((re.compile(r'\s*'), False));
+        else:
+            expressions.append((re.compile(re.escape(token[-1])), False));
+    return(expressions);
+
+
+# Helper method to read numbers from text as Matlab's sscanf does: the format
+# is applied over and over, and scanning stops at the first mismatch
+def scanNumbers(text, namePattern):
+    expressions = scanfExpressions(namePattern);
+    numbers = [];
+    position = 0;
+    while position < len(text):
+        start = position;
+        for expression, isConversion in expressions:
+            match = expression.match(text, position);
+            if match is None:
+                return(numbers);
+            if isConversion:
+                numbers.append(float(match.group(1)));
+            position = match.end();
+        if position == start:
+            break;
+    return(numbers);
+
+
+# Helper method to get the wavelength of a slice from its name: the number it
+# scans to, or the mean of the two numbers it scans to, or None
+def sliceWavelength(sliceName, namePattern='%f-%f'):
+    band = scanNumbers(sliceName, namePattern);
+    if len(band) in (1, 2):
+        return(float(numpy.mean(band)));
+    return(None);
+
+
+# Method to summarize evenly spaced wavelengths in "S" format: [start delta n]
+# (as Psychtoolbox's MakeItS)
+def makeItS(wls):
+    wls = numpy.asarray(wls, dtype=numpy.float64).reshape(-1);
+    if wls.size == 0:
+        return(numpy.zeros(0));
+    delta = wls[1] - wls[0] if wls.size > 1 else 0.0;
+    return(numpy.array([wls[0], delta, wls.size]));
+
+
+# Method to get wavelengths from slice names, as rtbWlsFromSliceNames.m does.
+# A slice name that scans to one number is a band center, one that scans to
+# two numbers gives the edges of a band. Returns the sorted band centers, the
+# S summary of the wavelengths, and the (zero-based) order that sorts all
+# slices by wavelength, where slices that are not spectral bands count as 0.
+def wlsFromSliceNames(sliceNames, namePattern='%f-%f'):
+    wls = numpy.zeros(len(sliceNames));
+    isSpectralBand = numpy.zeros(len(sliceNames), dtype=bool);
+    for index, sliceName in enumerate(sliceNames):
+        wavelength = sliceWavelength(sliceName, namePattern);
+        if wavelength is not None:
+            wls[index] = wavelength;
+            isSpectralBand[index] = True;
+    order = numpy.argsort(wls, kind='mergesort');
+    wls = wls[order][isSpectralBand[order]];
+    return(wls, makeItS(wls), order);
+
+
+# Helper method to undo the byte predictor of the RLE and ZIP compressions.
+# The result holds the even bytes of the data, then its odd bytes.
+def predictBytes(data):
+    source = numpy.frombuffer(data, dtype=numpy.uint8);
+    deltas = source - numpy.uint8(128);
+    deltas[0] = source[0];
+    # uint8 sums wrap around, as the predictor does
+    return(numpy.cumsum(deltas, dtype=numpy.uint8));
+
+
+# Helper method to apply the byte predictor of the RLE and ZIP compressions
+# to the even bytes of data followed by its odd bytes (see predictBytes)
+def unpredictBytes(data):
+    source = numpy.frombuffer(data, dtype=numpy.uint8);
+    interleaved = numpy.concatenate((source[0::2], source[1::2]));
+    deltas = numpy.empty_like(interleaved);
+    deltas[0] = interleaved[0];
+    # uint8 differences wrap around, as the predictor does
+    deltas[1:] = interleaved[1:] - interleaved[:-1] + numpy.uint8(128);
+    return(deltas);
+
+
+# Helper method to expand RLE compressed data: a negative count n is followed
+# by -n literal bytes, a count n >= 0 by one byte repeated n+1 times
+def expandRunLengths(data):
+    data = bytes(data);
+    pieces = [];
+    position = 0;
+    while position < len(data):
+        count = struct.unpack_from('<b', data, position)[0];
+        position += 1;
+        if count < 0:
+            pieces.append(data[position:position-count]);
+            position -= count;
+        else:
+            pieces.append(data[position:position+1]*(count+1));
+            position += 1;
+    return(b''.join(pieces));
+
+
+# Class for a multispectral (or any multichannel) OpenEXR file, whose
+# channels are decoded on demand
+class multispectralEXR:
+    def __init__(self, fileName, namePattern='%f-%f'):
+        self.fileName = fileName;
+        self.data = numpy.memmap(fileName, dtype=numpy.uint8, mode='r');
+        self.parseHeader();
+
+        # channel layout of a scanline
+        self.channelNames = [channel['name'] for channel in self.channels];
+        self.channelOffsets = {};
+        offset = 0;
+        for channel in self.channels:
+            self.channelOffsets[channel['name']] = offset;
+            offset += self.width*channel['dtype'].itemsize;
+        self.lineBytes = offset;
+
+        self.wls, self.S, self.order = wlsFromSliceNames(self.channelNames, namePattern);
+        # the names of the spectral slices, sorted by wavelength
+        self.sliceNames = [self.channelNames[index] for index in self.order if sliceWavelength(self.channelNames[index], namePattern) is not None];
+
+    # Helper method to read the header attributes and the block offsets
+    def parseHeader(self):
+        magic, version = struct.unpack_from('<ii', self.data, 0);
+        if magic != exrMagic:
+            raise ValueError('"{}" is not an OpenEXR file'.format(self.fileName));
+        if version & (tiledFlag | deepFlag | multipartFlag):
+            raise ValueError('"{}" is tiled, deep or multi-part: only single-part scanline OpenEXR files are supported'.format(self.fileName));
+
+        self.attributes = {};
+        position = 8;
+        while self.data[position] != 0:
+            name, position = self.readString(position);
+            typeName, position = self.readString(position);
+            size = struct.unpack_from('<i', self.data, position)[0];
+            position += 4;
+            self.attributes[name] = (typeName, bytes(self.data[position:position+size]));
+            position += size;
+        position += 1;
+
+        self.channels = self.parseChannels(self.attributes['channels'][1]);
+        xMin, yMin, xMax, yMax = struct.unpack('<4i', self.attributes['dataWindow'][1]);
+        self.xMin, self.yMin = xMin, yMin;
+        self.width  = xMax - xMin + 1;
+        self.height = yMax - yMin + 1;
+        self.compression, self.linesPerBlock = compressions.get(self.attributes['compression'][1][0], ('UNKNOWN', 1));
+        if self.compression not in supportedCompressions:
+            raise ValueError('"{}" uses {} compression: only {} are supported'.format(self.fileName, self.compression, ', '.join(supportedCompressions)));
+
+        blocksNum = int(math.ceil(self.height/float(self.linesPerBlock)));
+        self.blockOffsets = numpy.frombuffer(self.data, dtype='<u8', count=blocksNum, offset=position).astype(numpy.int64);
+
+    # Helper method to read a null-terminated string
+    def readString(self, position):
+        end = position;
+        while self.data[end] != 0:
+            end += 1;
+        return(bytes(self.data[position:end]).decode('utf-8'), end+1);
+
+    # Helper method to parse the channel list, with the fields of rtbReadMultichannelEXR's channelInfo
+    def parseChannels(self, value):
+        channels = [];
+        position = 0;
+        while value[position] != 0:
+            end = value.index(b'\0', position);
+            name = value[position:end].decode('utf-8');
+            pixelType, pLinear, xSampling, ySampling = struct.unpack_from('<iB3xii', value, end+1);
+            position = end + 17;
+            if pixelType not in pixelTypes:
+                raise ValueError('Channel "{}" of "{}" has an unknown pixel type'.format(name, self.fileName));
+            if (xSampling != 1) or (ySampling != 1):
+                raise ValueError('Channel "{}" of "{}" is subsampled, which is not supported'.format(name, self.fileName));
+            channels.append({
+                'name'      : name,
+                'pixelType' : pixelTypes[pixelType][0],
+                'xSampling' : xSampling,
+                'ySampling' : ySampling,
+                'isLinear'  : bool(pLinear),
+                'dtype'     : pixelTypes[pixelType][1],
+            });
+        return(channels);
+
+    # Method to get the decompressed scanlines of a block, split into their
+    # even and odd bytes, as two (lines, lineBytes/2) uint8 arrays. This is
+    # how RLE and ZIP store them, and the bytes of channels that are not read
+    # are never interleaved. All pixel types have an even number of bytes.
+    def readBlock(self, blockIndex):
+        offset = int(self.blockOffsets[blockIndex]);
+        y, packedSize = struct.unpack_from('<ii', self.data, offset);
+        linesNum = min(self.linesPerBlock, self.yMin + self.height - y);
+        rawSize = linesNum*self.lineBytes;
+        packed = self.data[offset+8:offset+8+packedSize];
+        if (packedSize >= rawSize) or (self.compression == 'NONE'):
+            # blocks that do not compress are stored as they are
+            lines = numpy.asarray(packed[0:rawSize]).reshape((linesNum, self.lineBytes));
+            return(lines[:, 0::2], lines[:, 1::2]);
+        if self.compression == 'RLE':
+            predicted = predictBytes(expandRunLengths(packed));
+        else:
+            predicted = predictBytes(zlib.decompress(packed));
+        if predicted.size != rawSize:
+            raise ValueError('Block at line {} of "{}" is corrupt'.format(y, self.fileName));
+        return(predicted[0:rawSize//2].reshape((linesNum, -1)), predicted[rawSize//2:].reshape((linesNum, -1)));
+
+    # Method to read channels, by name, for the lines yStart to yEnd-1 (counted
+    # from the top of the data window, all lines by default). Returns a
+    # (lines, width, channels) array of the given type.
+    def readChannels(self, names, yStart=0, yEnd=None, dtype=numpy.float32):
+        if yEnd is None:
+            yEnd = self.height;
+        if not (0 <= yStart < yEnd <= self.height):
+            raise ValueError('Lines {} to {} are outside of the {} lines of "{}"'.format(yStart, yEnd, self.height, self.fileName));
+        channels = [self.channels[self.channelNames.index(name)] for name in names];
+        image = numpy.empty((yEnd-yStart, self.width, len(channels)), dtype=dtype);
+        for blockIndex in range(yStart//self.linesPerBlock, (yEnd-1)//self.linesPerBlock + 1):
+            evenBytes, oddBytes = self.readBlock(blockIndex);
+            blockStart = blockIndex*self.linesPerBlock;
+            first = max(yStart, blockStart);
+            last  = min(yEnd, blockStart + evenBytes.shape[0]);
+            for index, channel in enumerate(channels):
+                start = self.channelOffsets[channel['name']]//2;
+                count = self.width*channel['dtype'].itemsize//2;
+                pixels = numpy.empty((last-first, count, 2), dtype=numpy.uint8);
+                pixels[:, :, 0] = evenBytes[first-blockStart:last-blockStart, start:start+count];
+                pixels[:, :, 1] = oddBytes[first-blockStart:last-blockStart, start:start+count];
+                image[first-yStart:last-yStart, :, index] = pixels.reshape((last-first, -1)).view(channel['dtype']);
+        return(image);
+
+    # Method to read one channel, by name, as a (lines, width) array
+    def readChannel(self, name, yStart=0, yEnd=None, dtype=numpy.float32):
+        return(self.readChannels([name], yStart, yEnd, dtype)[:, :, 0]);
+
+    # Method to read the spectral slice closest to a wavelength. Returns
+    # the (lines, width) array and the wavelength of the slice.
+    def readWavelength(self, wavelength, yStart=0, yEnd=None, dtype=numpy.float32):
+        if self.wls.size == 0:
+            raise ValueError('"{}" has no spectral slices'.format(self.fileName));
+        index = int(numpy.argmin(numpy.abs(self.wls - wavelength)));
+        return(self.readChannel(self.sliceNames[index], yStart, yEnd, dtype), self.wls[index]);
+
+    # Method to read all spectral slices, sorted by wavelength, as a
+    # (lines, width, wavelengths) array
+    def readSpectral(self, yStart=0, yEnd=None, dtype=numpy.float32):
+        return(self.readChannels(self.sliceNames, yStart, yEnd, dtype));
+
+    # Method to get the channel descriptions, as rtbReadMultichannelEXR's channelInfo
+    def channelInfo(self):
+        return([dict([(key, channel[key]) for key in ('name', 'pixelType', 'xSampling', 'ySampling', 'isLinear')]) for channel in self.channels]);
+
+    # Method to release the memory map of the file
+    def close(self):
+        self.data = None;
+
+    def __enter__(self):
+        return(self);
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close();
+
+
+# Method to read all channels of an OpenEXR file, as rtbReadMultichannelEXR.m
+# does. Returns the channel descriptions and a (height, width, channels) array.
+def readMultichannelEXR(fileName, dtype=numpy.float64):
+    with multispectralEXR(fileName) as image:
+        return(image.channelInfo(), image.readChannels(image.channelNames, dtype=dtype));
+
+
+# Method to read a multispectral OpenEXR file, as rtbReadMultispectralEXR.m
+# does: returns a (height, width, channels) array with the channels sorted by
+# wavelength (channels that are not spectral slices come first, as they do
+# in Matlab), the wavelengths of the spectral slices and their S summary.
+def readMultispectralEXR(fileName, namePattern='%f-%f', dtype=numpy.float64):
+    with multispectralEXR(fileName, namePattern) as image:
+        names = [image.channelNames[index] for index in image.order];
+        return(image.readChannels(names, dtype=dtype), image.wls, image.S);
+
+
+# Helper method to format an OpenEXR header attribute
+def headerAttribute(name, typeName, value):
+    return(name.encode('utf-8') + b'\0' + typeName.encode('utf-8') + b'\0' + struct.pack('<i', len(value)) + value);
+
+
+# Class for a single-part scanline OpenEXR file of FLOAT channels, with ZIP
+# compression, written block by block from the top line down. The line
+# offsets are written when the file is closed.
+class exrWriter:
+    def __init__(self, fileName, width, height, channelNames):
+        self.width  = width;
+        self.height = height;
+        # channels are stored in alphabetical order
+        self.channelNames = sorted(channelNames);
+        self.order = [list(channelNames).index(name) for name in self.channelNames];
+        self.linesPerBlock = compressions[3][1];
+        self.blockOffsets = [];
+        self.pending = numpy.zeros((0, width, len(channelNames)), dtype='<f4');
+        self.fileHandle = open(fileName, 'wb');
+
+        channels = b''.join([name.encode('utf-8') + b'\0' + struct.pack('<iB3xii', 2, 0, 1, 1) for name in self.channelNames]) + b'\0';
+        header = struct.pack('<ii', exrMagic, 2);
+        header += headerAttribute('channels', 'chlist', channels);
+        header += headerAttribute('compression', 'compression', struct.pack('<B', 3));
+        header += headerAttribute('dataWindow', 'box2i', struct.pack('<4i', 0, 0, width-1, height-1));
+        header += headerAttribute('displayWindow', 'box2i', struct.pack('<4i', 0, 0, width-1, height-1));
+        header += headerAttribute('lineOrder', 'lineOrder', struct.pack('<B', 0));
+        header += headerAttribute('pixelAspectRatio', 'float', struct.pack('<f', 1.0));
+        header += headerAttribute('screenWindowCenter', 'v2f', struct.pack('<2f', 0.0, 0.0));
+        header += headerAttribute('screenWindowWidth', 'float', struct.pack('<f', 1.0));
+        self.fileHandle.write(header + b'\0');
+        self.offsetsPosition = self.fileHandle.tell();
+        blocksNum = int(math.ceil(height/float(self.linesPerBlock)));
+        self.fileHandle.write(b'\0'*(8*blocksNum));
+        self.linesWritten = 0;
+
+    # Helper method to write one block of (lines, width, channels) lines
+    def writeBlock(self, lines):
+        # each line holds the pixels of each channel in turn
+        raw = numpy.ascontiguousarray(lines.transpose((0, 2, 1)), dtype='<f4').tobytes();
+        packed = zlib.compress(unpredictBytes(raw).tobytes(), 6);
+        if len(packed) >= len(raw):
+            packed = raw;
+        self.blockOffsets.append(self.fileHandle.tell());
+        self.fileHandle.write(struct.pack('<ii', self.linesWritten, len(packed)) + packed);
+        self.linesWritten += lines.shape[0];
+
+    # Method to write (lines, width, channels) or, for one channel,
+    # (lines, width) lines, after the ones written so far. Channels are
+    # given in the order of the channelNames the file was opened with.
+    def writeLines(self, lines):
+        lines = numpy.asarray(lines, dtype='<f4');
+        if lines.ndim == 2:
+            lines = lines[:, :, numpy.newaxis];
+        self.pending = numpy.concatenate((self.pending, lines[:, :, self.order]));
+        while self.pending.shape[0] >= self.linesPerBlock:
+            self.writeBlock(self.pending[0:self.linesPerBlock]);
+            self.pending = self.pending[self.linesPerBlock:];
+
+    def close(self):
+        if self.pending.shape[0] > 0:
+            self.writeBlock(self.pending);
+        if self.linesWritten != self.height:
+            self.fileHandle.close();
+            raise ValueError('{} lines were written to an image of {} lines'.format(self.linesWritten, self.height));
+        self.fileHandle.seek(self.offsetsPosition);
+        self.fileHandle.write(numpy.asarray(self.blockOffsets, dtype='<u8').tobytes());
+        self.fileHandle.close();
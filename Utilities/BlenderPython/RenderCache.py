@@ -0,0 +1,270 @@
+# Content-addressed, on-disk cache for renderings. A rendering is keyed by
+# everything that determines it: the text of the scene file, the mappings,
+# the condition values, the renderer and its version, the hints that affect
+# the image (see rtbDefaultHints.m), and the contents of the files these
+# refer to (spectrum .spd files, textures and meshes). Renderings whose key
+# is cached are copied out of the cache instead of being rendered again.
+# Like ElevationMapCache, this module does not depend on bpy.
+#
+# Each entry is a folder named after its key, holding the output files and a
+# manifest with their sizes and hashes, which are checked when the entry is
+# read, so that damaged entries are dropped instead of returned.
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import ElevationMapUtils
+
+
+# Bump this whenever the meaning of keys or the layout of entries changes
+cacheFormatVersion = 1;
+
+# Default parameters for the cache
+cacheDefaults = {
+    'cacheDir'  : os.path.join(tempfile.gettempdir(), 'RenderToolbox4', 'RenderCache'),
+    'maxBytes'  : 20*1024**3,
+    # hints (see rtbDefaultHints.m) that affect renderings; the others (e.g.
+    # workingFolder, isParallel) do not, and are left out of keys
+    'hintNames' : ['imageWidth', 'imageHeight', 'renderer', 'batchRenderStrategy', 'converter'],
+    # how entries are checked when read: 'hash' (contents) or 'size'
+    'verify'    : 'hash',
+};
+
+# Extensions of the files that scene and mappings files refer to, whose
+# contents are part of keys
+referencedExtensions = ['spd', 'png', 'exr', 'jpg', 'jpeg', 'tga', 'bmp', 'hdr', 'tif', 'tiff', 'ply'];
+
+# Expression for file names in scene and mappings files (not spectrum strings like "300:0 800:1")
+referenceExpression = re.compile('[^\\s"\'<>:=,\\[\\]{}()]+\\.(?:' + '|'.join(referencedExtensions) + ')(?![\\w.])', re.IGNORECASE);
+
+# Name of the manifest file of each entry
+manifestName = 'manifest.json';
+
+
+# Method to describe an executable for keys, when no better renderer version
+# is known: its resolved path, size and modification time
+def executableVersion(executable):
+    path = shutil.which(executable) or executable;
+    try:
+        info = os.stat(path);
+    except OSError:
+        return({'executable': executable});
+    return({'executable': os.path.abspath(path), 'bytes': info.st_size, 'mtime': info.st_mtime});
+
+
+# Helper method to hash the contents of a file, in chunks
+def fileDigest(path):
+    digest = hashlib.sha1();
+    with open(path, 'rb') as fileHandle:
+        for chunk in iter(lambda: fileHandle.read(1024**2), b''):
+            digest.update(chunk);
+    return(digest.hexdigest());
+
+
+# Class for managing a directory of cached renderings
+class renderCache:
+    # ---- Method to initialize the cache -----
+    def __init__(self, params=None):
+        params = ElevationMapUtils.mergeParams(cacheDefaults, params);
+        if params['verify'] not in ('hash', 'size'):
+            raise ValueError('Unknown verify mode "{}"'.format(params['verify']));
+        self.cacheDir  = params['cacheDir'];
+        self.maxBytes  = params['maxBytes'];
+        self.hintNames = list(params['hintNames']);
+        self.verify    = params['verify'];
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir);
+        # hashes of the files read so far, by path, with the size and
+        # modification time they were hashed at, so that the many scenes
+        # of a sweep that share spectra and textures hash them once
+        self.fileHashes = {};
+        self.hits         = 0;
+        self.misses       = 0;
+        self.stores       = 0;
+        self.corrupt      = 0;
+        self.evictions    = 0;
+        self.savedSeconds = 0.0;
+
+    # Helper method to hash an input file, unless it has not changed since it was last hashed
+    def hashFile(self, path):
+        info = os.stat(path);
+        stamp = (info.st_size, info.st_mtime_ns);
+        if (path not in self.fileHashes) or (self.fileHashes[path][0] != stamp):
+            self.fileHashes[path] = (stamp, fileDigest(path));
+        return(self.fileHashes[path][1]);
+
+    # Helper method to hash a file that other files refer to, looked for as
+    # given, and then in each of the folders, as rtbResolveFilePath.m does.
+    # Files that are not found are keyed as missing, so that their later
+    # appearance changes the key.
+    def referencedFileHash(self, name, folders):
+        candidates = [name] if os.path.isabs(name) else [os.path.join(folder, name) for folder in folders];
+        for candidate in candidates:
+            if os.path.isfile(candidate):
+                return(self.hashFile(candidate));
+        return('missing');
+
+    # Method to compute the key of a rendering. The scene file and the
+    # mappings file (if any) are hashed with the files they refer to, which
+    # are looked for next to them and in resourceFolders. condition holds
+    # the condition values of the scene, if any (see ConditionsUtils).
+    # rendererVersion may be any JSON value that identifies the renderer,
+    # e.g. the relevant fields of rtbVersionInfo(), a Docker image, or
+    # executableVersion(). hints is a dictionary of rtbDefaultHints fields,
+    # of which only hintNames count. Returns the key and its description.
+    def renderKey(self, sceneFile, renderer, rendererVersion=None, hints=None, mappingsFile=None, condition=None, resourceFolders=None):
+        folders = [os.path.dirname(os.path.abspath(sceneFile))];
+        if mappingsFile is not None:
+            folders.append(os.path.dirname(os.path.abspath(mappingsFile)));
+        folders += list(resourceFolders or []);
+        references = set();
+        hashes = {};
+        for role, path in (('scene', sceneFile), ('mappings', mappingsFile)):
+            if path is None:
+                continue;
+            hashes[role] = self.hashFile(path);
+            with open(path, 'r', errors='replace') as fileHandle:
+                references.update(referenceExpression.findall(fileHandle.read()));
+        for value in (condition or {}).values():
+            references.update(referenceExpression.findall('{}'.format(value)));
+        hints = hints or {};
+        description = {
+            'version'         : cacheFormatVersion,
+            'scene'           : hashes['scene'],
+            'mappings'        : hashes.get('mappings'),
+            'condition'       : condition or {},
+            'renderer'        : renderer,
+            'rendererVersion' : rendererVersion,
+            'hints'           : dict([(name, hints[name]) for name in self.hintNames if name in hints]),
+            'files'           : dict([(name, self.referencedFileHash(name, folders)) for name in sorted(references)]),
+        };
+        text = json.dumps(description, sort_keys=True, default=str);
+        return(hashlib.sha1(text.encode('utf-8')).hexdigest(), description);
+
+    # Method to get the folder of an entry
+    def entryPath(self, key):
+        return(os.path.join(self.cacheDir, key));
+
+    # Helper method to check the files of an entry against its manifest
+    def checkEntry(self, path, manifest):
+        for name, info in manifest['files'].items():
+            filePath = os.path.join(path, name);
+            if (not os.path.isfile(filePath)) or (os.path.getsize(filePath) != info['bytes']):
+                return(False);
+            if (self.verify == 'hash') and (fileDigest(filePath) != info['sha1']):
+                return(False);
+        return(True);
+
+    # Method to get a cached rendering: files is a dictionary of the
+    # destination paths of the entry's files, by name (as stored). Returns
+    # True and copies the files on a hit, or False on a miss. Damaged
+    # entries are removed, and count as misses.
+    def getRendering(self, key, files):
+        path = self.entryPath(key);
+        manifestFile = os.path.join(path, manifestName);
+        if os.path.isfile(manifestFile):
+            try:
+                with open(manifestFile, 'r') as fileHandle:
+                    manifest = json.load(fileHandle);
+                if (set(files.keys()) <= set(manifest['files'].keys())) and self.checkEntry(path, manifest):
+                    for name, destination in files.items():
+                        folder = os.path.dirname(os.path.abspath(destination));
+                        if not os.path.isdir(folder):
+                            os.makedirs(folder, exist_ok=True);
+                        shutil.copyfile(os.path.join(path, name), destination);
+                    # touch the manifest so that the entry becomes the most recently used
+                    os.utime(manifestFile, None);
+                    self.hits += 1;
+                    self.savedSeconds += manifest.get('seconds', 0.0);
+                    return(True);
+                if set(files.keys()) <= set(manifest['files'].keys()):
+                    self.corrupt += 1;
+                    self.removeEntry(path);
+            except (IOError, OSError, ValueError, KeyError):
+                # unreadable entry: render again
+                self.corrupt += 1;
+                self.removeEntry(path);
+        self.misses += 1;
+        return(False);
+
+    # Method to store a rendering: files is a dictionary of the paths of its
+    # output files, by name, seconds the time it took to render, and
+    # description the key's description (kept in the manifest, for
+    # inspection). Entries are written to a temporary folder of the cache
+    # and then moved into place, so that readers never see partial entries.
+    def storeRendering(self, key, files, seconds=0.0, description=None):
+        path = self.entryPath(key);
+        tempPath = tempfile.mkdtemp(suffix='.tmp', dir=self.cacheDir);
+        try:
+            manifest = {'files': {}, 'seconds': seconds, 'created': time.time(), 'description': description};
+            for name, source in files.items():
+                shutil.copyfile(source, os.path.join(tempPath, name));
+                manifest['files'][name] = {'bytes': os.path.getsize(source), 'sha1': fileDigest(os.path.join(tempPath, name))};
+            with open(os.path.join(tempPath, manifestName), 'w') as fileHandle:
+                json.dump(manifest, fileHandle, indent=2, sort_keys=True, default=str);
+            if os.path.isdir(path):
+                self.removeEntry(path);
+            os.replace(tempPath, path);
+        except:
+            self.removeEntry(tempPath);
+            raise;
+        self.stores += 1;
+        self.evict(keepPath=path);
+
+    # Method to remove a single cache entry
+    def removeEntry(self, path):
+        shutil.rmtree(path, ignore_errors=True);
+
+    # Method to list cache entries as (lastUseTime, bytes, path) tuples, oldest first
+    def entries(self):
+        entries = [];
+        for fileName in os.listdir(self.cacheDir):
+            if fileName.endswith('.tmp'):
+                # entries being stored
+                continue;
+            path = os.path.join(self.cacheDir, fileName);
+            try:
+                lastUseTime = os.stat(os.path.join(path, manifestName)).st_mtime;
+                entryBytes = sum([os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)]);
+            except OSError:
+                continue;
+            entries.append((lastUseTime, entryBytes, path));
+        entries.sort();
+        return(entries);
+
+    # Method to evict the least recently used entries until the cache fits in maxBytes
+    def evict(self, keepPath=None):
+        entries = self.entries();
+        totalBytes = sum([entry[1] for entry in entries]);
+        for lastUseTime, entryBytes, path in entries:
+            if totalBytes <= self.maxBytes:
+                break;
+            if path == keepPath:
+                continue;
+            self.removeEntry(path);
+            totalBytes -= entryBytes;
+            self.evictions += 1;
+
+    # Method to remove all cached renderings
+    def clear(self):
+        for lastUseTime, entryBytes, path in self.entries():
+            self.removeEntry(path);
+
+    # Method to get the hit/miss counters, the render time saved by hits and the current cache size
+    def statistics(self):
+        entries = self.entries();
+        return({
+            'hits'         : self.hits,
+            'misses'       : self.misses,
+            'stores'       : self.stores,
+            'corrupt'      : self.corrupt,
+            'evictions'    : self.evictions,
+            'savedSeconds' : self.savedSeconds,
+            'entriesNum'   : len(entries),
+            'bytes'        : sum([entry[1] for entry in entries]),
+        });
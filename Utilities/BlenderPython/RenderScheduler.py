@@ -0,0 +1,466 @@
+# Blender-free scheduler for rendering a folder of renderer-native scene
+# files (as written by the sceneManager's exportToRendererFile) on one
+# multi-core node, without a Matlab parallel pool.
+#
+# Each scene is a job that needs some cores and some memory. Jobs are started
+# as soon as they fit in the free cores and memory of the node, largest
+# first, and smaller ones fill the gaps. Jobs whose renderer fails in a way
+# that looks transient (e.g. the Docker daemon not answering, or the process
+# being killed for lack of memory) are run again, after a growing delay.
+# Progress and per-job timing are streamed to a JSON log, one object per line.
+#
+# Renderer commands are run by an executor, an object with a method
+# jobCommand(job) that returns the command (list of arguments) of a job:
+#   localExecutor  : runs the renderers installed on the node
+#   dockerExecutor : runs them in Docker containers, as rtbRunDocker.m does
+#                    (with any program that takes "docker run" arguments)
+#
+# With a RenderCache.renderCache, jobs whose rendering is cached are not
+# run: their output is copied out of the cache, and the outputs of the jobs
+# that are run are stored in it.
+#
+# Example:
+#   jobs = RenderScheduler.sceneJobs('/path/to/scenes');
+#   scheduler = RenderScheduler.renderScheduler(RenderScheduler.localExecutor(), {'logFile': 'render-log.json'});
+#   results = scheduler.run(jobs);
+
+import json
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+
+import RenderCache
+
+
+# Renderers, by name: the extension of their scene files, the extension of
+# their output files, and their command, where {cores}, {outFile} and
+# {sceneFile} are replaced by those of the job
+renderers = {
+    'pbrt'    : {
+        'sceneExtension'  : '.pbrt',
+        'outputExtension' : '.dat',
+        'command'         : ['pbrt', '--nthreads', '{cores}', '--outfile', '{outFile}', '{sceneFile}'],
+    },
+    'mitsuba' : {
+        'sceneExtension'  : '.xml',
+        'outputExtension' : '.exr',
+        'command'         : ['mitsuba', '-p', '{cores}', '-o', '{outFile}', '{sceneFile}'],
+    },
+};
+
+# Default parameters of a scheduler
+schedulerDefaults = {
+    # cores to use (None: all the cores of the node)
+    'coresNum'           : None,
+    # bytes of memory to use (None: memoryFraction of the available memory)
+    'memoryBytes'        : None,
+    'memoryFraction'     : 0.8,
+    # cores per job (None: the cores shared among the jobs, at least 1 each)
+    'jobCores'           : None,
+    # bytes of memory per job (None: estimated from the size of each scene)
+    'jobMemoryBytes'     : None,
+    'memoryBaseBytes'    : 256*1024**2,
+    'memoryPerSceneByte' : 4,
+    # seconds a job may run before it is killed (None: no limit)
+    'jobTimeout'         : None,
+    # times a job is run again after a transient failure, with a delay
+    # that starts at retryDelay seconds and doubles each time
+    'retries'            : 2,
+    'retryDelay'         : 1.0,
+    # exit statuses and output text that make a failure transient
+    'transientStatuses'  : [125, 137, -9],
+    'transientPatterns'  : ['Cannot connect to the Docker daemon', 'Error response from daemon',
+                            'Resource temporarily unavailable', 'Out of memory', 'std::bad_alloc'],
+    # JSON log file (None: no log)
+    'logFile'            : None,
+    # number of lines of renderer output kept in each result
+    'outputLinesNum'     : 50,
+    # inputs of the cache keys (see RenderCache.renderCache.renderKey), for
+    # the jobs that do not give their own: versions of the renderers by name
+    # (default: the executor's rendererVersion), hints, mappings file and
+    # folders where referenced files are looked for
+    'rendererVersions'   : {},
+    'hints'              : {},
+    'mappingsFile'       : None,
+    'resourceFolders'    : [],
+};
+
+
+# Method to get the number of cores of the node
+def nodeCoresNum():
+    return(multiprocessing.cpu_count());
+
+
+# Method to get the memory available on the node, in bytes, or None if it is unknown
+def availableMemoryBytes():
+    try:
+        with open('/proc/meminfo', 'r') as fileHandle:
+            for line in fileHandle:
+                if line.startswith('MemAvailable:'):
+                    return(int(line.split()[1]) * 1024);
+    except (OSError, ValueError, IndexError):
+        pass;
+    try:
+        return(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES'));
+    except (AttributeError, ValueError, OSError):
+        return(None);
+
+
+# Helper method to get the bytes of a scene: its file and its folder of
+# meshes (<name>-meshes, as written by RendererExportUtils), if any
+def sceneBytes(sceneFile):
+    total = os.path.getsize(sceneFile);
+    meshFolder = os.path.splitext(sceneFile)[0] + '-meshes';
+    if os.path.isdir(meshFolder):
+        for folder, folderNames, fileNames in os.walk(meshFolder):
+            total += sum([os.path.getsize(os.path.join(folder, fileName)) for fileName in fileNames]);
+    return(total);
+
+
+# Method to make the jobs of the scene files of a folder (not its
+# subfolders), for the given renderers (default: all). Output files go to
+# outputFolder/<renderer> (default: <sceneFolder>/renderings/<renderer>).
+# Returns a list of jobs {'name', 'renderer', 'sceneFile', 'outFile', 'sceneBytes'}.
+def sceneJobs(sceneFolder, outputFolder=None, rendererNames=None):
+    if outputFolder is None:
+        outputFolder = os.path.join(sceneFolder, 'renderings');
+    if rendererNames is None:
+        rendererNames = sorted(renderers.keys());
+    for rendererName in rendererNames:
+        if rendererName not in renderers:
+            raise ValueError('Unknown renderer "{}"'.format(rendererName));
+    jobs = [];
+    for fileName in sorted(os.listdir(sceneFolder)):
+        sceneFile = os.path.join(sceneFolder, fileName);
+        name, extension = os.path.splitext(fileName);
+        if not os.path.isfile(sceneFile):
+            continue;
+        for rendererName in rendererNames:
+            if extension == renderers[rendererName]['sceneExtension']:
+                jobs.append({
+                    'name'       : name,
+                    'renderer'   : rendererName,
+                    'sceneFile'  : os.path.abspath(sceneFile),
+                    'outFile'    : os.path.abspath(os.path.join(outputFolder, rendererName, name + renderers[rendererName]['outputExtension'])),
+                    'sceneBytes' : sceneBytes(sceneFile),
+                });
+    return(jobs);
+
+
+# Helper method to get the renderer command of a job
+def rendererCommand(job):
+    values = {'cores': job['cores'], 'outFile': job['outFile'], 'sceneFile': job['sceneFile']};
+    return([argument.format(**values) for argument in renderers[job['renderer']]['command']]);
+
+
+# Class for running renderers installed on the node. executables may give
+# the executable of each renderer, by name (default: found on the PATH).
+class localExecutor:
+    def __init__(self, executables=None):
+        self.executables = dict(executables or {});
+
+    # Method to get the command of a job
+    def jobCommand(self, job):
+        command = rendererCommand(job);
+        command[0] = self.executables.get(job['renderer'], command[0]);
+        return(command);
+
+    # Method to identify the version of a renderer, for cache keys
+    def rendererVersion(self, rendererName):
+        return(RenderCache.executableVersion(self.executables.get(rendererName, renderers[rendererName]['command'][0])));
+
+
+# Class for running renderers in Docker containers, as rtbRunDocker.m does:
+# images gives the image of each renderer, by name. The scene and output
+# folders are mounted at the same paths in the container, with any extra
+# volumes, and each container is limited to the cores and memory of its job.
+# dockerExecutable may be any program that takes "docker run" arguments,
+# e.g. a stand-in on nodes without Docker.
+class dockerExecutor:
+    def __init__(self, images, dockerExecutable='docker', user=None, volumes=None):
+        self.images = dict(images);
+        self.dockerExecutable = dockerExecutable;
+        if (user is None) and hasattr(os, 'getuid'):
+            user = '{}'.format(os.getuid());
+        self.user = user;
+        self.volumes = list(volumes or []);
+
+    # Method to get the command of a job
+    def jobCommand(self, job):
+        if job['renderer'] not in self.images:
+            raise ValueError('There is no Docker image for renderer "{}"'.format(job['renderer']));
+        sceneFolder = os.path.dirname(job['sceneFile']);
+        command = [self.dockerExecutable, 'run', '--rm', '--workdir={}'.format(sceneFolder)];
+        if self.user:
+            command.append('--user={}:{}'.format(self.user, self.user));
+        volumes = [sceneFolder, os.path.dirname(job['outFile'])] + self.volumes;
+        for volume in sorted(set(volumes)):
+            command.append('--volume={}:{}'.format(volume, volume));
+        command += ['--cpus={}'.format(job['cores']), '--memory={}b'.format(job['memoryBytes'])];
+        return(command + [self.images[job['renderer']]] + rendererCommand(job));
+
+    # Method to identify the version of a renderer, for cache keys
+    def rendererVersion(self, rendererName):
+        return({'dockerImage': self.images.get(rendererName)});
+
+
+# Method to tell whether a failed run is worth running again, from its
+# exit status and output
+def isTransientFailure(returnCode, output, params):
+    if returnCode in params['transientStatuses']:
+        return(True);
+    return(any([pattern in output for pattern in params['transientPatterns']]));
+
+
+# Class for a scheduler that runs render jobs with an executor, packing them
+# into the cores and memory of the node
+class renderScheduler:
+    def __init__(self, executor, params=None, cache=None):
+        self.executor = executor;
+        self.cache = cache;
+        self.cacheLock = threading.Lock();
+        self.params = dict(schedulerDefaults);
+        self.params.update(params or {});
+        self.coresNum = self.params['coresNum'] or nodeCoresNum();
+        self.memoryBytes = self.params['memoryBytes'];
+        if self.memoryBytes is None:
+            available = availableMemoryBytes();
+            self.memoryBytes = None if available is None else int(available * self.params['memoryFraction']);
+        self.condition = threading.Condition();
+        self.logHandle = None;
+        self.startTime = None;
+        self.statistics = {};
+
+    # Helper method to write an event to the log
+    def log(self, event, fields):
+        if self.logHandle is None:
+            return;
+        entry = {'event': event, 'time': time.time() - self.startTime};
+        entry.update(fields);
+        self.logHandle.write(json.dumps(entry, sort_keys=True) + '\n');
+        self.logHandle.flush();
+
+    # Helper method to set the cores and memory of each job. Jobs never ask
+    # for more than the whole node, so that each can run, if only alone.
+    def sizeJobs(self, jobs):
+        jobCores = self.params['jobCores'];
+        if jobCores is None:
+            jobCores = max(1, self.coresNum // max(1, len(jobs)));
+        sizedJobs = [];
+        for job in jobs:
+            job = dict(job);
+            job['cores'] = min(job.get('cores', jobCores), self.coresNum);
+            if 'memoryBytes' not in job:
+                job['memoryBytes'] = self.params['jobMemoryBytes'];
+                if job['memoryBytes'] is None:
+                    scene = job['sceneBytes'] if 'sceneBytes' in job else sceneBytes(job['sceneFile']);
+                    job['memoryBytes'] = self.params['memoryBaseBytes'] + self.params['memoryPerSceneByte'] * scene;
+            if self.memoryBytes is not None:
+                job['memoryBytes'] = min(job['memoryBytes'], self.memoryBytes);
+            sizedJobs.append(job);
+        return(sizedJobs);
+
+    # Helper method to run one attempt of a job, on its own thread, and to
+    # hand its outcome to finishJob. Any error fails the attempt, so that its
+    # cores and memory are always given back.
+    def runAttempt(self, index, job, state):
+        startTime = time.time();
+        returnCode = None;
+        output = '';
+        try:
+            outFolder = os.path.dirname(job['outFile']);
+            if not os.path.isdir(outFolder):
+                os.makedirs(outFolder, exist_ok=True);
+            process = subprocess.Popen(self.executor.jobCommand(job), cwd=os.path.dirname(job['sceneFile']),
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True);
+            try:
+                output = process.communicate(timeout=self.params['jobTimeout'])[0];
+                returnCode = process.returncode;
+            except subprocess.TimeoutExpired:
+                process.kill();
+                output = process.communicate()[0] + '\nKilled after {} s'.format(self.params['jobTimeout']);
+                returnCode = -9;
+        except Exception as error:
+            output = '{}: {}'.format(type(error).__name__, error);
+            returnCode = None;
+        endTime = time.time();
+        if (returnCode == 0) and ('cacheKey' in job) and os.path.isfile(job['outFile']):
+            self.storeRendering(job, endTime - startTime);
+        self.finishJob(index, job, state, returnCode, output, startTime, endTime);
+
+    # Helper method to get the cache entry files of a job, by name
+    def cacheFiles(self, job):
+        return({'output' + os.path.splitext(job['outFile'])[1]: job['outFile']});
+
+    # Helper method to compute the cache key of a job
+    def cacheKey(self, job):
+        versions = self.params['rendererVersions'];
+        if 'rendererVersion' in job:
+            version = job['rendererVersion'];
+        elif job['renderer'] in versions:
+            version = versions[job['renderer']];
+        else:
+            version = self.executor.rendererVersion(job['renderer']);
+        return(self.cache.renderKey(job['sceneFile'], job['renderer'], version, job.get('hints', self.params['hints']),
+                                    job.get('mappingsFile', self.params['mappingsFile']), job.get('condition'),
+                                    job.get('resourceFolders', self.params['resourceFolders'])));
+
+    # Helper method to store the output of a job in the cache
+    def storeRendering(self, job, seconds):
+        with self.cacheLock:
+            try:
+                self.cache.storeRendering(job['cacheKey'], self.cacheFiles(job), seconds, job['cacheDescription']);
+            except Exception as error:
+                # the rendering itself succeeded: only its caching failed
+                self.log('cacheError', {'name': job['name'], 'error': '{}: {}'.format(type(error).__name__, error)});
+
+    # Helper method to copy the output of a job out of the cache. Returns
+    # whether it was cached.
+    def getRendering(self, job):
+        job['cacheKey'], job['cacheDescription'] = self.cacheKey(job);
+        with self.cacheLock:
+            return(self.cache.getRendering(job['cacheKey'], self.cacheFiles(job)));
+
+    # Helper method to record the outcome of an attempt, free its cores and
+    # memory, and queue the job again if its failure was transient
+    def finishJob(self, index, job, state, returnCode, output, startTime, endTime):
+        with self.condition:
+            state['freeCores'] += job['cores'];
+            state['freeMemory'] += job['memoryBytes'];
+            state['running'] -= 1;
+            state['busyCoreSeconds'] += job['cores'] * (endTime - startTime);
+            result = state['results'][index];
+            result['attempts'] += 1;
+            result['seconds'] = endTime - startTime;
+            result['runSeconds'] += endTime - startTime;
+            result['returnCode'] = returnCode;
+            result['output'] = output.splitlines()[-self.params['outputLinesNum']:];
+            transient = (returnCode != 0) and (returnCode is not None) and isTransientFailure(returnCode, output, self.params);
+            fields = {'job': index, 'name': job['name'], 'renderer': job['renderer'], 'attempt': result['attempts'],
+                      'returnCode': returnCode, 'seconds': result['seconds']};
+            if transient and (result['attempts'] <= self.params['retries']):
+                delay = self.params['retryDelay'] * 2**(result['attempts']-1);
+                state['pending'].append((time.time() + delay, index, job));
+                state['retries'] += 1;
+                fields.update({'delay': delay, 'output': result['output'][-3:]});
+                self.log('retry', fields);
+            else:
+                result['status'] = 'ok' if returnCode == 0 else 'failed';
+                result['outputExists'] = os.path.isfile(job['outFile']);
+                result['totalSeconds'] = endTime - result['queuedTime'];
+                state['done'] += 1;
+                fields.update({'status': result['status'], 'outputExists': result['outputExists'],
+                               'done': state['done'], 'total': len(state['results'])});
+                if result['status'] != 'ok':
+                    fields['output'] = result['output'][-3:];
+                self.log('finish', fields);
+                if state['progress'] is not None:
+                    state['progress'](dict(result));
+            self.condition.notify_all();
+
+    # Helper method to start the pending jobs that fit in the free cores and
+    # memory, in order (largest first), and whose retry delay is over.
+    # Returns the time of the next retry, if any is waiting.
+    def startJobs(self, state):
+        now = time.time();
+        nextTime = None;
+        for entry in list(state['pending']):
+            readyTime, index, job = entry;
+            if readyTime > now:
+                nextTime = readyTime if nextTime is None else min(nextTime, readyTime);
+                continue;
+            fitsMemory = (state['freeMemory'] is None) or (job['memoryBytes'] <= state['freeMemory']);
+            if (job['cores'] <= state['freeCores']) and fitsMemory:
+                state['pending'].remove(entry);
+                state['freeCores'] -= job['cores'];
+                if state['freeMemory'] is not None:
+                    state['freeMemory'] -= job['memoryBytes'];
+                state['running'] += 1;
+                result = state['results'][index];
+                if result['attempts'] == 0:
+                    result['waitSeconds'] = now - result['queuedTime'];
+                self.log('start', {'job': index, 'name': job['name'], 'renderer': job['renderer'], 'attempt': result['attempts']+1,
+                                   'cores': job['cores'], 'memoryBytes': job['memoryBytes'], 'freeCores': state['freeCores']});
+                thread = threading.Thread(target=self.runAttempt, args=(index, job, state));
+                thread.daemon = True;
+                thread.start();
+        return(nextTime);
+
+    # Method to run render jobs (see sceneJobs), each with optional 'cores'
+    # and 'memoryBytes', and with the inputs of their cache keys, if there
+    # is a cache: optional 'condition', 'mappingsFile', 'hints',
+    # 'rendererVersion' and 'resourceFolders' (default: from the params).
+    # Returns one result per job, in order: {'name', 'renderer',
+    # 'sceneFile', 'outFile', 'status' ('ok', 'cached' or 'failed'),
+    #  'returnCode', 'outputExists', 'attempts', 'cores', 'memoryBytes',
+    #  'seconds' (last attempt), 'runSeconds' (all attempts), 'waitSeconds'
+    #  (before the first attempt), 'totalSeconds', 'output' (last lines)}.
+    # Failed jobs do not stop the others. If given, progress(result) is
+    # called as each job finishes.
+    def run(self, jobs, progress=None):
+        jobs = self.sizeJobs(jobs);
+        self.startTime = time.time();
+        if self.params['logFile'] is not None:
+            self.logHandle = open(self.params['logFile'], 'a');
+        state = {
+            'pending'         : [],
+            'results'         : [],
+            'freeCores'       : self.coresNum,
+            'freeMemory'      : self.memoryBytes,
+            'running'         : 0,
+            'done'            : 0,
+            'retries'         : 0,
+            'busyCoreSeconds' : 0.0,
+            'progress'        : progress,
+        };
+        for job in jobs:
+            result = dict([(key, job[key]) for key in ('name', 'renderer', 'sceneFile', 'outFile', 'cores', 'memoryBytes')]);
+            result.update({'status': None, 'returnCode': None, 'outputExists': False, 'attempts': 0, 'seconds': 0.0,
+                           'runSeconds': 0.0, 'waitSeconds': 0.0, 'totalSeconds': 0.0, 'output': [], 'queuedTime': self.startTime});
+            state['results'].append(result);
+        try:
+            with self.condition:
+                self.log('schedule', {'jobs': len(jobs), 'coresNum': self.coresNum, 'memoryBytes': self.memoryBytes});
+                for index, job in sorted(enumerate(jobs), key=lambda item: (-item[1]['memoryBytes'], -item[1]['cores'], item[0])):
+                    if (self.cache is not None) and self.getRendering(job):
+                        result = state['results'][index];
+                        result.update({'status': 'cached', 'outputExists': True});
+                        state['done'] += 1;
+                        self.log('cached', {'job': index, 'name': job['name'], 'renderer': job['renderer'], 'key': job['cacheKey'],
+                                            'done': state['done'], 'total': len(jobs)});
+                        if progress is not None:
+                            progress(dict(result));
+                        continue;
+                    state['pending'].append((self.startTime, index, job));
+                while state['pending'] or state['running']:
+                    nextTime = self.startJobs(state);
+                    timeout = None if nextTime is None else max(0.0, nextTime - time.time());
+                    self.condition.wait(timeout);
+                wallSeconds = time.time() - self.startTime;
+                self.statistics = {
+                    'jobs'            : len(jobs),
+                    'failed'          : len([result for result in state['results'] if result['status'] == 'failed']),
+                    'cached'          : len([result for result in state['results'] if result['status'] == 'cached']),
+                    'retries'         : state['retries'],
+                    'wallSeconds'     : wallSeconds,
+                    'busyCoreSeconds' : state['busyCoreSeconds'],
+                    'utilization'     : state['busyCoreSeconds'] / (self.coresNum * wallSeconds) if wallSeconds > 0 else 0.0,
+                };
+                if self.cache is not None:
+                    self.statistics['cache'] = self.cache.statistics();
+                self.log('summary', self.statistics);
+        finally:
+            if self.logHandle is not None:
+                self.logHandle.close();
+                self.logHandle = None;
+        for result in state['results']:
+            del result['queuedTime'];
+        return(state['results']);
+
+    # Method to get the statistics of the last run: numbers of jobs, failed
+    # jobs, cached jobs and retries, the statistics of the cache, wall time, core-seconds spent in renderers, and the
+    # fraction of the cores they kept busy
+    def getStatistics(self):
+        return(dict(self.statistics));
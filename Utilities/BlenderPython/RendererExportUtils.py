@@ -0,0 +1,507 @@
+# Blender-free writers for renderer-native scene files: PBRT-v3 (.pbrt) and
+# Mitsuba 0.5 (.xml). Large meshes are written to binary little-endian PLY
+# side files, in chunks, so that no text version of them is ever built.
+#
+# The writers take a scene description built by a sceneManager (SceneUtilsV1
+# or SceneGraphV1), a dictionary with:
+#   'name'       : scene name
+#   'resolution' : (width, height) in pixels
+#   'cameras'    : list of {'name', 'matrix', 'fieldOfViewInDegrees' (horizontal), 'clipRange'}
+#   'lights'     : list of {'name', 'type' ('AREA', 'SUN' or 'POINT'), 'matrix', 'color', 'size'}
+#   'materials'  : dictionary of {'name', 'diffuse', 'specular', 'hardness', 'alpha', 'bump'} by name
+#   'shapes'     : list of {'name', 'matrix', 'mesh' (mesh name), 'materials' (names per slot)}
+#   'meshes'     : dictionary of functions by mesh name, each returning the mesh as
+#                  {'vertices', 'loopVertexIndices', 'faceSizes', 'materialIndices', 'smooth', 'uvs'},
+#                  so that only one mesh at a time needs to be fetched
+# Matrices are 4x4 object-to-world transforms, colors are linear RGB. 'uvs'
+# holds per-vertex texture coordinates, or None, and 'bump' the elevation
+# texture of the material (see ElevationTextureUtils), or None. Neither
+# PBRT-v3 nor Mitsuba 0.5 displace geometry, so elevation textures are
+# applied as bump maps whatever their mode.
+
+import math
+import os
+import re
+from xml.sax import saxutils
+
+import numpy
+
+import ElevationMapUtils
+import MeshUtils
+
+
+# Default parameters for the export
+exportDefaults = {
+    # meshes with fewer faces are written inline in .pbrt files (Mitsuba always uses PLY)
+    'inlineFacesLimit' : 256,
+    # number of vertices / faces written per chunk to the PLY files
+    'plyChunkSize'     : 65536,
+    # camera to export (renderers use a single camera); default: the first one
+    'cameraName'       : None,
+    # image file name written by the renderer; default: the scene file name
+    'imageFileName'    : None,
+};
+
+supportedRenderers = ('pbrt', 'mitsuba');
+sceneFileExtensions = {'pbrt': 'pbrt', 'mitsuba': 'xml'};
+
+
+# Helper method to compute the object-to-world matrix of a location, an XYZ
+# euler rotation (radians) and a scale, as Blender does for unparented objects
+def objectMatrix(location, rotation, scale):
+    cx, cy, cz = [math.cos(angle) for angle in rotation];
+    sx, sy, sz = [math.sin(angle) for angle in rotation];
+    rotationX = numpy.array([(1, 0, 0), (0, cx, -sx), (0, sx, cx)]);
+    rotationY = numpy.array([(cy, 0, sy), (0, 1, 0), (-sy, 0, cy)]);
+    rotationZ = numpy.array([(cz, -sz, 0), (sz, cz, 0), (0, 0, 1)]);
+    matrix = numpy.identity(4);
+    matrix[0:3, 0:3] = rotationZ.dot(rotationY).dot(rotationX) * numpy.asarray(scale, dtype=numpy.float64)[numpy.newaxis, :];
+    matrix[0:3, 3] = [float(value) for value in location];
+    return(matrix);
+
+
+# Helper method to get the eye, target and up vector of a camera matrix
+# (Blender cameras look along their local -z axis, with +y up)
+def cameraLookAt(matrix):
+    eye = matrix[0:3, 3];
+    forward = -matrix[0:3, 2] / numpy.linalg.norm(matrix[0:3, 2]);
+    up = matrix[0:3, 1] / numpy.linalg.norm(matrix[0:3, 1]);
+    return(eye, eye + forward, up);
+
+
+# Helper method to get the elevation texture of a material: the bumpTexture
+# of SceneGraphV1 materials, or the 'rtbBumpTexture' custom property of
+# Blender materials
+def materialBumpTexture(material):
+    if hasattr(material, 'bumpTexture'):
+        return(material.bumpTexture);
+    bump = material.get('rtbBumpTexture');
+    if bump is None:
+        return(None);
+    return(dict(bump));
+
+
+# Helper method to describe a material, from its Blender-style attributes
+def materialDescription(material):
+    diffuse  = [component*material.diffuse_intensity for component in material.diffuse_color];
+    specular = [component*material.specular_intensity for component in material.specular_color];
+    return({
+        'name'     : material.name,
+        'diffuse'  : diffuse,
+        'specular' : specular,
+        'hardness' : getattr(material, 'specular_hardness', 50),
+        'alpha'    : material.alpha,
+        'bump'     : materialBumpTexture(material),
+    });
+
+
+# Method to build a scene description from objects with Blender-style
+# attributes (name, data, location, rotation_euler, scale).
+#   objectKind(object)      : 'CAMERA', 'LAMP' or 'MESH' (other objects are skipped)
+#   objectMaterials(object) : the materials of the object's slots (None for empty slots)
+#   meshArrays(mesh)        : the mesh arrays, as described at the top of this file
+def sceneDescription(name, resolution, objects, objectKind, objectMaterials, meshArrays):
+    description = {'name': name, 'resolution': resolution, 'cameras': [], 'lights': [], 'materials': {}, 'shapes': [], 'meshes': {}};
+    for theObject in objects:
+        kind = objectKind(theObject);
+        matrix = objectMatrix(theObject.location, theObject.rotation_euler, theObject.scale);
+        if kind == 'CAMERA':
+            description['cameras'].append({
+                'name'                 : theObject.name,
+                'matrix'               : matrix,
+                'fieldOfViewInDegrees' : math.degrees(theObject.data.angle_x),
+                'clipRange'            : (theObject.data.clip_start, theObject.data.clip_end),
+            });
+        elif kind == 'LAMP':
+            lamp = theObject.data;
+            description['lights'].append({
+                'name'   : theObject.name,
+                'type'   : lamp.type,
+                'matrix' : matrix,
+                'color'  : [component*lamp.energy for component in lamp.color],
+                'size'   : (lamp.size, getattr(lamp, 'size_y', lamp.size)),
+            });
+        elif kind == 'MESH':
+            materialNames = [];
+            for material in objectMaterials(theObject):
+                if material is None:
+                    materialNames.append(None);
+                    continue;
+                materialNames.append(material.name);
+                if material.name not in description['materials']:
+                    description['materials'][material.name] = materialDescription(material);
+            theMesh = theObject.data;
+            if theMesh.name not in description['meshes']:
+                description['meshes'][theMesh.name] = (lambda theMesh=theMesh: meshArrays(theMesh));
+            description['shapes'].append({'name': theObject.name, 'matrix': matrix, 'mesh': theMesh.name, 'materials': materialNames});
+    return(description);
+
+
+# Helper method to make a name usable as a file name
+def fileSafeName(name):
+    return(re.sub(r'[^\w.-]', '_', name));
+
+
+# Helper method to format numbers for the scene files
+def numbersText(values):
+    return(' '.join(['{:.7g}'.format(float(value)) for value in numpy.asarray(values).reshape(-1)]));
+
+
+# Method to write a mesh to a binary little-endian PLY file, in chunks of
+# chunkSize vertices or faces. Normals and texture coordinates, if given,
+# are written per vertex.
+def writePlyFile(fileName, vertices, loopVertexIndices, faceSizes, normals=None, chunkSize=65536, uvs=None):
+    vertices = numpy.asarray(vertices, dtype='<f4').reshape((-1, 3));
+    faceSizes = numpy.asarray(faceSizes, dtype=numpy.int64);
+    if numpy.any(faceSizes > 255):
+        raise ValueError('PLY faces can have at most 255 vertices');
+    loopStart = numpy.concatenate(([0], numpy.cumsum(faceSizes)));
+
+    header = ['ply', 'format binary_little_endian 1.0', 'comment RenderToolbox4',
+              'element vertex {}'.format(vertices.shape[0]),
+              'property float x', 'property float y', 'property float z'];
+    if normals is not None:
+        header += ['property float nx', 'property float ny', 'property float nz'];
+    if uvs is not None:
+        header += ['property float u', 'property float v'];
+    header += ['element face {}'.format(faceSizes.size), 'property list uchar int vertex_indices', 'end_header'];
+
+    with open(fileName, 'wb') as fileHandle:
+        fileHandle.write(('\n'.join(header) + '\n').encode('ascii'));
+        for first in range(0, vertices.shape[0], chunkSize):
+            chunk = vertices[first:first+chunkSize];
+            if normals is not None:
+                chunk = numpy.column_stack((chunk, numpy.asarray(normals[first:first+chunkSize], dtype='<f4')));
+            if uvs is not None:
+                chunk = numpy.column_stack((chunk, numpy.asarray(uvs[first:first+chunkSize], dtype='<f4')));
+            fileHandle.write(numpy.ascontiguousarray(chunk, dtype='<f4').tobytes());
+        for first in range(0, faceSizes.size, chunkSize):
+            sizes = faceSizes[first:first+chunkSize];
+            loops = numpy.asarray(loopVertexIndices[loopStart[first]:loopStart[first+sizes.size]], dtype='<i4');
+            # each face is a count byte followed by its 4-byte indices
+            faceBytes = 1 + 4*sizes;
+            faceOffsets = numpy.concatenate(([0], numpy.cumsum(faceBytes)[:-1]));
+            chunkLoopStart = numpy.concatenate(([0], numpy.cumsum(sizes)[:-1]));
+            loopFace = numpy.repeat(numpy.arange(sizes.size), sizes);
+            loopInFace = numpy.arange(loops.size) - chunkLoopStart[loopFace];
+            loopOffsets = faceOffsets[loopFace] + 1 + 4*loopInFace;
+            buffer = numpy.empty(int(numpy.sum(faceBytes)), dtype=numpy.uint8);
+            buffer[faceOffsets] = sizes;
+            buffer[loopOffsets[:, numpy.newaxis] + numpy.arange(4)] = loops.view(numpy.uint8).reshape((-1, 4));
+            fileHandle.write(buffer.tobytes());
+    return(fileName);
+
+
+# Method to split a mesh into one part per material slot, with n-gons split
+# into triangles (renderers read triangles and quads only). Vertices that a
+# part does not use are dropped. Returns a list of (slot, part) pairs, where
+# part has 'vertices', 'normals' (None for flat meshes), 'uvs' (None for
+# meshes without texture coordinates), 'loopVertexIndices', 'faceSizes'.
+def meshParts(mesh):
+    vertices = numpy.asarray(mesh['vertices'], dtype=numpy.float32).reshape((-1, 3));
+    uvs = mesh.get('uvs');
+    if uvs is not None:
+        uvs = numpy.asarray(uvs, dtype=numpy.float32).reshape((-1, 2));
+    loopVertexIndices, faceSizes = MeshUtils.faceArrays((mesh['loopVertexIndices'], mesh['faceSizes']));
+    normals = None;
+    if mesh['smooth']:
+        normals = MeshUtils.meshNormals(vertices, loopVertexIndices, faceSizes, smooth=True);
+    loopVertexIndices, faceSizes, sourceFaces = MeshUtils.triangulateLargeFaces(loopVertexIndices, faceSizes);
+    materialIndices = numpy.asarray(mesh['materialIndices'], dtype=numpy.int32)[sourceFaces];
+
+    slots = numpy.unique(materialIndices);
+    if slots.size == 1:
+        return([(int(slots[0]), {'vertices': vertices, 'normals': normals, 'uvs': uvs, 'loopVertexIndices': loopVertexIndices, 'faceSizes': faceSizes})]);
+
+    parts = [];
+    faceOfLoop = numpy.repeat(materialIndices, faceSizes);
+    for slot in slots:
+        partLoops = loopVertexIndices[faceOfLoop == slot];
+        usedVertices, partLoops = numpy.unique(partLoops, return_inverse=True);
+        parts.append((int(slot), {
+            'vertices'          : vertices[usedVertices],
+            'normals'           : None if normals is None else normals[usedVertices],
+            'uvs'               : None if uvs is None else uvs[usedVertices],
+            'loopVertexIndices' : partLoops.astype(numpy.int32),
+            'faceSizes'         : faceSizes[materialIndices == slot],
+        }));
+    return(parts);
+
+
+# Helper method to tell whether a material is invisible (as the transparent
+# material of the area lamp quads, which are exported as area lights instead)
+def isInvisible(materials, materialName):
+    return((materialName in materials) and (materials[materialName]['alpha'] == 0));
+
+
+# Method to write the meshes of the shapes, once per mesh: to PLY side files in
+# meshFolder, or kept in memory for inline writing when they have fewer than
+# inlineFacesLimit faces. Returns the parts of each mesh by mesh name, as
+# lists of (slot, part) pairs, where part has either 'plyFile' or the arrays.
+def writeMeshParts(description, meshFolder, relativeMeshFolder, inlineFacesLimit, chunkSize):
+    # slots of each mesh that some shape shows with a visible material
+    visibleSlots = {};
+    for shape in description['shapes']:
+        slots = visibleSlots.setdefault(shape['mesh'], set());
+        for slot in range(0, max(len(shape['materials']), 1)):
+            if not isInvisible(description['materials'], slotMaterial(shape, slot)):
+                slots.add(slot);
+
+    meshes = {};
+    usedFileNames = set();
+    for shape in description['shapes']:
+        if shape['mesh'] in meshes:
+            continue;
+        parts = meshParts(description['meshes'][shape['mesh']]());
+        parts = [(slot, part) for slot, part in parts if (slot in visibleSlots[shape['mesh']]) or (slot >= len(shape['materials']))];
+        for slot, part in parts:
+            if part['faceSizes'].size < inlineFacesLimit:
+                continue;
+            baseName = fileSafeName('{}-{}'.format(shape['mesh'], slot));
+            plyFileName = '{}.ply'.format(baseName);
+            suffix = 1;
+            while plyFileName in usedFileNames:
+                plyFileName = '{}.{:03d}.ply'.format(baseName, suffix);
+                suffix += 1;
+            usedFileNames.add(plyFileName);
+            if not os.path.isdir(meshFolder):
+                os.makedirs(meshFolder);
+            writePlyFile(os.path.join(meshFolder, plyFileName), part['vertices'], part['loopVertexIndices'], part['faceSizes'], part['normals'], chunkSize, part['uvs']);
+            # only the file name is kept, not the arrays
+            for key in list(part.keys()):
+                del part[key];
+            part['plyFile'] = '{}/{}'.format(relativeMeshFolder, plyFileName);
+        meshes[shape['mesh']] = parts;
+    return(meshes);
+
+
+# Helper method to get the material name of a shape's slot
+def slotMaterial(shape, slot):
+    if slot < len(shape['materials']):
+        return(shape['materials'][slot]);
+    return(None);
+
+
+# Helper method to pick the exported camera
+def selectCamera(description, cameraName):
+    for camera in description['cameras']:
+        if (cameraName is None) or (camera['name'] == cameraName):
+            return(camera);
+    return(None);
+
+
+# Helper method to refer to a texture file from a scene file, relative to its folder
+def textureReference(sceneFileName, texture):
+    return(os.path.relpath(texture['file'], os.path.dirname(os.path.abspath(sceneFileName))).replace(os.sep, '/'));
+
+
+# Helper method to write the textures of a material's bump map to a PBRT
+# file: the image, and its product with the strength of the relief. PNG
+# files are not gamma-decoded. Returns the material parameter that refers to it.
+def writePbrtBumpTextures(fileHandle, fileName, material):
+    textureName = '{}-bump'.format(material['name']);
+    bump = material['bump'];
+    fileHandle.write('Texture "{}-image" "float" "imagemap" "string filename" "{}" "bool gamma" "false"\n'.format(textureName, textureReference(fileName, bump)));
+    fileHandle.write('Texture "{}" "float" "scale" "texture tex1" "{}-image" "float tex2" [{:.7g}]\n'.format(textureName, textureName, bump['strength']));
+    return(' "texture bumpmap" "{}"'.format(textureName));
+
+
+# Method to write a PBRT-v3 scene file
+def writePbrtFile(fileName, description, meshes, params):
+    width, height = description['resolution'];
+    with open(fileName, 'w') as fileHandle:
+        fileHandle.write('# {} (exported by RenderToolbox4)\n'.format(description['name']));
+        fileHandle.write('Film "image" "integer xresolution" [{}] "integer yresolution" [{}] "string filename" "{}"\n\n'.format(
+            int(width), int(height), params['imageFileName']));
+
+        camera = selectCamera(description, params['cameraName']);
+        if camera is not None:
+            eye, target, up = cameraLookAt(camera['matrix']);
+            # PBRT cameras are left handed
+            fileHandle.write('Scale -1 1 1\n');
+            fileHandle.write('LookAt {}  {}  {}\n'.format(numbersText(eye), numbersText(target), numbersText(up)));
+            # PBRT's fov is the angle along the shorter image axis
+            aspectRatio = float(width)/height;
+            fieldOfView = camera['fieldOfViewInDegrees'];
+            if aspectRatio > 1:
+                fieldOfView = 2*math.degrees(math.atan(math.tan(math.radians(fieldOfView)/2)/aspectRatio));
+            fileHandle.write('Camera "perspective" "float fov" [{:.7g}] # {}\n\n'.format(fieldOfView, camera['name']));
+
+        fileHandle.write('WorldBegin\n\n');
+        for material in description['materials'].values():
+            if material['alpha'] == 0:
+                continue;
+            bumpParameter = '';
+            if material.get('bump') is not None:
+                bumpParameter = writePbrtBumpTextures(fileHandle, fileName, material);
+            if max(material['specular']) > 0:
+                fileHandle.write('MakeNamedMaterial "{}" "string type" "plastic" "rgb Kd" [{}] "rgb Ks" [{}] "float roughness" [{:.7g}]{}\n'.format(
+                    material['name'], numbersText(material['diffuse']), numbersText(material['specular']), 2.0/(material['hardness']+2), bumpParameter));
+            else:
+                fileHandle.write('MakeNamedMaterial "{}" "string type" "matte" "rgb Kd" [{}]{}\n'.format(material['name'], numbersText(material['diffuse']), bumpParameter));
+        fileHandle.write('\n');
+
+        for light in description['lights']:
+            fileHandle.write('# light {}\n'.format(light['name']));
+            if light['type'] == 'SUN':
+                direction = -light['matrix'][0:3, 2];
+                fileHandle.write('LightSource "distant" "point from" [0 0 0] "point to" [{}] "rgb L" [{}]\n'.format(numbersText(direction), numbersText(light['color'])));
+                continue;
+            if light['type'] != 'AREA':
+                fileHandle.write('LightSource "point" "point from" [{}] "rgb I" [{}]\n'.format(numbersText(light['matrix'][0:3, 3]), numbersText(light['color'])));
+                continue;
+            # area lamps emit along their local -z axis
+            sizeX, sizeY = light['size'];
+            quad = numpy.array([(-sizeX/2, -sizeY/2, 0), (-sizeX/2, sizeY/2, 0), (sizeX/2, sizeY/2, 0), (sizeX/2, -sizeY/2, 0)]);
+            fileHandle.write('AttributeBegin\n');
+            fileHandle.write('  ConcatTransform [{}]\n'.format(numbersText(light['matrix'].T)));
+            fileHandle.write('  AreaLightSource "diffuse" "rgb L" [{}]\n'.format(numbersText(light['color'])));
+            fileHandle.write('  Shape "trianglemesh" "integer indices" [0 1 2 0 2 3] "point P" [{}]\n'.format(numbersText(quad)));
+            fileHandle.write('AttributeEnd\n');
+        fileHandle.write('\n');
+
+        for shape in description['shapes']:
+            parts = [(slot, part) for slot, part in meshes[shape['mesh']] if not isInvisible(description['materials'], slotMaterial(shape, slot))];
+            if len(parts) == 0:
+                continue;
+            fileHandle.write('AttributeBegin # {}\n'.format(shape['name']));
+            fileHandle.write('  ConcatTransform [{}]\n'.format(numbersText(shape['matrix'].T)));
+            for slot, part in parts:
+                materialName = slotMaterial(shape, slot);
+                if materialName is not None:
+                    fileHandle.write('  NamedMaterial "{}"\n'.format(materialName));
+                if 'plyFile' in part:
+                    fileHandle.write('  Shape "plymesh" "string filename" "{}"\n'.format(part['plyFile']));
+                    continue;
+                triangles, triangleSizes, sourceFaces = MeshUtils.triangulateLargeFaces(part['loopVertexIndices'], part['faceSizes'], 3);
+                fileHandle.write('  Shape "trianglemesh" "integer indices" [{}]\n'.format(' '.join([str(index) for index in triangles])));
+                fileHandle.write('    "point P" [{}]\n'.format(numbersText(part['vertices'])));
+                if part['normals'] is not None:
+                    fileHandle.write('    "normal N" [{}]\n'.format(numbersText(part['normals'])));
+                if part['uvs'] is not None:
+                    fileHandle.write('    "float uv" [{}]\n'.format(numbersText(part['uvs'])));
+            fileHandle.write('AttributeEnd\n');
+        fileHandle.write('\nWorldEnd\n');
+    return(fileName);
+
+
+# Helper method to escape a name for an XML attribute
+def xmlName(name):
+    return(saxutils.escape(name, {'"': '&quot;'}));
+
+
+# Helper method to format a matrix as a Mitsuba transform
+def mitsubaTransform(matrix, indent):
+    return('{}<transform name="toWorld">\n{}  <matrix value="{}"/>\n{}</transform>\n'.format(indent, indent, numbersText(matrix), indent));
+
+
+# Helper method to format a color as a Mitsuba rgb element
+def mitsubaRgb(name, color):
+    return('<rgb name="{}" value="{}"/>'.format(name, ', '.join(['{:.7g}'.format(float(value)) for value in color])));
+
+
+# Helper method to format the bsdf of a material, with the given id attribute (if any)
+def mitsubaBsdf(material, idAttribute, indent):
+    if max(material['specular']) > 0:
+        return('{}<bsdf type="phong"{}>\n{}  {}\n{}  {}\n{}  <float name="exponent" value="{:.7g}"/>\n{}</bsdf>\n'.format(indent, idAttribute,
+            indent, mitsubaRgb('diffuseReflectance', material['diffuse']), indent, mitsubaRgb('specularReflectance', material['specular']),
+            indent, material['hardness'], indent));
+    return('{}<bsdf type="diffuse"{}>\n{}  {}\n{}</bsdf>\n'.format(indent, idAttribute, indent, mitsubaRgb('reflectance', material['diffuse']), indent));
+
+
+# Helper method to format the texture of a bump map as a Mitsuba scale
+# texture around a bitmap, with PNG files read without gamma decoding
+def mitsubaBumpTexture(fileName, bump):
+    return(('    <texture type="scale">\n      <float name="scale" value="{:.7g}"/>\n      <texture type="bitmap">\n'
+            '        <string name="filename" value="{}"/>\n        <float name="gamma" value="1"/>\n      </texture>\n    </texture>\n').format(
+            bump['strength'], xmlName(textureReference(fileName, bump))));
+
+
+# Method to write a Mitsuba 0.5 scene file. All meshes are written as PLY
+# files, since Mitsuba has no inline mesh format.
+def writeMitsubaFile(fileName, description, meshes, params):
+    width, height = description['resolution'];
+    with open(fileName, 'w') as fileHandle:
+        fileHandle.write('<?xml version="1.0" encoding="utf-8"?>\n');
+        fileHandle.write('<!-- {} (exported by RenderToolbox4) -->\n'.format(description['name']));
+        fileHandle.write('<scene version="0.5.0">\n');
+        fileHandle.write('  <integrator type="path"/>\n');
+
+        camera = selectCamera(description, params['cameraName']);
+        if camera is not None:
+            eye, target, up = cameraLookAt(camera['matrix']);
+            fileHandle.write('  <sensor type="perspective" id="{}">\n'.format(xmlName(camera['name'])));
+            fileHandle.write('    <float name="fov" value="{:.7g}"/>\n    <string name="fovAxis" value="x"/>\n'.format(camera['fieldOfViewInDegrees']));
+            fileHandle.write('    <float name="nearClip" value="{:.7g}"/>\n    <float name="farClip" value="{:.7g}"/>\n'.format(*camera['clipRange']));
+            fileHandle.write('    <transform name="toWorld">\n');
+            fileHandle.write('      <lookat origin="{}" target="{}" up="{}"/>\n'.format(*[', '.join(['{:.7g}'.format(value) for value in vector]) for vector in (eye, target, up)]));
+            fileHandle.write('    </transform>\n');
+            fileHandle.write('    <film type="hdrfilm">\n      <integer name="width" value="{}"/>\n      <integer name="height" value="{}"/>\n    </film>\n'.format(int(width), int(height)));
+            fileHandle.write('  </sensor>\n');
+
+        for material in description['materials'].values():
+            if material['alpha'] == 0:
+                continue;
+            if material.get('bump') is None:
+                fileHandle.write(mitsubaBsdf(material, ' id="{}"'.format(xmlName(material['name'])), '  '));
+                continue;
+            # bump maps wrap the material's bsdf
+            fileHandle.write('  <bsdf type="bumpmap" id="{}">\n'.format(xmlName(material['name'])));
+            fileHandle.write(mitsubaBumpTexture(fileName, material['bump']));
+            fileHandle.write(mitsubaBsdf(material, '', '    '));
+            fileHandle.write('  </bsdf>\n');
+
+        for light in description['lights']:
+            if light['type'] == 'SUN':
+                direction = -light['matrix'][0:3, 2];
+                fileHandle.write('  <emitter type="directional" id="{}">\n    <vector name="direction" x="{:.7g}" y="{:.7g}" z="{:.7g}"/>\n    {}\n  </emitter>\n'.format(
+                    xmlName(light['name']), direction[0], direction[1], direction[2], mitsubaRgb('irradiance', light['color'])));
+                continue;
+            if light['type'] != 'AREA':
+                position = light['matrix'][0:3, 3];
+                fileHandle.write('  <emitter type="point" id="{}">\n    <point name="position" x="{:.7g}" y="{:.7g}" z="{:.7g}"/>\n    {}\n  </emitter>\n'.format(
+                    xmlName(light['name']), position[0], position[1], position[2], mitsubaRgb('intensity', light['color'])));
+                continue;
+            # Mitsuba rectangles span [-1,1]^2 and face +z: scale them to the
+            # lamp size and turn them around to face the lamp's -z axis
+            sizeX, sizeY = light['size'];
+            matrix = light['matrix'].dot(numpy.diag((sizeX/2, -sizeY/2, -1, 1)));
+            fileHandle.write('  <shape type="rectangle" id="{}">\n'.format(xmlName(light['name'])));
+            fileHandle.write(mitsubaTransform(matrix, '    '));
+            fileHandle.write('    <emitter type="area">\n      {}\n    </emitter>\n  </shape>\n'.format(mitsubaRgb('radiance', light['color'])));
+
+        for shape in description['shapes']:
+            for slot, part in meshes[shape['mesh']]:
+                materialName = slotMaterial(shape, slot);
+                if isInvisible(description['materials'], materialName):
+                    continue;
+                fileHandle.write('  <shape type="ply" id="{}-{}">\n'.format(xmlName(shape['name']), slot));
+                fileHandle.write('    <string name="filename" value="{}"/>\n'.format(xmlName(part['plyFile'])));
+                fileHandle.write(mitsubaTransform(shape['matrix'], '    '));
+                if materialName is not None:
+                    fileHandle.write('    <ref id="{}"/>\n'.format(xmlName(materialName)));
+                fileHandle.write('  </shape>\n');
+        fileHandle.write('</scene>\n');
+    return(fileName);
+
+
+# Method to export a scene description to a renderer-native scene file
+# <filePath>/<fileName>.pbrt or .xml, with PLY files in <fileName>-meshes/.
+# Returns the scene file name.
+def exportRendererScene(description, filePath, fileName, renderer='pbrt', params=None):
+    if renderer not in supportedRenderers:
+        raise ValueError('Unknown renderer "{}" (supported: {})'.format(renderer, ', '.join(supportedRenderers)));
+    params = ElevationMapUtils.mergeParams(exportDefaults, params);
+    if params['imageFileName'] is None:
+        params['imageFileName'] = '{}.exr'.format(fileName);
+
+    relativeMeshFolder = '{}-meshes'.format(fileSafeName(fileName));
+    inlineFacesLimit = params['inlineFacesLimit'];
+    if renderer == 'mitsuba':
+        inlineFacesLimit = 0;
+    meshes = writeMeshParts(description, os.path.join(filePath, relativeMeshFolder), relativeMeshFolder, inlineFacesLimit, params['plyChunkSize']);
+
+    sceneFileName = os.path.join(filePath, '{}.{}'.format(fileName, sceneFileExtensions[renderer]));
+    if renderer == 'pbrt':
+        return(writePbrtFile(sceneFileName, description, meshes, params));
+    return(writeMitsubaFile(sceneFileName, description, meshes, params));
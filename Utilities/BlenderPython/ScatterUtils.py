@@ -0,0 +1,233 @@
+# Blender-free helpers for scattering many primitives (cubes, cylinders,
+# spheres) at random without interpenetration, for the sceneManager's
+# scatterObjects.
+#
+# Each placed object is kept as its axis-aligned bounding box in a uniform
+# grid, with cells about the size of the largest object, so that a new
+# candidate is only tested against the few boxes of the cells it touches,
+# instead of against all the objects placed so far. Placing n objects then
+# takes about n times the number of attempts per object, however large n is.
+
+import math
+import time
+
+import numpy
+
+
+# Default parameters of a scattering (see scatterPlacements)
+scatterDefaults = {
+    'type'        : 'cube',
+    'count'       : 100,
+    'scaling'     : (1.0, 1.0, 1.0),
+    'scaleRange'  : (1.0, 1.0),
+    'rotateZ'     : False,
+    'region'      : None,
+    'room'        : None,
+    'placement'   : 'floor',
+    'minSpacing'  : 0.0,
+    'maxAttempts' : 30,
+    'obstacles'   : [],
+    'seed'        : None,
+};
+
+# Number of random candidates drawn at once
+candidatesBlockSize = 4096;
+
+
+# Helper method to get the half extents, along z, of a primitive of the given
+# scaling: cubes span +/-1, cylinders have a depth of 1 and spheres a radius of 1
+def primitiveHalfHeight(primitiveType, scaling):
+    if primitiveType == 'cylinder':
+        return(0.5*scaling[2]);
+    return(scaling[2]);
+
+
+# Helper method to get the half extents of the axis-aligned bounding box of
+# a primitive of the given scaling, rotated by angle around z. The footprint
+# of cubes is a rectangle, that of cylinders and spheres an ellipse.
+def primitiveHalfExtents(primitiveType, scaling, angle):
+    c = abs(math.cos(angle));
+    s = abs(math.sin(angle));
+    if primitiveType == 'cube':
+        hx = c*scaling[0] + s*scaling[1];
+        hy = s*scaling[0] + c*scaling[1];
+    else:
+        hx = math.sqrt((c*scaling[0])**2 + (s*scaling[1])**2);
+        hy = math.sqrt((s*scaling[0])**2 + (c*scaling[1])**2);
+    return(hx, hy, primitiveHalfHeight(primitiveType, scaling));
+
+
+# Helper method to get the footprint area and the volume of a primitive of the given scaling
+def primitiveSize(primitiveType, scaling):
+    sx, sy, sz = scaling;
+    if primitiveType == 'cube':
+        return(4*sx*sy, 8*sx*sy*sz);
+    if primitiveType == 'cylinder':
+        return(math.pi*sx*sy, math.pi*sx*sy*sz);
+    return(math.pi*sx*sy, 4.0/3.0*math.pi*sx*sy*sz);
+
+
+# Method to get the box (min, max) inside the walls, floor and ceiling of a
+# room made by the sceneManager's addRoom with the given params. Walls with a
+# 'wallThickness' are boxes, which addRoom offsets towards the origin.
+def roomInterior(roomParams):
+    x, y, z = [float(roomParams['roomLocation'][axis]) for axis in range(0, 3)];
+    halfWidth  = roomParams['roomWidth']/2.0;
+    halfDepth  = roomParams['roomDepth']/2.0;
+    roomHeight = roomParams['roomHeight'];
+    wallThickness = roomParams.get('wallThickness', 0.0);
+    # the surface coordinates along their thickness axis, for the lower and the upper walls
+    lower = (x-halfWidth, y-halfDepth, z);
+    upper = (x+halfWidth, y+halfDepth, z+roomHeight);
+
+    # addRoom moves each wall box by its thickness towards the origin, and
+    # the box spans +/- wallThickness around that
+    def wallCenter(coordinate):
+        return(coordinate + wallThickness if coordinate < 0 else coordinate - wallThickness);
+    boxMin = tuple([wallCenter(coordinate) + wallThickness for coordinate in lower]);
+    boxMax = tuple([wallCenter(coordinate) - wallThickness for coordinate in upper]);
+    return(boxMin, boxMax);
+
+
+# Class for a uniform grid of axis-aligned boxes, each listed in every cell it touches
+class uniformGrid:
+    def __init__(self, cellSize):
+        self.cellSize = float(cellSize);
+        self.cells = {};
+        self.boxes = [];
+        self.tests = 0;
+
+    # Helper method to get the range of cells that a box touches, per axis
+    def cellRange(self, boxMin, boxMax):
+        return([range(int(math.floor(boxMin[axis]/self.cellSize)), int(math.floor(boxMax[axis]/self.cellSize))+1) for axis in range(0, 3)]);
+
+    # Method to tell whether a box comes closer than gap to any box of the grid
+    def overlaps(self, boxMin, boxMax, gap=0.0):
+        xRange, yRange, zRange = self.cellRange([value - gap for value in boxMin], [value + gap for value in boxMax]);
+        seen = set();
+        for i in xRange:
+            for j in yRange:
+                for k in zRange:
+                    for index in self.cells.get((i, j, k), ()):
+                        if index in seen:
+                            continue;
+                        seen.add(index);
+                        self.tests += 1;
+                        otherMin, otherMax = self.boxes[index];
+                        if ((boxMin[0] < otherMax[0] + gap) and (otherMin[0] < boxMax[0] + gap) and
+                            (boxMin[1] < otherMax[1] + gap) and (otherMin[1] < boxMax[1] + gap) and
+                            (boxMin[2] < otherMax[2] + gap) and (otherMin[2] < boxMax[2] + gap)):
+                            return(True);
+        return(False);
+
+    # Method to add a box to the grid
+    def insert(self, boxMin, boxMax):
+        index = len(self.boxes);
+        self.boxes.append((tuple(boxMin), tuple(boxMax)));
+        xRange, yRange, zRange = self.cellRange(boxMin, boxMax);
+        for i in xRange:
+            for j in yRange:
+                for k in zRange:
+                    self.cells.setdefault((i, j, k), []).append(index);
+        return(index);
+
+
+# Method to place primitives at random inside a region, without overlaps.
+#   params['type']        : 'cube', 'cylinder' or 'sphere'
+#   params['count']       : number of objects wanted
+#   params['scaling']     : scaling (x, y, z) of the objects, as for addCube
+#   params['scaleRange']  : (low, high) range of a random factor applied to the scaling
+#   params['rotateZ']     : whether to rotate the objects at random around z (not spheres)
+#   params['region']      : (min, max) box to place the objects in, or
+#   params['room']        : params of an addRoom room, to place the objects inside it
+#   params['placement']   : 'floor', to rest the objects on the bottom of the
+#                           region, or 'volume', to place them anywhere in it
+#   params['minSpacing']  : minimum gap between the bounding boxes of the objects
+#   params['maxAttempts'] : random positions tried per object, before it is dropped
+#   params['obstacles']   : (min, max) boxes of objects already in the region
+#   params['seed']        : seed of the random numbers
+# Returns the locations, rotations (euler angles) and scalings of the placed
+# objects, as (n,3) arrays, and statistics: numbers of objects 'requested'
+# and 'placed', of position 'attempts' and box 'tests', the 'density' of the
+# objects (the fraction of the floor they cover, or of the volume they fill),
+# the number of grid 'cells' and the 'seconds' taken.
+def scatterPlacements(params):
+    params = dict(scatterDefaults, **params);
+    startTime = time.time();
+    primitiveType = params['type'];
+    if primitiveType not in ('cube', 'cylinder', 'sphere'):
+        raise ValueError('Unknown primitive type "{}"'.format(primitiveType));
+    if params['placement'] not in ('floor', 'volume'):
+        raise ValueError('Unknown placement "{}"'.format(params['placement']));
+    if params['room'] is not None:
+        regionMin, regionMax = roomInterior(params['room']);
+    elif params['region'] is not None:
+        regionMin, regionMax = [tuple([float(value) for value in corner]) for corner in params['region']];
+    else:
+        raise ValueError('Scattered objects need a region or a room');
+    count = int(params['count']);
+    scaling = [float(value) for value in params['scaling']];
+    lowScale, highScale = params['scaleRange'];
+    rotateZ = params['rotateZ'] and (primitiveType != 'sphere');
+    gap = float(params['minSpacing']);
+    isFloor = params['placement'] == 'floor';
+
+    # cells as large as the largest object (rotated) and its gap, so that each box touches few cells
+    largest = primitiveHalfExtents(primitiveType, [highScale*value for value in scaling], math.pi/4 if rotateZ else 0.0);
+    grid = uniformGrid(2*max(largest) + gap);
+    for obstacleMin, obstacleMax in params['obstacles']:
+        grid.insert(obstacleMin, obstacleMax);
+
+    rng = numpy.random.default_rng(params['seed']);
+    locations = numpy.zeros((count, 3));
+    rotations = numpy.zeros((count, 3));
+    scalings  = numpy.zeros((count, 3));
+    placedNum = 0;
+    attempts  = 0;
+    occupied  = 0.0;
+    candidates = numpy.zeros((0, 3));
+    candidateIndex = 0;
+    for index in range(0, count):
+        factor = rng.uniform(lowScale, highScale);
+        objectScaling = (factor*scaling[0], factor*scaling[1], factor*scaling[2]);
+        angle = rng.uniform(0.0, 2*math.pi) if rotateZ else 0.0;
+        halfExtents = primitiveHalfExtents(primitiveType, objectScaling, angle);
+        # the range of the object's center that keeps it inside the region
+        low  = [regionMin[axis] + halfExtents[axis] for axis in range(0, 3)];
+        high = [regionMax[axis] - halfExtents[axis] for axis in range(0, 3)];
+        if isFloor:
+            high[2] = low[2];
+        if any([low[axis] > high[axis] for axis in range(0, 3)]):
+            continue;
+        for attempt in range(0, params['maxAttempts']):
+            if candidateIndex == candidates.shape[0]:
+                candidates = rng.random((candidatesBlockSize, 3));
+                candidateIndex = 0;
+            fraction = candidates[candidateIndex];
+            candidateIndex += 1;
+            attempts += 1;
+            center = [low[axis] + fraction[axis]*(high[axis] - low[axis]) for axis in range(0, 3)];
+            boxMin = [center[axis] - halfExtents[axis] for axis in range(0, 3)];
+            boxMax = [center[axis] + halfExtents[axis] for axis in range(0, 3)];
+            if grid.overlaps(boxMin, boxMax, gap):
+                continue;
+            grid.insert(boxMin, boxMax);
+            locations[placedNum] = center;
+            rotations[placedNum] = (0.0, 0.0, angle);
+            scalings[placedNum]  = objectScaling;
+            placedNum += 1;
+            occupied += primitiveSize(primitiveType, objectScaling)[0 if isFloor else 1];
+            break;
+
+    extents = [max(0.0, regionMax[axis] - regionMin[axis]) for axis in range(0, 3)];
+    capacity = extents[0]*extents[1] if isFloor else extents[0]*extents[1]*extents[2];
+    statistics = {
+        'requested' : count,
+        'placed'    : placedNum,
+        'attempts'  : attempts,
+        'tests'     : grid.tests,
+        'density'   : occupied/capacity if capacity > 0 else 0.0,
+        'cells'     : len(grid.cells),
+        'seconds'   : time.time() - startTime,
+    };
+    return(locations[0:placedNum], rotations[0:placedNum], scalings[0:placedNum], statistics);
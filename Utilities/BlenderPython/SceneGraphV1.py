@@ -0,0 +1,977 @@
+# Blender-free scene graph backend, with the same method surface as
+# SceneUtilsV1.sceneManager, and a direct Collada writer.
+# Scenes are kept as plain Python objects and NumPy arrays, and are written
+# as Collada files with 'transrotloc' transforms, i.e. the same layout that
+# Blender's collada exporter produces for SceneUtilsV1.exportToColladaFile.
+# This lets scenes be generated in plain Python interpreters, without Blender.
+
+import datetime
+import math
+import os
+import re
+from xml.sax import saxutils
+
+import numpy
+
+import AdaptiveMeshUtils
+import CameraRigUtils
+import ConditionsUtils
+import ElevationMapUtils
+import ElevationTextureUtils
+import FloorplanUtils
+import MeshUtils
+import RendererExportUtils
+import ScatterUtils
+import SpectrumUtils
+import TiledElevationMapUtils
+
+
+# Helper method to get a tuple of floats from a mathutils.Vector, a tuple, a list or an array
+def vector3(v):
+    return(tuple([float(c) for c in v]));
+
+
+# Helper Method to rotate an object so that it points at a target
+def pointObjectToTarget(obj, targetLoc):
+    dx = targetLoc[0] - obj.location[0];
+    dy = targetLoc[1] - obj.location[1];
+    dz = targetLoc[2] - obj.location[2];
+    xRad = math.atan2(dz, math.sqrt(dy**2 + dx**2)) + math.pi/2;
+    zRad = math.atan2(dy, dx) - math.pi/2;
+    obj.rotation_euler = (xRad, 0.0, zRad);
+
+
+# Helper method to turn a datablock name into a valid collada id (as Blender does)
+def colladaId(name):
+    name = re.sub('[^A-Za-z0-9_.-]', '_', name);
+    if not re.match('[A-Za-z_]', name):
+        name = '_' + name;
+    return(name);
+
+
+# Helper method to escape a datablock name for use in an xml attribute
+def xmlName(name):
+    return(saxutils.escape(name, {'"': '&quot;'}));
+
+
+# Class for a named collection of datablocks, which makes names unique
+# by appending .001, .002, ... as Blender does
+class dataCollection:
+    def __init__(self):
+        self.clear();
+
+    def clear(self):
+        self.items  = [];
+        self.byName = {};
+        # last suffix used per base name, so that the search for a free name
+        # does not restart at .001 every time
+        self.lastSuffix = {};
+
+    def uniqueName(self, name):
+        if name not in self.byName:
+            return(name);
+        suffix = self.lastSuffix.get(name, 0) + 1;
+        while '{}.{:03d}'.format(name, suffix) in self.byName:
+            suffix += 1;
+        self.lastSuffix[name] = suffix;
+        return('{}.{:03d}'.format(name, suffix));
+
+    def add(self, item):
+        item.name = self.uniqueName(item.name);
+        self.byName[item.name] = item;
+        self.items.append(item);
+        return(item);
+
+    def remove(self, item):
+        self.items.remove(item);
+        del self.byName[item.name];
+
+    def __iter__(self):
+        return(iter(list(self.items)));
+
+    def __len__(self):
+        return(len(self.items));
+
+    def __contains__(self, name):
+        return(name in self.byName);
+
+    def __getitem__(self, name):
+        return(self.byName[name]);
+
+
+# Class for mesh data: vertex coordinates, faces, material slots
+class meshData:
+    def __init__(self, name, vertices, faces, smooth=False):
+        self.name = name;
+        self.vertices = numpy.asarray(vertices, dtype=numpy.float32).reshape((-1, 3));
+        self.loopVertexIndices, self.faceSizes = MeshUtils.faceArrays(faces);
+        self.smooth = smooth;
+        self.materials = [];
+        # per-face index into self.materials
+        self.materialIndices = numpy.zeros(self.faceSizes.size, dtype=numpy.int32);
+        # (min, max, openings) of a box that had openings cut through it, see boreOutBatch
+        self.slab = None;
+        # (V,2) per-vertex texture coordinates, if any
+        self.uvs = None;
+
+
+# Class for camera data
+class cameraData:
+    def __init__(self, name):
+        self.name          = name;
+        self.type          = 'PERSP';
+        self.angle_x       = 49.13434/180*math.pi;
+        self.sensor_width  = 32.0;
+        self.sensor_height = 18.0;
+        self.clip_start    = 0.1;
+        self.clip_end      = 100.0;
+        self.draw_size     = 1.0;
+        self.show_limits   = False;
+
+
+# Class for lamp data
+class lampData:
+    def __init__(self, name, type):
+        self.name     = name;
+        self.type     = type;
+        self.energy   = 1.0;
+        self.color    = (1.0, 1.0, 1.0);
+        self.distance = 25.0;
+        self.shape    = 'SQUARE';
+        self.size     = 1.0;
+        self.size_y   = 1.0;
+
+
+# Class for material data (Blender-internal style parameters)
+class materialData:
+    def __init__(self, name):
+        self.name               = name;
+        self.diffuse_shader     = 'LAMBERT';
+        self.diffuse_intensity  = 0.8;
+        self.diffuse_color      = (0.8, 0.8, 0.8);
+        self.specular_shader    = 'COOKTORR';
+        self.specular_intensity = 0.5;
+        self.specular_color     = (1.0, 1.0, 1.0);
+        self.specular_hardness  = 50;
+        self.alpha              = 1.0;
+        self.use_transparency   = False;
+        # spectra by component, see SpectrumUtils.materialSpectra
+        self.spectra            = {};
+        # elevation texture applied as a bump or displacement map, as
+        # described by ElevationTextureUtils.elevationTextureArrays, if any
+        self.bumpTexture        = None;
+
+
+# Class for an object placed in the scene
+class sceneObject:
+    def __init__(self, name, data):
+        self.name           = name;
+        self.data           = data;
+        self.location       = (0.0, 0.0, 0.0);
+        self.rotation_euler = (0.0, 0.0, 0.0);
+        self.scale          = (1.0, 1.0, 1.0);
+        self.show_name      = False;
+        # object-linked materials per slot, for objects that share a mesh
+        # (as Blender's material_slots[i].link = 'OBJECT'), or None
+        self.materials      = None;
+
+
+# Helper method to get the materials of an object's slots
+def objectMaterials(theObject):
+    if theObject.materials is not None:
+        return(theObject.materials);
+    return(theObject.data.materials);
+
+
+# Helper method to get the base name and the vertex and face arrays of a
+# primitive: 'cube', 'cylinder' (resolution vertices) or 'sphere'
+# (resolution subdivisions)
+def primitiveMeshArrays(primitiveType, resolution):
+    if primitiveType == 'cube':
+        vertices, faces = MeshUtils.cubeMeshArrays();
+        return('Cube', vertices, faces);
+    if primitiveType == 'cylinder':
+        vertices, faces = MeshUtils.cylinderMeshArrays(resolution);
+        return('Cylinder', vertices, faces);
+    if primitiveType == 'sphere':
+        vertices, faces = MeshUtils.icoSphereMeshArrays(resolution);
+        return('Icosphere', vertices, faces);
+    raise ValueError('Unknown primitive type "{}"'.format(primitiveType));
+
+
+# Class for managing basscene components, without Blender
+class sceneManager:
+    # ---- Method to initialize the SceneManager object -----
+    def __init__(self, params):
+        self.objects   = dataCollection();
+        self.meshes    = dataCollection();
+        self.lamps     = dataCollection();
+        self.cameras   = dataCollection();
+        self.materials = dataCollection();
+
+        # Set the scene name
+        self.name = 'Scene';
+        if 'name' in params:
+            self.name = params['name'];
+
+        # Set the unit scale
+        self.unitScale = 1.0;
+        if 'sceneUnitScale' in params:
+            self.unitScale = params['sceneUnitScale'];
+
+        # Verbosity of the log messages (0: silent, 1: summaries, 2: details).
+        # Messages are printed, or sent to params['logger'] (a logging.Logger) if given.
+        self.verbosity = 1;
+        if 'verbosity' in params:
+            self.verbosity = params['verbosity'];
+        self.logger = params.get('logger');
+
+        # Set rendering resolution
+        self.resolution_x = params['sceneWidthInPixels'];
+        self.resolution_y = params['sceneHeightInPixels'];
+
+        # Material spectra are written to spectrum files in params['spectrumFolder']
+        # if given, once per distinct spectrum (see SpectrumUtils.spectrumStore)
+        self.spectrumStore = None;
+        if params.get('spectrumFolder') is not None:
+            self.spectrumStore = SpectrumUtils.spectrumStore(params['spectrumFolder']);
+
+        # Generate a transparent material (used to bypass collada issue with area lights)
+        params = {'name'              : 'transparent material',
+                  'diffuse_shader'    : 'LAMBERT',
+                  'diffuse_intensity' : 1.0,
+                  'diffuse_color'     : (1.0, 1.0, 1.0),
+                  'specular_shader'   : 'WARDISO',
+                  'specular_intensity': 1.0,
+                  'specular_color'    : (1.0, 1.0, 1.0),
+                  'alpha'             : 0.0,
+        };
+        self.transparentMaterial = self.generateMaterialType(params);
+
+        # Statistics of the adaptive elevation map meshes, by object name
+        self.meshStatistics = {};
+
+        # Statistics of the objects placed by scatterObjects, by name prefix
+        self.scatterStatistics = {};
+
+        # Template meshes of the primitives, by (type, resolution)
+        self.primitiveMeshes = {};
+
+    # Method to log a message if the verbosity level is at least level, as SceneUtilsV1 does
+    def log(self, level, message):
+        if self.verbosity < level:
+            return;
+        if self.logger is None:
+            print(message);
+        elif level <= 1:
+            self.logger.info(message);
+        else:
+            self.logger.debug(message);
+
+    # ---- Method to erase a previous scene ----------------
+    def erasePreviousContents(self):
+        self.objects.clear();
+        self.meshes.clear();
+        self.lamps.clear();
+        self.cameras.clear();
+        self.materials.clear();
+        self.primitiveMeshes = {};
+
+    # Method to remove a single oject from the current scene
+    def removeObjectFromScene(self, object):
+        self.objects.remove(object);
+
+    # Method to generate a camera type
+    def generateCameraType(self, params):
+        theCameraType = self.cameras.add(cameraData('CAMERA'));
+        theCameraType.type    = 'PERSP';
+        theCameraType.angle_x = params['fieldOfViewInDegrees']/180*math.pi;
+        if 'widthToHeightAspectRatio' in params:
+            theCameraType.sensor_height = theCameraType.sensor_width / params['widthToHeightAspectRatio'];
+            self.resolution_x = params['pixelSamplesAlongWidth'];
+            self.resolution_y = self.resolution_x / params['widthToHeightAspectRatio'];
+        theCameraType.clip_start  = params['clipRange'][0];
+        theCameraType.clip_end    = params['clipRange'][1];
+        theCameraType.draw_size   = params['drawSize'];
+        theCameraType.show_limits = True;
+        return(theCameraType);
+
+    # Method to add a camera object to the current scene
+    def addCameraObject(self, params):
+        theCameraObject = self.objects.add(sceneObject(params['name'], params['cameraType']));
+        theCameraObject.show_name = params['showName'];
+        theCameraObject.location  = vector3(params['location']);
+        pointObjectToTarget(theCameraObject, vector3(params['lookAt']));
+        return(theCameraObject);
+
+    # Method to add the cameras of a camera rig (see CameraRigUtils), whose 
+    # rotations are computed at once for all poses.
+    #   params['rig']        : the rig, e.g. from CameraRigUtils.pathRig
+    #   params['cameraType'] : the camera type shared by all cameras
+    #   params['names']      : optional list of camera names (default: 
+    #                          params['namePrefix'], or 'camera', followed by
+    #                          the camera number)
+    #   params['showName']   : optional (default: False)
+    def addCameraRig(self, params):
+        rig = params['rig'];
+        names = params.get('names');
+        if names is None:
+            names = CameraRigUtils.rigNames(rig, params.get('namePrefix', 'camera'));
+        theCameraObjects = [];
+        for name, location, rotation in zip(names, rig['positions'], rig['rotations']):
+            theCameraObject = self.objects.add(sceneObject(name, params['cameraType']));
+            theCameraObject.show_name      = params.get('showName', False);
+            theCameraObject.location       = vector3(location);
+            theCameraObject.rotation_euler = vector3(rotation);
+            theCameraObjects.append(theCameraObject);
+        return(theCameraObjects);
+
+    # Method to add a camera rig and export the scene once, with a camera per
+    # pose or a single camera and a conditions file of poses. See
+    # CameraRigUtils.exportCameraRig for the params.
+    def exportCameraRig(self, params):
+        return(CameraRigUtils.exportCameraRig(self, params));
+
+    # Method to generate an area lamp type
+    def generateAreaLampType(self, params):
+        theLampType = self.lamps.add(lampData(params['name'], 'AREA'));
+        theLampType.energy   = 1;
+        theLampType.color    = vector3(params['color']);
+        theLampType.distance = params['fallOffDistance'];
+        theLampType.shape    = 'RECTANGLE';
+        theLampType.size     = params['width1'];
+        theLampType.size_y   = params['width2'];
+        return(theLampType);
+
+    # Method to generate a directional lamp type
+    def generateDirectionalLampType(self, params):
+        return(self.lamps.add(lampData(params['name'], 'SUN')));
+
+    # Method to add a lamp object to the current scene
+    def addLampObject(self, params):
+        theLampObject = self.objects.add(sceneObject(params['name'], params['model']));
+        theLampObject.show_name = params['showName'];
+        theLampObject.location  = vector3(params['location']);
+        pointObjectToTarget(theLampObject, vector3(params['lookAt']));
+
+        # Check whether we are adding an area lamp object ...
+        if params['model'].type == 'AREA':
+            # add a transparent planar Quad at the same xyz coords, which RT3 will transform into an area light
+            quadParams = {'name'       : '{}-geomObject'.format(params['name']),
+                          'scaling'    : (params['model'].size, params['model'].size_y, 1),
+                          'rotation'   : (0, 0, 0),
+                          'location'   : params['location'],
+                          'material'   : self.transparentMaterial,
+                          'flipNormal' : True,
+                         };
+            quadOBJ = self.addPlanarQuad(quadParams);
+            pointObjectToTarget(quadOBJ, vector3(params['lookAt']));
+            # rename the underlying mesh so RT3 can access it
+            self.meshes.remove(quadOBJ.data);
+            quadOBJ.data.name = params['name'];
+            self.meshes.add(quadOBJ.data);
+        return(theLampObject);
+
+    # Method to add a matte material.
+    # The diffuse and specular colors may be given as spectra instead, by
+    # params['diffuse_spectrum'] and params['specular_spectrum'], each a
+    # (wavelengths, magnitudes) pair of arrays. The spectra are kept with the
+    # material (see getMaterialSpectra), and a preview color is computed from
+    # them unless params['diffuse_color'] / params['specular_color'] is given.
+    def generateMaterialType(self, params):
+        spectra = SpectrumUtils.materialSpectra(params, self.spectrumStore);
+        theMaterialType = self.materials.add(materialData(params['name']));
+        theMaterialType.diffuse_shader     = params['diffuse_shader'];
+        theMaterialType.diffuse_intensity  = params['diffuse_intensity'];
+        theMaterialType.diffuse_color      = vector3(SpectrumUtils.materialColor(params, spectra, 'diffuse'));
+        theMaterialType.specular_shader    = params['specular_shader'];
+        theMaterialType.specular_intensity = params['specular_intensity'];
+        theMaterialType.specular_color     = vector3(SpectrumUtils.materialColor(params, spectra, 'specular'));
+        theMaterialType.alpha              = params['alpha'];
+        theMaterialType.use_transparency   = True;
+        theMaterialType.spectra            = spectra;
+        return(theMaterialType);
+
+    # Method to get the spectra of the materials that have any, by material
+    # name and component, e.g. {'wall': {'diffuse': {'wavelengths', 'magnitudes', 'file'}}},
+    # for instance to write mappings that refer to the spectrum files
+    def getMaterialSpectra(self):
+        return(dict([(theMaterialType.name, dict(theMaterialType.spectra)) for theMaterialType in self.materials if theMaterialType.spectra]));
+
+    # Method to add a mesh object built from vertex and face arrays, and
+    # optionally (V,2) per-vertex texture coordinates
+    def addMeshObject(self, name, meshName, vertices, faces, smooth=False, uvs=None):
+        theMesh   = self.meshes.add(meshData(meshName, vertices, faces, smooth));
+        if uvs is not None:
+            theMesh.uvs = numpy.asarray(uvs, dtype=numpy.float32).reshape((-1, 2));
+        theObject = self.objects.add(sceneObject(name, theMesh));
+        return(theObject);
+
+    # Helper method to place an object and attach a material
+    def placeObject(self, theObject, params, rotationKey='rotation', scaleKey='scaling'):
+        if rotationKey in params:
+            theObject.rotation_euler = vector3(params[rotationKey]);
+        theObject.scale    = vector3(params[scaleKey]);
+        theObject.location = vector3(params['location']);
+        if 'material' in params:
+            self.attachMaterial(theObject, params['material']);
+        return(theObject);
+
+    # Helper method to attach a material to an object: to its own slot if
+    # it shares its mesh, else to its mesh
+    def attachMaterial(self, theObject, material):
+        if theObject.materials is not None:
+            theObject.materials[0] = material;
+        else:
+            theObject.data.materials.append(material);
+
+    # Method to get the template mesh of a primitive, generated once per (type, resolution).
+    # See SceneUtilsV1.sceneManager.getPrimitiveMesh.
+    def getPrimitiveMesh(self, primitiveType, resolution=None):
+        key = (primitiveType, resolution);
+        theMesh = self.primitiveMeshes.get(key);
+        if (theMesh is not None) and (theMesh.name in self.meshes) and (self.meshes[theMesh.name] is theMesh):
+            return(theMesh);
+        baseName, vertices, faces = primitiveMeshArrays(primitiveType, resolution);
+        theMesh = self.meshes.add(meshData('{}-primitive'.format(baseName), vertices, faces));
+        # a single material slot, linked per object
+        theMesh.materials.append(None);
+        self.primitiveMeshes[key] = theMesh;
+        return(theMesh);
+
+    # Method to add an object for a primitive mesh. Shared objects link the
+    # template mesh (and get object-linked materials), others get their own mesh.
+    def addPrimitiveObject(self, name, primitiveType, resolution, material, sharedMesh=False):
+        if sharedMesh:
+            theObject = self.objects.add(sceneObject(name, self.getPrimitiveMesh(primitiveType, resolution)));
+            theObject.materials = [None];
+        else:
+            baseName, vertices, faces = primitiveMeshArrays(primitiveType, resolution);
+            theObject = self.addMeshObject(name, baseName, vertices, faces);
+        if material is not None:
+            self.attachMaterial(theObject, material);
+        return(theObject);
+
+    # Method to add a cube at a specified location, rotation with specified scaling and material
+    # Set params['sharedMesh'] to True to link the cube to a shared mesh.
+    def addCube(self, params):
+        theCube = self.addPrimitiveObject(params['name'], 'cube', None, None, params.get('sharedMesh', False));
+        return(self.placeObject(theCube, params));
+
+    # Method to add a cylinder with a desired scale, rotation, and location
+    # params['verticesNum'] (default 128) and params['sharedMesh'] are optional.
+    def addCylinder(self, params):
+        theCylinder = self.addPrimitiveObject(params['name'], 'cylinder', params.get('verticesNum', 128), None, params.get('sharedMesh', False));
+        return(self.placeObject(theCylinder, params));
+
+    # Method to add a sphere with a desired scale, and location
+    def addSphere(self, params):
+        if 'subdivisions' in params:
+            subdivisionsNum = params['subdivisions'];
+        else:
+            subdivisionsNum = 5;
+        theSphere = self.addPrimitiveObject(params['name'], 'sphere', subdivisionsNum, None, params.get('sharedMesh', False));
+        return(self.placeObject(theSphere, params, rotationKey=None));
+
+    # Method to add many primitives of one type that share a single mesh.
+    # See SceneUtilsV1.sceneManager.addPrimitivesBatch for the params.
+    def addPrimitivesBatch(self, params):
+        primitiveType = params['type'];
+        defaultResolution = {'cube': None, 'cylinder': 128, 'sphere': 5}[primitiveType];
+        resolution = params.get('resolution', defaultResolution);
+        sharedMesh = params.get('sharedMesh', True);
+
+        locations = numpy.asarray(params['locations'], dtype=numpy.float64).reshape((-1, 3));
+        objectsNum = locations.shape[0];
+        if 'names' in params:
+            names = params['names'];
+        else:
+            names = ['{}{:05d}'.format(params['namePrefix'], index) for index in range(0, objectsNum)];
+        rotations = numpy.zeros((objectsNum, 3));
+        if 'rotations' in params:
+            rotations = numpy.asarray(params['rotations'], dtype=numpy.float64).reshape((-1, 3));
+        scalings = numpy.ones((objectsNum, 3));
+        if 'scalings' in params:
+            scalings = numpy.asarray(params['scalings'], dtype=numpy.float64).reshape((-1, 3));
+        materials = params['materials'];
+        if not isinstance(materials, (list, tuple)):
+            materials = [materials]*objectsNum;
+
+        theObjects = [];
+        for index in range(0, objectsNum):
+            theObject = self.addPrimitiveObject(names[index], primitiveType, resolution, materials[index], sharedMesh);
+            theObject.location       = tuple(locations[index].tolist());
+            theObject.rotation_euler = tuple(rotations[index].tolist());
+            theObject.scale          = tuple(scalings[index].tolist());
+            theObjects.append(theObject);
+        return(theObjects);
+
+    # Method to scatter many primitives of one type at random without
+    # overlaps. See SceneUtilsV1.sceneManager.scatterObjects.
+    def scatterObjects(self, params):
+        placementParams = dict([(key, params[key]) for key in ScatterUtils.scatterDefaults if key in params]);
+        locations, rotations, scalings, statistics = ScatterUtils.scatterPlacements(placementParams);
+        materials = params['materials'];
+        if isinstance(materials, (list, tuple)):
+            materials = [materials[index % len(materials)] for index in range(0, locations.shape[0])];
+        batchParams = {
+            'type'       : placementParams.get('type', ScatterUtils.scatterDefaults['type']),
+            'namePrefix' : params['namePrefix'],
+            'locations'  : locations,
+            'rotations'  : rotations,
+            'scalings'   : scalings,
+            'materials'  : materials,
+        };
+        for key in ('resolution', 'sharedMesh'):
+            if key in params:
+                batchParams[key] = params[key];
+        theObjects = [];
+        if locations.shape[0] > 0:
+            theObjects = self.addPrimitivesBatch(batchParams);
+        self.scatterStatistics[params['namePrefix']] = statistics;
+        self.log(1, 'Scattered "{}": {} of {} objects placed in {} attempts, density {:.3f}'.format(
+            params['namePrefix'], statistics['placed'], statistics['requested'], statistics['attempts'], statistics['density']));
+        return(theObjects);
+
+    # Method to add a planar quad
+    def addPlanarQuad(self, params):
+        if 'vertices' in params:
+            vertices, faces = MeshUtils.planarQuadMeshArrays(params['flipNormal'], params['vertices']);
+        else:
+            vertices, faces = MeshUtils.planarQuadMeshArrays(params['flipNormal']);
+        theObject = self.addMeshObject(params['name'], '{}-mesh'.format(params['name']), vertices, faces);
+        return(self.placeObject(theObject, params));
+
+    # Method to add a room. See SceneUtilsV1.sceneManager.addRoom.
+    def addRoom(self, roomParams):
+        roomLocation = vector3(roomParams['roomLocation']);
+        roomWidth    = roomParams['roomWidth'];
+        roomDepth    = roomParams['roomDepth'];
+        roomHeight   = roomParams['roomHeight'];
+        x, y, z      = roomLocation;
+
+        # (surface key, name key, material key, plane scaling, rotation, location, wall thickness axis)
+        surfaces = [
+            ('floorPlane',     'floorName',     'floorMaterialType',     (roomWidth, roomDepth),  (0, 0, 0),          (x, y, z),                              2),
+            ('backWallPlane',  'backWallName',  'backWallMaterialType',  (roomWidth, roomHeight), (math.pi/2, 0, 0),  (x, y+roomDepth/2, z+roomHeight/2),     1),
+            ('leftWallPlane',  'leftWallName',  'leftWallMaterialType',  (roomHeight, roomDepth), (0, math.pi/2, 0),  (x-roomWidth/2, y, z+roomHeight/2),     0),
+            ('rightWallPlane', 'rightWallName', 'rightWallMaterialType', (roomHeight, roomDepth), (0, -math.pi/2, 0), (x+roomWidth/2, y, z+roomHeight/2),     0),
+            ('frontWallPlane', 'frontWallName', 'frontWallMaterialType', (roomWidth, roomHeight), (-math.pi/2, 0, 0), (x, y-roomDepth/2, z+roomHeight/2),     1),
+            ('ceilingPlane',   'ceilingName',   'ceilingMaterialType',   (roomWidth, roomDepth),  (math.pi, 0, 0),    (x, y, z+roomHeight),                   2),
+        ];
+
+        surfacesDict = {};
+        for surfaceKey, nameKey, materialKey, planeScaling, rotation, location, thicknessAxis in surfaces:
+            params = { 'name'       : roomParams[nameKey],
+                       'scaling'    : (planeScaling[0], planeScaling[1], 0.1),
+                       'rotation'   : rotation,
+                       'location'   : location,
+                       'material'   : roomParams[materialKey],
+                       'flipNormal' : False,
+                     };
+            if ('wallThickness' in roomParams):
+                wallThickness = roomParams['wallThickness'];
+                params['scaling'] = (planeScaling[0]/2, planeScaling[1]/2, wallThickness);
+                location = list(location);
+                if location[thicknessAxis] < 0:
+                    location[thicknessAxis] += wallThickness;
+                else:
+                    location[thicknessAxis] -= wallThickness;
+                params['location'] = location;
+                surfacesDict[surfaceKey] = self.addCube(params);
+            else:
+                surfacesDict[surfaceKey] = self.addPlanarQuad(params);
+        return(surfacesDict);
+
+    # Method to add a floorplan of many rooms as a single object. See
+    # SceneUtilsV1.sceneManager.addFloorplan. The surface names of the
+    # material slots are kept in the mesh's surfaceNames list.
+    def addFloorplan(self, params):
+        rooms = params['rooms'];
+        if 'roomGrid' in params:
+            rectangles = FloorplanUtils.roomRectanglesFromGrid(params['roomGrid'], params.get('cellSize', 1.0));
+            if len(rectangles) != len(rooms):
+                raise ValueError('The room grid has {} rooms, but {} rooms are described'.format(len(rectangles), len(rooms)));
+        else:
+            rectangles = [room['roomRectangle'] for room in rooms];
+        vertices, faces, surfaceIndices = FloorplanUtils.floorplanMeshArrays(rectangles, params['roomHeight'], params['wallThickness']);
+
+        theFloorplan = self.addMeshObject(params['name'], '{}-mesh'.format(params['name']), vertices, faces);
+        theFloorplan.data.materialIndices = surfaceIndices;
+        theFloorplan.data.surfaceNames = [];
+        for room in rooms:
+            for surface in FloorplanUtils.roomSurfaces:
+                theFloorplan.data.materials.append(room['{}MaterialType'.format(surface)]);
+                theFloorplan.data.surfaceNames.append(room['{}Name'.format(surface)]);
+        if 'location' in params:
+            theFloorplan.location = vector3(params['location']);
+        return(theFloorplan);
+
+    # Method to generate a mesh object from an elevation map. With
+    # params['meshBuildMethod'] set to 'adaptive', the mesh is simplified as
+    # in SceneUtilsV1 and its statistics are kept in self.meshStatistics.
+    # With params['elevationTexture'], the map becomes a coarse base mesh
+    # with a bump texture on params['material'], as in SceneUtilsV1.
+    def addElevationMapObject(self, params):
+        statistics = None;
+        uvs = None;
+        if params.get('elevationTexture') is not None:
+            textureParams = dict(params['elevationTexture']);
+            textureParams.setdefault('scale', params['scale'][2]);
+            vertices, faces, uvs, texture, statistics = ElevationTextureUtils.elevationTextureArrays(params['name'], params['elevationMap'],
+                params['xBinsNum'], params['yBinsNum'], textureParams);
+            params['material'].bumpTexture = texture;
+        elif params.get('meshBuildMethod') == 'adaptive':
+            vertices, faces, statistics = AdaptiveMeshUtils.adaptiveElevationMapMeshArrays(params['elevationMap'], params['xBinsNum'], params['yBinsNum'],
+                maxError=params.get('maxError'), maxTriangles=params.get('maxTriangles'));
+        elif isinstance(params['elevationMap'], TiledElevationMapUtils.tiledElevationMap):
+            vertices, faces = TiledElevationMapUtils.tiledElevationMapMeshArrays(params['elevationMap']);
+        else:
+            vertices, faces = ElevationMapUtils.elevationMapMeshArrays(params['elevationMap'], params['xBinsNum'], params['yBinsNum']);
+        theObject = self.addMeshObject(params['name'], '{}-mesh'.format(params['name']), vertices, faces, smooth=True, uvs=uvs);
+        if statistics is not None:
+            self.meshStatistics[theObject.name] = statistics;
+        return(self.placeObject(theObject, params, scaleKey='scale'));
+
+    # Method to subtract (boring out) one geometric object from another
+    def boreOut(self, targetObject, boringObject, hideBoringObject):
+        return(self.boreOutBatch(targetObject, [boringObject], hideBoringObject));
+
+    # Method to subtract (bore out) many objects from a target object at once.
+    # There is no Boolean solver without Blender: only box-shaped cutters that
+    # go through an axis-aligned, box-shaped target (such as the walls of
+    # addRoom with a 'wallThickness') are supported, as in the fast path of
+    # SceneUtilsV1.sceneManager.boreOutBatch. Other cases raise a ValueError.
+    def boreOutBatch(self, targetObject, boringObjects, hideBoringObjects):
+        targetMesh = targetObject.data;
+        if targetMesh.slab is not None:
+            slabMin, slabMax, openings = targetMesh.slab;
+        else:
+            bounds = MeshUtils.axisAlignedBoxBounds(targetMesh.vertices, targetMesh.faceSizes);
+            if bounds is None:
+                raise ValueError('Cannot bore out "{}": only box-shaped objects can be bored out without Blender'.format(targetObject.name));
+            slabMin, slabMax = bounds;
+            openings = [];
+
+        targetMatrix = RendererExportUtils.objectMatrix(targetObject.location, targetObject.rotation_euler, targetObject.scale);
+        toTarget = numpy.linalg.inv(targetMatrix);
+        cutterBoxes = [];
+        for boringObject in boringObjects:
+            bounds = None;
+            if objectKind(boringObject) == 'MESH':
+                bounds = MeshUtils.axisAlignedBoxBounds(boringObject.data.vertices, boringObject.data.faceSizes);
+            if bounds is not None:
+                boringMatrix = RendererExportUtils.objectMatrix(boringObject.location, boringObject.rotation_euler, boringObject.scale);
+                bounds = MeshUtils.transformAxisAlignedBox(toTarget.dot(boringMatrix), bounds[0], bounds[1]);
+            if bounds is None:
+                raise ValueError('Cannot bore "{}" out of "{}": only boxes aligned with the target can bore out without Blender'.format(boringObject.name, targetObject.name));
+            cutterBoxes.append(bounds);
+
+        thinAxis = int(numpy.argmin((slabMax - slabMin)*numpy.linalg.norm(targetMatrix[0:3, 0:3], axis=0)));
+        newOpenings = MeshUtils.slabOpenings(slabMin, slabMax, thinAxis, cutterBoxes);
+        if newOpenings is None:
+            raise ValueError('Cannot bore out "{}": the boring objects must go through it without Blender'.format(targetObject.name));
+        openings = openings + newOpenings;
+        vertices, faces = MeshUtils.slabWithOpeningsMeshArrays(slabMin, slabMax, thinAxis, openings);
+        targetMesh.vertices = vertices;
+        targetMesh.loopVertexIndices, targetMesh.faceSizes = MeshUtils.faceArrays(faces);
+        targetMesh.materialIndices = numpy.zeros(targetMesh.faceSizes.size, dtype=numpy.int32);
+        targetMesh.slab = (slabMin, slabMax, openings);
+
+        if hideBoringObjects:
+            for boringObject in boringObjects:
+                self.removeObjectFromScene(boringObject);
+        return('slab');
+
+    # Method to export a collada file for the current 3D scene.
+    # The file is named after the scene, unless a fileName is given.
+    def exportToColladaFile(self, filePath, fileName=None):
+        if fileName is None:
+            fileName = self.name;
+        fileName = '{}/{}.dae'.format(filePath, fileName);
+        writeColladaFile(fileName, self);
+        return(fileName);
+
+    # Method to export the scene to a renderer-native scene file, for renderer
+    # 'pbrt' (PBRT-v3) or 'mitsuba' (Mitsuba 0.5), with large meshes written 
+    # to binary PLY files. See RendererExportUtils for the params.
+    def exportToRendererFile(self, filePath, renderer='pbrt', fileName=None, params=None):
+        if fileName is None:
+            fileName = self.name;
+        description = RendererExportUtils.sceneDescription(self.name, (self.resolution_x, self.resolution_y), self.objects,
+                                                           objectKind, objectMaterials, meshArrays);
+        return(RendererExportUtils.exportRendererScene(description, filePath, fileName, renderer, params));
+
+    # Method to export one collada file per row of a conditions file.
+    # See ConditionsUtils.exportConditionsBatch.
+    def exportConditionsBatch(self, params):
+        return(ConditionsUtils.exportConditionsBatch(self, params));
+
+
+# Helper method to get the kind of an object, as Blender's object.type
+def objectKind(theObject):
+    if isinstance(theObject.data, cameraData):
+        return('CAMERA');
+    if isinstance(theObject.data, lampData):
+        return('LAMP');
+    return('MESH');
+
+
+# Helper method to get the arrays of a mesh, for RendererExportUtils
+def meshArrays(theMesh):
+    return({
+        'vertices'          : theMesh.vertices,
+        'loopVertexIndices' : theMesh.loopVertexIndices,
+        'faceSizes'         : theMesh.faceSizes,
+        'materialIndices'   : theMesh.materialIndices,
+        'smooth'            : theMesh.smooth,
+        'uvs'               : theMesh.uvs,
+    });
+
+
+# Helper method to write numbers separated by spaces, in chunks, so that
+# the full text of large arrays never sits in memory
+def writeNumbers(fileHandle, values, numberFormat, chunkSize=65536):
+    values = numpy.asarray(values).reshape(-1);
+    for start in range(0, values.size, chunkSize):
+        chunk = values[start:start+chunkSize].tolist();
+        if start > 0:
+            fileHandle.write(' ');
+        fileHandle.write(' '.join([numberFormat]*len(chunk)) % tuple(chunk));
+
+
+# Helper method to write a collada float source with X/Y/Z params, or with
+# the given params (e.g. S/T for texture coordinates)
+def writeFloatSource(fileHandle, sourceId, values, indent, axisNames=('X', 'Y', 'Z')):
+    values = numpy.asarray(values, dtype=numpy.float32).reshape((-1, len(axisNames)));
+    fileHandle.write('{}<source id="{}">\n'.format(indent, sourceId));
+    fileHandle.write('{}  <float_array id="{}-array" count="{}">'.format(indent, sourceId, values.size));
+    writeNumbers(fileHandle, values, '%.7g');
+    fileHandle.write('</float_array>\n');
+    fileHandle.write('{}  <technique_common>\n'.format(indent));
+    fileHandle.write('{}    <accessor source="#{}-array" count="{}" stride="{}">\n'.format(indent, sourceId, values.shape[0], len(axisNames)));
+    for axisName in axisNames:
+        fileHandle.write('{}      <param name="{}" type="float"/>\n'.format(indent, axisName));
+    fileHandle.write('{}    </accessor>\n'.format(indent));
+    fileHandle.write('{}  </technique_common>\n'.format(indent));
+    fileHandle.write('{}</source>\n'.format(indent));
+
+
+# Helper method to format a color with alpha
+def colorText(color, scale=1.0, alpha=1.0):
+    return('{:.7g} {:.7g} {:.7g} {:.7g}'.format(color[0]*scale, color[1]*scale, color[2]*scale, alpha));
+
+
+# Helper method to write the library_cameras element
+def writeCameras(fileHandle, scene):
+    fileHandle.write('  <library_cameras>\n');
+    for camera in scene.cameras:
+        fileHandle.write('    <camera id="{}-camera" name="{}">\n'.format(colladaId(camera.name), xmlName(camera.name)));
+        fileHandle.write('      <optics>\n        <technique_common>\n          <perspective>\n');
+        fileHandle.write('            <xfov sid="xfov">{:.7g}</xfov>\n'.format(camera.angle_x*180/math.pi));
+        fileHandle.write('            <aspect_ratio>{:.7g}</aspect_ratio>\n'.format(float(scene.resolution_x)/scene.resolution_y));
+        fileHandle.write('            <znear sid="znear">{:.7g}</znear>\n'.format(camera.clip_start));
+        fileHandle.write('            <zfar sid="zfar">{:.7g}</zfar>\n'.format(camera.clip_end));
+        fileHandle.write('          </perspective>\n        </technique_common>\n      </optics>\n');
+        fileHandle.write('    </camera>\n');
+    fileHandle.write('  </library_cameras>\n');
+
+
+# Helper method to write the library_lights element.  As with Blender's
+# exporter, area lamps are written as point lights.
+def writeLights(fileHandle, scene):
+    fileHandle.write('  <library_lights>\n');
+    for lamp in scene.lamps:
+        color = '{:.7g} {:.7g} {:.7g}'.format(lamp.color[0]*lamp.energy, lamp.color[1]*lamp.energy, lamp.color[2]*lamp.energy);
+        fileHandle.write('    <light id="{}-light" name="{}">\n'.format(colladaId(lamp.name), xmlName(lamp.name)));
+        fileHandle.write('      <technique_common>\n');
+        if lamp.type == 'SUN':
+            fileHandle.write('        <directional>\n          <color sid="color">{}</color>\n        </directional>\n'.format(color));
+        else:
+            fileHandle.write('        <point>\n          <color sid="color">{}</color>\n'.format(color));
+            fileHandle.write('          <constant_attenuation>1</constant_attenuation>\n');
+            fileHandle.write('          <linear_attenuation>0</linear_attenuation>\n');
+            fileHandle.write('          <quadratic_attenuation>{:.7g}</quadratic_attenuation>\n'.format(1.0/(lamp.distance*lamp.distance)));
+            fileHandle.write('        </point>\n');
+        fileHandle.write('      </technique_common>\n');
+        fileHandle.write('    </light>\n');
+    fileHandle.write('  </library_lights>\n');
+
+
+# Helper method to get the collada id of the image of a material's bump texture
+def bumpImageId(material):
+    return(colladaId(os.path.basename(material.bumpTexture['file']).replace('.', '_')));
+
+
+# Helper method to write the library_images element, for the bump textures
+# of the materials, referred to relative to the collada file
+def writeImages(fileHandle, scene, fileName):
+    images = {};
+    for material in scene.materials:
+        if material.bumpTexture is not None:
+            images[bumpImageId(material)] = os.path.relpath(material.bumpTexture['file'], os.path.dirname(os.path.abspath(fileName)));
+    if len(images) == 0:
+        return;
+    fileHandle.write('  <library_images>\n');
+    for imageId in sorted(images.keys()):
+        fileHandle.write('    <image id="{}" name="{}">\n'.format(imageId, imageId));
+        fileHandle.write('      <init_from>{}</init_from>\n'.format(xmlName(images[imageId].replace(os.sep, '/'))));
+        fileHandle.write('    </image>\n');
+    fileHandle.write('  </library_images>\n');
+
+
+# Helper method to write the library_effects and library_materials elements.
+# Bump textures are written as Blender's exporter writes normal-mapped
+# textures, in an FCOLLADA 'bump' extra, which Assimp reads.
+def writeMaterials(fileHandle, scene):
+    fileHandle.write('  <library_effects>\n');
+    for material in scene.materials:
+        if material.specular_shader == 'BLINN':
+            shaderName = 'blinn';
+        elif material.specular_shader in ('PHONG', 'COOKTORR'):
+            shaderName = 'phong';
+        else:
+            shaderName = 'lambert';
+        fileHandle.write('    <effect id="{}-effect">\n      <profile_COMMON>\n'.format(colladaId(material.name)));
+        if material.bumpTexture is not None:
+            imageId = bumpImageId(material);
+            fileHandle.write('        <newparam sid="{}-surface">\n          <surface type="2D">\n            <init_from>{}</init_from>\n          </surface>\n        </newparam>\n'.format(imageId, imageId));
+            fileHandle.write('        <newparam sid="{}-sampler">\n          <sampler2D>\n            <source>{}-surface</source>\n          </sampler2D>\n        </newparam>\n'.format(imageId, imageId));
+        fileHandle.write('        <technique sid="common">\n');
+        fileHandle.write('          <{}>\n'.format(shaderName));
+        fileHandle.write('            <emission>\n              <color sid="emission">0 0 0 1</color>\n            </emission>\n');
+        fileHandle.write('            <ambient>\n              <color sid="ambient">0 0 0 1</color>\n            </ambient>\n');
+        fileHandle.write('            <diffuse>\n              <color sid="diffuse">{}</color>\n            </diffuse>\n'.format(colorText(material.diffuse_color, material.diffuse_intensity)));
+        if shaderName != 'lambert':
+            fileHandle.write('            <specular>\n              <color sid="specular">{}</color>\n            </specular>\n'.format(colorText(material.specular_color, material.specular_intensity)));
+            fileHandle.write('            <shininess>\n              <float sid="shininess">{:.7g}</float>\n            </shininess>\n'.format(material.specular_hardness));
+        if material.use_transparency and (material.alpha < 1.0):
+            fileHandle.write('            <transparent opaque="A_ONE">\n              <color>1 1 1 1</color>\n            </transparent>\n');
+            fileHandle.write('            <transparency>\n              <float sid="transparency">{:.7g}</float>\n            </transparency>\n'.format(material.alpha));
+        fileHandle.write('            <index_of_refraction>\n              <float sid="index_of_refraction">1</float>\n            </index_of_refraction>\n');
+        fileHandle.write('          </{}>\n'.format(shaderName));
+        if material.bumpTexture is not None:
+            fileHandle.write('          <extra>\n            <technique profile="FCOLLADA">\n              <bump>\n');
+            fileHandle.write('                <texture texture="{}-sampler" texcoord="UVMap"/>\n'.format(bumpImageId(material)));
+            fileHandle.write('              </bump>\n            </technique>\n          </extra>\n');
+        fileHandle.write('        </technique>\n      </profile_COMMON>\n    </effect>\n');
+    fileHandle.write('  </library_effects>\n');
+
+    fileHandle.write('  <library_materials>\n');
+    for material in scene.materials:
+        materialId = colladaId(material.name);
+        fileHandle.write('    <material id="{}-material" name="{}">\n'.format(materialId, xmlName(material.name)));
+        fileHandle.write('      <instance_effect url="#{}-effect"/>\n'.format(materialId));
+        fileHandle.write('    </material>\n');
+    fileHandle.write('  </library_materials>\n');
+
+
+# Helper method to write the library_geometries element
+def writeGeometries(fileHandle, scene):
+    fileHandle.write('  <library_geometries>\n');
+    for mesh in scene.meshes:
+        meshId = '{}-mesh'.format(colladaId(mesh.name));
+        fileHandle.write('    <geometry id="{}" name="{}">\n      <mesh>\n'.format(meshId, xmlName(mesh.name)));
+        writeFloatSource(fileHandle, '{}-positions'.format(meshId), mesh.vertices, '        ');
+
+        # smooth meshes get per-vertex normals, flat meshes get per-face normals
+        normals = MeshUtils.meshNormals(mesh.vertices, mesh.loopVertexIndices, mesh.faceSizes, mesh.smooth);
+        writeFloatSource(fileHandle, '{}-normals'.format(meshId), normals, '        ');
+        if mesh.uvs is not None:
+            writeFloatSource(fileHandle, '{}-map-0'.format(meshId), mesh.uvs, '        ', ('S', 'T'));
+        fileHandle.write('        <vertices id="{}-vertices">\n'.format(meshId));
+        fileHandle.write('          <input semantic="POSITION" source="#{}-positions"/>\n'.format(meshId));
+        fileHandle.write('        </vertices>\n');
+
+        faceOfLoop = numpy.repeat(numpy.arange(mesh.faceSizes.size, dtype=numpy.int32), mesh.faceSizes);
+        if mesh.smooth:
+            normalIndices = mesh.loopVertexIndices;
+        else:
+            normalIndices = faceOfLoop;
+
+        # one polylist per material slot
+        materialIndices = mesh.materialIndices if len(mesh.materials) > 0 else numpy.zeros(mesh.faceSizes.size, dtype=numpy.int32);
+        for slot in numpy.unique(materialIndices):
+            faceMask = (materialIndices == slot);
+            loopMask = faceMask[faceOfLoop];
+            if len(mesh.materials) > slot:
+                fileHandle.write('        <polylist material="{}" count="{}">\n'.format(materialSymbol(mesh, slot), int(numpy.sum(faceMask))));
+            else:
+                fileHandle.write('        <polylist count="{}">\n'.format(int(numpy.sum(faceMask))));
+            fileHandle.write('          <input semantic="VERTEX" source="#{}-vertices" offset="0"/>\n'.format(meshId));
+            fileHandle.write('          <input semantic="NORMAL" source="#{}-normals" offset="1"/>\n'.format(meshId));
+            if mesh.uvs is not None:
+                # texture coordinates are per vertex, so they share the vertex indices
+                fileHandle.write('          <input semantic="TEXCOORD" source="#{}-map-0" offset="0" set="0"/>\n'.format(meshId));
+            fileHandle.write('          <vcount>');
+            writeNumbers(fileHandle, mesh.faceSizes[faceMask], '%d');
+            fileHandle.write('</vcount>\n          <p>');
+            writeNumbers(fileHandle, numpy.column_stack((mesh.loopVertexIndices[loopMask], normalIndices[loopMask])), '%d');
+            fileHandle.write('</p>\n        </polylist>\n');
+
+        fileHandle.write('      </mesh>\n    </geometry>\n');
+    fileHandle.write('  </library_geometries>\n');
+
+
+# Helper method to get the collada symbol of a mesh's material slot: named
+# after its material, or after the slot for the empty slots of shared meshes,
+# whose materials are bound per object
+def materialSymbol(mesh, slot):
+    if mesh.materials[slot] is None:
+        return('slot{}-material'.format(slot));
+    return('{}-material'.format(colladaId(mesh.materials[slot].name)));
+
+
+# Helper method to write one scene node with 'transrotloc' transforms
+def writeNode(fileHandle, theObject):
+    rotation = [angle*180/math.pi for angle in theObject.rotation_euler];
+    fileHandle.write('      <node id="{}" name="{}" type="NODE">\n'.format(colladaId(theObject.name), xmlName(theObject.name)));
+    fileHandle.write('        <translate sid="location">{:.7g} {:.7g} {:.7g}</translate>\n'.format(*theObject.location));
+    fileHandle.write('        <rotate sid="rotationZ">0 0 1 {:.7g}</rotate>\n'.format(rotation[2]));
+    fileHandle.write('        <rotate sid="rotationY">0 1 0 {:.7g}</rotate>\n'.format(rotation[1]));
+    fileHandle.write('        <rotate sid="rotationX">1 0 0 {:.7g}</rotate>\n'.format(rotation[0]));
+    fileHandle.write('        <scale sid="scale">{:.7g} {:.7g} {:.7g}</scale>\n'.format(*theObject.scale));
+    if isinstance(theObject.data, cameraData):
+        fileHandle.write('        <instance_camera url="#{}-camera"/>\n'.format(colladaId(theObject.data.name)));
+    elif isinstance(theObject.data, lampData):
+        fileHandle.write('        <instance_light url="#{}-light"/>\n'.format(colladaId(theObject.data.name)));
+    else:
+        fileHandle.write('        <instance_geometry url="#{}-mesh">\n'.format(colladaId(theObject.data.name)));
+        materials = [(slot, material) for slot, material in enumerate(objectMaterials(theObject)) if material is not None];
+        if len(materials) > 0:
+            fileHandle.write('          <bind_material>\n            <technique_common>\n');
+            for slot, material in materials:
+                symbol = materialSymbol(theObject.data, slot);
+                materialId = colladaId(material.name);
+                if theObject.data.uvs is None:
+                    fileHandle.write('              <instance_material symbol="{}" target="#{}-material"/>\n'.format(symbol, materialId));
+                    continue;
+                fileHandle.write('              <instance_material symbol="{}" target="#{}-material">\n'.format(symbol, materialId));
+                fileHandle.write('                <bind_vertex_input semantic="UVMap" input_semantic="TEXCOORD" input_set="0"/>\n');
+                fileHandle.write('              </instance_material>\n');
+            fileHandle.write('            </technique_common>\n          </bind_material>\n');
+        fileHandle.write('        </instance_geometry>\n');
+    fileHandle.write('      </node>\n');
+
+
+# Method to write a scene as a collada file
+def writeColladaFile(fileName, scene):
+    now = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S');
+    with open(fileName, 'w') as fileHandle:
+        fileHandle.write('<?xml version="1.0" encoding="utf-8"?>\n');
+        fileHandle.write('<COLLADA xmlns="http://www.collada.org/2005/11/COLLADASchema" version="1.4.1">\n');
+        fileHandle.write('  <asset>\n    <contributor>\n      <authoring_tool>RenderToolbox4 SceneGraphV1</authoring_tool>\n    </contributor>\n');
+        fileHandle.write('    <created>{}</created>\n    <modified>{}</modified>\n'.format(now, now));
+        fileHandle.write('    <unit name="meter" meter="{:.7g}"/>\n    <up_axis>Z_UP</up_axis>\n  </asset>\n'.format(scene.unitScale));
+        writeCameras(fileHandle, scene);
+        writeLights(fileHandle, scene);
+        writeImages(fileHandle, scene, fileName);
+        writeMaterials(fileHandle, scene);
+        writeGeometries(fileHandle, scene);
+        fileHandle.write('  <library_visual_scenes>\n');
+        fileHandle.write('    <visual_scene id="{}" name="{}">\n'.format(colladaId(scene.name), xmlName(scene.name)));
+        for theObject in scene.objects:
+            writeNode(fileHandle, theObject);
+        fileHandle.write('    </visual_scene>\n  </library_visual_scenes>\n');
+        fileHandle.write('  <scene>\n    <instance_visual_scene url="#{}"/>\n  </scene>\n'.format(colladaId(scene.name)));
+        fileHandle.write('</COLLADA>\n');
@@ -4,8 +4,24 @@ import bpy
 # Import other useful modules
 import mathutils
 import math
-import random
-import sys
+import os
+import hashlib
+import json
+import numpy
+
+# Import the Blender-free helpers
+import AdaptiveMeshUtils
+import CameraRigUtils
+import ConditionsUtils
+import ElevationMapUtils
+import ElevationTextureUtils
+import FloorplanUtils
+import InstrumentationUtils
+import MeshUtils
+import RendererExportUtils
+import ScatterUtils
+import SpectrumUtils
+import TiledElevationMapUtils
 
 # Helper Method to rotate an object so that it points at a target
 def pointObjectToTarget(obj, targetLoc):
@@ -17,96 +33,68 @@ def pointObjectToTarget(obj, targetLoc):
     obj.rotation_euler = mathutils.Euler((xRad, 0, zRad), 'XYZ');
 
 # Helper method to create a random surface (resembling spilled liquid)  
-# by blitting Gaussians and truncating the result  
-def createRandomSurfaceMap(xBinsNum, yBinsNum):
-    sigmaX = 1/3.2;
-    sigmaY = 1/3.2;
-    elevationMap = [[0 for x in range(0,xBinsNum)] for y in range(0,yBinsNum)];
-    for y in range (0, yBinsNum ):
-        for x in range(0,xBinsNum):
-            xc = 2*(x-xBinsNum/2+0.5)/xBinsNum;
-            yc = 2*(y-yBinsNum/2+0.5)/yBinsNum;
-            z  = random.random()*math.pow(math.exp(-0.5*(math.pow(xc/sigmaX,2)+math.pow(yc/sigmaY,2))),0.7);
-            if z > 0.25:
-               z = 0.25;
-            elevationMap[y][x] = z;
-    return(elevationMap);
+# by blitting Gaussians and truncating the result.
+# The optional params dictionary can override the Gaussian sigma, the clamp 
+# level and the seed (see ElevationMapUtils.randomSurfaceDefaults).
+# If an ElevationMapCache.elevationMapCache is passed, seeded maps are 
+# loaded from / stored in that cache.
+def createRandomSurfaceMap(xBinsNum, yBinsNum, params=None, cache=None, progress=None):
+    if cache is None:
+        elevation = ElevationMapUtils.generateRandomSurfaceMap(xBinsNum, yBinsNum, params, progress);
+    else:
+        elevation = cache.getMap('randomSurface', xBinsNum, yBinsNum, params, progress);
+    return(elevation.tolist());
 
 
 # Helper method to create an elevation map (resembling a stretched cloth) 
-# by blitting elongated Gaussians at random positions/orientations
-def createRandomGaussianBlobsMap(xBinsNum, yBinsNum):
-    # create a 2D list and fill it with 0
-    elevation = [[0 for x in range(0,xBinsNum)] for y in range(0,yBinsNum)];
-     
-    # allocate memory
-    fx = [0 for x in range(0, xBinsNum)];
-    fy = [0 for y in range(0, yBinsNum)];
-    fySinTheta = [0 for y in range(0, yBinsNum)];
-    fyCosTheta = [0 for y in range(0, yBinsNum)];
-     
-    peakPos         = mathutils.Vector((0.0, 0.0));
-    positionSigma   = mathutils.Vector((1/3.0,  1/3.0));
-    dx              = 1.0/xBinsNum;
-    dy              = 1.0/yBinsNum;
-  
-    # medium + small elongated bumps
-    mediumBumpsNum = 200;
-    smallBumpsNum  = 100;
-    for bumpIndex in range(1,mediumBumpsNum+smallBumpsNum):
-        # give some feedback regarding the progress
-        print('Generating gaussian blob #{} of {}'.format(bumpIndex, mediumBumpsNum+smallBumpsNum));
-        sys.stdout.flush()
-        
-        # randomize Gaussian sigmas
-        bumpSigmaX = (0.16+random.random())*0.03;
-        if bumpIndex > mediumBumpsNum:
-           bumpSigmaX = (0.12+random.random())*0.03;
-        bumpSigmaY = (6.0 + 2*random.random())*bumpSigmaX;
-
-        # randomize Gaussian position around main radius
-        randomRadius = random.gauss(0.9, 0.35);  
-        if (randomRadius < 0.0):
-            continue;  
-        randomTheta  = random.random()*2.0*math.pi + 2.0*math.pi;
-        randomXpos   = randomRadius * math.cos(randomTheta);
-        randomYpos   = randomRadius * math.sin(randomTheta);
-        xc = peakPos.x + randomXpos;
-        yc = peakPos.y + randomYpos;
-
-        # this choice of Gaussian orientation results in an elevation map resembling a stretched cloth
-        gaussianOrientaton = randomTheta - math.pi/2.0 + random.gauss(0, math.pi/60);
-        sinTheta = math.sin(gaussianOrientaton);
-        cosTheta = math.cos(gaussianOrientaton);
-        
-        # precompute some stuff
-        for y in range(0, yBinsNum):
-            fy[y] = 2*(y-yBinsNum/2+0.5)/yBinsNum - yc;
-            fySinTheta[y] = fy[y] * sinTheta;
-            fyCosTheta[y] = fy[y] * cosTheta;
-
-        # blit the Gaussian
-        for x in range(0, xBinsNum):
-            fx[x] = 2*(x-xBinsNum/2+0.5)/xBinsNum - xc;
-            fxCosTheta = fx[x] * cosTheta;
-            fxSinTheta = fx[x] * sinTheta;
-            for y in range(0, yBinsNum):
-                xx = fxCosTheta - fySinTheta[y];
-                yy = fxSinTheta + fyCosTheta[y];
-                elevation[y][x] += math.exp(-0.5*(math.pow(xx/bumpSigmaX,2.0) + math.pow(yy/bumpSigmaY,2.0)));
-    
-    # normalize elevation to 1.0  
-    maxElevation = max(max(elevation));
-    minElevation = min(min(elevation));
-    maxElevation = max([maxElevation, -minElevation]);
-    rows = len(elevation);
-    cols = len(elevation[0]);
-    for y in range(0, rows):
-        for x in range(0, cols):
-            elevation[y][x] *= 1.0/maxElevation;
-
+# by blitting elongated Gaussians at random positions/orientations.
+# The optional params dictionary can override the bump counts, sigma ranges, 
+# support cutoff and seed (see ElevationMapUtils.gaussianBlobsDefaults)
+# If an ElevationMapCache.elevationMapCache is passed, seeded maps are 
+# loaded from / stored in that cache.
+# If given, progress(bumpsDone, bumpsNum) is called as the bumps are blitted.
+def createRandomGaussianBlobsMap(xBinsNum, yBinsNum, params=None, cache=None, progress=None):
+    if cache is None:
+        elevation = ElevationMapUtils.generateGaussianBlobsMap(xBinsNum, yBinsNum, params, progress);
+    else:
+        elevation = cache.getMap('gaussianBlobs', xBinsNum, yBinsNum, params, progress);
     # return computed elevation map
-    return(elevation);
+    return(elevation.tolist());
+
+
+# Helper method to compute a key that identifies a datablock request by its
+# kind and parameters. Vectors/colors are keyed by their components, NumPy
+# arrays (such as spectra) by a hash of their values, and datablocks passed
+# as parameters by their names.
+def datablockKey(kind, params):
+    def normalize(value):
+        if hasattr(value, 'name'):
+            return(value.name);
+        if isinstance(value, numpy.ndarray):
+            return(hashlib.sha1(numpy.ascontiguousarray(value, dtype=numpy.float64).tobytes()).hexdigest());
+        return([float(component) for component in value]);
+    keyParams = dict([(key, params[key]) for key in params if key != 'reuseExisting']);
+    text = json.dumps({'kind': kind, 'params': keyParams}, sort_keys=True, default=normalize);
+    return(hashlib.sha1(text.encode('utf-8')).hexdigest());
+
+
+# Properties of the datablocks that are compared with their values at
+# generation time before a datablock is reused, by kind
+datablockProperties = {
+    'cameras'   : ('type', 'angle_x', 'sensor_width', 'sensor_height', 'clip_start', 'clip_end', 'draw_size', 'show_limits'),
+    'lamps'     : ('type', 'energy', 'color', 'use_specular', 'use_diffuse', 'distance', 'shape', 'size', 'size_y'),
+    'materials' : ('diffuse_shader', 'diffuse_intensity', 'diffuse_color', 'specular_shader', 'specular_intensity',
+                   'specular_color', 'ambient', 'alpha', 'use_transparency', 'transparency_method'),
+};
+
+
+# Helper method to compute a key for the current state of a datablock: its
+# properties listed in datablockProperties and the names of its custom
+# properties (e.g. a 'rtbBumpTexture' attached after it was generated)
+def datablockStateKey(kind, datablock):
+    state = dict([(name, getattr(datablock, name, None)) for name in datablockProperties[kind]]);
+    state['customProperties'] = sorted([key for key in datablock.keys() if key not in ('rtbDatablockKey', 'rtbDatablockState')]);
+    return(datablockKey(kind, state));
 
 
 # Class for managing basscene components    
@@ -114,9 +102,45 @@ class sceneManager:
     # ---- Method to initialize the SceneManager object -----
     def __init__(self, params):  
 
+        # Material, lamp and camera types are reused when an identical one
+        # was already requested, unless params['reuseDatablocks'] is False
+        self.reuseDatablocks = True;
+        if 'reuseDatablocks' in params:
+            self.reuseDatablocks = params['reuseDatablocks'];
+        self.datablockStatistics = {};
+        self.datablockIndex      = {};
+        self.primitiveMeshes     = {};
+
+        # Verbosity of the log messages (0: silent, 1: summaries, 2: one line per datablock).
+        # Messages are printed, or sent to params['logger'] (a logging.Logger) if given.
+        self.verbosity = 1;
+        if 'verbosity' in params:
+            self.verbosity = params['verbosity'];
+        self.logger = params.get('logger');
+
+        # Wall-time and call-count counters. If params['writeTimings'] is True, 
+        # exportToColladaFile writes them next to the exported file.
+        # params['progressCallback'], if given, is called as progress(stage, done, total).
+        self.timers           = InstrumentationUtils.timingCounters();
+        self.writeTimings     = params.get('writeTimings', False);
+        self.progressCallback = params.get('progressCallback');
+
+        # Statistics of the adaptive elevation map meshes, by object name
+        self.meshStatistics = {};
+
+        # Statistics of the objects placed by scatterObjects, by name prefix
+        self.scatterStatistics = {};
+
+        # Material spectra are written to spectrum files in params['spectrumFolder']
+        # if given, once per distinct spectrum (see SpectrumUtils.spectrumStore)
+        self.spectrumStore = None;
+        if params.get('spectrumFolder') is not None:
+            self.spectrumStore = SpectrumUtils.spectrumStore(params['spectrumFolder']);
+
         if ('erasePreviousScene' in params) and (params['erasePreviousScene'] == True):
-            # Remove objects from previous scene
-            self.erasePreviousContents();
+            # Remove objects from previous scene. If params['emptySceneTemplate'] 
+            # names a .blend file, the empty scene is cached there and restored from it.
+            self.erasePreviousContents(templateFile=params.get('emptySceneTemplate'));
             
         # Set the scene name
         if 'name' in params:
@@ -175,71 +199,161 @@ class sceneManager:
 
 
     # ---- Method to erase a previous scene ----------------
-    def erasePreviousContents(self):
-        print('Erasing previous scene components')
+    # By default all datablocks are removed in bulk passes (see resetScene).
+    # Set bulk to False to use the per-item removal methods below.
+    @InstrumentationUtils.timedMethod('reset')
+    def erasePreviousContents(self, bulk=True, templateFile=None):
+        self.log(1, 'Erasing previous scene components');
+        if bulk:
+            self.resetScene(templateFile);
+            return;
         self.unlinkAllObjects();
         self.removeAllMeshes();
         self.removeAllLamps();
         self.removeAllCameras();
         self.removeAllMaterials();
         self.removeAllObjects();
-        
+
+    # Method to log a message if the verbosity level is at least level
+    # (0: silent, 1: summaries, 2: one line per datablock)
+    def log(self, level, message):
+        if self.verbosity < level:
+            return;
+        if self.logger is None:
+            print(message);
+        elif level <= 1:
+            self.logger.info(message);
+        else:
+            self.logger.debug(message);
+
+    # Method to report progress to the progress callback, if any
+    def reportProgress(self, stage, done, total):
+        if self.progressCallback is not None:
+            self.progressCallback(stage, done, total);
+
+    # Method to get the timing counters, per method and per category
+    def getTimings(self):
+        return(self.timers.summary());
+
+    # Method to generate an elevation map as a float32 array, with the 
+    # generator registered in ElevationMapUtils.generators under generatorName
+    # ('randomSurface' or 'gaussianBlobs'), optionally through an ElevationMapCache
+    # If tiling params are given (see TiledElevationMapUtils.tilingDefaults),
+    # the map is generated tile by tile into a memory-mapped file and returned
+    # as a TiledElevationMapUtils.tiledElevationMap, for maps too large for RAM.
+    # If workersNum is given, the map is generated on that many processes,
+    # with the same result for any number of them (see
+    # TiledElevationMapUtils.generateParallelMap), and returned as an array
+    # unless tiling params are also given.
+    @InstrumentationUtils.timedMethod('mapGeneration')
+    def generateElevationMap(self, generatorName, xBinsNum, yBinsNum, params=None, cache=None, tiling=None, workersNum=None):
+        def progress(done, total):
+            self.reportProgress(generatorName, done, total);
+        if cache is not None:
+            return(cache.getMap(generatorName, xBinsNum, yBinsNum, params, progress, tiling, workersNum));
+        if tiling is not None:
+            return(TiledElevationMapUtils.generateTiledMap(generatorName, xBinsNum, yBinsNum, params, progress, tiling, workersNum));
+        if workersNum is not None:
+            theMap = TiledElevationMapUtils.generateParallelMap(generatorName, xBinsNum, yBinsNum, params, progress, workersNum=workersNum);
+            elevation = numpy.array(theMap);
+            theMap.close();
+            return(elevation);
+        generator, defaults = ElevationMapUtils.generators[generatorName];
+        return(generator(xBinsNum, yBinsNum, params, progress));
+
+    # Method to reset the scene in bulk: all objects are removed in one pass,
+    # followed by an orphan purge sweep of the datablocks left without users.
+    # If a templateFile is given and exists, the empty scene is instead 
+    # restored by reloading that .blend file. If it does not exist yet, it 
+    # is saved after the reset so that later resets can use it.
+    def resetScene(self, templateFile=None):
+        # we can remove objects only when in OBJECT mode
+        if bpy.ops.object.mode_set.poll():
+            bpy.ops.object.mode_set(mode='OBJECT');
+
+        if (templateFile is not None) and os.path.isfile(templateFile):
+            bpy.ops.wm.open_mainfile(filepath=templateFile);
+            # datablocks of the previous file are gone
+            self.datablockIndex  = {};
+            self.primitiveMeshes = {};
+            self.log(1, 'Restored empty scene from "{}"'.format(templateFile));
+            return;
+
+        objects = list(bpy.data.objects);
+        # objects must be unlinked from all scenes before they can be removed
+        for scene in bpy.data.scenes:
+            for object in list(scene.objects):
+                scene.objects.unlink(object);
+        self.removeDatablocks(bpy.data.objects, objects);
+        removedNum = len(objects) + self.purgeOrphans([bpy.data.meshes, bpy.data.lamps, bpy.data.cameras, bpy.data.materials, bpy.data.textures, bpy.data.images, bpy.data.curves]);
+        self.log(1, 'Removed {} datablocks from old scene ("{}")'.format(removedNum, bpy.context.scene.name));
+
+        if templateFile is not None:
+            bpy.ops.wm.save_as_mainfile(filepath=templateFile, copy=True);
+            self.log(1, 'Saved empty scene template "{}"'.format(templateFile));
+
+    # Method to remove a list of datablocks from a collection
+    def removeDatablocks(self, collection, datablocks):
+        for datablock in datablocks:
+            self.log(2, 'Removing "{}", from old scene ("{}")'.format(datablock.name, bpy.context.scene.name));
+            datablock.user_clear();
+            collection.remove(datablock);
+
+    # Method to remove all datablocks without users from the given collections.
+    # Removing e.g. materials can leave textures without users, so the sweep
+    # is repeated until nothing is left to remove. Returns the number removed.
+    def purgeOrphans(self, collections):
+        removedNum = 0;
+        while True:
+            passRemovedNum = 0;
+            for collection in collections:
+                orphans = [datablock for datablock in collection if (datablock.users == 0) and not datablock.use_fake_user];
+                self.removeDatablocks(collection, orphans);
+                passRemovedNum += len(orphans);
+            removedNum += passRemovedNum;
+            if passRemovedNum == 0:
+                return(removedNum);
+
     # Method to remove a single oject from the current scene
     def removeObjectFromScene(self,  object):
         # Remove the object from the scene
-        print('Removing object "{}", from old scene ("{}")'.format(object.name, bpy.context.scene.name));
+        self.log(2, 'Removing object "{}", from old scene ("{}")'.format(object.name, bpy.context.scene.name));
         bpy.data.objects.remove(object);
         
     # Method to remove all objects from the current scene
     def removeAllObjects(self):
-        for object in bpy.data.objects:
+        for object in list(bpy.data.objects):
             self.removeObjectFromScene(object);  
          
     def unlinkObjectFromScene(self,  object):
         # Check to see if the object is in the scene, and if it is, unlink it from the scene
         if object.name in bpy.context.scene.objects:
             bpy.context.scene.objects.unlink(object);
-            print('Unlinking object "{}", from old scene ("{}")'.format(object.name, bpy.context.scene.name));
+            self.log(2, 'Unlinking object "{}", from old scene ("{}")'.format(object.name, bpy.context.scene.name));
                
     # Method to unlink all objects from the current scene
     def unlinkAllObjects(self):
-        for object in bpy.data.objects:
-            # we can unlink an object only when in OBJECT mode
-            if bpy.ops.object.mode_set.poll(): 
-                bpy.ops.object.mode_set(mode='OBJECT') 
+        # we can unlink an object only when in OBJECT mode
+        if bpy.ops.object.mode_set.poll(): 
+            bpy.ops.object.mode_set(mode='OBJECT') 
+        for object in list(bpy.data.objects):
             self.unlinkObjectFromScene(object);
             
     # Method to remove all mesh data
     def removeAllMeshes(self):
-        for mesh in bpy.data.meshes:
-            print('Clearing all users for mesh "{}"'.format(mesh.name));
-            mesh.user_clear();
-            print('Removing mesh "{}", from old scene ("{}")'.format(mesh.name, bpy.context.scene.name));
-            bpy.data.meshes.remove(mesh);
+        self.removeDatablocks(bpy.data.meshes, list(bpy.data.meshes));
             
     # Method to remove all lamp data
     def removeAllLamps(self):
-        for lamp in bpy.data.lamps:
-            print('Clearing all users for lamp "{}"'.format(lamp.name));
-            lamp.user_clear();
-            print('Removing lamp "{}", from old scene ("{}")'.format(lamp.name, bpy.context.scene.name));
-            bpy.data.lamps.remove(lamp);
+        self.removeDatablocks(bpy.data.lamps, list(bpy.data.lamps));
             
     # Method to remove all camera data
     def removeAllCameras(self):
-        for camera in bpy.data.cameras:
-            print('Clearing all users for camera "{}"'.format(camera.name));
-            camera.user_clear();
-            print('Removing camera "{}", from old scene ("{}")'.format(camera.name, bpy.context.scene.name));
-            bpy.data.cameras.remove(camera);
+        self.removeDatablocks(bpy.data.cameras, list(bpy.data.cameras));
             
     # Method to remove all material data
     def removeAllMaterials(self):
-        for material in bpy.data.materials:
-            print('Clearing all users for material "{}"'.format(material.name));
-            material.user_clear();
-            print('Removing material "{}", from old scene ("{}")'.format(material.name, bpy.context.scene.name));
-            bpy.data.materials.remove(material);
+        self.removeDatablocks(bpy.data.materials, list(bpy.data.materials));
             
     # ---- Method to set the grid spacing and the number of grid lines ----     
     def setGrid(self, gridSpacing, gridLinesNum):
@@ -262,27 +376,87 @@ class sceneManager:
                             space.grid_scale = gridSpacing;
                             space.grid_lines = gridLinesNum;
         if not(foundGridParam):
-            print('Did not find any "VIEW_3D" space in which the grid is defined');
+            self.log(1, 'Did not find any "VIEW_3D" space in which the grid is defined');
+
+    # Method to find a previously generated datablock for identical params.
+    # Datablocks are tagged with the key of the params they were generated from,
+    # so they are also found across sceneManager instances, and with the key
+    # of their state then: datablocks changed since (e.g. recolored by a
+    # conditions file row) lose their tags and are not reused.
+    # Returns None if there is none, or if reuse is disabled (globally via
+    # self.reuseDatablocks, or for this request via params['reuseExisting']).
+    def findDatablock(self, collection, kind, params, subKind=''):
+        if not(self.reuseDatablocks) or (('reuseExisting' in params) and (params['reuseExisting'] == False)):
+            return(None);
+        if kind not in self.datablockIndex:
+            # index the datablocks tagged by earlier sceneManager instances
+            self.datablockIndex[kind] = {};
+            for datablock in collection:
+                if 'rtbDatablockKey' in datablock:
+                    self.datablockIndex[kind][datablock['rtbDatablockKey']] = datablock.name;
+        key  = datablockKey(kind + subKind, params);
+        name = self.datablockIndex[kind].get(key);
+        if (name is None) or (name not in collection) or (collection[name].get('rtbDatablockKey') != key):
+            # not generated yet, or removed/renamed since
+            return(None);
+        datablock = collection[name];
+        if datablock.get('rtbDatablockState') != datablockStateKey(kind, datablock):
+            # changed since it was generated: it no longer matches its params
+            del datablock['rtbDatablockKey'];
+            if 'rtbDatablockState' in datablock:
+                del datablock['rtbDatablockState'];
+            del self.datablockIndex[kind][key];
+            return(None);
+        self.countDatablock(kind, 'reused');
+        return(datablock);
+
+    # Method to tag a newly generated datablock with the key of its params
+    def registerDatablock(self, datablock, kind, params, subKind=''):
+        key = datablockKey(kind + subKind, params);
+        datablock['rtbDatablockKey'] = key;
+        datablock['rtbDatablockState'] = datablockStateKey(kind, datablock);
+        if kind in self.datablockIndex:
+            self.datablockIndex[kind][key] = datablock.name;
+        self.countDatablock(kind, 'created');
+
+    # Method to count created/reused datablocks
+    def countDatablock(self, kind, event):
+        if kind not in self.datablockStatistics:
+            self.datablockStatistics[kind] = {'created': 0, 'reused': 0};
+        self.datablockStatistics[kind][event] += 1;
+
+    # Method to get the datablock reuse statistics, e.g. {'materials': {'created': 3, 'reused': 120}},
+    # including the spectrum files written by the spectrum store, as 'spectra'
+    def getDatablockStatistics(self):
+        statistics = dict([(kind, dict(counts)) for kind, counts in self.datablockStatistics.items()]);
+        if self.spectrumStore is not None:
+            statistics['spectra'] = self.spectrumStore.getStatistics();
+        return(statistics);
 
     # Method to generate a camera type
     def generateCameraType(self, params):
+        if 'widthToHeightAspectRatio' in params:
+            # the rendering resolution is set even when an existing camera type is reused
+            bpy.data.scenes[0].render.resolution_x = params['pixelSamplesAlongWidth'];
+            bpy.data.scenes[0].render.resolution_y = bpy.data.scenes[0].render.resolution_x / params['widthToHeightAspectRatio'];
+        theCameraType = self.findDatablock(bpy.data.cameras, 'cameras', params);
+        if theCameraType is not None:
+            return(theCameraType);
+
         # generate a camera type
         theCameraType = bpy.data.cameras.new('CAMERA');
         # configure the camera type
         theCameraType.type        = 'PERSP' ;               # perspective camera
         theCameraType.angle_x     =  params['fieldOfViewInDegrees']/180*math.pi;
         if 'widthToHeightAspectRatio' in params:
-        	print('before camera sensor: {} x {}; image resolution: {} x {}; horiz FOV = {}'.format(theCameraType.sensor_width, theCameraType.sensor_height, bpy.data.scenes[0].render.resolution_x, bpy.data.scenes[0].render.resolution_y, theCameraType.angle_x));
-        	aspectRatio = theCameraType.sensor_width / theCameraType.sensor_height;
         	theCameraType.sensor_height = theCameraType.sensor_width / params['widthToHeightAspectRatio'];
-        	bpy.data.scenes[0].render.resolution_x = params['pixelSamplesAlongWidth'];
-        	bpy.data.scenes[0].render.resolution_y = bpy.data.scenes[0].render.resolution_x / params['widthToHeightAspectRatio'];
-        	print('after camera sensor: {} x {}; image resolution: {} x {}; horiz FOV = {}'.format(theCameraType.sensor_width, theCameraType.sensor_height, bpy.data.scenes[0].render.resolution_x, bpy.data.scenes[0].render.resolution_y, theCameraType.angle_x));
+        	self.log(1, 'camera sensor: {} x {}; image resolution: {} x {}; horiz FOV = {}'.format(theCameraType.sensor_width, theCameraType.sensor_height, bpy.data.scenes[0].render.resolution_x, bpy.data.scenes[0].render.resolution_y, theCameraType.angle_x));
 
         theCameraType.clip_start  =  params['clipRange'][0];
         theCameraType.clip_end    =  params['clipRange'][1];
         theCameraType.draw_size   =  params['drawSize'];     # apparent size of Camera object in 3D View
         theCameraType.show_limits =  True;                   # draw clipping range and focus point
+        self.registerDatablock(theCameraType, 'cameras', params);
         return(theCameraType);
     
     # Method to add a camera object to the current scene
@@ -297,9 +471,44 @@ class sceneManager:
         # link the camera object to the current scene (if not linked, the camera is not functional)
         bpy.context.screen.scene.objects.link(theCameraObject);
         return(theCameraObject);
+
+    # Method to add the cameras of a camera rig (see CameraRigUtils), whose 
+    # rotations are computed at once for all poses.
+    #   params['rig']        : the rig, e.g. from CameraRigUtils.pathRig
+    #   params['cameraType'] : the camera type shared by all cameras
+    #   params['names']      : optional list of camera names (default: 
+    #                          params['namePrefix'], or 'camera', followed by
+    #                          the camera number)
+    #   params['showName']   : optional (default: False)
+    def addCameraRig(self, params):
+        rig = params['rig'];
+        names = params.get('names');
+        if names is None:
+            names = CameraRigUtils.rigNames(rig, params.get('namePrefix', 'camera'));
+        theCameraObjects = [];
+        for name, location, rotation in zip(names, rig['positions'], rig['rotations']):
+            theCameraObject = bpy.data.objects.new(name, params['cameraType']);
+            theCameraObject.show_name      = params.get('showName', False);
+            theCameraObject.location       = mathutils.Vector(location);
+            theCameraObject.rotation_euler = mathutils.Euler(rotation, 'XYZ');
+            bpy.context.screen.scene.objects.link(theCameraObject);
+            theCameraObjects.append(theCameraObject);
+        return(theCameraObjects);
+
+    # Method to add a camera rig and export the scene once, with a camera per
+    # pose or a single camera and a conditions file of poses. See
+    # CameraRigUtils.exportCameraRig for the params.
+    def exportCameraRig(self, params):
+        return(CameraRigUtils.exportCameraRig(self, params));
     
-    # Method to generate an area lamp type     
+    # Method to generate an area lamp type.
+    # Requests with identical params get the same lamp type (see findDatablock):
+    # pass params['reuseExisting'] = False for a lamp type of its own, e.g. to
+    # change it later without affecting the others.
     def generateAreaLampType(self, params):
+        theLampType = self.findDatablock(bpy.data.lamps, 'lamps', params, 'AREA');
+        if theLampType is not None:
+            return(theLampType);
         # generate a lamp type
         theLampType = bpy.data.lamps.new(params['name'], 'AREA');
         # configure the lamp type
@@ -311,13 +520,18 @@ class sceneManager:
         theLampType.shape           = 'RECTANGLE';
         theLampType.size            = params['width1'];
         theLampType.size_y          = params['width2']
+        self.registerDatablock(theLampType, 'lamps', params, 'AREA');
         return(theLampType);
     
-    # Method to generate a directional lamp type     
+    # Method to generate a directional lamp type, shared as generateAreaLampType's
     def generateDirectionalLampType(self, params):
+        theLampType = self.findDatablock(bpy.data.lamps, 'lamps', params, 'SUN');
+        if theLampType is not None:
+            return(theLampType);
         # generate a lamp type
         theLampType = bpy.data.lamps.new(params['name'], 'SUN');
         # configure the lamp type
+        self.registerDatablock(theLampType, 'lamps', params, 'SUN');
         return(theLampType);
 
 
@@ -348,20 +562,34 @@ class sceneManager:
             pointObjectToTarget(quadOBJ, params['lookAt']);
             # rename the underlying mesh so RT3 can access it
             bpy.data.meshes[quadOBJ.data.name].name = '{}'.format(params['name']);
-            print('Area light mesh name for RT3: {}'.format(bpy.data.meshes[quadOBJ.data.name].name));
+            self.log(2, 'Area light mesh name for RT3: {}'.format(bpy.data.meshes[quadOBJ.data.name].name));
             
 
-    # Method to add a matte material
+    # Method to add a matte material.
+    # The diffuse and specular colors may be given as spectra instead, by
+    # params['diffuse_spectrum'] and params['specular_spectrum'], each a
+    # (wavelengths, magnitudes) pair of arrays. The spectra are kept with the
+    # material (see getMaterialSpectra), and a preview color is computed from
+    # them unless params['diffuse_color'] / params['specular_color'] is given.
+    # Requests with identical params get the same material (see findDatablock):
+    # pass params['reuseExisting'] = False for a material of its own, e.g. to
+    # recolor it later without affecting the others.
     def generateMaterialType(self, params):
+        theMaterialType = self.findDatablock(bpy.data.materials, 'materials', params);
+        if theMaterialType is not None:
+            return(theMaterialType);
+        spectra = SpectrumUtils.materialSpectra(params, self.spectrumStore);
         theMaterialType = bpy.data.materials.new(params['name']);
         # Options for diffuse shaders: Minnaert, Fresnel, Toon, Oren-Nayar, Lambert
         theMaterialType.diffuse_shader      = params['diffuse_shader'];
         theMaterialType.diffuse_intensity   = params['diffuse_intensity'];
-        theMaterialType.diffuse_color       = params['diffuse_color'];
+        theMaterialType.diffuse_color       = SpectrumUtils.materialColor(params, spectra, 'diffuse');
         # Options for specular shaders: CookTorr, Phong, Blinn, Toon, WardIso
         theMaterialType.specular_shader     = params['specular_shader'];
         theMaterialType.specular_intensity  = params['specular_intensity'];
-        theMaterialType.specular_color      = params['specular_color'];
+        theMaterialType.specular_color      = SpectrumUtils.materialColor(params, spectra, 'specular');
+        if spectra:
+            theMaterialType['rtbSpectra'] = spectra;
         # Transparency options
         theMaterialType.ambient             = 1;
         theMaterialType.alpha               = params['alpha'];
@@ -370,51 +598,199 @@ class sceneManager:
 
         #theMaterialType.raytrace_mirror.depth = 5;
         #theMaterialType.raytrace_mirror.use = True;
+        self.registerDatablock(theMaterialType, 'materials', params);
         return(theMaterialType);  
 
+    # Method to get the spectra of the materials that have any, by material
+    # name and component, e.g. {'wall': {'diffuse': {'wavelengths', 'magnitudes', 'file'}}},
+    # for instance to write mappings that refer to the spectrum files
+    def getMaterialSpectra(self):
+        materialSpectra = {};
+        for theMaterialType in bpy.data.materials:
+            if 'rtbSpectra' in theMaterialType:
+                spectra = theMaterialType['rtbSpectra'];
+                materialSpectra[theMaterialType.name] = dict([(component, {
+                    'wavelengths' : list(spectra[component]['wavelengths']),
+                    'magnitudes'  : list(spectra[component]['magnitudes']),
+                    'file'        : spectra[component]['file'],
+                }) for component in spectra.keys()]);
+        return(materialSpectra);
+
+    # Method to get the template mesh of a primitive, generated once per (type, resolution)
+    # with the data API (no operators). primitiveType is 'cube', 'cylinder' or 'sphere';
+    # resolution is the number of cylinder vertices or the number of sphere subdivisions.
+    @InstrumentationUtils.timedMethod('meshBuilding')
+    def getPrimitiveMesh(self, primitiveType, resolution=None):
+        key = '{}-{}'.format(primitiveType, resolution);
+        if key in self.primitiveMeshes:
+            meshName = self.primitiveMeshes[key];
+            if (meshName in bpy.data.meshes) and (bpy.data.meshes[meshName].get('rtbPrimitiveKey') == key):
+                return(bpy.data.meshes[meshName]);
+
+        if primitiveType == 'cube':
+            baseName = 'Cube';
+            vertices, faces = MeshUtils.cubeMeshArrays();
+        elif primitiveType == 'cylinder':
+            baseName = 'Cylinder';
+            vertices, faces = MeshUtils.cylinderMeshArrays(resolution);
+        elif primitiveType == 'sphere':
+            baseName = 'Icosphere';
+            vertices, faces = MeshUtils.icoSphereMeshArrays(resolution);
+        else:
+            raise ValueError('Unknown primitive type "{}"'.format(primitiveType));
+        theMesh = bpy.data.meshes.new('{}-primitive'.format(baseName));
+        self.fillMeshFromArrays(theMesh, vertices, faces);
+        # a single material slot, linked per object for shared meshes
+        theMesh.materials.append(None);
+        theMesh['rtbPrimitiveKey']  = key;
+        theMesh['rtbPrimitiveName'] = baseName;
+        self.primitiveMeshes[key] = theMesh.name;
+        return(theMesh);
+
+    # Method to add an object for a primitive mesh. Shared objects link the 
+    # template mesh (and get object-linked materials), others get their own copy.
+    def addPrimitiveObject(self, name, primitiveType, resolution, material, sharedMesh=False):
+        templateMesh = self.getPrimitiveMesh(primitiveType, resolution);
+        if sharedMesh:
+            theMesh = templateMesh;
+        else:
+            theMesh = templateMesh.copy();
+            theMesh.name = templateMesh['rtbPrimitiveName'];
+            del theMesh['rtbPrimitiveKey'];
+        theObject = bpy.data.objects.new(name, theMesh);
+        bpy.context.scene.objects.link(theObject);
+        # attach a material 
+        if sharedMesh:
+            theObject.material_slots[0].link     = 'OBJECT';
+            theObject.material_slots[0].material = material;
+        else:
+            theMesh.materials[0] = material;
+        return(theObject);
+
     # Method to add a cube at a specified location, rotation with specified scaling and material
+    # Set params['sharedMesh'] to True to link the cube to a shared mesh. 
+    # Shared meshes can only be bored out by box-shaped objects (see boreOutBatch).
+    @InstrumentationUtils.timedMethod('meshBuilding')
     def addCube(self, params):
-        bpy.ops.mesh.primitive_cube_add();
-        theCube          = bpy.context.active_object;
-        theCube.name     = params['name'];
+        theCube          = self.addPrimitiveObject(params['name'], 'cube', None, params['material'], params.get('sharedMesh', False));
         theCube.rotation_euler = params['rotation'];
         theCube.scale    = params['scaling'];
         theCube.location = params['location'];
-        # attach a material 
-        theCube.data.materials.append(params['material']);
         # return the generated object
         return(theCube);
 
     # Method to add a cylinder with a desired scale, rotation, and location
+    # params['verticesNum'] (default 128) and params['sharedMesh'] are optional.
+    @InstrumentationUtils.timedMethod('meshBuilding')
     def addCylinder(self,params):
         # Create cylinder
-        bpy.ops.mesh.primitive_cylinder_add(vertices=128, radius=1, depth=1, end_fill_type='NGON');
-        theCylinder                = bpy.context.active_object;
-        theCylinder.name           = params['name'];
+        verticesNum = params.get('verticesNum', 128);
+        theCylinder                = self.addPrimitiveObject(params['name'], 'cylinder', verticesNum, params['material'], params.get('sharedMesh', False));
         theCylinder.rotation_euler = params['rotation'];
         theCylinder.scale          = params['scaling'];
         theCylinder.location       = params['location'];
-        # attach a material 
-        theCylinder.data.materials.append(params['material']);
         # return the generated object
         return(theCylinder);
 
     # Method to add a sphere with a desired scale, and location
+    # params['subdivisions'] (default 5) and params['sharedMesh'] are optional.
+    @InstrumentationUtils.timedMethod('meshBuilding')
     def addSphere(self,params):
         # Create sphere
         if 'subdivisions' in params:
             subdivisionsNum = params['subdivisions'];
         else:
             subdivisionsNum = 5;
-        bpy.ops.mesh.primitive_ico_sphere_add(subdivisions=subdivisionsNum, size=1);
-        theSphere          = bpy.context.active_object;
-        theSphere.name     = params['name'];
+        theSphere          = self.addPrimitiveObject(params['name'], 'sphere', subdivisionsNum, params['material'], params.get('sharedMesh', False));
         theSphere.scale    = params['scaling'];
         theSphere.location = params['location'];
-        # attach a material 
-        theSphere.data.materials.append(params['material']);
         return(theSphere);
 
+    # Method to add many primitives of one type that share a single mesh.
+    #   params['type']        : 'cube', 'cylinder' or 'sphere'
+    #   params['names']       : list of N object names (or params['namePrefix'])
+    #   params['locations']   : (N,3) array or list of locations
+    #   params['rotations']   : optional (N,3) euler angles
+    #   params['scalings']    : optional (N,3) scalings
+    #   params['materials']   : a material, or a list of N materials
+    #   params['resolution']  : optional cylinder vertices / sphere subdivisions
+    #   params['sharedMesh']  : optional, default True
+    # Returns the list of generated objects.
+    @InstrumentationUtils.timedMethod('meshBuilding')
+    def addPrimitivesBatch(self, params):
+        primitiveType = params['type'];
+        defaultResolution = {'cube': None, 'cylinder': 128, 'sphere': 5}[primitiveType];
+        resolution = params.get('resolution', defaultResolution);
+        sharedMesh = params.get('sharedMesh', True);
+
+        locations = numpy.asarray(params['locations'], dtype=numpy.float64).reshape((-1, 3));
+        objectsNum = locations.shape[0];
+        if 'names' in params:
+            names = params['names'];
+        else:
+            names = ['{}{:05d}'.format(params['namePrefix'], index) for index in range(0, objectsNum)];
+        rotations = numpy.zeros((objectsNum, 3));
+        if 'rotations' in params:
+            rotations = numpy.asarray(params['rotations'], dtype=numpy.float64).reshape((-1, 3));
+        scalings = numpy.ones((objectsNum, 3));
+        if 'scalings' in params:
+            scalings = numpy.asarray(params['scalings'], dtype=numpy.float64).reshape((-1, 3));
+        materials = params['materials'];
+        if not isinstance(materials, (list, tuple)):
+            materials = [materials]*objectsNum;
+
+        theObjects = [];
+        for index in range(0, objectsNum):
+            theObject = self.addPrimitiveObject(names[index], primitiveType, resolution, materials[index], sharedMesh);
+            theObject.location       = locations[index].tolist();
+            theObject.rotation_euler = rotations[index].tolist();
+            theObject.scale          = scalings[index].tolist();
+            theObjects.append(theObject);
+            if ((index+1) % 1000 == 0) or (index+1 == objectsNum):
+                self.reportProgress('addPrimitivesBatch', index+1, objectsNum);
+        return(theObjects);
+
+    # Method to scatter many primitives of one type at random without
+    # overlaps, on the floor or in the volume of a region or of an addRoom
+    # room, e.g. for clutter or dice scenes. The placement params ('type',
+    # 'count', 'scaling', 'scaleRange', 'rotateZ', 'region' or 'room',
+    # 'placement', 'minSpacing', 'maxAttempts', 'obstacles', 'seed') are
+    # described in ScatterUtils.scatterPlacements; also:
+    #   params['namePrefix']  : prefix of the object names
+    #   params['materials']   : a material, or a list of materials used in turn
+    #   params['resolution'], params['sharedMesh'] : as for addPrimitivesBatch
+    # The bounding boxes of the placed objects are kept in a uniform grid, so
+    # that placing n objects takes time about linear in n. Objects that do not
+    # fit after maxAttempts tries are dropped; the numbers of objects placed
+    # and of attempts, and the density reached, are kept in
+    # self.scatterStatistics, by name prefix. Returns the list of objects.
+    @InstrumentationUtils.timedMethod('meshBuilding')
+    def scatterObjects(self, params):
+        placementParams = dict([(key, params[key]) for key in ScatterUtils.scatterDefaults if key in params]);
+        locations, rotations, scalings, statistics = ScatterUtils.scatterPlacements(placementParams);
+        materials = params['materials'];
+        if isinstance(materials, (list, tuple)):
+            materials = [materials[index % len(materials)] for index in range(0, locations.shape[0])];
+        batchParams = {
+            'type'       : placementParams.get('type', ScatterUtils.scatterDefaults['type']),
+            'namePrefix' : params['namePrefix'],
+            'locations'  : locations,
+            'rotations'  : rotations,
+            'scalings'   : scalings,
+            'materials'  : materials,
+        };
+        for key in ('resolution', 'sharedMesh'):
+            if key in params:
+                batchParams[key] = params[key];
+        theObjects = [];
+        if locations.shape[0] > 0:
+            theObjects = self.addPrimitivesBatch(batchParams);
+        self.scatterStatistics[params['namePrefix']] = statistics;
+        self.log(1, 'Scattered "{}": {} of {} objects placed in {} attempts, density {:.3f}'.format(
+            params['namePrefix'], statistics['placed'], statistics['requested'], statistics['attempts'], statistics['density']));
+        return(theObjects);
+
+    @InstrumentationUtils.timedMethod('meshBuilding')
     def addPlanarQuad(self, params):
         if 'vertices' in params:
             # Generate the mesh for the plane.
@@ -449,7 +825,10 @@ class sceneManager:
         return(thePlanarQuad);
 
     # Method to add a room. Note: if you want to make openings in the room
-    # using the boreOut method, the room must have a specified 'wallThickness'.
+    # using the boreOut or boreOutBatch methods, the room must have a specified
+    # 'wallThickness'. Its walls are then boxes, so box-shaped openings through
+    # them are cut without the Boolean solver.
+    @InstrumentationUtils.timedMethod('meshBuilding')
     def addRoom(self, roomParams):
         roomLocation = roomParams['roomLocation'];
         roomWidth    = roomParams['roomWidth'];
@@ -592,38 +971,80 @@ class sceneManager:
         # and return it
         return(surfacesDict);
 
+    # Method to add a floorplan of many rooms as a single object, with one
+    # closed mesh in which adjoining rooms share their walls and vertices
+    # (see FloorplanUtils). Unlike addRoom, there are no per-surface objects:
+    # each surface of each room gets its own material slot instead.
+    #   params['name']          : name of the object (and of its mesh)
+    #   params['rooms']         : list of room dicts, with the same name and
+    #                             material keys as the addRoom params (e.g.
+    #                             'floorName', 'floorMaterialType', ...) and,
+    #                             unless a roomGrid is given, a 'roomRectangle' 
+    #                             (xMin, yMin, xMax, yMax) measured at the 
+    #                             middle of the walls
+    #   params['roomGrid']      : optional 2D array of room indices, with 
+    #                             rooms spanning rectangles of cells, and -1
+    #                             for cells without a room
+    #   params['cellSize']      : size of the roomGrid cells (default 1)
+    #   params['roomHeight']    : height from the floor to the ceiling
+    #   params['wallThickness'] : thickness of the walls, floor and ceiling
+    #   params['location']      : optional location of the floor's origin
+    # The slot of surface s (see FloorplanUtils.roomSurfaces) of room r is
+    # 6*r+s. The slots hold the rooms' materials, so mappings that refer to 
+    # these materials still apply, and the mesh's 'rtbSurfaceNames' property 
+    # lists the surface names (e.g. the rooms' 'floorName') by slot.
+    @InstrumentationUtils.timedMethod('meshBuilding')
+    def addFloorplan(self, params):
+        rooms = params['rooms'];
+        if 'roomGrid' in params:
+            rectangles = FloorplanUtils.roomRectanglesFromGrid(params['roomGrid'], params.get('cellSize', 1.0));
+            if len(rectangles) != len(rooms):
+                raise ValueError('The room grid has {} rooms, but {} rooms are described'.format(len(rectangles), len(rooms)));
+        else:
+            rectangles = [room['roomRectangle'] for room in rooms];
+        vertices, faces, surfaceIndices = FloorplanUtils.floorplanMeshArrays(rectangles, params['roomHeight'], params['wallThickness']);
 
+        theMesh = bpy.data.meshes.new('{}-mesh'.format(params['name']));
+        self.fillMeshFromArrays(theMesh, vertices, faces, materialIndices=surfaceIndices);
+        surfaceNames = [];
+        for room in rooms:
+            for surface in FloorplanUtils.roomSurfaces:
+                theMesh.materials.append(room['{}MaterialType'.format(surface)]);
+                surfaceNames.append(room['{}Name'.format(surface)]);
+        theMesh['rtbSurfaceNames'] = surfaceNames;
 
-    # Method to generate a mesh object from an elevation map
+        theFloorplan = bpy.data.objects.new(params['name'], theMesh);
+        if 'location' in params:
+            theFloorplan.location = params['location'];
+        bpy.context.scene.objects.link(theFloorplan);
+        self.log(1, 'Floorplan "{}": {} rooms, {} vertices, {} faces'.format(theFloorplan.name, len(rooms), vertices.shape[0], faces.shape[0]));
+        return(theFloorplan);
+
+
+
+    # Method to generate a mesh object from an elevation map.
+    # The elevation map can be a list of lists, a NumPy array, or any
+    # buffer-protocol object. By default the mesh is filled from vectorized
+    # vertex/face arrays via foreach_set. Set params['meshBuildMethod'] to 
+    # 'pydata' to build it via mesh.from_pydata() instead, or to 'adaptive'
+    # to build a triangle mesh with at most params['maxError'] vertical error
+    # and/or params['maxTriangles'] triangles (see AdaptiveMeshUtils). The
+    # achieved error and triangle count are kept in self.meshStatistics.
+    # Tiled maps (see TiledElevationMapUtils) are meshed one block of rows at
+    # a time, through memory-mapped scratch arrays.
+    # With params['elevationTexture'] (see ElevationTextureUtils.textureDefaults),
+    # the map is written to a texture file instead, and the mesh is a coarse
+    # base grid of params['elevationTexture']['baseResolution'] vertices with
+    # texture coordinates. The texture is attached to params['material'] as a
+    # bump map, or, in 'displacement' mode, displaces the base grid through
+    # Subdivision and Displace modifiers. Its statistics are kept in
+    # self.meshStatistics, as for adaptive meshes.
+    @InstrumentationUtils.timedMethod('meshBuilding')
     def addElevationMapObject(self, params):
-        # compute vertices
-        vertices = [];
         numX      = params['xBinsNum'];
         numY      = params['yBinsNum'];
         elevation = params['elevationMap'];
 
-        for y in range (0, numY):
-            for x in range(0,numX):
-                xc = 2*(x-(numX-1.5)/2)/(numX-2);
-                yc = 2*(y-(numY-1.5)/2)/(numY-2);
-                vertices.append((xc, yc, elevation[y][x]));
- 
-        # Fill faces array.
-        # Each item in the face array contains 4 indices that refer to items in the vertices array.
-        count = 0;
-        faces = [];
-        for i in range (0, numY*(numX-1)):
-            if count < numX-1:
-                A = i;              # first vertex
-                B = i+1;            # second vertex
-                C = (i+numX)+1;     # third vertex
-                D = (i+numX);       # fourth vertex
-                face = (A,B,C,D);
-                faces.append(face);
-                count = count + 1
-            else:
-                count = 0
- 
         #create mesh and object
         theRandomSurfaceMesh   = bpy.data.meshes.new('{}-mesh'.format(params['name']));
         theRandomSurfaceObject = bpy.data.objects.new(params['name'], theRandomSurfaceMesh);
@@ -631,15 +1052,38 @@ class sceneManager:
         theRandomSurfaceObject.location       = params['location'];
         theRandomSurfaceObject.scale          = params['scale'];
         theRandomSurfaceObject.rotation_euler = params['rotation'];
-        #create mesh from python data
-        theRandomSurfaceMesh.from_pydata(vertices,[],faces)
-        theRandomSurfaceMesh.update()
+
+        if params.get('elevationTexture') is not None:
+            textureParams = dict(params['elevationTexture']);
+            textureParams.setdefault('scale', params['scale'][2]);
+            vertices, faces, uvs, texture, statistics = ElevationTextureUtils.elevationTextureArrays(params['name'], elevation, numX, numY, textureParams);
+            self.fillMeshFromArrays(theRandomSurfaceMesh, vertices, faces, smooth=True, uvs=uvs);
+            self.addElevationTexture(theRandomSurfaceObject, params['material'], texture, numX, numY);
+            self.meshStatistics[theRandomSurfaceObject.name] = statistics;
+            self.log(1, 'Elevation texture "{}": {} triangles (regular grid: {}), {}x{} texture "{}"'.format(
+                theRandomSurfaceObject.name, statistics['trianglesNum'], statistics['regularTrianglesNum'], numX, numY, texture['file']));
+        elif ('meshBuildMethod' in params) and (params['meshBuildMethod'] == 'pydata'):
+            if isinstance(elevation, TiledElevationMapUtils.tiledElevationMap):
+                # index the memory-mapped array of tiled maps (without copying it)
+                elevation = numpy.asarray(elevation);
+            self.fillElevationMeshFromPydata(theRandomSurfaceMesh, elevation, numX, numY);
+        elif ('meshBuildMethod' in params) and (params['meshBuildMethod'] == 'adaptive'):
+            vertices, faces, statistics = AdaptiveMeshUtils.adaptiveElevationMapMeshArrays(elevation, numX, numY,
+                maxError=params.get('maxError'), maxTriangles=params.get('maxTriangles'));
+            self.fillMeshFromArrays(theRandomSurfaceMesh, vertices, faces, smooth=True);
+            self.meshStatistics[theRandomSurfaceObject.name] = statistics;
+            self.log(1, 'Adaptive mesh "{}": {} triangles (regular grid: {}), max error {:.4g}'.format(
+                theRandomSurfaceObject.name, statistics['trianglesNum'], statistics['regularTrianglesNum'], statistics['maxError']));
+        elif isinstance(elevation, TiledElevationMapUtils.tiledElevationMap):
+            vertices, faces = TiledElevationMapUtils.tiledElevationMapMeshArrays(elevation);
+            self.fillMeshFromArrays(theRandomSurfaceMesh, vertices, faces, smooth=True);
+        else:
+            vertices, faces = ElevationMapUtils.elevationMapMeshArrays(elevation, numX, numY);
+            self.fillMeshFromArrays(theRandomSurfaceMesh, vertices, faces, smooth=True);
+
         # subdivide modifier
         #theRandomSurfaceObject.modifiers.new("subd", type='SUBSURF')
         #theRandomSurfaceObject.modifiers['subd'].levels = 3;
-        # smooth the mesh's polygons
-        for polygon in theRandomSurfaceMesh.polygons:
-            polygon.use_smooth = True
         # attach a material
         theRandomSurfaceObject.data.materials.append(params['material']);
         # link it to current scene to make it visible
@@ -647,33 +1091,375 @@ class sceneManager:
         # return the generated object
         return(theRandomSurfaceObject);
 
+    # Method to attach an elevation texture (see ElevationTextureUtils) to a
+    # material, as a bump map, or to displace an object with it. The texture
+    # description is kept in the material's 'rtbBumpTexture' property, for
+    # exportToRendererFile.
+    def addElevationTexture(self, theObject, theMaterialType, texture, numX, numY):
+        image = bpy.data.images.load(texture['file']);
+        image.colorspace_settings.name = 'Non-Color';
+        theTexture = bpy.data.textures.new('{}-elevation'.format(theObject.name), 'IMAGE');
+        theTexture.image = image;
+        if texture['mode'] == 'bump':
+            textureSlot = theMaterialType.texture_slots.add();
+            textureSlot.texture               = theTexture;
+            textureSlot.texture_coords        = 'UV';
+            textureSlot.use_map_color_diffuse = False;
+            textureSlot.use_map_normal        = True;
+        else:
+            # subdivide the base grid about as finely as the map, then displace it in object space
+            baseX, baseY = ElevationTextureUtils.baseVerticesNum(texture['baseResolution'], numX, numY);
+            levels = min(6, max(1, int(math.ceil(math.log(max(float(numX)/baseX, float(numY)/baseY), 2)))));
+            subdivision = theObject.modifiers.new('elevationSubdivision', type='SUBSURF');
+            subdivision.subdivision_type = 'SIMPLE';
+            subdivision.levels           = min(levels, 2);
+            subdivision.render_levels    = levels;
+            displacement = theObject.modifiers.new('elevationDisplacement', type='DISPLACE');
+            displacement.texture        = theTexture;
+            displacement.texture_coords = 'UV';
+            displacement.direction      = 'Z';
+            displacement.mid_level      = texture['midLevel'];
+            displacement.strength       = texture['heightScale'];
+        theMaterialType['rtbBumpTexture'] = texture;
+
+    # Method to fill an elevation map mesh via from_pydata (one tuple per vertex and face)
+    def fillElevationMeshFromPydata(self, theMesh, elevation, numX, numY):
+        # compute vertices
+        vertices = [];
+        for y in range (0, numY):
+            for x in range(0,numX):
+                xc = 2*(x-(numX-1.5)/2)/(numX-2);
+                yc = 2*(y-(numY-1.5)/2)/(numY-2);
+                vertices.append((xc, yc, elevation[y][x]));
+ 
+        # Fill faces array.
+        # Each item in the face array contains 4 indices that refer to items in the vertices array.
+        faces = [];
+        for y in range (0, numY-1):
+            for x in range(0, numX-1):
+                A = y*numX + x;     # first vertex
+                B = A+1;            # second vertex
+                C = (A+numX)+1;     # third vertex
+                D = (A+numX);       # fourth vertex
+                faces.append((A,B,C,D));
+
+        #create mesh from python data
+        theMesh.from_pydata(vertices,[],faces)
+        theMesh.update()
+        # smooth the mesh's polygons
+        for polygon in theMesh.polygons:
+            polygon.use_smooth = True
+
+    # Method to fill an empty mesh from a (N,3) array of vertex coordinates and 
+    # faces given as a (F,K) array of vertex indices (K vertices per face) or in 
+    # any other layout accepted by MeshUtils.faceArrays, via foreach_set. 
+    # If given, materialIndices holds the material slot of each face, and
+    # uvs the (N,2) texture coordinates of each vertex, set on a 'UVMap' layer.
+    def fillMeshFromArrays(self, theMesh, vertices, faces, smooth=False, materialIndices=None, uvs=None):
+        vertices = numpy.ascontiguousarray(vertices, dtype=numpy.float32).reshape(-1);
+        loopVertexIndices, faceSizes = MeshUtils.faceArrays(faces);
+        facesNum = faceSizes.size;
+        loopsNum = loopVertexIndices.size;
+
+        theMesh.vertices.add(vertices.size//3);
+        theMesh.vertices.foreach_set('co', vertices);
+        theMesh.loops.add(loopsNum);
+        theMesh.loops.foreach_set('vertex_index', loopVertexIndices);
+        theMesh.polygons.add(facesNum);
+        theMesh.polygons.foreach_set('loop_start', numpy.concatenate(([0], numpy.cumsum(faceSizes)[:-1])).astype(numpy.int32));
+        theMesh.polygons.foreach_set('loop_total', faceSizes);
+        if smooth:
+            theMesh.polygons.foreach_set('use_smooth', numpy.ones(facesNum, dtype=bool));
+        if materialIndices is not None:
+            theMesh.polygons.foreach_set('material_index', numpy.asarray(materialIndices, dtype=numpy.int32));
+        if uvs is not None:
+            theMesh.uv_textures.new('UVMap');
+            loopUvs = numpy.asarray(uvs, dtype=numpy.float32).reshape((-1, 2))[loopVertexIndices];
+            theMesh.uv_layers[-1].data.foreach_set('uv', loopUvs.reshape(-1));
+        theMesh.update(calc_edges=True);
+        theMesh.validate();
+
 
     # Method to subtract (boring out) one geometric object from another 
     def boreOut(self, targetObject, boringObject, hideBoringObject):
+        return(self.boreOutBatch(targetObject, [boringObject], hideBoringObject));
+
+    # Method to subtract (bore out) many objects from a target object at once.
+    # Box-shaped cutters that go through a box-shaped target, such as the
+    # walls of addRoom with a 'wallThickness', when both are axis-aligned
+    # (rotated by multiples of 90 degrees), are cut straight into a new mesh
+    # for the target, without the Boolean solver. Targets cut this way can be
+    # cut this way again. Otherwise, the cutters are united into one temporary
+    # object, which is subtracted with a single Boolean DIFFERENCE modifier.
+    # Returns 'slab' or 'boolean', depending on the way the target was cut.
+    @InstrumentationUtils.timedMethod('booleanOps')
+    def boreOutBatch(self, targetObject, boringObjects, hideBoringObjects):
+        if self.boreOutSlab(targetObject, boringObjects):
+            method = 'slab';
+        else:
+            self.boreOutWithBoolean(targetObject, boringObjects);
+            method = 'boolean';
+        self.log(2, 'Bored {} objects out of "{}" ({})'.format(len(boringObjects), targetObject.name, method));
+        if hideBoringObjects:
+            for boringObject in boringObjects:
+                # unlink the boring object from the scene so it is not visible
+                self.unlinkObjectFromScene(boringObject);
+        return(method);
+
+    # Helper method to get the 4x4 transform of an object from its location, rotation and scale
+    def objectMatrix(self, theObject):
+        return(RendererExportUtils.objectMatrix(theObject.location, theObject.rotation_euler, theObject.scale));
+
+    # Method to cut box-shaped objects through a box-shaped target by
+    # rebuilding its mesh (see MeshUtils.slabWithOpeningsMeshArrays). The
+    # slab and its openings are kept in the mesh's 'rtbSlab' property, so that
+    # more openings can be added later. Returns False, and leaves the target
+    # alone, if the target or a cutter is not a suitable box.
+    def boreOutSlab(self, targetObject, boringObjects):
+        if targetObject.type != 'MESH':
+            return(False);
+        targetMesh = targetObject.data;
+        if 'rtbSlab' in targetMesh:
+            slabMin  = numpy.array(targetMesh['rtbSlab']['min'], dtype=numpy.float64);
+            slabMax  = numpy.array(targetMesh['rtbSlab']['max'], dtype=numpy.float64);
+            openings = numpy.array(targetMesh['rtbSlab']['openings'], dtype=numpy.float64).reshape((-1, 2, 3));
+            openings = [(opening[0], opening[1]) for opening in openings];
+        else:
+            targetArrays = self.getMeshArrays(targetMesh);
+            bounds = MeshUtils.axisAlignedBoxBounds(targetArrays['vertices'], targetArrays['faceSizes']);
+            if bounds is None:
+                return(False);
+            slabMin, slabMax = bounds;
+            openings = [];
+
+        # the cutters, in the frame of the target
+        targetMatrix = self.objectMatrix(targetObject);
+        toTarget = numpy.linalg.inv(targetMatrix);
+        cutterBoxes = [];
+        for boringObject in boringObjects:
+            if boringObject.type != 'MESH':
+                return(False);
+            cutterArrays = self.getMeshArrays(boringObject.data);
+            bounds = MeshUtils.axisAlignedBoxBounds(cutterArrays['vertices'], cutterArrays['faceSizes']);
+            if bounds is not None:
+                bounds = MeshUtils.transformAxisAlignedBox(toTarget.dot(self.objectMatrix(boringObject)), bounds[0], bounds[1]);
+            if bounds is None:
+                return(False);
+            cutterBoxes.append(bounds);
+
+        # the slab is thin along the axis that is shortest once scaled
+        thinAxis = int(numpy.argmin((slabMax - slabMin)*numpy.linalg.norm(targetMatrix[0:3, 0:3], axis=0)));
+        newOpenings = MeshUtils.slabOpenings(slabMin, slabMax, thinAxis, cutterBoxes);
+        if newOpenings is None:
+            return(False);
+        openings = openings + newOpenings;
+        vertices, faces = MeshUtils.slabWithOpeningsMeshArrays(slabMin, slabMax, thinAxis, openings);
+
+        # swap the new mesh in, with the materials of the old one
+        newMesh = bpy.data.meshes.new(targetMesh.name);
+        self.fillMeshFromArrays(newMesh, vertices, faces);
+        for material in targetMesh.materials:
+            newMesh.materials.append(material);
+        newMesh['rtbSlab'] = {
+            'min'      : slabMin.tolist(),
+            'max'      : slabMax.tolist(),
+            'openings' : numpy.array(openings).reshape(-1).tolist(),
+        };
+        targetObject.data = newMesh;
+        if (targetMesh.users == 0) and ('rtbPrimitiveKey' not in targetMesh):
+            meshName = targetMesh.name;
+            bpy.data.meshes.remove(targetMesh);
+            newMesh.name = meshName;
+        return(True);
+
+    # Method to subtract objects from a target with the Boolean solver: the 
+    # objects are first united, and then subtracted in a single pass
+    def boreOutWithBoolean(self, targetObject, boringObjects):
+        if len(boringObjects) == 1:
+            cutterObject = boringObjects[0];
+        else:
+            cutterObject = self.uniteObjects(boringObjects, '{}-cutters'.format(targetObject.name));
+
+        # add a modifier to the target object, and apply that modifier
+        modifier = targetObject.modifiers.new(name='boreOut', type='BOOLEAN');
+        modifier.object    = cutterObject;
+        modifier.operation = 'DIFFERENCE';
+        self.applyModifiers(targetObject, [modifier.name]);
+        # the mesh is no longer a plain slab
+        if 'rtbSlab' in targetObject.data:
+            del targetObject.data['rtbSlab'];
+
+        if cutterObject not in boringObjects:
+            self.removeTemporaryObject(cutterObject);
+
+    # Helper method to apply modifiers of an object, by name, in order
+    def applyModifiers(self, theObject, modifierNames):
         # Deselect all object
         bpy.ops.object.select_all(action='DESELECT')
-        # make the target object active and select it
-        bpy.context.scene.objects.active = targetObject;
-        targetObject.select = True;
-        # add a modifier to the target object
-        objectModifiersNum = len(bpy.context.object.modifiers);
-        bpy.ops.object.modifier_add(type='BOOLEAN')
-        bpy.context.object.modifiers[objectModifiersNum].object = boringObject;
-        bpy.context.object.modifiers[objectModifiersNum].operation = 'DIFFERENCE'; 
-        # apply modifier
-        bpy.ops.object.modifier_apply(apply_as='DATA', modifier=bpy.context.object.modifiers[0].name);
-        if hideBoringObject:
-            # unlink the boring object from the scene so it is not visible
-            self.unlinkObjectFromScene(boringObject);
-
-
-    # Method to export a collada file for the current 3D scene 
-    def exportToColladaFile(self, filePath):
+        # make the object active and select it
+        bpy.context.scene.objects.active = theObject;
+        theObject.select = True;
+        for modifierName in modifierNames:
+            bpy.ops.object.modifier_apply(apply_as='DATA', modifier=modifierName);
+
+    # Method to unite objects into a new, temporary object, with their meshes
+    # in world coordinates. Objects whose bounding boxes are disjoint are
+    # simply joined in one mesh, and overlapping ones are first united with
+    # Boolean UNION modifiers, so that the result is a single closed volume.
+    def uniteObjects(self, theObjects, name):
+        # world-space mesh arrays and bounds of the objects
+        parts = [];
+        for theObject in theObjects:
+            arrays = self.getMeshArrays(theObject.data);
+            matrix = self.objectMatrix(theObject);
+            arrays['vertices'] = arrays['vertices'].dot(matrix[0:3, 0:3].T) + matrix[0:3, 3];
+            parts.append(arrays);
+        boundsMin = numpy.array([part['vertices'].min(axis=0) for part in parts]);
+        boundsMax = numpy.array([part['vertices'].max(axis=0) for part in parts]);
+
+        # group the objects with overlapping bounds
+        groups = list(range(0, len(parts)));
+        def groupOf(index):
+            while groups[index] != index:
+                index = groups[index];
+            return(index);
+        overlaps = numpy.all(boundsMin[:, numpy.newaxis, :] < boundsMax[numpy.newaxis, :, :], axis=2) & \
+                   numpy.all(boundsMin[numpy.newaxis, :, :] < boundsMax[:, numpy.newaxis, :], axis=2);
+        for first, second in zip(*numpy.nonzero(numpy.triu(overlaps, 1))):
+            groups[groupOf(second)] = groupOf(first);
+
+        joinedParts = [];
+        for group in sorted(set([groupOf(index) for index in range(0, len(parts))])):
+            members = [index for index in range(0, len(parts)) if groupOf(index) == group];
+            if len(members) == 1:
+                joinedParts.append(parts[members[0]]);
+                continue;
+            # unite the overlapping objects with the Boolean solver
+            groupObject = self.addTemporaryObject('{}-union'.format(name), parts[members[0]]);
+            modifierNames = [];
+            for index in members[1:]:
+                modifier = groupObject.modifiers.new(name='unite{}'.format(index), type='BOOLEAN');
+                modifier.object    = theObjects[index];
+                modifier.operation = 'UNION';
+                modifierNames.append(modifier.name);
+            self.applyModifiers(groupObject, modifierNames);
+            joinedParts.append(self.getMeshArrays(groupObject.data));
+            self.removeTemporaryObject(groupObject);
+
+        # join all parts in a single mesh
+        vertexOffsets = numpy.cumsum([0] + [part['vertices'].shape[0] for part in joinedParts]);
+        joined = {
+            'vertices'          : numpy.concatenate([part['vertices'] for part in joinedParts]),
+            'loopVertexIndices' : numpy.concatenate([part['loopVertexIndices'] + offset for part, offset in zip(joinedParts, vertexOffsets)]),
+            'faceSizes'         : numpy.concatenate([part['faceSizes'] for part in joinedParts]),
+        };
+        return(self.addTemporaryObject(name, joined));
+
+    # Helper method to add a hidden object, linked to the scene, for a mesh given by its arrays
+    def addTemporaryObject(self, name, arrays):
+        theMesh = bpy.data.meshes.new('{}-mesh'.format(name));
+        self.fillMeshFromArrays(theMesh, arrays['vertices'], (arrays['loopVertexIndices'], arrays['faceSizes']));
+        theObject = bpy.data.objects.new(name, theMesh);
+        theObject.hide        = True;
+        theObject.hide_render = True;
+        bpy.context.scene.objects.link(theObject);
+        return(theObject);
+
+    # Helper method to remove an object made by addTemporaryObject, with its mesh
+    def removeTemporaryObject(self, theObject):
+        theMesh = theObject.data;
+        self.unlinkObjectFromScene(theObject);
+        bpy.data.objects.remove(theObject);
+        bpy.data.meshes.remove(theMesh);
+
+
+    # Method to export a collada file for the current 3D scene.
+    # The file is named after the scene, unless a fileName is given.
+    # If self.writeTimings is True, the timing counters accumulated since the 
+    # previous export are written to <fileName>-timings.json, and then reset.
+    def exportToColladaFile(self, filePath, fileName=None):
         # Get scene 
         currentScene = bpy.data.scenes[0];
-        fileName = '{}/{}.dae'.format(filePath, currentScene.name);
-        #The transrotloc option is necessary for RT3 to successfully parse the collada file
-        bpy.ops.wm.collada_export(filepath=fileName, export_transformation_type_selection='transrotloc');
+        if fileName is None:
+            fileName = currentScene.name;
+        sceneFileName = '{}/{}.dae'.format(filePath, fileName);
+        with self.timers.measure('exportToColladaFile', 'export'):
+            #The transrotloc option is necessary for RT3 to successfully parse the collada file
+            bpy.ops.wm.collada_export(filepath=sceneFileName, export_transformation_type_selection='transrotloc');
+        self.writeTimingsFile(filePath, fileName, sceneFileName);
+        return(sceneFileName);
+
+    # Method to export the current 3D scene to a renderer-native scene file,
+    # for renderer 'pbrt' (PBRT-v3) or 'mitsuba' (Mitsuba 0.5), with large 
+    # meshes written to binary PLY files. The file is named after the scene,
+    # unless a fileName is given. See RendererExportUtils for the params.
+    def exportToRendererFile(self, filePath, renderer='pbrt', fileName=None, params=None):
+        currentScene = bpy.data.scenes[0];
+        if fileName is None:
+            fileName = currentScene.name;
+        with self.timers.measure('exportToRendererFile', 'export'):
+            description = RendererExportUtils.sceneDescription(currentScene.name,
+                (currentScene.render.resolution_x, currentScene.render.resolution_y),
+                list(bpy.context.scene.objects),
+                lambda theObject: theObject.type,
+                lambda theObject: [slot.material for slot in theObject.material_slots],
+                self.getMeshArrays);
+            sceneFileName = RendererExportUtils.exportRendererScene(description, filePath, fileName, renderer, params);
+        self.writeTimingsFile(filePath, fileName, sceneFileName);
+        return(sceneFileName);
+
+    # Method to read the vertex, face and material index arrays of a mesh, and
+    # the per-vertex texture coordinates of its first UV map (if any), via
+    # foreach_get. Vertices on UV seams keep the coordinates of one of their loops.
+    def getMeshArrays(self, theMesh):
+        vertices = numpy.empty(3*len(theMesh.vertices), dtype=numpy.float32);
+        theMesh.vertices.foreach_get('co', vertices);
+        loopVertexIndices = numpy.empty(len(theMesh.loops), dtype=numpy.int32);
+        theMesh.loops.foreach_get('vertex_index', loopVertexIndices);
+        facesNum = len(theMesh.polygons);
+        loopStart       = numpy.empty(facesNum, dtype=numpy.int32);
+        faceSizes       = numpy.empty(facesNum, dtype=numpy.int32);
+        materialIndices = numpy.empty(facesNum, dtype=numpy.int32);
+        smooth          = numpy.empty(facesNum, dtype=bool);
+        theMesh.polygons.foreach_get('loop_start', loopStart);
+        theMesh.polygons.foreach_get('loop_total', faceSizes);
+        theMesh.polygons.foreach_get('material_index', materialIndices);
+        theMesh.polygons.foreach_get('use_smooth', smooth);
+        # put the loops in face order, if they are not
+        faceLoopStart = numpy.concatenate(([0], numpy.cumsum(faceSizes)[:-1]));
+        loopOrder = None;
+        if not numpy.array_equal(loopStart, faceLoopStart):
+            loopOrder = numpy.arange(loopVertexIndices.size) + numpy.repeat(loopStart - faceLoopStart, faceSizes);
+            loopVertexIndices = loopVertexIndices[loopOrder];
+        uvs = None;
+        if len(theMesh.uv_layers) > 0:
+            loopUvs = numpy.empty(2*len(theMesh.loops), dtype=numpy.float32);
+            theMesh.uv_layers[0].data.foreach_get('uv', loopUvs);
+            loopUvs = loopUvs.reshape((-1, 2));
+            if loopOrder is not None:
+                loopUvs = loopUvs[loopOrder];
+            uvs = numpy.zeros((vertices.size//3, 2), dtype=numpy.float32);
+            uvs[loopVertexIndices] = loopUvs;
+        return({
+            'vertices'          : vertices.reshape((-1, 3)),
+            'loopVertexIndices' : loopVertexIndices,
+            'faceSizes'         : faceSizes,
+            'materialIndices'   : materialIndices,
+            'smooth'            : bool(numpy.any(smooth)),
+            'uvs'               : uvs,
+        });
+
+    # Method to write the timing counters to <fileName>-timings.json, if 
+    # self.writeTimings is True, and reset them
+    def writeTimingsFile(self, filePath, fileName, sceneFileName):
+        if not self.writeTimings:
+            return;
+        self.timers.dump('{}/{}-timings.json'.format(filePath, fileName), {'sceneFile': sceneFileName});
+        self.timers.reset();
 
+    # Method to export one collada file per row of a conditions file, in this 
+    # Blender session. The static scene is built once, and each row only
+    # updates the parameterized objects. See ConditionsUtils.exportConditionsBatch.
+    def exportConditionsBatch(self, params):
+        return(ConditionsUtils.exportConditionsBatch(self, params));
 
-        
\ No newline at end of file
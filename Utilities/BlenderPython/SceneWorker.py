@@ -0,0 +1,250 @@
+# Resident scene-building worker: imports a sceneManager backend once, and
+# then builds, resets and exports scenes on command, so that a batch of
+# scenes pays for one Blender launch instead of one per scene.
+#
+# Usage, in Blender (SceneUtilsV1 backend):
+#   blender -b --python SceneWorker.py -- [--port PORT]
+# or in plain Python (SceneGraphV1 backend, no Blender needed):
+#   python SceneWorker.py --backend SceneGraphV1 [--port PORT]
+#
+# Commands are JSON objects, one per line, read from stdin, or from
+# connections to a local socket on 127.0.0.1:PORT if --port is given. Each
+# command gets one response line, written to stdout (or to the connection)
+# with the responsePrefix, so that it can be told apart from Blender's own
+# output. Responses are {'id', 'status' ('ok' or 'error'), 'result' or
+# 'error', 'seconds'}, where id is the command's 'id', if any.
+#
+# Commands, by their 'command' field:
+#   'build'    : build a new scene, and export it if asked to. Fields:
+#                'sceneParams' : params of the sceneManager (the previous
+#                                scene is always erased)
+#                'script'      : optional Python file defining a function,
+#                                'function' (default: 'buildScene'), called as
+#                                function(scene, params) with the 'params'
+#                                field; its return value is returned in the
+#                                result's 'value' (if it can be sent as JSON)
+#                'calls'       : optional list of sceneManager method calls,
+#                                {'method', 'params', 'as'}, made after the
+#                                script; the result of a call with an 'as'
+#                                name is referred to by {'$ref': name} in the
+#                                params of later calls, and {'$vector': [...]}
+#                                stands for a mathutils.Vector
+#                'export'      : optional {'folder', 'fileName', 'renderer'
+#                                ('collada', the default, 'pbrt' or 'mitsuba'),
+#                                'params'}, as for exportToColladaFile /
+#                                exportToRendererFile
+#              The result holds the 'sceneFile' (if exported), the 'timings'
+#              of the sceneManager and the script's 'value'.
+#   'export'   : export the current scene, with the fields of 'export' above
+#   'reset'    : erase the current scene
+#   'ping'     : do nothing (e.g. to check that the worker is ready)
+#   'shutdown' : stop the worker
+
+import json
+import os
+import socket
+import sys
+import time
+import traceback
+
+# the backends and their helpers are next to this file
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)));
+
+# Prefix of the response lines
+responsePrefix = 'rtbSceneWorker ';
+
+
+# Helper method to get the arguments after '--' (Blender's own come before),
+# or all of them when run in plain Python
+def workerArguments(argv):
+    if '--' in argv:
+        return(argv[argv.index('--')+1:]);
+    return(argv[1:]);
+
+
+# Class for the state of a worker: the backend module, the current scene,
+# and the scene scripts loaded so far
+class sceneWorker:
+    def __init__(self, backendName):
+        self.backendName = backendName;
+        self.backend = __import__(backendName);
+        self.scene = None;
+        # script namespaces, by file name, with the modification time they were loaded at
+        self.scripts = {};
+
+    # Helper method to get the namespace of a scene script, which is loaded
+    # once, and again only if the file has changed since
+    def loadScript(self, fileName):
+        fileName = os.path.abspath(fileName);
+        modificationTime = os.path.getmtime(fileName);
+        if (fileName not in self.scripts) or (self.scripts[fileName][0] != modificationTime):
+            namespace = {'__file__': fileName, '__name__': 'rtbSceneScript'};
+            with open(fileName, 'r') as fileHandle:
+                exec(compile(fileHandle.read(), fileName, 'exec'), namespace);
+            self.scripts[fileName] = (modificationTime, namespace);
+        return(self.scripts[fileName][1]);
+
+    # Helper method to replace the {'$ref': name} and {'$vector': values}
+    # entries of call params with the named results and with vectors
+    def resolveValue(self, value, results):
+        if isinstance(value, dict):
+            if '$ref' in value:
+                if value['$ref'] not in results:
+                    raise ValueError('Unknown reference "{}"'.format(value['$ref']));
+                return(results[value['$ref']]);
+            if '$vector' in value:
+                if self.backendName == 'SceneUtilsV1':
+                    import mathutils;
+                    return(mathutils.Vector(value['$vector']));
+                return(tuple(value['$vector']));
+            return(dict([(key, self.resolveValue(item, results)) for key, item in value.items()]));
+        if isinstance(value, list):
+            return([self.resolveValue(item, results) for item in value]);
+        return(value);
+
+    # Method to erase the current scene
+    def reset(self):
+        if self.scene is not None:
+            self.scene.erasePreviousContents();
+        self.scene = None;
+        return({});
+
+    # Method to export the current scene
+    def export(self, params):
+        if self.scene is None:
+            raise ValueError('There is no scene to export');
+        folder = params['folder'];
+        if not os.path.isdir(folder):
+            os.makedirs(folder);
+        renderer = params.get('renderer', 'collada');
+        if renderer == 'collada':
+            sceneFile = self.scene.exportToColladaFile(folder, params.get('fileName'));
+        else:
+            sceneFile = self.scene.exportToRendererFile(folder, renderer, params.get('fileName'), params.get('params'));
+        return({'sceneFile': sceneFile});
+
+    # Method to build a scene (see the 'build' command)
+    def build(self, command):
+        sceneParams = dict(command.get('sceneParams', {}));
+        sceneParams['erasePreviousScene'] = True;
+        self.scene = None;
+        self.scene = self.backend.sceneManager(sceneParams);
+        result = {};
+        if command.get('script'):
+            namespace = self.loadScript(command['script']);
+            functionName = command.get('function', 'buildScene');
+            if functionName not in namespace:
+                raise ValueError('"{}" has no function {}'.format(command['script'], functionName));
+            value = namespace[functionName](self.scene, command.get('params', {}));
+            try:
+                json.dumps(value);
+                result['value'] = value;
+            except (TypeError, ValueError):
+                result['value'] = None;
+        results = {};
+        for call in command.get('calls', []):
+            value = getattr(self.scene, call['method'])(self.resolveValue(call.get('params', {}), results));
+            if call.get('as'):
+                results[call['as']] = value;
+        if command.get('export'):
+            result.update(self.export(command['export']));
+        if hasattr(self.scene, 'getTimings'):
+            result['timings'] = self.scene.getTimings();
+        return(result);
+
+    # Method to run a command. Returns its response, and whether to stop.
+    def runCommand(self, command):
+        startTime = time.time();
+        response = {'id': command.get('id')};
+        stop = False;
+        try:
+            name = command.get('command');
+            if name == 'build':
+                response['result'] = self.build(command);
+            elif name == 'export':
+                response['result'] = self.export(command.get('export', command));
+            elif name == 'reset':
+                response['result'] = self.reset();
+            elif name == 'ping':
+                response['result'] = {'backend': self.backendName, 'pid': os.getpid()};
+            elif name == 'shutdown':
+                response['result'] = {};
+                stop = True;
+            else:
+                raise ValueError('Unknown command "{}"'.format(name));
+            response['status'] = 'ok';
+        except Exception as error:
+            response['status'] = 'error';
+            response['error'] = '{}: {}'.format(type(error).__name__, error);
+            response['traceback'] = traceback.format_exc();
+        response['seconds'] = time.time() - startTime;
+        return(response, stop);
+
+    # Method to run the commands of a stream of lines, writing the responses
+    # with writeLine. Returns True if a shutdown command was received.
+    def serveLines(self, lines, writeLine):
+        for line in lines:
+            line = line.strip();
+            if not line:
+                continue;
+            try:
+                command = json.loads(line);
+            except ValueError as error:
+                writeLine(responsePrefix + json.dumps({'id': None, 'status': 'error', 'error': 'Invalid command: {}'.format(error), 'seconds': 0.0}));
+                continue;
+            response, stop = self.runCommand(command);
+            writeLine(responsePrefix + json.dumps(response, default=str));
+            if stop:
+                return(True);
+        return(False);
+
+
+# Helper method to write a response line to stdout
+def writeStdout(line):
+    sys.stdout.write(line + '\n');
+    sys.stdout.flush();
+
+
+# Method to serve commands on a local socket, one connection at a time,
+# until a shutdown command
+def serveSocket(worker, port):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM);
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1);
+    server.bind(('127.0.0.1', port));
+    server.listen(1);
+    writeStdout(responsePrefix + json.dumps({'id': None, 'status': 'ok', 'result': {'port': server.getsockname()[1]}, 'seconds': 0.0}));
+    try:
+        while True:
+            connection, address = server.accept();
+            with connection:
+                stream = connection.makefile('rw');
+                def writeLine(line):
+                    stream.write(line + '\n');
+                    stream.flush();
+                if worker.serveLines(stream, writeLine):
+                    return;
+    finally:
+        server.close();
+
+
+def main(argv):
+    arguments = workerArguments(argv);
+    backendName = 'SceneUtilsV1';
+    port = None;
+    while arguments:
+        option = arguments.pop(0);
+        if option == '--backend':
+            backendName = arguments.pop(0);
+        elif option == '--port':
+            port = int(arguments.pop(0));
+        else:
+            raise ValueError('Unknown option "{}"'.format(option));
+    worker = sceneWorker(backendName);
+    if port is None:
+        worker.serveLines(sys.stdin, writeStdout);
+    else:
+        serveSocket(worker, port);
+
+
+if __name__ == '__main__':
+    main(sys.argv);
@@ -0,0 +1,251 @@
+# Client for resident scene workers (see SceneWorker): keeps a pool of
+# worker processes busy on a queue of scene jobs, restarting the workers
+# that crash or hang, and reports the latency of each job.
+#
+# A job is a 'build' command of SceneWorker (a dictionary with 'sceneParams',
+# 'script', 'params', 'calls', 'export'), with an optional 'id'. Each worker
+# process is fed by its own thread, over the process's stdin and stdout.
+#
+# Example, with Blender:
+#   pool = SceneWorkerPool.sceneWorkerPool(SceneWorkerPool.blenderWorkerCommand('blender'), 4);
+#   results = pool.run(jobs);
+#   pool.close();
+
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import SceneWorker
+
+
+# Default parameters of a pool
+poolDefaults = {
+    # seconds a job may take before its worker is killed (None: no limit)
+    'jobTimeout'     : None,
+    # seconds a worker may take to start (answer its first ping)
+    'startTimeout'   : 120,
+    # times a job is run again after its worker crashed or timed out
+    'jobRetries'     : 1,
+    # number of lines of worker output kept to report crashes
+    'outputLinesNum' : 50,
+};
+
+
+# Method to get the command that starts a worker in Blender, in background mode
+def blenderWorkerCommand(blenderExecutable='blender'):
+    workerScript = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SceneWorker.py');
+    return([blenderExecutable, '-b', '--python', workerScript, '--']);
+
+
+# Method to get the command that starts a worker in plain Python, with the
+# Blender-free SceneGraphV1 backend
+def pythonWorkerCommand(pythonExecutable=None):
+    workerScript = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SceneWorker.py');
+    return([pythonExecutable or sys.executable, workerScript, '--backend', 'SceneGraphV1']);
+
+
+# Exception raised when a worker process exits or stops answering
+class workerFailure(Exception):
+    pass;
+
+
+# Class for one worker process: its commands are written to its stdin, and
+# its output lines are read by a thread, into a queue
+class workerProcess:
+    def __init__(self, command, params):
+        self.params = params;
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                            universal_newlines=True, bufsize=1);
+        except OSError as error:
+            raise workerFailure('the worker could not be started: {}'.format(error));
+        self.lines = queue.Queue();
+        self.output = [];
+        self.reader = threading.Thread(target=self.readLines);
+        self.reader.daemon = True;
+        self.reader.start();
+        try:
+            self.startSeconds = self.request({'command': 'ping'}, params['startTimeout'])['latency'];
+        except workerFailure:
+            self.stop(force=True);
+            raise;
+
+    # Helper method to read the output lines of the process, until it exits
+    def readLines(self):
+        for line in self.process.stdout:
+            self.lines.put(line);
+        self.lines.put(None);
+
+    # Method to send a command and wait for its response, for at most
+    # timeout seconds. Returns the response, with the round trip 'seconds'
+    # in 'latency'. Raises workerFailure if the process exits or times out.
+    def request(self, command, timeout=None):
+        startTime = time.time();
+        try:
+            self.process.stdin.write(json.dumps(command) + '\n');
+            self.process.stdin.flush();
+        except (OSError, ValueError):
+            raise workerFailure('the worker exited');
+        while True:
+            remaining = None if timeout is None else max(0.0, startTime + timeout - time.time());
+            try:
+                line = self.lines.get(timeout=remaining);
+            except queue.Empty:
+                raise workerFailure('no response after {} s'.format(timeout));
+            if line is None:
+                raise workerFailure('the worker exited with status {}'.format(self.process.wait()));
+            if line.startswith(SceneWorker.responsePrefix):
+                response = json.loads(line[len(SceneWorker.responsePrefix):]);
+                response['latency'] = time.time() - startTime;
+                if (command.get('id') is None) or (response.get('id') == command.get('id')):
+                    return(response);
+            else:
+                # keep the last lines of the worker's own output, to report crashes
+                self.output.append(line.rstrip('\n'));
+                del self.output[0:max(0, len(self.output) - self.params['outputLinesNum'])];
+
+    # Method to stop the process: politely, then by force, or only by force
+    # if force is set (e.g. when it is stuck)
+    def stop(self, force=False):
+        if (self.process.poll() is None) and not force:
+            try:
+                self.request({'command': 'shutdown'}, 10);
+            except workerFailure:
+                pass;
+        if self.process.poll() is None:
+            self.process.kill();
+        self.process.wait();
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close();
+            except (OSError, ValueError):
+                pass;
+
+
+# Class for a pool of worker processes, started with workerCommand (see
+# blenderWorkerCommand and pythonWorkerCommand)
+class sceneWorkerPool:
+    def __init__(self, workerCommand, workersNum, params=None):
+        self.workerCommand = list(workerCommand);
+        self.workersNum = workersNum;
+        self.params = dict(poolDefaults);
+        self.params.update(params or {});
+        self.workers = [None]*workersNum;
+        self.lock = threading.Lock();
+        self.statistics = {'jobs': 0, 'failed': 0, 'crashes': 0, 'startSeconds': []};
+
+    # Helper method to get a running worker for a slot of the pool, starting one if needed
+    def slotWorker(self, slot):
+        if self.workers[slot] is None:
+            worker = workerProcess(self.workerCommand, self.params);
+            with self.lock:
+                self.statistics['startSeconds'].append(worker.startSeconds);
+            self.workers[slot] = worker;
+        return(self.workers[slot]);
+
+    # Helper method to replace the worker of a slot after a crash
+    def restartSlot(self, slot):
+        worker = self.workers[slot];
+        self.workers[slot] = None;
+        output = [];
+        if worker is not None:
+            output = list(worker.output);
+            worker.stop(force=True);
+        with self.lock:
+            self.statistics['crashes'] += 1;
+        return(output);
+
+    # Helper method to run one job on a slot. Returns its result dictionary.
+    def runJob(self, slot, index, job):
+        command = dict(job);
+        command['command'] = 'build';
+        command['id'] = '{}'.format(job.get('id', index));
+        result = {'id': job.get('id', index), 'slot': slot, 'attempts': 0, 'crashes': []};
+        queuedTime = time.time();
+        while True:
+            result['attempts'] += 1;
+            try:
+                worker = self.slotWorker(slot);
+                response = worker.request(command, self.params['jobTimeout']);
+            except workerFailure as failure:
+                # the worker is gone (or stuck): replace it, and run the job again if allowed
+                result['crashes'].append({'error': str(failure), 'output': self.restartSlot(slot)});
+                if result['attempts'] > self.params['jobRetries']:
+                    result.update({'status': 'crashed', 'error': str(failure), 'latency': time.time() - queuedTime});
+                    return(result);
+                continue;
+            result.update({
+                'status'        : response['status'],
+                'result'        : response.get('result'),
+                'error'         : response.get('error'),
+                'traceback'     : response.get('traceback'),
+                'workerSeconds' : response['seconds'],
+                'latency'       : time.time() - queuedTime,
+                'pid'           : worker.process.pid,
+            });
+            return(result);
+
+    # Helper method to run jobs from a queue on one slot, until it is empty
+    def serveSlot(self, slot, jobs, results, progress):
+        # start the worker up front, so that its start-up is not counted in
+        # the latency of its first job (runJob tries again if it fails)
+        try:
+            self.slotWorker(slot);
+        except workerFailure:
+            pass;
+        while True:
+            try:
+                index, job = jobs.get_nowait();
+            except queue.Empty:
+                return;
+            results[index] = self.runJob(slot, index, job);
+            with self.lock:
+                self.statistics['jobs'] += 1;
+                if results[index]['status'] != 'ok':
+                    self.statistics['failed'] += 1;
+                if progress is not None:
+                    progress(results[index]);
+
+    # Method to run jobs on the pool. Returns one result per job, in order:
+    # {'id', 'status' ('ok', 'error' or 'crashed'), 'result', 'error',
+    #  'latency', 'workerSeconds', 'attempts', 'crashes', 'slot', 'pid'},
+    # where 'latency' is the wall time of the job, from its dispatch to its
+    # response, including worker restarts, and 'workerSeconds' the time the
+    # worker spent on it. Failed jobs do not stop the others. If given,
+    # progress(result) is called as each job finishes.
+    def run(self, jobs, progress=None):
+        jobQueue = queue.Queue();
+        for index, job in enumerate(jobs):
+            jobQueue.put((index, job));
+        results = [None]*len(jobs);
+        threads = [threading.Thread(target=self.serveSlot, args=(slot, jobQueue, results, progress)) for slot in range(0, self.workersNum)];
+        for thread in threads:
+            thread.start();
+        for thread in threads:
+            thread.join();
+        return(results);
+
+    # Method to get the statistics of the pool: numbers of jobs, failed jobs
+    # and worker crashes, and the start-up time of each worker started
+    def getStatistics(self):
+        with self.lock:
+            statistics = dict(self.statistics);
+            statistics['startSeconds'] = list(self.statistics['startSeconds']);
+        return(statistics);
+
+    # Method to stop all workers
+    def close(self):
+        for slot in range(0, self.workersNum):
+            if self.workers[slot] is not None:
+                self.workers[slot].stop();
+                self.workers[slot] = None;
+
+    def __enter__(self):
+        return(self);
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close();
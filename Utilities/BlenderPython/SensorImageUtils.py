@@ -0,0 +1,484 @@
+# Blender-free conversion of multispectral images to sensor images and to
+# sRGB, as rtbMultispectralToSensorImage.m, rtbMultispectralToSRGB.m and
+# rtbMakeSensorImages.m do, for batches of large images.
+#
+# Images are streamed in blocks of rows: each block of multispectral data is
+# converted for all matching functions at once, with a single matrix product,
+# and written into the outputs, which are memory-mapped files. The rows per
+# block are chosen so that a block of multispectral data fits in
+# params['blockBytes'], which bounds the memory each worker uses, whatever
+# the size of the images. Images are converted on a pool of threads (NumPy's
+# matrix products and zlib release the GIL).
+#
+# Multispectral images are read from the .mat files written by rtbBatchRender
+# (variables multispectralImage and S), or from multispectral OpenEXR files
+# (see MultispectralEXRUtils). Sensor images are written to .mat files, with
+# the variables that rtbMakeSensorImages.m saves, and sRGB images to 8-bit
+# PNG files.
+#
+# Matching functions are resampled to the wavelengths of the images by linear
+# interpolation (see SpectrumUtils.resampleSpectra), where Psychtoolbox's
+# SplineCmf uses a cubic spline: the results are the same when the image
+# wavelengths are among those of the matching functions (e.g. images with
+# S = [400 10 31] and the 5nm CIE 1931 functions), and differ slightly otherwise.
+
+import concurrent.futures
+import os
+import struct
+import tempfile
+import zlib
+
+import numpy
+
+import MatFileUtils
+import MultispectralEXRUtils
+import SpectrumUtils
+
+
+# The Psychtoolbox colorimetric data file of the CIE 1931 color matching functions
+xyz1931File = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'external', 'PsychToolbox', 'T_xyz1931.mat');
+
+# 683 converts watt-valued spectra to lumen-valued luminances (Y-values)
+wattsToLumens = 683;
+
+# XYZ to linear sRGB primaries (as Psychtoolbox's XYZToSRGBPrimary)
+xyzToSRGBMatrix = numpy.array([
+    ( 3.2410, -1.5374, -0.4986),
+    (-0.9692,  1.8760,  0.0416),
+    ( 0.0556, -0.2040,  1.0570),
+]);
+
+# Default parameters for the conversions
+conversionDefaults = {
+    # bytes of multispectral data (as float64) converted at once, per worker
+    'blockBytes'       : 64*1024*1024,
+    # number of images converted at once (default: the number of CPUs)
+    'workersNum'       : None,
+    # where output files are written (default: next to each input file)
+    'outputFolder'     : None,
+    # names of the spectral channels of OpenEXR files (see MultispectralEXRUtils)
+    'namePattern'      : '%f-%f',
+    # tone mapping and scaling of the sRGB images (see rtbMultispectralToSRGB.m)
+    'toneMapFactor'    : 0,
+    'toneMapThreshold' : 0,
+    'isScale'          : False,
+    'scaleFactor'      : 0,
+    # whether sensor image files include a copy of the multispectral image, as
+    # rtbMakeSensorImages.m writes them
+    'saveMultispectral': True,
+};
+
+
+# Helper method to merge params with the conversion defaults
+def conversionParams(params):
+    merged = dict(conversionDefaults);
+    merged.update(params or {});
+    return(merged);
+
+
+# Method to read a Psychtoolbox colorimetric data file (named T_<name>.mat),
+# as rtbParsePsychColorimetricMatFile.m does. Returns the matching functions
+# (channels x wavelengths), their S sampling [start delta n], the category
+# (the file name up to its first underscore: 'T') and the name.
+def readColorimetricData(dataFile):
+    fileBase = os.path.splitext(os.path.basename(dataFile))[0];
+    category, _, name = fileBase.partition('_');
+    matrices = MatFileUtils.readMatFile(dataFile, [fileBase, 'S_' + name]);
+    if (fileBase not in matrices) or ('S_' + name not in matrices):
+        raise ValueError('"{}" has no {} and S_{} variables'.format(dataFile, fileBase, name));
+    return(numpy.asarray(matrices[fileBase], dtype=numpy.float64), matrices['S_' + name].reshape(-1).astype(numpy.float64), category, name);
+
+
+# Method to get the (channels x wavelengths) matrix that converts the spectra
+# of an image, in power per nm with the imageS sampling, to sensor values,
+# for matching functions with the matchingS sampling: the matching functions
+# resampled to the image wavelengths, times the image's wavelength band (as
+# rtbMultispectralToSensorImage.m multiplies the image by it)
+def sensorMatrix(matchingFunction, matchingS, imageS):
+    matchingFunction = numpy.atleast_2d(numpy.asarray(matchingFunction, dtype=numpy.float64));
+    imageS = numpy.asarray(imageS, dtype=numpy.float64).reshape(-1);
+    resampled = SpectrumUtils.resampleSpectra(SpectrumUtils.wlsFromS(matchingS), matchingFunction, imageS, targetIsS=True, extrapolation='zero');
+    return(resampled*imageS[1]);
+
+
+# Helper method to get the number of rows per block of a (height, width,
+# wavelengths) image, for a budget of blockBytes
+def rowsPerBlock(shape, blockBytes):
+    rowBytes = max(1, shape[1]*shape[2]*8);
+    return(int(max(1, min(shape[0], blockBytes // rowBytes))));
+
+
+# Class for a multispectral image held in an array (or a memory-mapped
+# array), of shape (height, width, wavelengths)
+class arrayImage:
+    def __init__(self, image, S, fileName=None):
+        self.image = image;
+        self.S = numpy.asarray(S, dtype=numpy.float64).reshape(-1);
+        self.shape = image.shape;
+        self.fileName = fileName;
+
+    # Method to read the rows start to end-1, as float64
+    def readRows(self, start, end):
+        return(numpy.asarray(self.image[start:end], dtype=numpy.float64));
+
+    def close(self):
+        self.image = None;
+
+
+# Class for a multispectral OpenEXR image, whose rows are decoded on demand
+class exrImage:
+    def __init__(self, fileName, namePattern='%f-%f'):
+        self.exr = MultispectralEXRUtils.multispectralEXR(fileName, namePattern);
+        self.S = self.exr.S;
+        self.shape = (self.exr.height, self.exr.width, len(self.exr.sliceNames));
+        self.fileName = fileName;
+
+    def readRows(self, start, end):
+        return(self.exr.readSpectral(start, end, dtype=numpy.float64));
+
+    def close(self):
+        self.exr.close();
+
+
+# Method to open a multispectral image file: a .mat file written by
+# rtbBatchRender (uncompressed images are memory-mapped, compressed ones
+# are read whole) or an OpenEXR file
+def openMultispectralImage(fileName, namePattern='%f-%f'):
+    if os.path.splitext(fileName)[1].lower() == '.exr':
+        return(exrImage(fileName, namePattern));
+    matrices = MatFileUtils.readMatFile(fileName, ['multispectralImage', 'S']);
+    if ('multispectralImage' not in matrices) or ('S' not in matrices):
+        raise ValueError('"{}" has no multispectralImage and S variables'.format(fileName));
+    image = matrices['multispectralImage'];
+    if image.ndim == 2:
+        image = image[:, :, numpy.newaxis];
+    return(arrayImage(image, matrices['S'], fileName));
+
+
+# Method to convert a multispectral image (an arrayImage, exrImage, ...)
+# to sensor images, block by block: for each of the (channels x wavelengths)
+# matrices (see sensorMatrix), the sensor image is written into the
+# corresponding (height, width, channels) output array. A callback, if
+# given, is called with each block of rows (start, end, multispectral block).
+def convertImage(image, matrices, outputs, blockBytes, callback=None):
+    allMatrices = numpy.concatenate(matrices, axis=0);
+    channelStarts = numpy.cumsum([0] + [matrix.shape[0] for matrix in matrices]);
+    height, width, wavelengthsNum = image.shape;
+    if allMatrices.shape[1] != wavelengthsNum:
+        raise ValueError('Sensor matrices are for {} wavelengths, and the image has {}'.format(allMatrices.shape[1], wavelengthsNum));
+    blockRows = rowsPerBlock(image.shape, blockBytes);
+    for start in range(0, height, blockRows):
+        end = min(height, start + blockRows);
+        block = image.readRows(start, end);
+        sensorValues = block.reshape((-1, wavelengthsNum)).dot(allMatrices.T).reshape((end-start, width, -1));
+        for index, output in enumerate(outputs):
+            output[start:end] = sensorValues[:, :, channelStarts[index]:channelStarts[index+1]];
+        if callback is not None:
+            callback(start, end, block);
+
+
+# Helper method to tone map a block of XYZ values (pixels x 3), as
+# Psychtoolbox's BasicToneMapCalFormat: luminances above maxLum are truncated
+def toneMap(xyz, maxLum):
+    bright = xyz[:, 1] > maxLum;
+    if numpy.any(bright):
+        xyz = xyz.copy();
+        xyz[bright] = maxLum*(xyz[bright]/xyz[bright, 1:2]);
+    return(xyz);
+
+
+# Helper method to get the luminance above which XYZ values are tone mapped, or None
+def toneMapLuminance(params, meanLuminance):
+    if params['toneMapThreshold'] > 0:
+        return(params['toneMapThreshold']);
+    if params['toneMapFactor'] > 0:
+        return(params['toneMapFactor']*meanLuminance);
+    return(None);
+
+
+# Helper method to get the linear sRGB values of a block of XYZ values
+# (pixels x 3), tone mapped above maxLum if given
+def srgbPrimary(xyz, maxLum):
+    if maxLum is not None:
+        xyz = toneMap(xyz, maxLum);
+    return(xyz.dot(xyzToSRGBMatrix.T));
+
+
+# Helper method to gamma correct linear sRGB values, as Psychtoolbox's
+# SRGBGammaCorrect: values are divided by maxValue if given (else clipped
+# to 1), and returned as 0-255 integers (rounded half away from zero)
+def gammaCorrect(rgb, maxValue=None):
+    if maxValue is not None:
+        rgb = rgb/maxValue;
+    else:
+        rgb = numpy.minimum(rgb, 1);
+    rgb = numpy.maximum(rgb, 0);
+    corrected = numpy.where(rgb < 0.00304, 12.92*rgb, 1.055*numpy.power(rgb, 1/2.4) - 0.055);
+    return(numpy.floor(255*corrected + 0.5).astype(numpy.uint8));
+
+
+# Method to convert XYZ images to sRGB, as rtbXYZToSRGB.m does, for an XYZ
+# image of (height, width, 3) in any array (or memory-mapped array), block by
+# block. Each block of gamma-corrected rows is passed to writeRows(start, rows).
+# meanLuminance is the mean Y of the image (computed if not given) and
+# maxPrimary the maximum linear sRGB value after tone mapping (computed if
+# needed and not given). Returns the scale factor, as rtbXYZToSRGB.m does.
+def xyzToSRGB(xyzImage, params, writeRows, meanLuminance=None, maxPrimary=None, blockRows=None):
+    params = conversionParams(params);
+    height, width = xyzImage.shape[0:2];
+    if blockRows is None:
+        blockRows = rowsPerBlock((height, width, 3), params['blockBytes']);
+    blockRanges = [(start, min(height, start + blockRows)) for start in range(0, height, blockRows)];
+    def xyzBlock(start, end):
+        return(numpy.asarray(xyzImage[start:end], dtype=numpy.float64).reshape((-1, 3)));
+
+    if (meanLuminance is None) and (params['toneMapThreshold'] <= 0) and (params['toneMapFactor'] > 0):
+        meanLuminance = sum([xyzBlock(start, end)[:, 1].sum() for start, end in blockRanges])/float(height*width);
+    maxLum = toneMapLuminance(params, meanLuminance);
+
+    scaleFactor = params['scaleFactor'];
+    if scaleFactor > 0:
+        maxValue = None;
+    else:
+        if maxPrimary is None:
+            maxPrimary = max([srgbPrimary(xyzBlock(start, end), maxLum).max() for start, end in blockRanges]);
+        scaleFactor = 1.0/maxPrimary;
+        maxValue = maxPrimary if params['isScale'] else None;
+
+    for start, end in blockRanges:
+        rgb = srgbPrimary(xyzBlock(start, end), maxLum);
+        if params['scaleFactor'] > 0:
+            rgb = rgb*params['scaleFactor'];
+        writeRows(start, gammaCorrect(rgb, maxValue).reshape((end-start, width, 3)));
+    return(scaleFactor);
+
+
+# Method to convert a multispectral image array, as rtbMultispectralToSRGB.m
+# does. Returns the sRGB image (uint8), the XYZ image, the uncorrected sRGB
+# image and the scale factor.
+def multispectralToSRGB(multispectralImage, S, params=None):
+    params = conversionParams(params);
+    matchingFunction, matchingS, _, _ = readColorimetricData(xyz1931File);
+    image = arrayImage(numpy.asarray(multispectralImage), S);
+    xyzImage = numpy.empty(image.shape[0:2] + (3,));
+    convertImage(image, [sensorMatrix(wattsToLumens*matchingFunction, matchingS, image.S)], [xyzImage], params['blockBytes']);
+    sRGBImage = numpy.empty(xyzImage.shape, dtype=numpy.uint8);
+    def writeRows(start, rows):
+        sRGBImage[start:start+rows.shape[0]] = rows;
+    scaleFactor = xyzToSRGB(xyzImage, params, writeRows);
+
+    rawRGBImage = srgbPrimary(xyzImage.reshape((-1, 3)), toneMapLuminance(params, xyzImage[:, :, 1].mean())).reshape(xyzImage.shape);
+    if params['scaleFactor'] > 0:
+        rawRGBImage = rawRGBImage*params['scaleFactor'];
+    return(sRGBImage, xyzImage, rawRGBImage, scaleFactor);
+
+
+# Method to convert a multispectral image array to a sensor image, as
+# rtbMultispectralToSensorImage.m does, for matching functions given as a
+# matrix (channels x wavelengths) with their matchingS sampling, or as the
+# name of a Psychtoolbox colorimetric data file
+def multispectralToSensorImage(multispectralImage, imageS, matchingFunction, matchingS=None, params=None):
+    params = conversionParams(params);
+    if isinstance(matchingFunction, str):
+        matchingFunction, matchingS, _, _ = readColorimetricData(matchingFunction);
+    image = arrayImage(numpy.asarray(multispectralImage), imageS);
+    matrix = sensorMatrix(matchingFunction, matchingS, image.S);
+    sensorImage = numpy.empty(image.shape[0:2] + (matrix.shape[0],));
+    convertImage(image, [matrix], [sensorImage], params['blockBytes']);
+    return(sensorImage);
+
+
+# Class for a PNG file written row by row, with its image data compressed
+# as it comes: 8-bit RGB by default, or with 1 (gray) or 3 (RGB) channels
+# of 8 or 16 bits
+class pngWriter:
+    def __init__(self, fileName, width, height, bitDepth=8, channelsNum=3):
+        if (bitDepth not in (8, 16)) or (channelsNum not in (1, 3)):
+            raise ValueError('Unsupported PNG format: {} channels of {} bits'.format(channelsNum, bitDepth));
+        self.dtype = numpy.dtype('>u2') if bitDepth == 16 else numpy.dtype(numpy.uint8);
+        self.fileHandle = open(fileName, 'wb');
+        self.compressor = zlib.compressobj(6);
+        self.pending = [];
+        self.pendingBytes = 0;
+        self.fileHandle.write(b'\x89PNG\r\n\x1a\n');
+        self.writeChunk(b'IHDR', struct.pack('>IIBBBBB', width, height, bitDepth, 2 if channelsNum == 3 else 0, 0, 0, 0));
+
+    # Helper method to write a PNG chunk
+    def writeChunk(self, chunkType, payload):
+        self.fileHandle.write(struct.pack('>I', len(payload)) + chunkType + payload + struct.pack('>I', zlib.crc32(chunkType + payload) & 0xFFFFFFFF));
+
+    # Method to write (rows, width, channels) or (rows, width) rows of
+    # integers (uint8, or uint16 for 16 bits), after the ones written so far
+    def writeRows(self, rows):
+        # each row starts with its filter type (0: none), and 16-bit samples are big-endian
+        samples = numpy.ascontiguousarray(rows, dtype=self.dtype).reshape((rows.shape[0], -1)).view(numpy.uint8);
+        filtered = numpy.zeros((rows.shape[0], samples.shape[1] + 1), dtype=numpy.uint8);
+        filtered[:, 1:] = samples;
+        self.pending.append(self.compressor.compress(filtered.tobytes()));
+        self.pendingBytes += len(self.pending[-1]);
+        if self.pendingBytes >= 1024*1024:
+            self.flushData();
+
+    # Helper method to write the compressed data so far as an IDAT chunk
+    def flushData(self):
+        if self.pendingBytes > 0:
+            self.writeChunk(b'IDAT', b''.join(self.pending));
+        self.pending = [];
+        self.pendingBytes = 0;
+
+    def close(self):
+        self.pending.append(self.compressor.flush());
+        self.pendingBytes += len(self.pending[-1]);
+        self.flushData();
+        self.writeChunk(b'IEND', b'');
+        self.fileHandle.close();
+
+
+# Helper method to resolve matching functions, given as matrices or as
+# Psychtoolbox colorimetric data files, with their samplings and names, as
+# rtbMakeSensorImages.m does
+def resolveMatchingFunctions(matchingFunctions, matchingS=None, names=None):
+    resolved = [];
+    for index, matchingFunction in enumerate(matchingFunctions):
+        if isinstance(matchingFunction, str):
+            data, S, _, name = readColorimetricData(matchingFunction);
+        else:
+            data = numpy.atleast_2d(numpy.asarray(matchingFunction, dtype=numpy.float64));
+            S = numpy.asarray(matchingS[index], dtype=numpy.float64).reshape(-1);
+            name = '{}'.format(index+1);
+        if names and names[index]:
+            name = names[index];
+        resolved.append({'matchingFunction': data, 'matchingS': S, 'name': name});
+    return(resolved);
+
+
+# Helper method to check that no two input files have the same output files,
+# which would be written over each other by different workers
+def checkOutputNames(inFiles, params):
+    folders = [os.path.abspath(params['outputFolder'] or os.path.dirname(os.path.abspath(inFile))) for inFile in inFiles];
+    bases = [os.path.splitext(os.path.basename(inFile))[0] for inFile in inFiles];
+    outputs = set();
+    for inFile, folder, base in zip(inFiles, folders, bases):
+        if (folder, base) in outputs:
+            raise ValueError('"{}" would be written over the outputs of another input file with the same name, in "{}"'.format(inFile, folder));
+        outputs.add((folder, base));
+
+
+# Helper method to get the output folder of an input file
+def outputFolder(inFile, params):
+    folder = params['outputFolder'];
+    if folder is None:
+        folder = os.path.dirname(os.path.abspath(inFile));
+    if not os.path.isdir(folder):
+        os.makedirs(folder);
+    return(folder);
+
+
+# Helper method to make the sensor images of one multispectral file
+def makeFileSensorImages(inFile, resolved, params):
+    if not os.path.isfile(inFile):
+        return([None]*len(resolved));
+    image = openMultispectralImage(inFile, params['namePattern']);
+    writers = [];
+    try:
+        folder = outputFolder(inFile, params);
+        inBase = os.path.splitext(os.path.basename(inFile))[0];
+        outFiles = [];
+        matrices = [];
+        outputs = [];
+        copies = [];
+        for matching in resolved:
+            outFiles.append(os.path.join(folder, '{}_{}.mat'.format(inBase, matching['name'])));
+            writer = MatFileUtils.matFileWriter(outFiles[-1]);
+            writers.append(writer);
+            matrices.append(sensorMatrix(matching['matchingFunction'], matching['matchingS'], image.S));
+            outputs.append(writer.allocate('sensorImage', image.shape[0:2] + (matrices[-1].shape[0],)));
+            if params['saveMultispectral']:
+                copies.append(writer.allocate('multispectralImage', image.shape));
+            writer.write('imageS', image.S.reshape((1, -1)));
+            writer.write('matchingFunction', matching['matchingFunction']);
+            writer.write('matchingS', matching['matchingS'].reshape((1, -1)));
+        def copyBlock(start, end, block):
+            for copy in copies:
+                copy[start:end] = block;
+        convertImage(image, matrices, outputs, params['blockBytes'], copyBlock);
+        return(outFiles);
+    finally:
+        for writer in writers:
+            writer.close();
+        image.close();
+
+
+# Method to write sensor image files for multispectral files, as
+# rtbMakeSensorImages.m does. matchingFunctions is a list of matching
+# function matrices (with their samplings in matchingS) or Psychtoolbox
+# colorimetric data file names, and names optional names for them.
+# The files are named <input file base>_<name>.mat, and input files must
+# have different names if they are written to the same folder. Returns a list of lists
+# of file names, one row per input file and one column per matching
+# function, with None for input files that do not exist.
+def makeSensorImages(inFiles, matchingFunctions, matchingS=None, names=None, params=None):
+    params = conversionParams(params);
+    checkOutputNames(inFiles, params);
+    resolved = resolveMatchingFunctions(matchingFunctions, matchingS, names);
+    with concurrent.futures.ThreadPoolExecutor(max_workers=params['workersNum'] or os.cpu_count()) as executor:
+        return(list(executor.map(lambda inFile: makeFileSensorImages(inFile, resolved, params), inFiles)));
+
+
+# Helper method to make the sRGB image of one multispectral file: its XYZ
+# image is computed block by block into a temporary memory-mapped file, with
+# the statistics that tone mapping and scaling need, and then converted
+# block by block to rows of the PNG file
+def makeFileSRGBImage(inFile, matchingFunction, matchingS, params):
+    if not os.path.isfile(inFile):
+        return(None);
+    image = openMultispectralImage(inFile, params['namePattern']);
+    folder = outputFolder(inFile, params);
+    fileHandle, xyzPath = tempfile.mkstemp(suffix='.xyz', dir=folder);
+    os.close(fileHandle);
+    xyzImage = None;
+    try:
+        height, width = image.shape[0:2];
+        xyzImage = numpy.memmap(xyzPath, dtype=numpy.float64, mode='w+', shape=(height, width, 3));
+        # the tone mapping luminance is known up front unless it depends on the mean luminance
+        statistics = {'luminance': 0.0, 'maxPrimary': -numpy.inf};
+        maxLum = None if (params['toneMapThreshold'] <= 0) and (params['toneMapFactor'] > 0) else toneMapLuminance(params, None);
+        def blockStatistics(start, end, block):
+            xyz = numpy.asarray(xyzImage[start:end]).reshape((-1, 3));
+            statistics['luminance'] += xyz[:, 1].sum();
+            if (maxLum is not None) or (params['toneMapFactor'] <= 0):
+                statistics['maxPrimary'] = max(statistics['maxPrimary'], srgbPrimary(xyz, maxLum).max());
+        convertImage(image, [sensorMatrix(wattsToLumens*matchingFunction, matchingS, image.S)], [xyzImage], params['blockBytes'], blockStatistics);
+
+        sRGBFile = os.path.join(folder, '{}_sRGB.png'.format(os.path.splitext(os.path.basename(inFile))[0]));
+        maxPrimary = statistics['maxPrimary'] if numpy.isfinite(statistics['maxPrimary']) else None;
+        writer = pngWriter(sRGBFile, width, height);
+        completed = False;
+        try:
+            scaleFactor = xyzToSRGB(xyzImage, params, lambda start, rows: writer.writeRows(rows),
+                                    statistics['luminance']/float(height*width), maxPrimary);
+            completed = True;
+        finally:
+            writer.close();
+            # do not leave a partial preview behind
+            if not completed:
+                os.remove(sRGBFile);
+        return({'sRGBFile': sRGBFile, 'scaleFactor': scaleFactor});
+    finally:
+        image.close();
+        # release the mapping before its file is removed
+        xyzImage = None;
+        os.remove(xyzPath);
+
+
+# Method to write sRGB previews of multispectral files, as
+# rtbMultispectralToSRGB.m computes them, to PNG files named
+# <input file base>_sRGB.png (see makeSensorImages). Returns, for each input
+# file, a dictionary with the 'sRGBFile' and the 'scaleFactor', or None for
+# files that do not exist.
+def makeSRGBImages(inFiles, params=None):
+    params = conversionParams(params);
+    checkOutputNames(inFiles, params);
+    matchingFunction, matchingS, _, _ = readColorimetricData(xyz1931File);
+    with concurrent.futures.ThreadPoolExecutor(max_workers=params['workersNum'] or os.cpu_count()) as executor:
+        return(list(executor.map(lambda inFile: makeFileSRGBImage(inFile, matchingFunction, matchingS, params), inFiles)));
@@ -0,0 +1,230 @@
+# Blender-free helpers for spectra given as wavelength/magnitude arrays: a
+# reader and a writer for spectrum data files (.spd), in the format of
+# rtbReadSpectrum.m and rtbWriteSpectrumFile.m, a store that writes each
+# distinct spectrum to a single file named after a hash of its contents, and
+# a resampler to a target wavelength sampling.
+#
+# Spectrum files hold one "wavelength magnitude" pair per line, e.g.
+#   380 0.000000
+#   390 0.250000
+# Spectrum strings hold "wavelength:magnitude" pairs separated by spaces, e.g.
+#   300:0.1 550:0.5 800:0.9
+
+import collections
+import hashlib
+import os
+import tempfile
+
+import numpy
+
+import MultispectralEXRUtils
+
+
+# Number of resampling matrices kept by resamplingMatrix
+resamplingCacheSize = 64;
+
+# Resampling matrices, by source wavelengths, target wavelengths and extrapolation, most recently used last
+resamplingCache = collections.OrderedDict();
+
+
+# Method to get the wavelengths and magnitudes of a spectrum string or of a
+# spectrum file, as rtbReadSpectrum.m does. Returns two (n,) float64 arrays.
+def readSpectrum(spectrum):
+    if os.path.isfile(spectrum):
+        with open(spectrum, 'r') as fileHandle:
+            text = fileHandle.read();
+        numbers = MultispectralEXRUtils.scanNumbers(text, '%f');
+    else:
+        numbers = MultispectralEXRUtils.scanNumbers(spectrum, '%f:%f');
+    numbers = numpy.array(numbers, dtype=numpy.float64);
+    return(numbers[0::2], numbers[1::2]);
+
+
+# Helper method to format a number as Matlab's fprintf does with %d: integers
+# are printed as such, other numbers as with %e
+def formatInteger(value):
+    value = float(value);
+    if value == int(value):
+        return('{:d}'.format(int(value)));
+    return('{:e}'.format(value));
+
+
+# Method to get the text of a spectrum file, one "%d %f" pair per line.
+# The numbers of wavelengths and magnitudes must match.
+def spectrumText(wavelengths, magnitudes):
+    wavelengths = numpy.asarray(wavelengths, dtype=numpy.float64).reshape(-1);
+    magnitudes = numpy.asarray(magnitudes, dtype=numpy.float64).reshape(-1);
+    if wavelengths.size != magnitudes.size:
+        raise ValueError('Number of wavelengths {} must match number of magnitudes {}.'.format(wavelengths.size, magnitudes.size));
+    if numpy.all(wavelengths == numpy.round(wavelengths)):
+        return(''.join(['%d %f\n' % pair for pair in zip(wavelengths.tolist(), magnitudes.tolist())]));
+    return(''.join(['{} {:f}\n'.format(formatInteger(wavelength), magnitude) for wavelength, magnitude in zip(wavelengths, magnitudes)]));
+
+
+# Method to write a spectrum file, as rtbWriteSpectrumFile.m does: the
+# folder is created if needed, and the .spd extension is added to file names
+# without an extension. Returns the file name.
+def writeSpectrumFile(wavelengths, magnitudes, fileName):
+    filePath, fileBase = os.path.split(fileName);
+    if filePath and not os.path.isdir(filePath):
+        os.makedirs(filePath);
+    if not os.path.splitext(fileBase)[1]:
+        fileName = os.path.join(filePath, fileBase + '.spd');
+    with open(fileName, 'w') as fileHandle:
+        fileHandle.write(spectrumText(wavelengths, magnitudes));
+    return(fileName);
+
+
+# Method to get the wavelengths of an "S" sampling: [start delta n]
+# (as Psychtoolbox's SToWls)
+def wlsFromS(S):
+    start, delta, count = [float(value) for value in numpy.asarray(S).reshape(-1)[0:3]];
+    return(start + delta*numpy.arange(int(count)));
+
+
+# Method to get the (T,K) matrix that linearly interpolates spectra sampled
+# at K sourceWls to T targetWls: resampled = magnitudes.dot(matrix.T).
+# Outside the source wavelengths, magnitudes are held at the end values, or
+# are zero if extrapolation is 'zero'. Matrices are cached, so that many
+# calls with the same samplings only compute one.
+def resamplingMatrix(sourceWls, targetWls, extrapolation='clamp'):
+    if extrapolation not in ('clamp', 'zero'):
+        raise ValueError('Unknown extrapolation "{}"'.format(extrapolation));
+    sourceWls = numpy.asarray(sourceWls, dtype=numpy.float64).reshape(-1);
+    targetWls = numpy.asarray(targetWls, dtype=numpy.float64).reshape(-1);
+    key = (sourceWls.tobytes(), targetWls.tobytes(), extrapolation);
+    if key in resamplingCache:
+        resamplingCache.move_to_end(key);
+        return(resamplingCache[key]);
+
+    if sourceWls.size == 0:
+        raise ValueError('Spectra need at least one wavelength');
+    if numpy.any(numpy.diff(sourceWls) <= 0):
+        raise ValueError('The wavelengths of spectra must be increasing');
+    matrix = numpy.zeros((targetWls.size, sourceWls.size));
+    targets = numpy.arange(targetWls.size);
+    if sourceWls.size == 1:
+        matrix[:, 0] = 1.0;
+    else:
+        # the source interval of each target wavelength, and its weight on the upper end
+        upper = numpy.clip(numpy.searchsorted(sourceWls, targetWls), 1, sourceWls.size-1);
+        weights = numpy.clip((targetWls - sourceWls[upper-1]) / (sourceWls[upper] - sourceWls[upper-1]), 0.0, 1.0);
+        matrix[targets, upper-1] = 1.0 - weights;
+        matrix[targets, upper] += weights;
+    if extrapolation == 'zero':
+        matrix[(targetWls < sourceWls[0]) | (targetWls > sourceWls[-1])] = 0.0;
+    matrix.setflags(write=False);
+
+    resamplingCache[key] = matrix;
+    if len(resamplingCache) > resamplingCacheSize:
+        resamplingCache.popitem(last=False);
+    return(matrix);
+
+
+# Method to resample spectra to target wavelengths, by linear interpolation
+# of their magnitudes (as for reflectances, not as for power per band).
+# magnitudes may hold a single spectrum (K,) or many (..., K), which are all
+# resampled at once. targetWls may also be an "S" sampling, if targetIsS is set.
+def resampleSpectra(wavelengths, magnitudes, targetWls, targetIsS=False, extrapolation='clamp'):
+    if targetIsS:
+        targetWls = wlsFromS(targetWls);
+    matrix = resamplingMatrix(wavelengths, targetWls, extrapolation);
+    magnitudes = numpy.asarray(magnitudes, dtype=numpy.float64);
+    if magnitudes.shape[-1] != matrix.shape[1]:
+        raise ValueError('Spectra have {} magnitudes for {} wavelengths'.format(magnitudes.shape[-1], matrix.shape[1]));
+    resampled = magnitudes.reshape((-1, matrix.shape[1])).dot(matrix.T);
+    return(resampled.reshape(magnitudes.shape[:-1] + (matrix.shape[0],)));
+
+
+# Method to get an RGB color that previews a reflectance spectrum: its mean
+# magnitude over the 600-700nm, 500-600nm and 400-500nm bands. This is only
+# meant for viewports and for renderers that take no spectra.
+def previewColor(wavelengths, magnitudes):
+    bands = resampleSpectra(wavelengths, magnitudes, numpy.arange(400.0, 701.0, 10.0));
+    return((float(bands[20:31].mean()), float(bands[10:21].mean()), float(bands[0:11].mean())));
+
+
+# Method to collect the spectra of a material request (see the sceneManager's
+# generateMaterialType), by component ('diffuse', 'specular'), as
+# {'wavelengths', 'magnitudes', 'file'}, where 'file' is the name of the
+# spectrum file in the given spectrumStore, or '' without a store
+def materialSpectra(params, store=None):
+    spectra = {};
+    for component in ('diffuse', 'specular'):
+        if params.get(component + '_spectrum') is None:
+            continue;
+        wavelengths, magnitudes = [numpy.asarray(values, dtype=numpy.float64).reshape(-1) for values in params[component + '_spectrum']];
+        if wavelengths.size != magnitudes.size:
+            raise ValueError('The {} spectrum of material "{}" has {} wavelengths and {} magnitudes'.format(
+                component, params['name'], wavelengths.size, magnitudes.size));
+        spectra[component] = {
+            'wavelengths' : wavelengths.tolist(),
+            'magnitudes'  : magnitudes.tolist(),
+            'file'        : '' if store is None else store.spectrumFile(wavelengths, magnitudes),
+        };
+    return(spectra);
+
+
+# Method to get the color of a material component: params[component + '_color']
+# if given, or else the preview color of the component's spectrum
+def materialColor(params, spectra, component):
+    if (params.get(component + '_color') is None) and (component in spectra):
+        return(previewColor(spectra[component]['wavelengths'], spectra[component]['magnitudes']));
+    return(params[component + '_color']);
+
+
+# Class for a folder of spectrum files, in which each distinct spectrum is
+# written once, to a file named <prefix>-<hash of its text>.spd. Files left
+# by earlier stores in the same folder are reused.
+class spectrumStore:
+    def __init__(self, folder, prefix='spectrum'):
+        self.folder = folder;
+        self.prefix = prefix;
+        # file names, by hash of the spectrum text, and by hash of the
+        # spectrum arrays, which spares formatting spectra seen before
+        self.fileNames      = {};
+        self.arrayFileNames = {};
+        self.statistics = {'created': 0, 'reused': 0};
+
+    # Method to get the name of the file of a spectrum (relative to the
+    # folder), writing the file if it does not exist yet
+    def spectrumFile(self, wavelengths, magnitudes):
+        arrays = [numpy.asarray(values, dtype=numpy.float64).reshape(-1) for values in (wavelengths, magnitudes)];
+        arrayKey = hashlib.sha1(b''.join([values.tobytes() for values in arrays]) + str(arrays[0].size).encode('utf-8')).hexdigest();
+        if arrayKey in self.arrayFileNames:
+            self.statistics['reused'] += 1;
+            return(self.arrayFileNames[arrayKey]);
+        text = spectrumText(arrays[0], arrays[1]);
+        key = hashlib.sha1(text.encode('utf-8')).hexdigest();
+        if key in self.fileNames:
+            self.statistics['reused'] += 1;
+            self.arrayFileNames[arrayKey] = self.fileNames[key];
+            return(self.fileNames[key]);
+        fileName = '{}-{}.spd'.format(self.prefix, key[0:16]);
+        filePath = os.path.join(self.folder, fileName);
+        if os.path.isfile(filePath):
+            self.statistics['reused'] += 1;
+        else:
+            if not os.path.isdir(self.folder):
+                os.makedirs(self.folder);
+            self.storeText(filePath, text);
+            self.statistics['created'] += 1;
+        self.fileNames[key] = fileName;
+        self.arrayFileNames[arrayKey] = fileName;
+        return(fileName);
+
+    # Method to write a spectrum file atomically, so that concurrent readers never see partial files
+    def storeText(self, path, text):
+        fileHandle, tempPath = tempfile.mkstemp(suffix='.tmp', dir=self.folder);
+        try:
+            with os.fdopen(fileHandle, 'w') as tempFile:
+                tempFile.write(text);
+            os.replace(tempPath, path);
+        except:
+            if os.path.exists(tempPath):
+                os.remove(tempPath);
+            raise;
+
+    # Method to get the statistics of the store: {'created': ..., 'reused': ...}
+    def getStatistics(self):
+        return(dict(self.statistics));
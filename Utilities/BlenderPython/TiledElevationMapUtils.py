@@ -0,0 +1,301 @@
+# Blender-free helpers for elevation maps that are too large to hold in RAM.
+# A tiled map is a (yBinsNum, xBinsNum) float32 array kept in a memory-mapped
+# .npy file, which is generated, normalized and meshed one tile at a time, so
+# that peak memory depends on the tile size and not on the map resolution.
+# Tiled generators give the same maps as the ones of ElevationMapUtils, so a
+# tiled map can be cached with, and compared to, a map generated in one piece.
+# Tiles can also be generated on a pool of processes (generateParallelMap).
+
+import concurrent.futures
+import os
+import tempfile
+
+import numpy
+
+import ElevationMapUtils
+import InstrumentationUtils
+
+
+# Default tiling parameters
+tilingDefaults = {
+    'tileSize'   : 512,
+    # .npy file of the map, or None for a temporary file, removed on close()
+    'filePath'   : None,
+    # folder for temporary map and mesh files, or None for the system default
+    'scratchDir' : None,
+};
+
+# Largest number of samples processed at once by the row-by-row passes
+maxBlockSamples = 1024**2;
+
+
+# Class for an elevation map kept in a memory-mapped float32 .npy file, and
+# accessed by tiles of tileSize x tileSize bins (smaller at the far borders).
+# numpy.asarray(theMap) gives the memory-mapped array, without copying it.
+class tiledElevationMap:
+    def __init__(self, elevation, filePath, tileSize, temporary=False):
+        self.elevation = elevation;
+        self.filePath  = filePath;
+        self.tileSize  = int(tileSize);
+        self.temporary = temporary;
+        self.yBinsNum, self.xBinsNum = elevation.shape;
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return(self.elevation);
+        return(numpy.asarray(self.elevation, dtype=dtype));
+
+    @property
+    def shape(self):
+        return(self.elevation.shape);
+
+    # Method to list the tiles as (x0, x1, y0, y1) bin ranges, row by row
+    def tiles(self):
+        tiles = [];
+        for y0 in range(0, self.yBinsNum, self.tileSize):
+            for x0 in range(0, self.xBinsNum, self.tileSize):
+                tiles.append((x0, min(x0+self.tileSize, self.xBinsNum), y0, min(y0+self.tileSize, self.yBinsNum)));
+        return(tiles);
+
+    # Method to get a (writable, unless opened read-only) view of one tile
+    def tile(self, bounds):
+        x0, x1, y0, y1 = bounds;
+        return(self.elevation[y0:y1, x0:x1]);
+
+    # Method to compute the max |elevation| in a streaming pass over the tiles
+    def maxAbsElevation(self):
+        maxElevation = 0.0;
+        for bounds in self.tiles():
+            maxElevation = max(maxElevation, float(numpy.max(numpy.abs(self.tile(bounds)))));
+        return(maxElevation);
+
+    # Method to scale the map in place, one tile at a time
+    def scale(self, factor):
+        for bounds in self.tiles():
+            tile = self.tile(bounds);
+            tile *= factor;
+
+    # Method to write pending changes to the file
+    def flush(self):
+        if isinstance(self.elevation, numpy.memmap):
+            self.elevation.flush();
+
+    # Method to release the file, and remove it if it is temporary
+    def close(self):
+        if self.elevation is None:
+            return;
+        self.flush();
+        self.elevation = None;
+        if self.temporary and os.path.isfile(self.filePath):
+            os.remove(self.filePath);
+
+
+# Method to create a zero-filled tiled map. tiling overrides tilingDefaults.
+def createTiledElevationMap(xBinsNum, yBinsNum, tiling=None):
+    tiling = ElevationMapUtils.mergeParams(tilingDefaults, tiling);
+    filePath  = tiling['filePath'];
+    temporary = filePath is None;
+    if temporary:
+        fileHandle, filePath = tempfile.mkstemp(suffix='.npy', prefix='elevationMap-', dir=tiling['scratchDir']);
+        os.close(fileHandle);
+    elevation = numpy.lib.format.open_memmap(filePath, mode='w+', dtype=numpy.float32, shape=(yBinsNum, xBinsNum));
+    return(tiledElevationMap(elevation, filePath, tiling['tileSize'], temporary));
+
+
+# Method to open an existing .npy elevation map as a tiled map.
+# mode is 'r' for read-only access, or 'r+' for read-write access.
+def openTiledElevationMap(filePath, tileSize=tilingDefaults['tileSize'], mode='r'):
+    elevation = numpy.load(filePath, mmap_mode=mode);
+    if (elevation.ndim != 2) or (elevation.dtype != numpy.float32):
+        raise ValueError('"{}" does not hold a 2D float32 elevation map'.format(filePath));
+    return(tiledElevationMap(elevation, filePath, tileSize));
+
+
+# Method to generate a tiled random surface map, as
+# ElevationMapUtils.generateRandomSurfaceMap does. The noise is drawn in
+# blocks of rows, in the same order, so the maps are identical.
+# If given, progress(rowsDone, rowsNum) is called after each block.
+def generateTiledRandomSurfaceMap(xBinsNum, yBinsNum, params=None, progress=None, tiling=None):
+    params = ElevationMapUtils.mergeParams(ElevationMapUtils.randomSurfaceDefaults, params);
+    rng = ElevationMapUtils.randomSurfaceGenerator(params);
+    entropy = ElevationMapUtils.streamsEntropy(params['seed']) if params['rngStreams'] else None;
+    theMap = createTiledElevationMap(xBinsNum, yBinsNum, tiling);
+
+    for y0, y1 in rowBlocks(xBinsNum, yBinsNum):
+        theMap.elevation[y0:y1, :] = ElevationMapUtils.randomSurfaceRows(xBinsNum, yBinsNum, y0, y1, params, rng, entropy);
+        InstrumentationUtils.reportProgress(progress, y1, yBinsNum);
+    theMap.flush();
+    return(theMap);
+
+
+# Helper method to split the rows of a map in blocks of about maxBlockSamples
+# samples. Returns a list of [y0, y1) row ranges.
+def rowBlocks(xBinsNum, yBinsNum):
+    rowsPerBlock = max(1, maxBlockSamples // xBinsNum);
+    return([(y0, min(y0+rowsPerBlock, yBinsNum)) for y0 in range(0, yBinsNum, rowsPerBlock)]);
+
+
+# Method to generate a tiled Gaussian blobs map, as
+# ElevationMapUtils.generateGaussianBlobsMap does. Each tile is accumulated
+# in RAM from the bumps whose support overlaps it, in the same order as the
+# whole map is, so the maps are identical. The max |elevation| is tracked as
+# the tiles are written, and the map is then normalized in a second pass.
+# If given, progress(tilesDone, tilesNum) is called after each tile.
+def generateTiledGaussianBlobsMap(xBinsNum, yBinsNum, params=None, progress=None, tiling=None):
+    params = ElevationMapUtils.mergeParams(ElevationMapUtils.gaussianBlobsDefaults, params);
+    rng = ElevationMapUtils.getRandomGenerator(params['seed']);
+    bumps = ElevationMapUtils.drawGaussianBumps(params, rng);
+    batches = ElevationMapUtils.gaussianBatches(bumps, params['sigmaCutoff'], params['bumpsPerPass'], xBinsNum, yBinsNum);
+    theMap = createTiledElevationMap(xBinsNum, yBinsNum, tiling);
+    maxElevation = generateGaussianTiles(theMap, batches, theMap.tiles(), progress);
+
+    # normalize elevation to 1.0
+    if maxElevation > 0:
+        theMap.scale(1.0/maxElevation);
+    theMap.flush();
+    return(theMap);
+
+
+# Helper method to accumulate batches of Gaussians (see
+# ElevationMapUtils.gaussianBatches) into some tiles of a tiled map.
+# Returns the max |elevation| of these tiles.
+def generateGaussianTiles(theMap, batches, tiles, progress=None):
+    xCenters = ElevationMapUtils.binCenters(theMap.xBinsNum);
+    yCenters = ElevationMapUtils.binCenters(theMap.yBinsNum);
+    # bin ranges covered by the windows of each batch
+    batchBounds = [(min(xOrigins), max(xOrigins)+windowWidth, min(yOrigins), max(yOrigins)+windowHeight)
+                   for bumps, (xOrigins, yOrigins, windowWidth, windowHeight) in batches];
+
+    maxElevation = 0.0;
+    for tileIndex, (x0, x1, y0, y1) in enumerate(tiles):
+        tile = numpy.zeros((y1-y0, x1-x0), dtype=numpy.float32);
+        for (bumps, windows), (bx0, bx1, by0, by1) in zip(batches, batchBounds):
+            if (bx0 < x1) and (x0 < bx1) and (by0 < y1) and (y0 < by1):
+                ElevationMapUtils.blitGaussianBatch(tile, bumps, windows, xCenters, yCenters, x0, y0);
+        theMap.elevation[y0:y1, x0:x1] = tile;
+        maxElevation = max(maxElevation, float(numpy.max(numpy.abs(tile))));
+        InstrumentationUtils.reportProgress(progress, tileIndex+1, len(tiles));
+    return(maxElevation);
+
+
+# Helper method run by the workers of generateParallelMap: generate some of
+# the tiles of a Gaussian blobs map, straight into its file.
+# Returns the max |elevation| of these tiles.
+def gaussianTilesTask(filePath, tileSize, batches, tiles):
+    theMap = openTiledElevationMap(filePath, tileSize, mode='r+');
+    maxElevation = generateGaussianTiles(theMap, batches, tiles);
+    theMap.close();
+    return(maxElevation);
+
+
+# Helper method run by the workers of generateParallelMap: generate rows
+# y0 .. y1-1 of a random surface map, straight into its file
+def randomSurfaceRowsTask(filePath, tileSize, params, entropy, y0, y1):
+    theMap = openTiledElevationMap(filePath, tileSize, mode='r+');
+    theMap.elevation[y0:y1, :] = ElevationMapUtils.randomSurfaceRows(theMap.xBinsNum, theMap.yBinsNum, y0, y1, params, entropy=entropy);
+    theMap.close();
+    return(0.0);
+
+
+# Method to generate a tiled map on workersNum processes (all cores if None).
+# The grid is split in tiles (Gaussian blobs) or blocks of rows (random
+# surfaces), which the workers write straight into the memory-mapped file.
+# Each part is computed the same way whichever worker computes it, so maps
+# are bit-identical for any number of workers, and to the maps of the serial
+# generators. Random surfaces are drawn in parallel only with
+# params['rngStreams'] set, since rows must otherwise be drawn in order.
+# If given, progress(partsDone, partsNum) is called as the parts complete.
+def generateParallelMap(generatorName, xBinsNum, yBinsNum, params=None, progress=None, tiling=None, workersNum=None):
+    generator, defaults = ElevationMapUtils.generators[generatorName];
+    params = ElevationMapUtils.mergeParams(defaults, params);
+    if (generatorName == 'randomSurface') and not params['rngStreams']:
+        raise ValueError('Random surface maps are generated in parallel only with the "rngStreams" param set');
+    theMap = createTiledElevationMap(xBinsNum, yBinsNum, tiling);
+    theMap.flush();
+
+    # the random draws are made here, once, and shared by all workers
+    if generatorName == 'gaussianBlobs':
+        bumps = ElevationMapUtils.drawGaussianBumps(params, ElevationMapUtils.getRandomGenerator(params['seed']));
+        batches = ElevationMapUtils.gaussianBatches(bumps, params['sigmaCutoff'], params['bumpsPerPass'], xBinsNum, yBinsNum);
+        tasks = [(gaussianTilesTask, theMap.filePath, theMap.tileSize, batches, [tile]) for tile in theMap.tiles()];
+    else:
+        entropy = ElevationMapUtils.streamsEntropy(params['seed']);
+        tasks = [(randomSurfaceRowsTask, theMap.filePath, theMap.tileSize, params, entropy, y0, y1) for y0, y1 in rowBlocks(xBinsNum, yBinsNum)];
+
+    maxElevation = 0.0;
+    try:
+        if workersNum == 1:
+            for taskIndex, task in enumerate(tasks):
+                maxElevation = max(maxElevation, task[0](*task[1:]));
+                InstrumentationUtils.reportProgress(progress, taskIndex+1, len(tasks));
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workersNum) as pool:
+                futures = [pool.submit(*task) for task in tasks];
+                for taskIndex, future in enumerate(concurrent.futures.as_completed(futures)):
+                    maxElevation = max(maxElevation, future.result());
+                    InstrumentationUtils.reportProgress(progress, taskIndex+1, len(tasks));
+    except:
+        theMap.close();
+        raise;
+
+    # normalize elevation to 1.0
+    if (generatorName == 'gaussianBlobs') and (maxElevation > 0):
+        theMap.scale(1.0/maxElevation);
+    theMap.flush();
+    return(theMap);
+
+
+# Method to generate a tiled map with the named generator, in parallel if
+# workersNum is given (see generateParallelMap)
+def generateTiledMap(generatorName, xBinsNum, yBinsNum, params=None, progress=None, tiling=None, workersNum=None):
+    if workersNum is not None:
+        return(generateParallelMap(generatorName, xBinsNum, yBinsNum, params, progress, tiling, workersNum));
+    return(tiledGenerators[generatorName](xBinsNum, yBinsNum, params, progress, tiling));
+
+
+# Registry of the tiled elevation map generators, by name (as in ElevationMapUtils.generators)
+tiledGenerators = {
+    'randomSurface'   : generateTiledRandomSurfaceMap,
+    'gaussianBlobs'   : generateTiledGaussianBlobsMap,
+};
+
+
+# Helper method to get a zero-filled scratch array in an anonymous
+# temporary file, which is removed once the array is released
+def scratchArray(shape, dtype, scratchDir=None):
+    with tempfile.TemporaryFile(dir=scratchDir) as fileHandle:
+        return(numpy.memmap(fileHandle, dtype=dtype, mode='w+', shape=shape));
+
+
+# Method to compute the vertex and face arrays of the regular quad grid of a
+# tiled map, as ElevationMapUtils.elevationMapMeshArrays does. The arrays are
+# filled one block of rows at a time into memory-mapped scratch files, so
+# that they can be passed on to foreach_set without holding them in RAM.
+def tiledElevationMapMeshArrays(theMap, scratchDir=None):
+    xBinsNum = theMap.xBinsNum;
+    yBinsNum = theMap.yBinsNum;
+    vertices = scratchArray((yBinsNum, xBinsNum, 3), numpy.float32, scratchDir);
+    faces    = scratchArray(((yBinsNum-1)*(xBinsNum-1), 4), numpy.int32, scratchDir);
+
+    xs = (2*(numpy.arange(xBinsNum)-(xBinsNum-1.5)/2)/(xBinsNum-2)).astype(numpy.float32);
+    xFirst = numpy.arange(xBinsNum-1, dtype=numpy.int32)[numpy.newaxis, :];
+    rowsPerBlock = max(1, maxBlockSamples // xBinsNum);
+    for y0 in range(0, yBinsNum, rowsPerBlock):
+        y1 = min(y0+rowsPerBlock, yBinsNum);
+        ys = 2*(numpy.arange(y0, y1)-(yBinsNum-1.5)/2)/(yBinsNum-2);
+        vertices[y0:y1, :, 0] = xs[numpy.newaxis, :];
+        vertices[y0:y1, :, 1] = ys[:, numpy.newaxis];
+        vertices[y0:y1, :, 2] = theMap.elevation[y0:y1, :];
+
+        # quads of the rows y0 .. y1-1 (the last row of the map has none)
+        quadRows = min(y1, yBinsNum-1) - y0;
+        if quadRows <= 0:
+            continue;
+        firstVertex = (numpy.arange(y0, y0+quadRows, dtype=numpy.int32)[:, numpy.newaxis]*xBinsNum + xFirst).reshape(-1);
+        blockFaces = faces[y0*(xBinsNum-1):(y0+quadRows)*(xBinsNum-1)];
+        blockFaces[:, 0] = firstVertex;
+        blockFaces[:, 1] = firstVertex + 1;
+        blockFaces[:, 2] = firstVertex + xBinsNum + 1;
+        blockFaces[:, 3] = firstVertex + xBinsNum;
+
+    return(vertices.reshape((-1, 3)), faces);